@@ -3,6 +3,10 @@ ASGI config for facturacion project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Las notificaciones en vivo (``/api/eventos/``) solo se sirven bajo ASGI: cada
+worker arranca aquí su hilo LISTEN de Postgres para recibir los eventos
+publicados por los demás procesos.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 """
@@ -14,3 +18,7 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
 
 application = get_asgi_application()
+
+from core.eventos import hub  # noqa: E402  (requiere apps cargadas)
+
+hub.iniciar()
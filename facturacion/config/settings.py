@@ -26,7 +26,9 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'core.middleware.InstrumentacionConsultasMiddleware',  # Conteo de consultas y Server-Timing
     'django.contrib.sessions.middleware.SessionMiddleware',
+    'core.middleware.RenovacionSesionMiddleware',  # Renovación de sesión limitada (ver SESSION_RENOVACION_INTERVALO)
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
@@ -35,6 +37,21 @@ MIDDLEWARE = [
     'core.middleware.PermisosMiddleware',  # Middleware de permisos
 ]
 
+# Fracción de requests instrumentadas en producción (con DEBUG se miden todas)
+CONSULTAS_MUESTREO = 0.05
+
+# Log estructurado (JSON por línea) de la instrumentación de consultas
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'core.consultas': {'handlers': ['console'], 'level': 'INFO', 'propagate': False},
+    },
+}
+
 ROOT_URLCONF = 'config.urls'
 
 TEMPLATES = [
@@ -84,6 +101,30 @@ DATABASES = {
     },
 }
 
+# Los reportes marcados con @usar_replica leen de esta base mientras su
+# retraso no supere REPLICA_RETRASO_MAXIMO (segundos); si no, usan 'default'
+DATABASE_ROUTERS = ['core.routers.RouterReplica']
+REPLICA_LECTURA = 'supabase'
+REPLICA_RETRASO_MAXIMO = 900
+# Cada cuántos minutos run_scheduler replica los cambios a Supabase
+REPLICACION_INTERVALO_MINUTOS = 10
+
+# Minutos sin actividad tras los que vence la reserva de stock de una factura en carga
+RESERVA_STOCK_MINUTOS = 15
+
+# Días que se conservan los snapshots diarios de inventario (los mensuales no se depuran)
+INVENTARIO_SNAPSHOTS_DIARIOS_DIAS = 90
+
+# Ingesta de facturas sin conexión: segundos de caché del catálogo de precios y facturas por lote
+INGESTA_CATALOGO_SEGUNDOS = 60
+INGESTA_LOTE_MAXIMO = 1000
+
+# Horas que se recuerda el resultado de un formulario de facturas o pagos (reenvíos y doble clic)
+IDEMPOTENCIA_HORAS = 24
+
+# Máximo de facturas por descarga de PDF en lote desde la web (más: comando imprimir_facturas)
+PDF_LOTE_MAXIMO = 500
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -128,7 +169,26 @@ LOGOUT_REDIRECT_URL = 'login'
 # Configuración de sesiones
 SESSION_COOKIE_AGE = 1209600  # 14 días en segundos (máximo tiempo de sesión)
 SESSION_EXPIRE_AT_BROWSER_CLOSE = False  # False significa que la sesión no expira al cerrar el navegador
-SESSION_SAVE_EVERY_REQUEST = True  # Guardar la sesión en cada request para mantenerla activa
+SESSION_SAVE_EVERY_REQUEST = False  # La renovación la hace RenovacionSesionMiddleware
+SESSION_RENOVACION_INTERVALO = 3600  # Segundos mínimos entre escrituras para extender el vencimiento
+
+# Sesiones en caché con respaldo en base: las lecturas no consultan django_session.
+# La caché de archivos se comparte entre procesos del mismo servidor; con un solo
+# proceso se puede usar LocMemCache.
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+SESSION_CACHE_ALIAS = 'sesiones'
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'sesiones': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache', 'sesiones'),
+        'TIMEOUT': SESSION_COOKIE_AGE,
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+}
 
 # ============================================================================
 # CONFIGURACIÓN DE EMAIL
@@ -149,3 +209,5 @@ EMAIL_ADMIN_ADDRESS = 'admin@avicolacva.com'  # Email del administrador
 
 # Frecuencia de notificaciones (en horas)
 EMAIL_ALERT_FREQUENCY = 24  # Enviar alertas cada 24 horas
+# Los emails se encolan en CorreoSaliente y los envía `manage.py procesar_correos`;
+# las alertas individuales se agrupan en un resumen cada EMAIL_ALERT_FREQUENCY horas (0 = sin agrupar)
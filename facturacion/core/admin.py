@@ -2,31 +2,37 @@ from django.contrib import admin
 from .models import (
     Producto, Proveedor, Cliente, Factura, DetalleFactura, 
     Pago, PagoFactura, Notificacion, ConfiguracionSistema, MovimientoStock,
-    Caja, MovimientoCaja, Gasto, Denominacion
+    Caja, MovimientoCaja, Gasto, Denominacion, MovimientoSaldo, CorreoSaliente,
+    EjecucionTarea, ReservaStock, InventarioSnapshot, TomaInventario, ConteoInventario,
+    HistorialCosto, SolicitudIdempotente
 )
 
 @admin.register(Producto)
 class ProductoAdmin(admin.ModelAdmin):
-    list_display = ['codigo', 'nombre', 'precio', 'stock', 'stock_minimo', 'activo']
+    list_display = ['codigo', 'nombre', 'precio', 'stock', 'reservado', 'disponible', 'stock_minimo', 'activo']
     list_filter = ['activo', 'iva']
     search_fields = ['codigo', 'nombre']
-    list_editable = ['stock', 'stock_minimo', 'activo']
+    # stock, reservado y costo_promedio los mantienen los movimientos (ajustar stock desde la app)
+    list_editable = ['stock_minimo', 'activo']
+    readonly_fields = ['stock', 'reservado', 'costo_promedio']
 
 @admin.register(Proveedor)
 class ProveedorAdmin(admin.ModelAdmin):
     list_display = ['nombre', 'ruc', 'telefono', 'email', 'saldo', 'activo']
     list_filter = ['activo']
     search_fields = ['nombre', 'ruc', 'email']
+    readonly_fields = ['saldo']
 
 @admin.register(Cliente)
 class ClienteAdmin(admin.ModelAdmin):
     list_display = ['nombre', 'ruc', 'telefono', 'email', 'saldo', 'activo']
     list_filter = ['activo']
     search_fields = ['nombre', 'ruc', 'email']
+    readonly_fields = ['saldo']
 
 @admin.register(Factura)
 class FacturaAdmin(admin.ModelAdmin):
-    list_display = ['numero', 'tipo', 'fecha', 'proveedor', 'cliente', 'total', 'estado']
+    list_display = ['numero', 'tipo', 'fecha', 'fecha_vencimiento', 'proveedor', 'cliente', 'total', 'monto_pendiente', 'estado']
     list_filter = ['tipo', 'estado', 'fecha']
     search_fields = ['numero', 'proveedor__nombre', 'cliente__nombre']
     date_hierarchy = 'fecha'
@@ -51,11 +57,24 @@ class PagoFacturaAdmin(admin.ModelAdmin):
 
 @admin.register(Notificacion)
 class NotificacionAdmin(admin.ModelAdmin):
-    list_display = ['mensaje', 'tipo', 'fecha', 'leida', 'usuario']
+    list_display = ['mensaje', 'tipo', 'fecha', 'repeticiones', 'leida', 'usuario']
     list_filter = ['tipo', 'leida', 'fecha']
-    search_fields = ['mensaje']
+    search_fields = ['mensaje', 'clave']
     list_editable = ['leida']
 
+@admin.register(CorreoSaliente)
+class CorreoSalienteAdmin(admin.ModelAdmin):
+    list_display = ['asunto', 'categoria', 'estado', 'intentos', 'proximo_intento', 'fecha_creacion', 'fecha_envio']
+    list_filter = ['estado', 'categoria', 'agrupable']
+    search_fields = ['asunto', 'destinatarios', 'ultimo_error']
+    readonly_fields = ['fecha_creacion', 'fecha_envio', 'intentos', 'ultimo_error']
+
+@admin.register(EjecucionTarea)
+class EjecucionTareaAdmin(admin.ModelAdmin):
+    list_display = ['tarea', 'estado', 'inicio', 'duracion_ms', 'servidor']
+    list_filter = ['tarea', 'estado']
+    readonly_fields = ['tarea', 'servidor', 'inicio', 'fin', 'duracion_ms', 'estado', 'resultado']
+
 @admin.register(ConfiguracionSistema)
 class ConfiguracionSistemaAdmin(admin.ModelAdmin):
     list_display = ['clave', 'valor', 'categoria', 'activo']
@@ -74,6 +93,82 @@ class MovimientoStockAdmin(admin.ModelAdmin):
         # No permitir agregar movimientos manualmente desde el admin
         return False
 
+@admin.register(HistorialCosto)
+class HistorialCostoAdmin(admin.ModelAdmin):
+    list_display = ['fecha', 'producto', 'cantidad', 'costo_unitario', 'stock_anterior', 'costo_anterior', 'costo_promedio']
+    search_fields = ['producto__nombre', 'producto__codigo']
+    date_hierarchy = 'fecha'
+
+    def has_add_permission(self, request):
+        # Lo escriben las compras y manage.py recalcular_costo_promedio
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+@admin.register(ReservaStock)
+class ReservaStockAdmin(admin.ModelAdmin):
+    list_display = ['producto', 'cantidad', 'clave', 'usuario', 'vence', 'fecha']
+    search_fields = ['producto__nombre', 'producto__codigo', 'clave']
+    readonly_fields = ['clave', 'producto', 'cantidad', 'usuario', 'vence', 'fecha']
+
+    def has_add_permission(self, request):
+        # Las reservas las crea el formulario de factura
+        return False
+
+@admin.register(SolicitudIdempotente)
+class SolicitudIdempotenteAdmin(admin.ModelAdmin):
+    list_display = ['clave', 'vista', 'usuario', 'resultado', 'vence']
+    list_filter = ['vista']
+    readonly_fields = ['clave', 'vista', 'usuario', 'resultado', 'vence']
+
+    def has_add_permission(self, request):
+        # Los tokens los registra el decorador idempotente
+        return False
+
+@admin.register(InventarioSnapshot)
+class InventarioSnapshotAdmin(admin.ModelAdmin):
+    list_display = ['fecha', 'periodo', 'producto', 'stock', 'costo']
+    list_filter = ['periodo', 'fecha']
+    search_fields = ['producto__nombre', 'producto__codigo']
+    date_hierarchy = 'fecha'
+
+    def has_add_permission(self, request):
+        # Los snapshots los toma el planificador (manage.py snapshot_inventario)
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+class ConteoInventarioInline(admin.TabularInline):
+    model = ConteoInventario
+    extra = 0
+    readonly_fields = ['stock_sistema', 'costo']
+
+@admin.register(TomaInventario)
+class TomaInventarioAdmin(admin.ModelAdmin):
+    list_display = ['id', 'fecha', 'descripcion', 'estado', 'usuario', 'fecha_aplicacion']
+    list_filter = ['estado', 'fecha']
+    readonly_fields = ['estado', 'fecha_aplicacion', 'usuario_aplicacion']
+    inlines = [ConteoInventarioInline]
+
+@admin.register(MovimientoSaldo)
+class MovimientoSaldoAdmin(admin.ModelAdmin):
+    list_display = ['fecha', 'cliente', 'proveedor', 'origen', 'monto', 'factura', 'pago', 'usuario']
+    list_filter = ['origen', 'fecha']
+    search_fields = ['cliente__nombre', 'proveedor__nombre', 'referencia', 'factura__numero']
+    date_hierarchy = 'fecha'
+    
+    def has_add_permission(self, request):
+        # Los movimientos solo se generan desde las operaciones de facturas y pagos
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+    
+    def has_delete_permission(self, request, obj=None):
+        return False
+
 @admin.register(Denominacion)
 class DenominacionAdmin(admin.ModelAdmin):
     list_display = ['caja', 'valor', 'cantidad', 'subtotal']
@@ -83,9 +178,9 @@ class DenominacionAdmin(admin.ModelAdmin):
 
 @admin.register(Caja)
 class CajaAdmin(admin.ModelAdmin):
-    list_display = ['fecha', 'saldo_inicial', 'saldo_final', 'saldo_real', 'diferencia', 'cerrada', 'usuario_apertura']
-    list_filter = ['cerrada', 'fecha']
-    search_fields = ['fecha']
+    list_display = ['fecha', 'terminal', 'saldo_inicial', 'saldo_final', 'saldo_real', 'diferencia', 'cerrada', 'usuario_apertura']
+    list_filter = ['cerrada', 'terminal', 'fecha']
+    search_fields = ['fecha', 'terminal']
     date_hierarchy = 'fecha'
     readonly_fields = ['saldo_final', 'diferencia', 'fecha_apertura', 'fecha_cierre']
 
@@ -0,0 +1,122 @@
+"""
+Instrumentación de consultas SQL: captura por request, huellas para detectar
+N+1 y presupuestos declarativos por vista.
+
+Uso en vistas:
+
+    @login_required
+    @presupuesto_consultas(25)
+    def dashboard(request): ...
+
+Uso en tests:
+
+    from core.consultas import afirmar_presupuesto
+    afirmar_presupuesto(self.client, reverse('dashboard'))
+"""
+import re
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+from django.db import connections
+
+UMBRAL_DUPLICADAS = 3  # repeticiones de una misma huella que se reportan como posible N+1
+
+_LITERALES = [
+    (re.compile(r"'(?:[^']|'')*'"), '?'),
+    (re.compile(r'\b\d+(?:\.\d+)?\b'), '?'),
+    (re.compile(r'\bIN\s*\((?:\s*(?:\?|%s)\s*,?)+\)', re.IGNORECASE), 'IN (...)'),
+    (re.compile(r'\s+'), ' '),
+]
+
+
+def huella(sql):
+    """SQL sin literales: identifica consultas iguales con distintos parámetros"""
+    for patron, reemplazo in _LITERALES:
+        sql = patron.sub(reemplazo, sql)
+    return sql.strip()
+
+
+def presupuesto_consultas(maximo):
+    """Declarar la cantidad máxima de consultas esperada para una vista"""
+    def decorator(view_func):
+        view_func.presupuesto_consultas = maximo
+        return view_func
+    return decorator
+
+
+class CapturaConsultas:
+    """
+    Context manager que registra alias, SQL y duración de cada consulta en todas
+    las bases. Usa execute_wrapper, así que funciona también con DEBUG = False.
+    """
+
+    def __init__(self):
+        self.consultas = []
+
+    def __call__(self, execute, sql, params, many, context):
+        inicio = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.consultas.append({
+                'alias': context['connection'].alias,
+                'sql': sql,
+                'duracion_ms': (time.perf_counter() - inicio) * 1000,
+            })
+
+    def __enter__(self):
+        self._pila = ExitStack()
+        for alias in connections:
+            self._pila.enter_context(connections[alias].execute_wrapper(self))
+        return self
+
+    def __exit__(self, *exc):
+        self._pila.close()
+        return False
+
+    def resumen(self, maximo_lentas=3):
+        """Total, tiempo en base, huellas repetidas y consultas más lentas"""
+        repetidas = Counter(huella(consulta['sql']) for consulta in self.consultas)
+        lentas = sorted(self.consultas, key=lambda consulta: consulta['duracion_ms'], reverse=True)[:maximo_lentas]
+        return {
+            'consultas': len(self.consultas),
+            'tiempo_db_ms': round(sum(consulta['duracion_ms'] for consulta in self.consultas), 2),
+            'duplicadas': [
+                {'huella': sql, 'veces': veces}
+                for sql, veces in repetidas.most_common() if veces >= UMBRAL_DUPLICADAS
+            ],
+            'mas_lentas': [
+                {'sql': consulta['sql'][:500], 'duracion_ms': round(consulta['duracion_ms'], 2), 'alias': consulta['alias']}
+                for consulta in lentas
+            ],
+        }
+
+
+def presupuesto_de_vista(view_func):
+    return getattr(view_func, 'presupuesto_consultas', None)
+
+
+def afirmar_presupuesto(client, url, maximo=None, metodo='get', **kwargs):
+    """
+    Helper de tests: ejecutar la request y fallar si supera el presupuesto de la
+    vista (o `maximo`), mostrando las consultas repetidas para ubicar el N+1.
+    """
+    from django.urls import resolve
+
+    if maximo is None:
+        maximo = presupuesto_de_vista(resolve(url.split('?')[0]).func)
+        if maximo is None:
+            raise AssertionError(f'La vista de {url} no declara presupuesto_consultas')
+
+    with CapturaConsultas() as captura:
+        response = getattr(client, metodo)(url, **kwargs)
+
+    resumen = captura.resumen()
+    if resumen['consultas'] > maximo:
+        detalle = '\n'.join(f"  {item['veces']}x {item['huella'][:200]}" for item in resumen['duplicadas'])
+        raise AssertionError(
+            f"{url}: {resumen['consultas']} consultas, presupuesto {maximo}"
+            + (f'\nConsultas repetidas:\n{detalle}' if detalle else '')
+        )
+    return response
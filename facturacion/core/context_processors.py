@@ -1,58 +1,57 @@
-from django.db.models import F, Count, Sum
+from django.db.models import Count, Sum
 from django.utils import timezone
 from datetime import datetime, timedelta
 from .models import Producto, Factura, Notificacion, ConfiguracionSistema, PermisoUsuario
 
 
+def contar_alertas():
+    """Contadores de alertas de stock y facturas vencidas según la configuración"""
+    conteos = {'stock_bajo': 0, 'agotados': 0, 'facturas_vencidas': 0}
+    
+    # Stock bajo y agotados en una sola consulta sobre el índice de estado_stock
+    por_estado = Producto.objects.conteo_por_estado()
+    alertas_stock_bajo = ConfiguracionSistema.get_valor('alertas_stock_bajo', 'True')
+    if alertas_stock_bajo.lower() == 'true':
+        conteos['stock_bajo'] = sum(por_estado[estado] for estado in Producto.ESTADOS_STOCK_BAJO)
+    conteos['agotados'] = por_estado['agotado']
+    
+    # Verificar facturas vencidas
+    alertas_facturas_vencidas = ConfiguracionSistema.get_valor('alertas_facturas_vencidas', 'True')
+    if alertas_facturas_vencidas.lower() == 'true':
+        conteos['facturas_vencidas'] = Factura.vencidas().count()
+    
+    conteos['total'] = sum(conteos.values())
+    return conteos
+
+
 def alertas_globales(request):
     """Context processor para alertas globales"""
     if not request.user.is_authenticated:
         return {}
     
+    conteos = contar_alertas()
     alertas = []
     
-    # Verificar stock bajo
-    alertas_stock_bajo = ConfiguracionSistema.get_valor('alertas_stock_bajo', 'True')
-    if alertas_stock_bajo.lower() == 'true':
-        productos_stock_bajo = Producto.objects.filter(
-            activo=True,
-            stock__gt=0,
-            stock__lte=F('stock_minimo')
-        ).count()
-        
-        if productos_stock_bajo > 0:
-            alertas.append({
-                'tipo': 'warning',
-                'mensaje': f'{productos_stock_bajo} producto(s) con stock bajo',
-                'icono': 'bi-exclamation-triangle'
-            })
+    if conteos['stock_bajo'] > 0:
+        alertas.append({
+            'tipo': 'warning',
+            'mensaje': f'{conteos["stock_bajo"]} producto(s) con stock bajo',
+            'icono': 'bi-exclamation-triangle'
+        })
     
-    # Verificar productos agotados
-    productos_agotados = Producto.objects.filter(activo=True, stock=0).count()
-    if productos_agotados > 0:
+    if conteos['agotados'] > 0:
         alertas.append({
             'tipo': 'danger',
-            'mensaje': f'{productos_agotados} producto(s) agotado(s)',
+            'mensaje': f'{conteos["agotados"]} producto(s) agotado(s)',
             'icono': 'bi-x-circle'
         })
     
-    # Verificar facturas vencidas
-    alertas_facturas_vencidas = ConfiguracionSistema.get_valor('alertas_facturas_vencidas', 'True')
-    if alertas_facturas_vencidas.lower() == 'true':
-        dias_vencimiento = int(ConfiguracionSistema.get_valor('dias_factura_vencida', '30'))
-        fecha_limite = timezone.now().date() - timedelta(days=dias_vencimiento)
-        
-        facturas_vencidas = Factura.objects.filter(
-            estado='pendiente',
-            fecha__lt=fecha_limite
-        ).count()
-        
-        if facturas_vencidas > 0:
-            alertas.append({
-                'tipo': 'warning',
-                'mensaje': f'{facturas_vencidas} factura(s) vencida(s)',
-                'icono': 'bi-clock'
-            })
+    if conteos['facturas_vencidas'] > 0:
+        alertas.append({
+            'tipo': 'warning',
+            'mensaje': f'{conteos["facturas_vencidas"]} factura(s) vencida(s)',
+            'icono': 'bi-clock'
+        })
     
     return {'alertas_globales': alertas}
 
@@ -47,3 +47,77 @@ def puede_editar_modulo(modulo):
 def puede_eliminar_modulo(modulo):
     """Decorador para verificar si puede eliminar en un módulo"""
     return requiere_permiso(modulo, 'eliminar')
+
+
+def usar_replica(view_func):
+    """
+    Decorador para vistas de solo lectura (reportes, exportaciones) que pueden
+    leer de la réplica. Si la réplica falla durante la vista, se repite en la principal.
+    """
+    from django.db import OperationalError
+    from .routers import alias_lectura, replica_disponible, marcar_no_disponible
+
+    @wraps(view_func)
+    def _wrapped_view(request, *args, **kwargs):
+        alias = replica_disponible()
+        if alias is None:
+            return view_func(request, *args, **kwargs)
+
+        token = alias_lectura.set(alias)
+        try:
+            response = view_func(request, *args, **kwargs)
+        except OperationalError:
+            marcar_no_disponible()
+            alias_lectura.reset(token)
+            token = None
+            return view_func(request, *args, **kwargs)
+        finally:
+            if token is not None:
+                alias_lectura.reset(token)
+        response['X-Base-Lectura'] = alias
+        return response
+    return _wrapped_view
+
+
+def idempotente(view_func):
+    """
+    Decorador para vistas que registran facturas o pagos por POST. Si el token
+    del formulario ({% token_idempotencia %}) ya se procesó, redirige al
+    resultado original sin ejecutar la vista; los duplicados simultáneos se
+    serializan con un advisory lock sobre el token.
+
+    Solo se recuerda la redirección de una operación registrada: la vista la
+    marca con request.idempotente_ok = True. Las redirecciones por error (sin
+    caja abierta, sin contraparte) no consumen el token, así que el mismo
+    formulario se puede reenviar después de corregir la causa.
+    """
+    from django.http import HttpResponseRedirect
+    from .models import SolicitudIdempotente
+
+    @wraps(view_func)
+    def _wrapped_view(request, *args, **kwargs):
+        clave = request.POST.get('token_idempotencia', '').strip() if request.method == 'POST' else ''
+        if not clave or len(clave) > 64 or not request.user.is_authenticated:
+            return view_func(request, *args, **kwargs)
+
+        def repetido():
+            resultado = SolicitudIdempotente.resultado_previo(clave, request.user)
+            if resultado:
+                messages.info(request, 'Esta operación ya se había registrado; no se volvió a procesar.')
+                return HttpResponseRedirect(resultado)
+
+        # Camino rápido: una consulta por clave primaria, sin bloquear
+        response = repetido()
+        if response:
+            return response
+
+        with SolicitudIdempotente.bloqueo(clave):
+            # Un duplicado que esperó el bloqueo encuentra acá el resultado del primero
+            response = repetido()
+            if response:
+                return response
+            response = view_func(request, *args, **kwargs)
+            if getattr(request, 'idempotente_ok', False) and isinstance(response, HttpResponseRedirect):
+                SolicitudIdempotente.registrar(clave, request.user, view_func.__name__, response.url)
+        return response
+    return _wrapped_view
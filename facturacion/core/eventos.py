@@ -0,0 +1,139 @@
+"""
+Canal de eventos en vivo (notificaciones y contadores de alertas).
+
+Cada proceso ASGI mantiene un hub en memoria con una cola por conexión SSE.
+Los cambios se publican con NOTIFY de Postgres para que lleguen a todos los
+workers; cada proceso escucha el canal en un hilo propio y reparte los eventos
+a sus suscriptores. Con otros motores (SQLite en desarrollo) el hub local hace
+de sustituto y solo reparte dentro del mismo proceso.
+"""
+import asyncio
+import itertools
+import json
+import logging
+import select
+import threading
+import time
+
+from django.db import connection, connections, transaction
+
+logger = logging.getLogger(__name__)
+
+CANAL = 'avicola_eventos'
+TAMANO_COLA = 100
+ESPERA_RECONEXION = 5
+
+
+class HubEventos:
+    """Reparte eventos a las conexiones SSE abiertas en este proceso"""
+
+    def __init__(self):
+        self._suscriptores = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._escucha = None
+
+    def suscribir(self, usuario_id):
+        """Registrar una conexión; devuelve (id, cola). Debe llamarse desde el event loop"""
+        self.iniciar()
+        cola = asyncio.Queue(maxsize=TAMANO_COLA)
+        with self._lock:
+            suscripcion = next(self._ids)
+            self._suscriptores[suscripcion] = (asyncio.get_running_loop(), cola, usuario_id)
+        return suscripcion, cola
+
+    def desuscribir(self, suscripcion):
+        with self._lock:
+            self._suscriptores.pop(suscripcion, None)
+
+    def entregar(self, evento):
+        """Encolar el evento en las conexiones del usuario destino (o en todas si es global)"""
+        destino = evento.get('usuario_id')
+        with self._lock:
+            suscriptores = list(self._suscriptores.values())
+        for loop, cola, usuario_id in suscriptores:
+            if destino is None or destino == usuario_id:
+                loop.call_soon_threadsafe(_encolar, cola, evento)
+
+    def iniciar(self):
+        """Arrancar el hilo LISTEN de Postgres una sola vez por proceso"""
+        if connection.vendor != 'postgresql':
+            return
+        with self._lock:
+            if self._escucha is None or not self._escucha.is_alive():
+                self._escucha = threading.Thread(target=self._escuchar_postgres, name='eventos-listen', daemon=True)
+                self._escucha.start()
+
+    def _escuchar_postgres(self):
+        """Bucle LISTEN con reconexión; no consulta la base mientras no haya avisos"""
+        while True:
+            conexion = None
+            try:
+                db = connections['default']
+                conexion = db.get_new_connection(db.get_connection_params())
+                conexion.autocommit = True
+                with conexion.cursor() as cursor:
+                    cursor.execute(f'LISTEN {CANAL}')
+
+                if hasattr(conexion, 'poll'):
+                    # psycopg2
+                    while True:
+                        if select.select([conexion], [], [], 60) == ([], [], []):
+                            continue
+                        conexion.poll()
+                        while conexion.notifies:
+                            self.entregar(json.loads(conexion.notifies.pop(0).payload))
+                else:
+                    # psycopg 3
+                    for aviso in conexion.notifies():
+                        self.entregar(json.loads(aviso.payload))
+            except Exception:
+                logger.exception('Se perdió la conexión LISTEN de eventos; reintentando')
+                time.sleep(ESPERA_RECONEXION)
+            finally:
+                if conexion is not None:
+                    try:
+                        conexion.close()
+                    except Exception:
+                        pass
+
+
+def _encolar(cola, evento):
+    """Si el cliente no consume, se descarta el evento más antiguo"""
+    if cola.full():
+        cola.get_nowait()
+    cola.put_nowait(evento)
+
+
+hub = HubEventos()
+
+
+def publicar(tipo, datos, usuario_id=None):
+    """
+    Publicar un evento al confirmar la transacción actual.
+    `usuario_id=None` lo envía a todos los usuarios conectados.
+    """
+    evento = {'tipo': tipo, 'datos': datos, 'usuario_id': usuario_id}
+
+    if connection.vendor == 'postgresql':
+        # NOTIFY es transaccional: Postgres lo entrega recién en el COMMIT
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_notify(%s, %s)', [CANAL, json.dumps(evento, default=str)])
+    else:
+        transaction.on_commit(lambda: hub.entregar(evento))
+
+
+def publicar_notificacion(notificacion):
+    """Evento con los datos de una notificación nueva o re-notificada"""
+    publicar('notificacion', {
+        'id': notificacion.id,
+        'mensaje': notificacion.mensaje,
+        'tipo': notificacion.tipo,
+        'fecha': notificacion.fecha.strftime('%d/%m/%Y %H:%M') if notificacion.fecha else '',
+    }, notificacion.usuario_id)
+
+
+def publicar_alertas():
+    """Evento global con los contadores actuales de alertas de stock y facturas"""
+    from .context_processors import contar_alertas
+    publicar('alertas', contar_alertas())
@@ -0,0 +1,306 @@
+"""
+Ingesta en lote de facturas de venta cargadas sin conexión (camiones de reparto).
+
+Cada factura trae una clave de idempotencia generada por el terminal; se guarda
+en Factura.clave_idempotencia (única), así que reenviar un lote ya procesado no
+crea nada y devuelve las facturas existentes.
+
+Formato de cada factura:
+
+    {
+        "clave": "c01-20261019-000123",
+        "fecha": "2026-10-19T10:15:00-03:00",
+        "cliente": "<RUC>",
+        "observacion": "",
+        "detalles": [{"producto": "<código>", "cantidad": 3, "precio_unitario": 12000}],
+        "pagos": [{"tipo": "efectivo", "monto": 36000, "referencia": ""}]
+    }
+
+precio_unitario es opcional (se usa el precio vigente); un precio distinto al del
+catálogo se acepta con una advertencia. Los pagos, si vienen, deben cubrir el
+total (las ventas no admiten pagos parciales).
+
+Las facturas válidas de un lote se registran en una sola transacción con
+bulk_create: facturas, detalles, un registrar_lote de stock, pagos y sus
+asignaciones, saldos de clientes con un UPDATE agrupado y los ingresos de caja.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, models, transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import (
+    Caja, Cliente, DetalleFactura, Factura, MovimientoCaja, MovimientoSaldo, MovimientoStock,
+    Pago, PagoFactura, Producto,
+)
+
+CLAVE_CATALOGO = 'ingesta:catalogo_productos'
+# Reintentos si otro proceso tomó el mismo número (unique_together tipo, numero) o la misma clave
+INTENTOS = 3
+
+
+def catalogo_productos():
+    """{código: (id, precio, iva, activo)} de todos los productos, en caché unos segundos"""
+    catalogo = cache.get(CLAVE_CATALOGO)
+    if catalogo is None:
+        catalogo = {
+            codigo: (pk, precio, iva, activo)
+            for pk, codigo, precio, iva, activo in Producto.objects.values_list('pk', 'codigo', 'precio', 'iva', 'activo')
+        }
+        cache.set(CLAVE_CATALOGO, catalogo, getattr(settings, 'INGESTA_CATALOGO_SEGUNDOS', 60))
+    return catalogo
+
+
+def _entero(valor):
+    if isinstance(valor, bool):
+        raise ValueError
+    return int(valor)
+
+
+def _validar(dato, catalogo, clientes, ahora):
+    """
+    Normaliza una factura del lote. Devuelve (factura, errores, advertencias);
+    factura es None si hay errores.
+    """
+    errores, advertencias = [], []
+
+    fecha = parse_datetime(str(dato.get('fecha') or ''))
+    if fecha is None:
+        errores.append('Fecha inválida')
+    else:
+        if timezone.is_naive(fecha):
+            fecha = timezone.make_aware(fecha)
+        if fecha > ahora:
+            errores.append('La fecha no puede ser futura')
+
+    cliente_id = clientes.get(str(dato.get('cliente') or '').strip())
+    if cliente_id is None:
+        errores.append(f"Cliente desconocido: {dato.get('cliente')}")
+
+    lineas = []
+    detalles = dato.get('detalles') or []
+    if not isinstance(detalles, list):
+        errores.append('Los detalles deben ser una lista')
+        detalles = []
+    for numero, detalle in enumerate(detalles, start=1):
+        if not isinstance(detalle, dict):
+            errores.append(f'Línea {numero}: formato inválido')
+            continue
+        codigo = str(detalle.get('producto') or '').strip()
+        producto = catalogo.get(codigo)
+        if producto is None or not producto[3]:
+            errores.append(f'Línea {numero}: producto desconocido o inactivo: {codigo}')
+            continue
+        producto_id, precio_vigente, iva, _ = producto
+        try:
+            cantidad = _entero(detalle.get('cantidad'))
+            precio = _entero(detalle['precio_unitario']) if detalle.get('precio_unitario') is not None else precio_vigente
+        except (TypeError, ValueError):
+            errores.append(f'Línea {numero}: cantidad o precio inválido')
+            continue
+        if cantidad <= 0 or precio < 0:
+            errores.append(f'Línea {numero}: cantidad o precio inválido')
+            continue
+        if precio != precio_vigente:
+            advertencias.append(f'Línea {numero}: precio de {codigo} Gs. {precio} distinto al vigente Gs. {precio_vigente}')
+        subtotal = cantidad * precio
+        lineas.append({
+            'producto_id': producto_id, 'codigo': codigo, 'cantidad': cantidad, 'precio_unitario': precio,
+            'subtotal': subtotal, 'iva': subtotal // 21 if iva == 5 else subtotal // 11,
+        })
+    if not lineas and not errores:
+        errores.append('La factura debe tener al menos un producto')
+
+    pagos = []
+    tipos_pago = dict(Pago.TIPO_CHOICES)
+    datos_pagos = dato.get('pagos') or []
+    if not isinstance(datos_pagos, list):
+        errores.append('Los pagos deben ser una lista')
+        datos_pagos = []
+    for numero, pago in enumerate(datos_pagos, start=1):
+        if not isinstance(pago, dict):
+            errores.append(f'Pago {numero}: formato inválido')
+            continue
+        try:
+            monto = _entero(pago.get('monto'))
+        except (TypeError, ValueError):
+            monto = 0
+        if monto <= 0 or pago.get('tipo') not in tipos_pago:
+            errores.append(f'Pago {numero}: tipo o monto inválido')
+            continue
+        pagos.append({'tipo': pago['tipo'], 'monto': monto, 'referencia': str(pago.get('referencia') or '')[:50]})
+
+    total = sum(linea['subtotal'] for linea in lineas)
+    pagado = sum(pago['monto'] for pago in pagos)
+    if pagos and pagado != total:
+        errores.append(f'Los pagos (Gs. {pagado}) deben cubrir el total de la factura (Gs. {total})')
+
+    if errores:
+        return None, errores, advertencias
+    return {
+        'fecha': fecha, 'cliente_id': cliente_id, 'observacion': str(dato.get('observacion') or ''),
+        'lineas': lineas, 'pagos': pagos, 'total': total, 'pagado': pagado,
+        'iva': sum(linea['iva'] for linea in lineas),
+    }, errores, advertencias
+
+
+def ingerir_lote(datos, usuario, terminal=''):
+    """
+    Registrar un lote de facturas de venta. Devuelve un resultado por factura, en
+    el mismo orden: {'clave', 'estado' (creada | duplicada | rechazada),
+    'factura_id', 'numero', 'errores', 'advertencias'}.
+    """
+    for intento in range(INTENTOS):
+        try:
+            return _ingerir(datos, usuario, terminal)
+        except IntegrityError:
+            # Un proceso concurrente usó el mismo número o la misma clave: repetir
+            # relee las claves existentes y los números, y las repetidas pasan a duplicadas
+            if intento == INTENTOS - 1:
+                raise
+
+
+def _ingerir(datos, usuario, terminal):
+    ahora = timezone.now()
+    resultados = [
+        {'clave': str(dato.get('clave') or '').strip()[:64], 'estado': None, 'factura_id': None,
+         'numero': None, 'errores': [], 'advertencias': []}
+        for dato in datos
+    ]
+
+    # Reenvíos: claves ya registradas (en la base o antes en el mismo lote)
+    claves = {resultado['clave'] for resultado in resultados if resultado['clave']}
+    existentes = {
+        clave: (pk, numero)
+        for clave, pk, numero in Factura.objects.filter(clave_idempotencia__in=claves).values_list('clave_idempotencia', 'pk', 'numero')
+    }
+    catalogo = catalogo_productos()
+    rucs = {str(dato.get('cliente') or '').strip() for dato in datos}
+    clientes = dict(Cliente.objects.filter(ruc__in=rucs, activo=True).values_list('ruc', 'pk'))
+
+    validas, vistas = [], {}
+    for dato, resultado in zip(datos, resultados):
+        clave = resultado['clave']
+        if not clave:
+            resultado.update(estado='rechazada', errores=['Falta la clave de idempotencia'])
+        elif clave in existentes:
+            resultado.update(estado='duplicada', factura_id=existentes[clave][0], numero=existentes[clave][1])
+        elif clave in vistas:
+            # Repetida en el lote: sigue la suerte de su primera aparición
+            if vistas[clave]['estado'] == 'rechazada':
+                resultado.update(estado='rechazada', errores=['La primera factura del lote con esta clave fue rechazada'])
+            else:
+                resultado['estado'] = 'duplicada'
+        else:
+            vistas[clave] = resultado
+            factura, errores, advertencias = _validar(dato, catalogo, clientes, ahora)
+            resultado.update(errores=errores, advertencias=advertencias)
+            if factura is None:
+                resultado['estado'] = 'rechazada'
+            else:
+                validas.append((factura, resultado))
+
+    if validas:
+        _registrar(validas, usuario, terminal)
+
+    # Duplicadas dentro del mismo lote: apuntan a la factura de su primera aparición
+    por_clave = {resultado['clave']: resultado for _, resultado in validas}
+    for resultado in resultados:
+        original = por_clave.get(resultado['clave'])
+        if resultado['estado'] == 'duplicada' and resultado['factura_id'] is None and original:
+            resultado.update(factura_id=original['factura_id'], numero=original['numero'])
+    return resultados
+
+
+def _registrar(validas, usuario, terminal):
+    """Escribir las facturas válidas en una transacción con bulk_create"""
+    origen = f'Venta sin conexión ({terminal})' if terminal else 'Venta sin conexión'
+    dias = Factura.dias_vencimiento()
+
+    with transaction.atomic():
+        siguiente = Factura.ultimo_numero('venta') + 1
+        facturas = []
+        for posicion, (dato, resultado) in enumerate(validas):
+            pendiente = dato['total'] - dato['pagado']
+            factura = Factura(
+                tipo='venta',
+                numero=str(siguiente + posicion).zfill(6),
+                fecha=dato['fecha'],
+                cliente_id=dato['cliente_id'],
+                subtotal=dato['total'],
+                iva=dato['iva'],
+                total=dato['total'],
+                estado='pendiente' if pendiente > 0 else 'pagada',
+                monto_pendiente=pendiente,
+                observacion=dato['observacion'] or origen,
+                usuario=usuario,
+                clave_idempotencia=resultado['clave'],
+            )
+            factura.fecha_vencimiento = factura.calcular_vencimiento(dias)
+            facturas.append(factura)
+        Factura.objects.bulk_create(facturas)
+
+        detalles, entradas_stock, pagos, asignaciones = [], [], [], []
+        for factura, (dato, resultado) in zip(facturas, validas):
+            resultado.update(estado='creada', factura_id=factura.pk, numero=factura.numero)
+            for linea in dato['lineas']:
+                detalles.append(DetalleFactura(
+                    factura=factura, producto_id=linea['producto_id'], cantidad=linea['cantidad'],
+                    precio_unitario=linea['precio_unitario'], subtotal=linea['subtotal'],
+                    iva=linea['iva'], total=linea['subtotal'] + linea['iva'],
+                ))
+                entradas_stock.append((
+                    linea['producto_id'], -linea['cantidad'], 'factura_venta', f'Factura #{factura.id}',
+                    f"Venta de {linea['cantidad']} unidades a Gs. {linea['precio_unitario']} c/u ({origen.lower()})",
+                ))
+            for pago in dato['pagos']:
+                pagos.append(Pago(
+                    fecha=dato['fecha'], monto_total=pago['monto'], tipo=pago['tipo'],
+                    referencia=pago['referencia'], usuario=usuario, cliente_id=dato['cliente_id'],
+                    observacion=origen,
+                ))
+                asignaciones.append(PagoFactura(pago=pagos[-1], factura=factura, monto=pago['monto']))
+        DetalleFactura.objects.bulk_create(detalles)
+        Pago.objects.bulk_create(pagos)
+        PagoFactura.objects.bulk_create(asignaciones)
+
+        # Las ventas ya se entregaron: el stock puede quedar negativo hasta el ajuste
+        MovimientoStock.registrar_lote(entradas_stock, usuario)
+
+        # Saldos: cada cliente suma lo que quedó pendiente de sus facturas
+        saldos, movimientos_saldo = {}, []
+        for factura in facturas:
+            saldos[factura.cliente_id] = saldos.get(factura.cliente_id, 0) + factura.monto_pendiente
+            movimientos_saldo.append(MovimientoSaldo(
+                cliente_id=factura.cliente_id, monto=factura.total, origen='factura', factura=factura,
+                usuario=usuario, referencia=f'Factura #{factura.numero}',
+            ))
+        for asignacion in asignaciones:
+            movimientos_saldo.append(MovimientoSaldo(
+                cliente_id=asignacion.factura.cliente_id, monto=-asignacion.monto, origen='pago',
+                factura=asignacion.factura, pago=asignacion.pago, usuario=usuario,
+                referencia=f'Pago #{asignacion.pago.pk} → Factura #{asignacion.factura.numero}',
+            ))
+        saldos = {pk: monto for pk, monto in saldos.items() if monto}
+        if saldos:
+            Cliente.objects.filter(pk__in=saldos).update(saldo=F('saldo') + models.Case(
+                *[models.When(pk=pk, then=models.Value(monto)) for pk, monto in saldos.items()],
+                default=models.Value(0),
+            ))
+        MovimientoSaldo.objects.bulk_create(movimientos_saldo)
+
+        # Cobros: ingresos en la caja abierta del día del usuario, como la señal de PagoFactura
+        caja = Caja.caja_de_usuario(usuario, timezone.localdate())
+        if caja and asignaciones:
+            MovimientoCaja.objects.bulk_create([
+                MovimientoCaja(
+                    caja=caja, tipo='ingreso', categoria='venta', monto=asignacion.monto,
+                    descripcion=f'Pago factura #{asignacion.factura.numero} ({origen.lower()})'[:200],
+                    referencia=f'Factura #{asignacion.factura.numero}', usuario=usuario,
+                    observacion='Pago registrado por la ingesta de facturas',
+                )
+                for asignacion in asignaciones
+            ])
+            caja.acumular_saldo_final(sum(asignacion.monto for asignacion in asignaciones))
@@ -0,0 +1,50 @@
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core.respaldo import crear_respaldo
+
+
+class Command(BaseCommand):
+    help = 'Genera un respaldo local comprimido (COPY por tabla y trozos) con manifiesto'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--directorio',
+            default=str(Path(settings.BASE_DIR) / 'respaldos'),
+            help='Carpeta donde se guardan los respaldos (por defecto ./respaldos)',
+        )
+        parser.add_argument(
+            '--conservar',
+            type=int,
+            default=7,
+            help='Cantidad de respaldos a conservar; los más antiguos se borran (0 = todos)',
+        )
+
+    def handle(self, *args, **options):
+        directorio = Path(options['directorio'])
+        directorio.mkdir(parents=True, exist_ok=True)
+        ruta = directorio / f'respaldo_{time.strftime("%Y%m%d_%H%M%S")}.zip'
+        temporal = ruta.with_suffix('.zip.tmp')
+
+        self.stdout.write(self.style.WARNING(f'Generando respaldo en {ruta}...'))
+        inicio = time.monotonic()
+        try:
+            manifiesto = crear_respaldo(temporal, log=self.stdout.write)
+        except Exception:
+            temporal.unlink(missing_ok=True)
+            raise
+        # Solo aparece con su nombre final cuando está completo
+        temporal.rename(ruta)
+
+        if options['conservar']:
+            for viejo in sorted(directorio.glob('respaldo_*.zip'))[:-options['conservar']]:
+                viejo.unlink()
+
+        filas = sum(tabla['filas'] for tabla in manifiesto['tablas'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Respaldo completado en {time.monotonic() - inicio:.1f} s: {filas} filas, '
+            f'{ruta.stat().st_size / 1024 / 1024:.1f} MB'
+        ))
@@ -1,42 +1,71 @@
-from django.core.management.base import BaseCommand
-from django.core.management import call_command
-import tempfile
-import os
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core.models import MarcaReplicacion
+from core.replicacion import Replicador, TAMANO_LOTE
 
 
 class Command(BaseCommand):
-    help = "Copia todos los datos de la base local (default) a Supabase (supabase)."
+    help = "Replica de forma incremental los cambios de la base local (default) a Supabase (supabase)."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--destino',
+            default='supabase',
+            help="Alias de la base destino en DATABASES (por defecto 'supabase')",
+        )
+        parser.add_argument(
+            '--hilos',
+            type=int,
+            default=4,
+            help='Tablas que se copian en paralelo dentro de cada nivel de dependencias (por defecto 4)',
+        )
+        parser.add_argument(
+            '--lote',
+            type=int,
+            default=TAMANO_LOTE,
+            help=f'Filas por lote enviado (por defecto {TAMANO_LOTE})',
+        )
+        parser.add_argument(
+            '--sin-verificar',
+            action='store_true',
+            help='No comparar conteos y checksums por bloque al terminar',
+        )
+        parser.add_argument(
+            '--completa',
+            action='store_true',
+            help='Descartar las marcas de agua y volver a enviar todas las filas',
+        )
 
     def handle(self, *args, **options):
+        destino = options['destino']
+        if destino not in settings.DATABASES or destino == 'default':
+            raise CommandError(f"'{destino}' no es una base destino válida")
+
+        if options['completa']:
+            MarcaReplicacion.objects.filter(destino=destino).delete()
+
         self.stdout.write(self.style.WARNING(
-            "Iniciando backup: copiando datos de 'default' a 'supabase'..."
+            f"Iniciando replicación incremental de 'default' a '{destino}'..."
         ))
+        inicio = time.monotonic()
+
+        replicador = Replicador(
+            destino,
+            hilos=options['hilos'],
+            lote=options['lote'],
+            verificar=not options['sin_verificar'],
+            log=self.stdout.write,
+        )
+        marcas = replicador.ejecutar()
 
-        # 1) Volcar datos de la BD local (default) a un archivo JSON temporal (UTF-8)
-        with tempfile.NamedTemporaryFile(
-            mode="w+", suffix=".json", encoding="utf-8", delete=False
-        ) as tmp_file:
-            tmp_name = tmp_file.name
-            self.stdout.write(f"Generando dump temporal: {tmp_name}")
-
-            call_command(
-                "dumpdata",
-                database="default",
-                natural_foreign=True,
-                natural_primary=True,
-                exclude=["contenttypes", "auth.Permission"],
-                stdout=tmp_file,
-            )
-
-        # 2) Cargar ese JSON en la BD supabase
-        try:
-            self.stdout.write("Cargando datos en base 'supabase' (esto puede tardar)...")
-            call_command("loaddata", tmp_name, database="supabase")
-        finally:
-            # 3) Borrar archivo temporal
-            if os.path.exists(tmp_name):
-                os.remove(tmp_name)
+        diferencias = [marca.tabla for marca in marcas if not marca.verificada]
+        duracion = time.monotonic() - inicio
+        if diferencias:
+            raise CommandError(f"Replicación con diferencias de conteo en: {', '.join(diferencias)}")
 
         self.stdout.write(self.style.SUCCESS(
-            "Backup completado: datos sincronizados de 'default' a 'supabase'."
+            f"Replicación completada en {duracion:.1f} s: '{destino}' sincronizada con 'default'."
         ))
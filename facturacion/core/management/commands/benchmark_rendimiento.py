@@ -0,0 +1,306 @@
+import json
+import logging
+import os
+import platform
+import re
+import statistics
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import setup_test_environment
+from django.urls import reverse
+from django.utils import timezone
+
+from core.consultas import CapturaConsultas
+from core.models import Producto, Cliente, Proveedor, Factura
+
+# Nombres de URL de las vistas de lectura que se miden
+VISTAS = [
+    'dashboard',
+    'reportes_dashboard',
+    'reporte_ventas_detallado',
+    'reporte_productos_analisis',
+    'reporte_clientes_proveedores',
+    'reporte_pagos_proveedores',
+    'reporte_flujo_caja',
+    'reporte_rentabilidad_productos',
+    'reporte_tendencias_ventas',
+    'reporte_analisis_clientes',
+    'reporte_eficiencia_operativa',
+    'reporte_antiguedad_saldos',
+    'exportar_flujo_caja_excel',
+    'exportar_antiguedad_saldos_excel',
+    'exportar_facturas_excel',
+    'exportar_productos_excel',
+    'exportar_proveedores_excel',
+    'exportar_detalles_facturas_excel',
+]
+
+
+# Arranque de un worker: settings, apps, middleware y URLconf, sin atender requests
+SCRIPT_ARRANQUE = (
+    'from config.wsgi import application\n'
+    'from django.urls import get_resolver\n'
+    'get_resolver().url_patterns\n'
+    'import resource, sys\n'
+    'print(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, file=sys.stderr)\n'
+)
+
+# Dependencias que no deberían cargarse al arrancar
+DEPENDENCIAS_PESADAS = ['openpyxl', 'xlsxwriter', 'reportlab']
+
+LINEA_IMPORTTIME = re.compile(r'^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|\s*(\S+)')
+
+
+def percentil(valores, p):
+    ordenados = sorted(valores)
+    indice = min(len(ordenados) - 1, max(0, round(p / 100 * len(ordenados)) - 1))
+    return ordenados[indice]
+
+
+class Command(BaseCommand):
+    help = 'Mide tiempos y consultas del dashboard, los reportes, las exportaciones y la carga de facturas, y el tiempo de arranque'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeticiones', type=int, default=5, help='Mediciones por vista (por defecto 5)')
+        parser.add_argument('--calentamiento', type=int, default=1, help='Requests previas que no se miden (por defecto 1)')
+        parser.add_argument('--vista', action='append', dest='vistas', help='Medir solo estas vistas (repetible)')
+        parser.add_argument('--sin-facturas', action='store_true', help='No medir la carga de facturas')
+        parser.add_argument('--sin-arranque', action='store_true', help='No medir el tiempo de importación al arrancar')
+        parser.add_argument('--usuario', help='Usuario con el que se ejecutan las requests (por defecto el primer superusuario)')
+        parser.add_argument('--salida', help='Archivo JSON de resultados')
+        parser.add_argument('--comparar', help='JSON de una corrida anterior para detectar regresiones')
+        parser.add_argument('--tolerancia', type=float, default=20.0, help='Porcentaje de aumento de la mediana tolerado (por defecto 20)')
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        # El detalle por request ya queda en el informe
+        logging.getLogger('core.consultas').setLevel(logging.ERROR)
+        logging.getLogger('django.request').setLevel(logging.CRITICAL)
+        usuario = self.obtener_usuario(options['usuario'])
+        # Un error en una vista queda registrado como estado 500 en vez de cortar la corrida
+        self.client = Client(raise_request_exception=False)
+        self.client.force_login(usuario)
+
+        vistas = options['vistas'] or VISTAS
+        desconocidas = set(vistas) - set(VISTAS) - {'factura_crear'}
+        if desconocidas:
+            raise CommandError(f'Vistas desconocidas: {", ".join(sorted(desconocidas))}')
+
+        resultados = {}
+        for nombre in vistas:
+            if nombre == 'factura_crear':
+                continue
+            url = reverse(nombre)
+            resultados[nombre] = self.medir(lambda url=url: self.client.get(url), options)
+            self.mostrar(nombre, resultados[nombre])
+
+        if not options['sin_facturas'] and (not options['vistas'] or 'factura_crear' in vistas):
+            for tipo in ('venta', 'compra'):
+                datos = self.datos_factura(tipo)
+                if datos is None:
+                    self.stdout.write(self.style.WARNING(f'Sin datos para medir facturas de {tipo}'))
+                    continue
+                nombre = f'factura_crear_{tipo}'
+                resultados[nombre] = self.medir(lambda datos=datos: self.publicar_factura(datos), options)
+                self.mostrar(nombre, resultados[nombre])
+
+        arranque = None
+        if not options['sin_arranque']:
+            arranque = self.medir_arranque(options['repeticiones'])
+            self.stdout.write(
+                f"{'arranque':35} importación {arranque['importacion_ms']:8.1f} ms  "
+                f"total {arranque['total_ms']:8.1f} ms  RSS {arranque['rss_kb'] // 1024} MB  "
+                f"pesadas cargadas: {', '.join(arranque['pesadas_cargadas']) or 'ninguna'}"
+            )
+
+        informe = {
+            'fecha': timezone.now().isoformat(),
+            'base': connection.vendor,
+            'debug': settings.DEBUG,
+            'python': platform.python_version(),
+            'repeticiones': options['repeticiones'],
+            'volumen': {
+                'productos': Producto.objects.count(),
+                'clientes': Cliente.objects.count(),
+                'proveedores': Proveedor.objects.count(),
+                'facturas': Factura.objects.count(),
+            },
+            'arranque': arranque,
+            'resultados': resultados,
+        }
+
+        if options['salida']:
+            with open(options['salida'], 'w', encoding='utf-8') as archivo:
+                json.dump(informe, archivo, indent=2, ensure_ascii=False)
+            self.stdout.write(self.style.SUCCESS(f'Resultados guardados en {options["salida"]}'))
+
+        if options['comparar']:
+            regresiones = self.comparar(resultados, arranque, options['comparar'], options['tolerancia'])
+            if regresiones:
+                raise CommandError(f'{regresiones} regresiones respecto de {options["comparar"]}')
+            self.stdout.write(self.style.SUCCESS('Sin regresiones'))
+
+    def obtener_usuario(self, username):
+        if username:
+            try:
+                return User.objects.get(username=username)
+            except User.DoesNotExist:
+                raise CommandError(f'No existe el usuario {username}')
+        usuario = User.objects.filter(is_superuser=True, is_active=True).order_by('pk').first()
+        if usuario is None:
+            raise CommandError('Se necesita un superusuario activo (o --usuario)')
+        return usuario
+
+    def medir(self, request, options):
+        for _ in range(options['calentamiento']):
+            request()
+
+        tiempos, consultas, tiempos_db = [], [], []
+        respuesta = None
+        for _ in range(options['repeticiones']):
+            with CapturaConsultas() as captura:
+                inicio = time.perf_counter()
+                respuesta = request()
+                tiempos.append((time.perf_counter() - inicio) * 1000)
+            resumen = captura.resumen()
+            consultas.append(resumen['consultas'])
+            tiempos_db.append(resumen['tiempo_db_ms'])
+
+        contenido = b'' if respuesta.streaming else respuesta.content
+        return {
+            'estado': respuesta.status_code,
+            'bytes': len(contenido),
+            'min_ms': round(min(tiempos), 2),
+            'mediana_ms': round(statistics.median(tiempos), 2),
+            'p95_ms': round(percentil(tiempos, 95), 2),
+            'max_ms': round(max(tiempos), 2),
+            'consultas': max(consultas),
+            'tiempo_db_ms': round(statistics.median(tiempos_db), 2),
+        }
+
+    def medir_arranque(self, repeticiones):
+        """
+        Importar el proyecto en un proceso nuevo con `python -X importtime` y
+        quedarse con la corrida de menor tiempo total.
+        """
+        entorno = {**os.environ, 'PYTHONDONTWRITEBYTECODE': '1'}
+        mejor = None
+        for _ in range(max(1, repeticiones)):
+            inicio = time.perf_counter()
+            proceso = subprocess.run(
+                [sys.executable, '-X', 'importtime', '-c', SCRIPT_ARRANQUE],
+                cwd=settings.BASE_DIR, env=entorno, capture_output=True, text=True,
+            )
+            total_ms = (time.perf_counter() - inicio) * 1000
+            if proceso.returncode != 0:
+                raise CommandError(f'Falló la importación del proyecto:\n{proceso.stderr[-2000:]}')
+
+            modulos, rss_kb = [], 0
+            for linea in proceso.stderr.splitlines():
+                coincidencia = LINEA_IMPORTTIME.match(linea)
+                if coincidencia:
+                    propio, acumulado, modulo = coincidencia.groups()
+                    modulos.append((modulo, int(propio), int(acumulado)))
+                elif linea.strip().isdigit():
+                    rss_kb = int(linea.strip())
+
+            if mejor is None or total_ms < mejor['total_ms']:
+                por_paquete = {}
+                for modulo, propio, _ in modulos:
+                    paquete = modulo.split('.')[0]
+                    por_paquete[paquete] = por_paquete.get(paquete, 0) + propio
+                mejor = {
+                    'total_ms': round(total_ms, 2),
+                    'importacion_ms': round(sum(m[1] for m in modulos) / 1000, 2),
+                    'modulos': len(modulos),
+                    'rss_kb': rss_kb,
+                    'pesadas_cargadas': [nombre for nombre in DEPENDENCIAS_PESADAS if nombre in por_paquete],
+                    # Tiempo propio sumado por paquete raíz (django, core, openpyxl, ...)
+                    'por_paquete': [
+                        {'paquete': paquete, 'ms': round(propio / 1000, 2)}
+                        for paquete, propio in sorted(por_paquete.items(), key=lambda p: p[1], reverse=True)[:15]
+                    ],
+                    'core': sorted(
+                        ({'modulo': modulo, 'acumulado_ms': round(acumulado / 1000, 2)}
+                         for modulo, _, acumulado in modulos if modulo.startswith(('core', 'config'))),
+                        key=lambda m: m['acumulado_ms'], reverse=True,
+                    )[:15],
+                }
+        return mejor
+
+    def datos_factura(self, tipo):
+        contraparte = (Cliente if tipo == 'venta' else Proveedor).objects.filter(activo=True).order_by('pk').first()
+        productos = list(Producto.objects.filter(activo=True, stock__gte=10).order_by('pk')[:3])
+        if contraparte is None or not productos:
+            return None
+        datos = {
+            'tipo': tipo,
+            'fecha': timezone.localtime().strftime('%Y-%m-%dT%H:%M'),
+            'cliente' if tipo == 'venta' else 'proveedor': contraparte.pk,
+            'observacion': 'benchmark',
+        }
+        for i, producto in enumerate(productos):
+            datos[f'detalles-{i}-producto'] = producto.pk
+            datos[f'detalles-{i}-cantidad'] = 1
+            datos[f'detalles-{i}-precio_unitario'] = producto.precio if tipo == 'venta' else producto.costo or 1
+        return datos
+
+    def publicar_factura(self, datos):
+        # Se revierte cada factura para que las mediciones no alteren los datos
+        with transaction.atomic():
+            respuesta = self.client.post(reverse('factura_crear'), datos)
+            transaction.set_rollback(True)
+        return respuesta
+
+    def mostrar(self, nombre, resultado):
+        estilo = self.style.SUCCESS if resultado['estado'] < 400 else self.style.ERROR
+        self.stdout.write(estilo(
+            f"{nombre:35} {resultado['estado']}  mediana {resultado['mediana_ms']:8.1f} ms  "
+            f"p95 {resultado['p95_ms']:8.1f} ms  {resultado['consultas']:4} consultas  {resultado['bytes']:>9} bytes"
+        ))
+
+    def comparar(self, resultados, arranque, ruta, tolerancia):
+        try:
+            with open(ruta, encoding='utf-8') as archivo:
+                informe_anterior = json.load(archivo)
+            anteriores = informe_anterior['resultados']
+        except (OSError, ValueError, KeyError) as e:
+            raise CommandError(f'No se pudo leer {ruta}: {e}')
+
+        regresiones = 0
+        arranque_anterior = informe_anterior.get('arranque')
+        if arranque and arranque_anterior:
+            limite = arranque_anterior['importacion_ms'] * (1 + tolerancia / 100)
+            if arranque['importacion_ms'] > limite:
+                regresiones += 1
+                self.stdout.write(self.style.ERROR(
+                    f"arranque: importación {arranque['importacion_ms']} ms (antes {arranque_anterior['importacion_ms']} ms)"
+                ))
+            nuevas = set(arranque['pesadas_cargadas']) - set(arranque_anterior['pesadas_cargadas'])
+            if nuevas:
+                regresiones += 1
+                self.stdout.write(self.style.ERROR(f"arranque: ahora carga {', '.join(sorted(nuevas))}"))
+
+        for nombre, actual in resultados.items():
+            anterior = anteriores.get(nombre)
+            if not anterior:
+                continue
+            limite = anterior['mediana_ms'] * (1 + tolerancia / 100)
+            if actual['mediana_ms'] > limite:
+                regresiones += 1
+                self.stdout.write(self.style.ERROR(
+                    f"{nombre}: mediana {actual['mediana_ms']} ms (antes {anterior['mediana_ms']} ms)"
+                ))
+            if actual['consultas'] > anterior['consultas']:
+                regresiones += 1
+                self.stdout.write(self.style.ERROR(
+                    f"{nombre}: {actual['consultas']} consultas (antes {anterior['consultas']})"
+                ))
+        return regresiones
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+from core.models import Notificacion
+
+
+class Command(BaseCommand):
+    help = 'Depura notificaciones antiguas y colapsa duplicados'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dias-leidas',
+            type=int,
+            default=30,
+            help='Días que se conservan las notificaciones ya leídas (por defecto 30)',
+        )
+        parser.add_argument(
+            '--dias-retencion',
+            type=int,
+            default=90,
+            help='Días máximos de retención de cualquier notificación (por defecto 90)',
+        )
+
+    def handle(self, *args, **options):
+        resultado = Notificacion.compactar(
+            dias_leidas=options['dias_leidas'],
+            dias_retencion=options['dias_retencion'],
+        )
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Notificaciones eliminadas: {resultado['leidas']} leídas, "
+                f"{resultado['antiguas']} fuera de retención, {resultado['duplicadas']} duplicadas"
+            )
+        )
@@ -0,0 +1,309 @@
+import random
+import re
+from contextlib import contextmanager
+from datetime import datetime, time, timedelta
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from core.models import (
+    Producto, Cliente, Proveedor, Factura, DetalleFactura, Pago, PagoFactura,
+    Caja, Denominacion, MovimientoCaja, Gasto, MovimientoStock,
+)
+
+
+# (nombre, costo, precio, iva)
+PRODUCTOS_BASE = [
+    ('Pollo entero', 14000, 18500, 5),
+    ('Pechuga de pollo kg', 22000, 29000, 5),
+    ('Muslo de pollo kg', 15000, 19500, 5),
+    ('Alitas de pollo kg', 12000, 16000, 5),
+    ('Menudencias kg', 6000, 9000, 5),
+    ('Huevos maple x30', 21000, 27000, 5),
+    ('Huevos docena', 9000, 12000, 5),
+    ('Pollito BB', 4500, 6500, 10),
+    ('Balanceado inicial 40kg', 140000, 175000, 10),
+    ('Balanceado engorde 40kg', 130000, 165000, 10),
+    ('Balanceado ponedora 40kg', 125000, 158000, 10),
+    ('Maíz molido 50kg', 90000, 115000, 10),
+    ('Vacuna Newcastle', 35000, 48000, 10),
+    ('Bebedero automático', 45000, 65000, 10),
+    ('Comedero tolva', 55000, 78000, 10),
+]
+
+CATEGORIAS_GASTO = ['combustible', 'mantenimiento', 'servicios', 'alimentacion', 'transporte', 'limpieza', 'otro']
+NOMBRES = ['Juan', 'María', 'Carlos', 'Ana', 'Luis', 'Rosa', 'Pedro', 'Lucía', 'Jorge', 'Carmen', 'Miguel', 'Elena']
+APELLIDOS = ['González', 'Benítez', 'Martínez', 'López', 'Giménez', 'Vera', 'Duarte', 'Ramírez', 'Acosta', 'Rojas']
+
+
+@contextmanager
+def fechas_manuales(*modelos):
+    """
+    Desactivar auto_now/auto_now_add para poder cargar fechas históricas.
+    fecha_actualizacion (ActualizacionMixin) queda automática: es cuándo se
+    escribió la fila, la marca que usa la replicación incremental.
+    """
+    campos = [
+        campo for modelo in modelos for campo in modelo._meta.concrete_fields
+        if (getattr(campo, 'auto_now', False) or getattr(campo, 'auto_now_add', False))
+        and campo.name != 'fecha_actualizacion'
+    ]
+    originales = [(campo, campo.auto_now, campo.auto_now_add) for campo in campos]
+    for campo in campos:
+        campo.auto_now = campo.auto_now_add = False
+    try:
+        yield
+    finally:
+        for campo, auto_now, auto_now_add in originales:
+            campo.auto_now, campo.auto_now_add = auto_now, auto_now_add
+
+
+class Command(BaseCommand):
+    help = 'Genera datos de prueba realistas y reproducibles (productos, facturas, pagos, caja, stock) con bulk_create'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--semilla', type=int, default=42, help='Semilla del generador (por defecto 42)')
+        parser.add_argument('--dias', type=int, default=365, help='Días de historia hasta hoy (por defecto 365)')
+        parser.add_argument('--productos', type=int, default=60, help='Cantidad de productos (por defecto 60)')
+        parser.add_argument('--clientes', type=int, default=300, help='Cantidad de clientes (por defecto 300)')
+        parser.add_argument('--proveedores', type=int, default=30, help='Cantidad de proveedores (por defecto 30)')
+        parser.add_argument('--ventas-dia', type=int, default=40, help='Facturas de venta promedio por día (por defecto 40)')
+        parser.add_argument('--compras-dia', type=int, default=4, help='Facturas de compra promedio por día (por defecto 4)')
+        parser.add_argument('--lote', type=int, default=2000, help='Tamaño de lote de bulk_create (por defecto 2000)')
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['semilla'])
+        self.lote = options['lote']
+        self.usuario, _ = User.objects.get_or_create(username='datos_prueba', defaults={'first_name': 'Datos', 'last_name': 'Prueba'})
+        self.prefijo = f"G{options['semilla']}"
+
+        with fechas_manuales(Producto, Cliente, Proveedor, Factura, PagoFactura, MovimientoStock, MovimientoCaja, Gasto, Caja):
+            self.crear_maestros(options)
+            hoy = timezone.localdate()
+            dias = [hoy - timedelta(days=n) for n in range(options['dias'] - 1, -1, -1)]
+            # Un mes por transacción para no retener todo en memoria
+            for inicio in range(0, len(dias), 30):
+                with transaction.atomic():
+                    self.generar_periodo(dias[inicio:inicio + 30], options, hoy)
+                self.stdout.write(f'  {dias[min(inicio + 29, len(dias) - 1)]:%d/%m/%Y}: {self.contadores}')
+
+            Producto.objects.bulk_update(
+                [Producto(pk=pk, stock=stock) for pk, stock in self.stock.items()], ['stock'], batch_size=self.lote
+            )
+
+        # Los saldos y costos promedio se derivan de las facturas, pagos y compras generados
+        call_command('recalcular_saldos', stdout=self.stdout)
+        call_command('recalcular_costo_promedio', stdout=self.stdout)
+        self.stdout.write(self.style.SUCCESS(f'Datos de prueba generados: {self.contadores}'))
+
+    # -- maestros -------------------------------------------------------------
+
+    def momento(self, dia, hora_min=7, hora_max=19):
+        momento = timezone.make_aware(datetime.combine(dia, time(self.rng.randint(hora_min, hora_max), self.rng.randint(0, 59))))
+        # Sin movimientos en el futuro: el stock a una fecha se reconstruye desde el stock actual
+        return min(momento, timezone.now())
+
+    def crear_maestros(self, options):
+        inicio = timezone.now() - timedelta(days=options['dias'] + 1)
+        productos = []
+        for n in range(options['productos']):
+            nombre, costo, precio, iva = PRODUCTOS_BASE[n % len(PRODUCTOS_BASE)]
+            variante = n // len(PRODUCTOS_BASE)
+            productos.append(Producto(
+                codigo=f'{self.prefijo}-P{n:05d}',
+                nombre=nombre if not variante else f'{nombre} ({variante + 1})',
+                costo=costo, costo_promedio=costo, precio=precio, iva=iva,
+                stock=0, stock_minimo=self.rng.choice([5, 10, 20, 50]),
+                fecha_creacion=inicio,
+            ))
+        self.productos = Producto.objects.bulk_create(productos, batch_size=self.lote)
+        self.stock = {producto.pk: 0 for producto in self.productos}
+
+        def persona():
+            return f'{self.rng.choice(NOMBRES)} {self.rng.choice(APELLIDOS)}'
+
+        self.clientes = Cliente.objects.bulk_create([
+            Cliente(
+                nombre=persona(), ruc=f'{self.prefijo}-C{n:06d}', telefono=f'0981{self.rng.randint(100000, 999999)}',
+                email=f'cliente{n}@ejemplo.com.py', fecha_creacion=inicio,
+            )
+            for n in range(options['clientes'])
+        ], batch_size=self.lote)
+        self.proveedores = Proveedor.objects.bulk_create([
+            Proveedor(
+                nombre=f'Distribuidora {persona()}', ruc=f'{self.prefijo}-V{n:05d}', direccion='Asunción',
+                telefono=f'021{self.rng.randint(100000, 999999)}', email=f'proveedor{n}@ejemplo.com.py',
+                fecha_creacion=inicio,
+            )
+            for n in range(options['proveedores'])
+        ], batch_size=self.lote)
+
+        self.numeros = {}
+        for tipo in ('venta', 'compra'):
+            ultimo = 0
+            for numero in Factura.objects.filter(tipo=tipo).values_list('numero', flat=True):
+                digitos = re.findall(r'\d+', numero)
+                if digitos:
+                    ultimo = max(ultimo, int(digitos[-1]))
+            self.numeros[tipo] = ultimo
+        self.cajas_existentes = set(Caja.objects.values_list('fecha', flat=True))
+        self.pagos_programados = {}
+        self.contadores = {'facturas': 0, 'detalles': 0, 'pagos': 0, 'movimientos_stock': 0, 'cajas': 0, 'gastos': 0}
+
+    # -- movimiento diario ----------------------------------------------------
+
+    def generar_periodo(self, dias, options, hoy):
+        facturas, lineas = [], []
+        for dia in dias:
+            # Compras primero para que haya stock que vender
+            for _ in range(max(0, int(self.rng.gauss(options['compras_dia'], options['compras_dia'] / 3)))):
+                facturas.append(self.nueva_factura('compra', dia, hoy, lineas))
+            for _ in range(max(0, int(self.rng.gauss(options['ventas_dia'], options['ventas_dia'] / 4)))):
+                facturas.append(self.nueva_factura('venta', dia, hoy, lineas))
+
+        Factura.objects.bulk_create([factura for factura, _ in facturas], batch_size=self.lote)
+
+        detalles, movimientos = [], []
+        for (factura, programacion), (_, items) in zip(facturas, lineas):
+            for producto, cantidad, precio in items:
+                subtotal = cantidad * precio
+                iva = subtotal // 21 if producto.iva == 5 else subtotal // 11
+                detalles.append(DetalleFactura(
+                    factura=factura, producto=producto, cantidad=cantidad,
+                    precio_unitario=precio, iva=iva, subtotal=subtotal, total=subtotal + iva,
+                ))
+                anterior = self.stock[producto.pk]
+                self.stock[producto.pk] = anterior + (cantidad if factura.tipo == 'compra' else -cantidad)
+                movimientos.append(MovimientoStock(
+                    producto=producto,
+                    tipo='entrada' if factura.tipo == 'compra' else 'salida',
+                    origen=f'factura_{factura.tipo}',
+                    cantidad=cantidad, stock_anterior=anterior, stock_nuevo=self.stock[producto.pk],
+                    referencia=f'Factura #{factura.numero}', usuario=self.usuario, fecha=factura.fecha,
+                    costo_unitario=precio if factura.tipo == 'compra' else None,
+                ))
+            if programacion:
+                self.pagos_programados.setdefault(programacion, []).append(factura)
+
+        DetalleFactura.objects.bulk_create(detalles, batch_size=self.lote)
+        MovimientoStock.objects.bulk_create(movimientos, batch_size=self.lote)
+        self.contadores['facturas'] += len(facturas)
+        self.contadores['detalles'] += len(detalles)
+        self.contadores['movimientos_stock'] += len(movimientos)
+
+        for dia in dias:
+            self.generar_caja_y_pagos(dia, hoy)
+
+    def nueva_factura(self, tipo, dia, hoy, lineas):
+        self.numeros[tipo] += 1
+        fecha = self.momento(dia)
+        items = []
+        for producto in self.rng.sample(self.productos, k=min(len(self.productos), self.rng.randint(1, 5))):
+            if tipo == 'compra':
+                items.append((producto, self.rng.randint(20, 200), producto.costo))
+            else:
+                items.append((producto, self.rng.randint(1, 20), producto.precio))
+        subtotal = sum(cantidad * precio for _, cantidad, precio in items)
+        iva = sum(
+            (cantidad * precio) // 21 if producto.iva == 5 else (cantidad * precio) // 11
+            for producto, cantidad, precio in items
+        )
+
+        # La mayoría se cobra/paga entre el mismo día y 45 días después
+        dia_pago = dia + timedelta(days=self.rng.choice([0, 0, 0, 1, 7, 15, 30, 45]))
+        pagada = self.rng.random() < 0.85 and dia_pago <= hoy
+
+        factura = Factura(
+            tipo=tipo,
+            numero=str(self.numeros[tipo]).zfill(6),
+            fecha=fecha,
+            cliente=self.rng.choice(self.clientes) if tipo == 'venta' else None,
+            proveedor=self.rng.choice(self.proveedores) if tipo == 'compra' else None,
+            subtotal=subtotal, iva=iva, total=subtotal,
+            estado='pagada' if pagada else 'pendiente',
+            fecha_vencimiento=dia + timedelta(days=30),
+            monto_pendiente=0 if pagada else subtotal,
+            usuario=self.usuario,
+            fecha_creacion=fecha,
+        )
+        lineas.append((factura, items))
+        return factura, dia_pago if pagada else None
+
+    def generar_caja_y_pagos(self, dia, hoy):
+        facturas = self.pagos_programados.pop(dia, [])
+        pagos = [
+            Pago(
+                fecha=self.momento(dia, 8, 18),
+                monto_total=factura.total,
+                tipo=self.rng.choice(['efectivo', 'efectivo', 'transferencia', 'cheque']),
+                referencia=f'REC-{factura.tipo[0].upper()}{factura.numero}',
+                usuario=self.usuario,
+                cliente=factura.cliente, proveedor=factura.proveedor,
+            )
+            for factura in facturas
+        ]
+        Pago.objects.bulk_create(pagos, batch_size=self.lote)
+        PagoFactura.objects.bulk_create([
+            PagoFactura(pago=pago, factura=factura, monto=factura.total, fecha_asignacion=pago.fecha)
+            for pago, factura in zip(pagos, facturas)
+        ], batch_size=self.lote)
+        self.contadores['pagos'] += len(pagos)
+
+        if dia in self.cajas_existentes:
+            return
+
+        cerrada = dia < hoy
+        caja = Caja(
+            fecha=dia, usuario_apertura=self.usuario,
+            usuario_cierre=self.usuario if cerrada else None,
+            fecha_apertura=self.momento(dia, 6, 7),
+            fecha_cierre=self.momento(dia, 20, 21) if cerrada else None,
+            cerrada=cerrada,
+        )
+        apertura = {100000: 5, 50000: 10, 20000: 20, 10000: 20, 5000: 20, 2000: 25, 1000: 30}
+        caja.saldo_inicial = sum(valor * cantidad for valor, cantidad in apertura.items())
+        caja.save()
+        self.contadores['cajas'] += 1
+
+        movimientos = [
+            MovimientoCaja(
+                caja=caja,
+                tipo='ingreso' if factura.tipo == 'venta' else 'egreso',
+                categoria='venta' if factura.tipo == 'venta' else 'pago_proveedor',
+                monto=pago.monto_total,
+                descripcion=f'Pago factura #{factura.numero}',
+                referencia=f'Factura #{factura.numero}',
+                usuario=self.usuario, fecha=pago.fecha,
+            )
+            for pago, factura in zip(pagos, facturas) if pago.tipo == 'efectivo'
+        ]
+        gastos = [
+            Gasto(
+                caja=caja, categoria=self.rng.choice(CATEGORIAS_GASTO), descripcion='Gasto operativo',
+                monto=self.rng.randrange(10000, 300000, 1000), usuario=self.usuario, fecha=self.momento(dia),
+            )
+            for _ in range(self.rng.randint(0, 3))
+        ]
+        movimientos += [
+            MovimientoCaja(
+                caja=caja, tipo='egreso', categoria='gasto', monto=gasto.monto, descripcion=gasto.descripcion,
+                usuario=self.usuario, fecha=gasto.fecha,
+            )
+            for gasto in gastos
+        ]
+        MovimientoCaja.objects.bulk_create(movimientos, batch_size=self.lote)
+        Gasto.objects.bulk_create(gastos, batch_size=self.lote)
+        self.contadores['gastos'] += len(gastos)
+
+        ingresos = sum(mov.monto for mov in movimientos if mov.tipo == 'ingreso')
+        egresos = sum(mov.monto for mov in movimientos if mov.tipo == 'egreso')
+        caja.saldo_final = caja.saldo_inicial + ingresos - egresos
+        caja.saldo_real = caja.saldo_final if cerrada else 0
+        Caja.objects.filter(pk=caja.pk).update(saldo_inicial=caja.saldo_inicial, saldo_final=caja.saldo_final, saldo_real=caja.saldo_real)
+
+        Denominacion.objects.bulk_create(
+            [Denominacion(caja=caja, valor=valor, cantidad=cantidad, es_cierre=False) for valor, cantidad in apertura.items()]
+        )
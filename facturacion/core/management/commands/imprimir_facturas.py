@@ -0,0 +1,50 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from core.models import Factura
+from core.pdf_facturas import pdf_lote
+
+
+class Command(BaseCommand):
+    help = 'Genera los PDF de las facturas de un período en un ZIP o en un único PDF (reimpresión de fin de mes)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--desde', required=True, help='Fecha inicial (AAAA-MM-DD)')
+        parser.add_argument('--hasta', required=True, help='Fecha final inclusive (AAAA-MM-DD)')
+        parser.add_argument('--tipo', choices=['venta', 'compra'], help='Solo facturas de este tipo')
+        parser.add_argument('--formato', choices=['zip', 'pdf'], default='zip', help='ZIP con un PDF por factura o un único PDF (por defecto zip)')
+        parser.add_argument('--incluir-anuladas', action='store_true', help='Incluir facturas anuladas')
+        parser.add_argument('--procesos', type=int, default=None, help='Procesos para generar los PDF (por defecto uno por CPU)')
+        parser.add_argument('--salida', help='Archivo de salida (por defecto facturas_<desde>_<hasta>.<formato>)')
+
+    def handle(self, *args, **options):
+        desde, hasta = parse_date(options['desde']), parse_date(options['hasta'])
+        if not desde or not hasta:
+            raise CommandError('Las fechas deben tener el formato AAAA-MM-DD')
+        if desde > hasta:
+            raise CommandError('--desde no puede ser posterior a --hasta')
+
+        facturas = Factura.objects.filter(fecha__date__gte=desde, fecha__date__lte=hasta)
+        if options['tipo']:
+            facturas = facturas.filter(tipo=options['tipo'])
+        if not options['incluir_anuladas']:
+            facturas = facturas.exclude(estado='anulada')
+
+        inicio = time.monotonic()
+        contenido, estadisticas = pdf_lote(facturas, formato=options['formato'], procesos=options['procesos'])
+        if not estadisticas['facturas']:
+            self.stdout.write(self.style.WARNING('No hay facturas en el período'))
+            return
+
+        salida = options['salida'] or f"facturas_{desde:%Y%m%d}_{hasta:%Y%m%d}.{options['formato']}"
+        with open(salida, 'wb') as archivo:
+            archivo.write(contenido)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{estadisticas['facturas']} facturas en {os.path.abspath(salida)} "
+            f"({estadisticas['generadas']} generadas, {estadisticas['en_cache']} desde caché, "
+            f"{len(contenido) / 1024:.0f} KB, {time.monotonic() - inicio:.1f} s)"
+        ))
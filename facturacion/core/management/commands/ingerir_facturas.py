@@ -0,0 +1,72 @@
+import json
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from core.ingesta import ingerir_lote
+
+
+class Command(BaseCommand):
+    help = 'Importa facturas de venta cargadas sin conexión desde un archivo JSON o JSONL (los reenvíos no se duplican)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('archivo', help='JSON con {"terminal": ..., "facturas": [...]}, una lista de facturas, o JSONL con una factura por línea')
+        parser.add_argument('--usuario', required=True, help='Usuario al que se atribuyen las facturas')
+        parser.add_argument('--terminal', default='', help='Terminal de origen (si el archivo no lo indica)')
+        parser.add_argument('--lote', type=int, default=None, help='Facturas por transacción (por defecto INGESTA_LOTE_MAXIMO)')
+        parser.add_argument('--detalle', action='store_true', help='Mostrar las facturas rechazadas y las advertencias')
+
+    def handle(self, *args, **options):
+        try:
+            usuario = User.objects.get(username=options['usuario'])
+        except User.DoesNotExist:
+            raise CommandError(f"No existe el usuario {options['usuario']}")
+
+        terminal, facturas = self.leer(options['archivo'])
+        terminal = terminal or options['terminal']
+        lote = options['lote'] or getattr(settings, 'INGESTA_LOTE_MAXIMO', 1000)
+        if lote < 1:
+            raise CommandError('--lote debe ser mayor que cero')
+
+        inicio = time.monotonic()
+        resumen = {'creada': 0, 'duplicada': 0, 'rechazada': 0}
+        for desde in range(0, len(facturas), lote):
+            for resultado in ingerir_lote(facturas[desde:desde + lote], usuario, terminal):
+                resumen[resultado['estado']] += 1
+                if options['detalle']:
+                    for error in resultado['errores']:
+                        self.stdout.write(self.style.ERROR(f"{resultado['clave'] or '(sin clave)'}: {error}"))
+                    for advertencia in resultado['advertencias']:
+                        self.stdout.write(self.style.WARNING(f"{resultado['clave']}: {advertencia}"))
+
+        segundos = time.monotonic() - inicio
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(facturas)} facturas en {segundos:.1f} s: {resumen['creada']} creadas, "
+            f"{resumen['duplicada']} ya registradas, {resumen['rechazada']} rechazadas"
+        ))
+
+    def leer(self, ruta):
+        """(terminal, [facturas]) desde JSON o JSONL"""
+        try:
+            with open(ruta, encoding='utf-8-sig') as archivo:
+                texto = archivo.read()
+        except OSError as e:
+            raise CommandError(f'No se pudo leer {ruta}: {e}')
+
+        try:
+            datos = json.loads(texto)
+        except ValueError:
+            try:
+                datos = [json.loads(linea) for linea in texto.splitlines() if linea.strip()]
+            except ValueError as e:
+                raise CommandError(f'El archivo no es JSON ni JSONL válido: {e}')
+
+        terminal = ''
+        if isinstance(datos, dict):
+            terminal = str(datos.get('terminal') or '')[:50]
+            datos = datos.get('facturas')
+        if not isinstance(datos, list) or not all(isinstance(factura, dict) for factura in datos):
+            raise CommandError('Se esperaba una lista de facturas')
+        return terminal, datos
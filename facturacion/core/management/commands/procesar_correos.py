@@ -0,0 +1,48 @@
+import time
+
+from django.core.management.base import BaseCommand
+from core.models import CorreoSaliente
+
+
+class Command(BaseCommand):
+    help = 'Envía los correos pendientes de la bandeja de salida con una sola conexión SMTP'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--lote',
+            type=int,
+            default=100,
+            help='Cantidad máxima de correos por conexión (por defecto 100)',
+        )
+        parser.add_argument(
+            '--continuo',
+            action='store_true',
+            help='Quedarse ejecutando y revisar la bandeja cada --intervalo segundos',
+        )
+        parser.add_argument(
+            '--intervalo',
+            type=int,
+            default=30,
+            help='Segundos entre revisiones en modo continuo (por defecto 30)',
+        )
+        parser.add_argument(
+            '--forzar-resumen',
+            action='store_true',
+            help='Enviar ya el resumen de alertas sin esperar EMAIL_ALERT_FREQUENCY',
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            enviados, fallidos = CorreoSaliente.enviar_pendientes(
+                limite=options['lote'],
+                forzar_resumen=options['forzar_resumen'],
+            )
+            if enviados or fallidos or not options['continuo']:
+                estilo = self.style.WARNING if fallidos else self.style.SUCCESS
+                self.stdout.write(estilo(f'Correos enviados: {enviados}, con error: {fallidos}'))
+
+            if not options['continuo']:
+                break
+            # Si el lote se llenó puede haber más pendientes: seguir sin esperar
+            if enviados + fallidos < options['lote']:
+                time.sleep(options['intervalo'])
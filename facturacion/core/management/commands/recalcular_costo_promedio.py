@@ -0,0 +1,69 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from core.models import HistorialCosto, MovimientoStock, Producto
+
+
+class Command(BaseCommand):
+    help = 'Reconstruye el costo promedio ponderado y su historial recorriendo las compras en orden'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Solo informar los productos con diferencias, sin reescribir costos ni historial',
+        )
+        parser.add_argument('--lote', type=int, default=2000, help='Filas por lectura y por bulk_create (por defecto 2000)')
+
+    def handle(self, *args, **options):
+        dry_run, lote = options['dry_run'], options['lote']
+
+        with transaction.atomic():
+            # Bloquear los productos: ninguna compra puede cambiar un promedio a mitad del recálculo
+            actuales = dict(Producto.objects.select_for_update().order_by('pk').values_list('pk', 'costo_promedio'))
+            if not dry_run:
+                HistorialCosto.objects.all().delete()
+
+            # Una sola pasada ordenada: cada entrada trae el stock anterior del libro de movimientos
+            entradas = MovimientoStock.objects.filter(
+                tipo='entrada', costo_unitario__isnull=False
+            ).order_by('producto_id', 'fecha', 'id').only(
+                'producto_id', 'fecha', 'cantidad', 'stock_anterior', 'costo_unitario'
+            ).iterator(chunk_size=lote)
+
+            promedios, cambios, total = {}, [], 0
+            for movimiento in entradas:
+                # El stock anterior a la primera compra registrada se valúa al costo de esa compra
+                anterior = promedios.get(movimiento.producto_id, movimiento.costo_unitario)
+                cambio = HistorialCosto.desde_movimiento(movimiento, anterior)
+                promedios[movimiento.producto_id] = cambio.costo_promedio
+                cambios.append(cambio)
+                total += 1
+                if len(cambios) >= lote and not dry_run:
+                    HistorialCosto.objects.bulk_create(cambios)
+                    cambios = []
+            if cambios and not dry_run:
+                HistorialCosto.objects.bulk_create(cambios)
+
+            diferencias = {
+                pk: costo for pk, costo in promedios.items()
+                if pk in actuales and actuales[pk] != costo
+            }
+            nombres = dict(Producto.objects.filter(pk__in=diferencias).values_list('pk', 'nombre'))
+            for pk, costo in diferencias.items():
+                self.stdout.write(f'{nombres[pk]}: Gs. {actuales[pk]:,} → Gs. {costo:,}')
+
+            if diferencias and not dry_run:
+                Producto.objects.bulk_update(
+                    [Producto(pk=pk, costo_promedio=costo) for pk, costo in diferencias.items()],
+                    ['costo_promedio'], batch_size=lote,
+                )
+
+        if dry_run:
+            self.stdout.write(self.style.WARNING(
+                f'{total} compras recorridas, {len(diferencias)} costos con diferencias (sin cambios por --dry-run)'
+            ))
+        else:
+            self.stdout.write(self.style.SUCCESS(
+                f'{total} compras recorridas, historial reconstruido, {len(diferencias)} costos corregidos'
+            ))
@@ -0,0 +1,74 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from core.models import Cliente, Proveedor, Factura, PagoFactura, MovimientoSaldo
+
+
+class Command(BaseCommand):
+    help = 'Recalcula los saldos de clientes y proveedores a partir de facturas y pagos'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Solo informar las diferencias, sin corregir los saldos',
+        )
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        total_diferencias = 0
+
+        for modelo, campo, tipo in [(Cliente, 'cliente', 'venta'), (Proveedor, 'proveedor', 'compra')]:
+            total_diferencias += self.recalcular(modelo, campo, tipo, dry_run)
+
+        if not total_diferencias:
+            self.stdout.write(self.style.SUCCESS('Todos los saldos coinciden con facturas y pagos'))
+        elif dry_run:
+            self.stdout.write(self.style.WARNING(f'{total_diferencias} saldos con diferencias (sin cambios por --dry-run)'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'{total_diferencias} saldos corregidos'))
+
+    def saldo_esperado(self, campo, tipo):
+        """Expresión del saldo según facturas no anuladas menos pagos asignados"""
+        facturas = Factura.objects.filter(
+            **{campo: OuterRef('pk')}, tipo=tipo
+        ).exclude(estado='anulada').order_by().values(campo).annotate(total=Sum('total')).values('total')
+
+        pagos = PagoFactura.objects.filter(
+            **{f'factura__{campo}': OuterRef('pk')}, factura__tipo=tipo
+        ).exclude(factura__estado='anulada').order_by().values(f'factura__{campo}').annotate(total=Sum('monto')).values('total')
+
+        return Coalesce(Subquery(facturas), Value(0)) - Coalesce(Subquery(pagos), Value(0))
+
+    def recalcular(self, modelo, campo, tipo, dry_run):
+        """Compara y corrige los saldos de un modelo en una sola pasada"""
+        with transaction.atomic():
+            diferencias = list(
+                modelo.objects.select_for_update()
+                .annotate(esperado=self.saldo_esperado(campo, tipo))
+                .exclude(saldo=F('esperado'))
+                .values('pk', 'nombre', 'saldo', 'esperado')
+            )
+
+            for fila in diferencias:
+                self.stdout.write(
+                    f"{modelo._meta.verbose_name} {fila['nombre']}: "
+                    f"saldo Gs. {fila['saldo']:,} → esperado Gs. {fila['esperado']:,} "
+                    f"(diferencia {fila['esperado'] - fila['saldo']:+,})"
+                )
+
+            if diferencias and not dry_run:
+                ids = [fila['pk'] for fila in diferencias]
+                modelo.objects.filter(pk__in=ids).update(saldo=self.saldo_esperado(campo, tipo))
+                MovimientoSaldo.objects.bulk_create([
+                    MovimientoSaldo(
+                        **{campo + '_id': fila['pk']},
+                        monto=fila['esperado'] - fila['saldo'],
+                        origen='recalculo',
+                        referencia='Recálculo de saldos'
+                    )
+                    for fila in diferencias
+                ])
+
+        return len(diferencias)
@@ -0,0 +1,145 @@
+import os
+import socket
+import threading
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections, connections
+from django.utils import timezone
+
+from core.models import BloqueoPlanificador, EjecucionTarea
+from core.planificador import TAREAS
+
+
+BLOQUEO = 'run_scheduler'
+
+
+class Command(BaseCommand):
+    help = 'Ejecuta las tareas periódicas (alertas, correos, saldos, depuración, backups) con un solo líder entre servidores'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--intervalo',
+            type=int,
+            default=30,
+            help='Segundos entre revisiones de tareas vencidas (por defecto 30)',
+        )
+        parser.add_argument(
+            '--una-vez',
+            action='store_true',
+            help='Ejecutar las tareas vencidas una sola vez y salir',
+        )
+        parser.add_argument(
+            '--tarea',
+            action='append',
+            choices=sorted(TAREAS),
+            help='Forzar la ejecución inmediata de una tarea (se puede repetir) y salir',
+        )
+        parser.add_argument(
+            '--listar',
+            action='store_true',
+            help='Mostrar las tareas registradas con su última ejecución',
+        )
+
+    def handle(self, *args, **options):
+        if options['listar']:
+            return self.listar()
+
+        servidor = f'{socket.gethostname()}:{os.getpid()}'
+        intervalo = options['intervalo']
+        # El lease dura varias revisiones para tolerar una tarea lenta
+        duracion_bloqueo = timedelta(seconds=max(intervalo * 3, 90))
+
+        if options['tarea']:
+            if not BloqueoPlanificador.adquirir(BLOQUEO, servidor, duracion_bloqueo):
+                raise CommandError('Otro servidor está ejecutando el planificador')
+            try:
+                for nombre in options['tarea']:
+                    if not self.ejecutar(TAREAS[nombre], servidor, duracion_bloqueo):
+                        raise CommandError('Se perdió el bloqueo del planificador: otro servidor tomó el liderazgo')
+            finally:
+                BloqueoPlanificador.liberar(BLOQUEO, servidor)
+            return
+
+        self.stdout.write(f'Planificador iniciado en {servidor} ({len(TAREAS)} tareas registradas)')
+        lider = False
+        try:
+            while True:
+                close_old_connections()
+                es_lider = BloqueoPlanificador.adquirir(BLOQUEO, servidor, duracion_bloqueo)
+                if es_lider != lider:
+                    lider = es_lider
+                    self.stdout.write('Este servidor es el líder' if lider else 'En espera: otro servidor es el líder')
+
+                if lider:
+                    ahora = timezone.now()
+                    ultimas = EjecucionTarea.ultimas_ejecuciones()
+                    for tarea in TAREAS.values():
+                        if not tarea.vencida(ultimas.get(tarea.nombre), ahora):
+                            continue
+                        # Si el lease venció durante la tarea otro servidor puede ser líder:
+                        # no seguir ejecutando tareas hasta volver a adquirirlo
+                        if not self.ejecutar(tarea, servidor, duracion_bloqueo) or \
+                                not BloqueoPlanificador.adquirir(BLOQUEO, servidor, duracion_bloqueo):
+                            lider = False
+                            self.stdout.write(self.style.WARNING('Se perdió el liderazgo; en espera'))
+                            break
+
+                if options['una_vez']:
+                    break
+                time.sleep(intervalo)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            if lider:
+                BloqueoPlanificador.liberar(BLOQUEO, servidor)
+
+    @contextmanager
+    def latido(self, servidor, duracion_bloqueo):
+        """
+        Renovar el lease desde un hilo mientras corre una tarea (backups y
+        verificaciones pueden durar más que el lease). Devuelve un Event que
+        queda marcado si otro servidor tomó el bloqueo.
+        """
+        detener, perdido = threading.Event(), threading.Event()
+
+        def renovar():
+            try:
+                while not detener.wait(duracion_bloqueo.total_seconds() / 3):
+                    if not BloqueoPlanificador.adquirir(BLOQUEO, servidor, duracion_bloqueo):
+                        perdido.set()
+                        return
+            finally:
+                connections.close_all()  # conexiones propias del hilo
+
+        hilo = threading.Thread(target=renovar, name='latido-planificador', daemon=True)
+        hilo.start()
+        try:
+            yield perdido
+        finally:
+            detener.set()
+            hilo.join()
+
+    def ejecutar(self, tarea, servidor, duracion_bloqueo):
+        """Ejecutar la tarea renovando el lease; devuelve False si se perdió el bloqueo"""
+        with self.latido(servidor, duracion_bloqueo) as perdido:
+            ejecucion = tarea.ejecutar(servidor)
+        estilo = self.style.SUCCESS if ejecucion.estado == 'ok' else self.style.ERROR
+        self.stdout.write(estilo(
+            f'[{tarea.nombre}] {ejecucion.get_estado_display()} en {ejecucion.duracion_ms} ms'
+            + (f': {ejecucion.resultado}' if ejecucion.resultado else '')
+        ))
+        return not perdido.is_set()
+
+    def listar(self):
+        ultimas = EjecucionTarea.ultimas_ejecuciones()
+        for nombre, tarea in TAREAS.items():
+            intervalo = tarea.intervalo
+            ultima = ultimas.get(nombre)
+            self.stdout.write(
+                f'{nombre:<26} {"cada " + str(intervalo) if intervalo else "deshabilitada":<22} '
+                f'última: {timezone.localtime(ultima).strftime("%d/%m/%Y %H:%M") if ultima else "nunca"}  '
+                f'- {tarea.descripcion}'
+            )
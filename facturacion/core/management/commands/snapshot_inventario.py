@@ -0,0 +1,54 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from core.models import InventarioSnapshot, Producto
+
+
+class Command(BaseCommand):
+    help = 'Guarda un snapshot del stock y costo de todos los productos o muestra el inventario valorizado a una fecha'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--periodo',
+            choices=['diario', 'mensual'],
+            help='Tipo de snapshot (por defecto mensual si todavía no hay uno en el mes, si no diario)',
+        )
+        parser.add_argument(
+            '--dias-diarios',
+            type=int,
+            default=90,
+            help='Días que se conservan los snapshots diarios (por defecto 90; los mensuales no se depuran)',
+        )
+        parser.add_argument(
+            '--a-fecha',
+            help='No guardar: mostrar stock y valorización al cierre de esta fecha (AAAA-MM-DD)',
+        )
+
+    def handle(self, *args, **options):
+        if options['a_fecha']:
+            fecha = parse_date(options['a_fecha'])
+            if not fecha:
+                raise CommandError('La fecha debe tener el formato AAAA-MM-DD')
+            self.mostrar_valorizacion(fecha)
+            return
+
+        fecha, filas = InventarioSnapshot.tomar(options['periodo'])
+        eliminados = InventarioSnapshot.purgar(options['dias_diarios'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Snapshot de {filas} productos al {timezone.localtime(fecha):%d/%m/%Y %H:%M} '
+            f'({eliminados} filas diarias depuradas)'
+        ))
+
+    def mostrar_valorizacion(self, fecha):
+        valorizacion = InventarioSnapshot.valorizacion_a_fecha(fecha)
+        productos = Producto.objects.filter(pk__in=valorizacion).order_by('codigo')
+        total = 0
+        for producto in productos:
+            fila = valorizacion[producto.pk]
+            total += fila['valor']
+            self.stdout.write(
+                f"{producto.codigo:<12} {producto.nombre[:40]:<40} {fila['stock']:>8} "
+                f"{fila['costo']:>10} {fila['valor']:>14}"
+            )
+        self.stdout.write(self.style.SUCCESS(f'Inventario valorizado al {fecha:%d/%m/%Y}: Gs. {total:,}'.replace(',', '.')))
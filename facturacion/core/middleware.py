@@ -1,5 +1,15 @@
+import json
+import logging
+import random
+import time
+
+from django.conf import settings
+
+from .consultas import CapturaConsultas, presupuesto_de_vista
 from .models import PermisoUsuario
 
+logger = logging.getLogger('core.consultas')
+
 
 class PermisosMiddleware:
     """
@@ -44,3 +54,84 @@ class PermisosMiddleware:
         request.usuario_permisos = permisos_dict
 
         return self.get_response(request)
+
+
+class InstrumentacionConsultasMiddleware:
+    """
+    Mide las consultas SQL de una muestra de requests (CONSULTAS_MUESTREO, todas
+    con DEBUG): cantidad, tiempo en base, huellas repetidas (N+1) y las más
+    lentas. Agrega el header Server-Timing, deja un log estructurado en
+    'core.consultas' y avisa cuando la vista supera su presupuesto_consultas.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.muestreo = 1.0 if settings.DEBUG else getattr(settings, 'CONSULTAS_MUESTREO', 0.05)
+
+    def __call__(self, request):
+        if random.random() >= self.muestreo:
+            return self.get_response(request)
+
+        inicio = time.perf_counter()
+        with CapturaConsultas() as captura:
+            response = self.get_response(request)
+        total_ms = (time.perf_counter() - inicio) * 1000
+
+        # Los streams (SSE) siguen abiertos: no se miden
+        if response.streaming:
+            return response
+
+        resumen = captura.resumen()
+        vista = request.resolver_match.view_name if request.resolver_match else None
+        presupuesto = presupuesto_de_vista(request.resolver_match.func) if request.resolver_match else None
+
+        response['Server-Timing'] = (
+            f'db;dur={resumen["tiempo_db_ms"]:.1f};desc="{resumen["consultas"]} consultas", '
+            f'total;dur={total_ms:.1f}'
+        )
+
+        registro = {
+            'vista': vista,
+            'ruta': request.path,
+            'metodo': request.method,
+            'estado': response.status_code,
+            'total_ms': round(total_ms, 2),
+            'presupuesto': presupuesto,
+            **resumen,
+        }
+        excedido = presupuesto is not None and resumen['consultas'] > presupuesto
+        if excedido or resumen['duplicadas']:
+            logger.warning(json.dumps(registro, ensure_ascii=False))
+        else:
+            logger.info(json.dumps(registro, ensure_ascii=False))
+
+        return response
+
+
+class RenovacionSesionMiddleware:
+    """
+    Expiración deslizante sin escribir la sesión en cada request: la sesión se
+    guarda (y se renueva su vencimiento y la cookie) solo si cambió o si pasaron
+    más de SESSION_RENOVACION_INTERVALO segundos desde la última renovación.
+    Reemplaza a SESSION_SAVE_EVERY_REQUEST; va después de SessionMiddleware.
+    """
+
+    CLAVE = '_renovada'
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.intervalo = getattr(settings, 'SESSION_RENOVACION_INTERVALO', 3600)
+
+    def __call__(self, request):
+        response = self.get_response(request)
+
+        sesion = getattr(request, 'session', None)
+        # Sin clave no hay sesión guardada (anónimo sin cookie o logout)
+        if sesion is None or sesion.session_key is None:
+            return response
+
+        ahora = int(time.time())
+        if sesion.modified or ahora - sesion.get(self.CLAVE, 0) >= self.intervalo:
+            # Marcar la sesión como modificada hace que SessionMiddleware la guarde
+            sesion[self.CLAVE] = ahora
+        return response
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.4 on 2026-10-19 16:43
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_remove_cliente_ciudad_remove_cliente_direccion_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MovimientoSaldo',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('monto', models.IntegerField(help_text='Variación del saldo (positiva aumenta la deuda)')),
+                ('origen', models.CharField(choices=[('factura', 'Factura'), ('pago', 'Pago'), ('pago_eliminado', 'Pago Eliminado'), ('anulacion', 'Anulación de Factura'), ('eliminacion', 'Eliminación de Factura'), ('recalculo', 'Recálculo de Saldos')], max_length=20)),
+                ('referencia', models.CharField(blank=True, max_length=100, null=True)),
+                ('fecha', models.DateTimeField(auto_now_add=True)),
+                ('cliente', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='movimientos_saldo', to='core.cliente')),
+                ('factura', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='movimientos_saldo', to='core.factura')),
+                ('pago', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='movimientos_saldo', to='core.pago')),
+                ('proveedor', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='movimientos_saldo', to='core.proveedor')),
+                ('usuario', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Movimiento de Saldo',
+                'verbose_name_plural': 'Movimientos de Saldo',
+                'ordering': ['-fecha', '-id'],
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.4 on 2026-10-19 16:45
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_movimientosaldo'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='factura',
+            index=models.Index(fields=['cliente', 'fecha', 'id'], name='factura_cliente_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='factura',
+            index=models.Index(fields=['proveedor', 'fecha', 'id'], name='factura_proveedor_fecha_idx'),
+        ),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 5.2.4 on 2026-10-19 16:48
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import DateTimeField, ExpressionWrapper, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, TruncDate
+
+
+def completar_facturas(apps, schema_editor):
+    """Calcula vencimiento y monto pendiente de las facturas existentes en bloque"""
+    Factura = apps.get_model('core', 'Factura')
+    PagoFactura = apps.get_model('core', 'PagoFactura')
+    ConfiguracionSistema = apps.get_model('core', 'ConfiguracionSistema')
+
+    configuracion = ConfiguracionSistema.objects.filter(clave='dias_factura_vencida', activo=True).first()
+    try:
+        dias = int(configuracion.valor) if configuracion else 30
+    except ValueError:
+        dias = 30
+
+    Factura.objects.filter(fecha_vencimiento__isnull=True).update(
+        fecha_vencimiento=TruncDate(
+            ExpressionWrapper(F('fecha') + timedelta(days=dias), output_field=DateTimeField())
+        )
+    )
+
+    pagado = PagoFactura.objects.filter(
+        factura=OuterRef('pk')
+    ).order_by().values('factura').annotate(total=Sum('monto')).values('total')
+    Factura.objects.exclude(estado='anulada').update(
+        monto_pendiente=F('total') - Coalesce(Subquery(pagado), Value(0))
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_factura_factura_cliente_fecha_idx_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='factura',
+            name='fecha_vencimiento',
+            field=models.DateField(blank=True, help_text='Si se deja vacío se usa el plazo configurado (dias_factura_vencida)', null=True),
+        ),
+        migrations.AddField(
+            model_name='factura',
+            name='monto_pendiente',
+            field=models.IntegerField(default=0, help_text='Saldo pendiente desnormalizado (total menos pagos asignados)'),
+        ),
+        migrations.AddIndex(
+            model_name='factura',
+            index=models.Index(condition=models.Q(('estado', 'pendiente')), fields=['tipo', 'fecha_vencimiento'], name='factura_pendiente_venc_idx'),
+        ),
+        migrations.RunPython(completar_facturas, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.4 on 2026-10-19 16:51
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_factura_vencimiento_monto_pendiente'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notificacion',
+            name='clave',
+            field=models.CharField(blank=True, help_text='Clave de deduplicación: tipo de alerta + id de la entidad (ej. stock_bajo:15)', max_length=100, null=True),
+        ),
+        migrations.AddField(
+            model_name='notificacion',
+            name='repeticiones',
+            field=models.PositiveIntegerField(default=1),
+        ),
+        migrations.AddField(
+            model_name='notificacion',
+            name='ultima_ocurrencia',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='notificacion',
+            index=models.Index(fields=['leida', '-fecha'], name='notificacion_leida_fecha_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='notificacion',
+            constraint=models.UniqueConstraint(condition=models.Q(('clave__isnull', False), ('usuario__isnull', True)), fields=('clave',), name='notificacion_clave_global_unica'),
+        ),
+        migrations.AddConstraint(
+            model_name='notificacion',
+            constraint=models.UniqueConstraint(condition=models.Q(('clave__isnull', False), ('usuario__isnull', False)), fields=('clave', 'usuario'), name='notificacion_clave_usuario_unica'),
+        ),
+    ]
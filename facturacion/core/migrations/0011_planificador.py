@@ -0,0 +1,45 @@
+# Generated by Django 5.2.4 on 2026-10-19 16:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_correosaliente'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BloqueoPlanificador',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nombre', models.CharField(max_length=50, unique=True)),
+                ('servidor', models.CharField(max_length=255)),
+                ('vence', models.DateTimeField()),
+            ],
+            options={
+                'verbose_name': 'Bloqueo del planificador',
+                'verbose_name_plural': 'Bloqueos del planificador',
+            },
+        ),
+        migrations.CreateModel(
+            name='EjecucionTarea',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tarea', models.CharField(max_length=50)),
+                ('servidor', models.CharField(max_length=255)),
+                ('inicio', models.DateTimeField()),
+                ('fin', models.DateTimeField(blank=True, null=True)),
+                ('duracion_ms', models.PositiveIntegerField(blank=True, null=True)),
+                ('estado', models.CharField(choices=[('en_curso', 'En curso'), ('ok', 'Correcta'), ('error', 'Con error')], default='en_curso', max_length=10)),
+                ('resultado', models.TextField(blank=True)),
+            ],
+            options={
+                'verbose_name': 'Ejecución de tarea',
+                'verbose_name_plural': 'Ejecuciones de tareas',
+                'ordering': ['-inicio'],
+                'indexes': [models.Index(fields=['tarea', '-inicio'], name='ejecucion_tarea_inicio_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.2.4 on 2026-10-19 16:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_planificador'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MarcaReplicacion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('destino', models.CharField(max_length=50)),
+                ('tabla', models.CharField(max_length=100)),
+                ('ultimo_id', models.BigIntegerField(default=0)),
+                ('ultima_actualizacion', models.DateTimeField(blank=True, null=True)),
+                ('ultima_eliminacion', models.BigIntegerField(default=0, help_text='Último RegistroEliminacion aplicado')),
+                ('filas_origen', models.PositiveIntegerField(default=0)),
+                ('filas_destino', models.PositiveIntegerField(default=0)),
+                ('bloques_corregidos', models.PositiveIntegerField(default=0)),
+                ('verificada', models.BooleanField(default=False)),
+                ('fecha', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Marca de replicación',
+                'verbose_name_plural': 'Marcas de replicación',
+                'constraints': [models.UniqueConstraint(fields=('destino', 'tabla'), name='marca_replicacion_unica')],
+            },
+        ),
+        migrations.CreateModel(
+            name='RegistroEliminacion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tabla', models.CharField(max_length=100)),
+                ('registro_id', models.BigIntegerField()),
+                ('fecha', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Registro de eliminación',
+                'verbose_name_plural': 'Registros de eliminación',
+                'indexes': [models.Index(fields=['tabla', 'id'], name='eliminacion_tabla_id_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.2.4 on 2026-10-19 17:25
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_reservas_stock'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InventarioSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateTimeField()),
+                ('periodo', models.CharField(choices=[('diario', 'Diario'), ('mensual', 'Mensual')], max_length=10)),
+                ('stock', models.IntegerField()),
+                ('costo', models.IntegerField()),
+            ],
+            options={
+                'verbose_name': 'Snapshot de Inventario',
+                'verbose_name_plural': 'Snapshots de Inventario',
+                'ordering': ['-fecha'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='movimientostock',
+            index=models.Index(fields=['fecha', 'producto'], name='movstock_fecha_producto_idx'),
+        ),
+        migrations.AddField(
+            model_name='inventariosnapshot',
+            name='producto',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='snapshots_inventario', to='core.producto'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='inventariosnapshot',
+            unique_together={('fecha', 'producto')},
+        ),
+    ]
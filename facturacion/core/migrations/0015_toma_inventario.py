@@ -0,0 +1,54 @@
+# Generated by Django 5.2.4 on 2026-10-19 17:28
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_inventario_snapshot'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='movimientostock',
+            name='origen',
+            field=models.CharField(choices=[('factura_compra', 'Factura de Compra'), ('factura_venta', 'Factura de Venta'), ('ajuste_manual', 'Ajuste Manual'), ('stock_inicial', 'Stock Inicial'), ('devolucion', 'Devolución'), ('merma', 'Merma'), ('toma_inventario', 'Toma de Inventario')], max_length=20),
+        ),
+        migrations.CreateModel(
+            name='TomaInventario',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('descripcion', models.CharField(blank=True, max_length=200)),
+                ('estado', models.CharField(choices=[('borrador', 'Borrador'), ('aplicada', 'Aplicada'), ('cancelada', 'Cancelada')], default='borrador', max_length=10)),
+                ('fecha', models.DateTimeField(auto_now_add=True)),
+                ('fecha_aplicacion', models.DateTimeField(blank=True, null=True)),
+                ('usuario', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='tomas_inventario', to=settings.AUTH_USER_MODEL)),
+                ('usuario_aplicacion', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='tomas_inventario_aplicadas', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Toma de Inventario',
+                'verbose_name_plural': 'Tomas de Inventario',
+                'ordering': ['-fecha'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ConteoInventario',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cantidad_contada', models.IntegerField()),
+                ('stock_sistema', models.IntegerField(blank=True, null=True)),
+                ('costo', models.IntegerField(blank=True, null=True)),
+                ('producto', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='conteos_inventario', to='core.producto')),
+                ('toma', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='conteos', to='core.tomainventario')),
+            ],
+            options={
+                'verbose_name': 'Conteo de Inventario',
+                'verbose_name_plural': 'Conteos de Inventario',
+                'unique_together': {('toma', 'producto')},
+            },
+        ),
+    ]
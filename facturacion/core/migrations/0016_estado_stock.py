@@ -0,0 +1,22 @@
+# Generated by Django 5.2.4 on 2026-10-19 17:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_toma_inventario'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='producto',
+            name='estado_stock',
+            field=models.GeneratedField(db_persist=True, expression=models.Case(models.When(stock__lte=0, then=models.Value('agotado')), models.When(stock__lt=models.F('stock_minimo'), then=models.Value('critico')), models.When(stock=models.F('stock_minimo'), then=models.Value('minimo')), default=models.Value('normal')), output_field=models.CharField(max_length=10)),
+        ),
+        migrations.AddIndex(
+            model_name='producto',
+            index=models.Index(condition=models.Q(('activo', True)), fields=['estado_stock'], name='producto_activo_estado_idx'),
+        ),
+    ]
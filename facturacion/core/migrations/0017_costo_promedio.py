@@ -0,0 +1,82 @@
+# Generated by Django 5.2.4 on 2026-10-19 17:37
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import F
+
+
+def completar_costos(apps, schema_editor):
+    """
+    Costo de las entradas de compra ya registradas (desde sus líneas de factura)
+    y costo promedio inicial igual al último costo. El historial lo arma
+    manage.py recalcular_costo_promedio.
+    """
+    Producto = apps.get_model('core', 'Producto')
+    MovimientoStock = apps.get_model('core', 'MovimientoStock')
+    DetalleFactura = apps.get_model('core', 'DetalleFactura')
+
+    Producto.objects.update(costo_promedio=F('costo'))
+
+    # La referencia es 'Factura #<id>' (o el número en datos de prueba)
+    por_id, por_numero = {}, {}
+    lineas = DetalleFactura.objects.filter(factura__tipo='compra').values_list(
+        'factura_id', 'factura__numero', 'producto_id', 'cantidad', 'subtotal'
+    )
+    for factura_id, numero, producto_id, cantidad, subtotal in lineas.iterator():
+        for clave, totales in (((str(factura_id), producto_id), por_id), ((numero, producto_id), por_numero)):
+            acumulado = totales.setdefault(clave, [0, 0])
+            acumulado[0] += cantidad
+            acumulado[1] += subtotal
+
+    movimientos = []
+    entradas = MovimientoStock.objects.filter(
+        tipo='entrada', origen='factura_compra', costo_unitario__isnull=True, referencia__startswith='Factura #'
+    ).only('producto_id', 'referencia')
+    for movimiento in entradas.iterator():
+        clave = (movimiento.referencia[len('Factura #'):].strip(), movimiento.producto_id)
+        cantidad, subtotal = por_id.get(clave) or por_numero.get(clave) or (0, 0)
+        if cantidad:
+            movimiento.costo_unitario = round(subtotal / cantidad)
+            movimientos.append(movimiento)
+    MovimientoStock.objects.bulk_update(movimientos, ['costo_unitario'], batch_size=2000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0016_estado_stock'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='movimientostock',
+            name='costo_unitario',
+            field=models.IntegerField(blank=True, help_text='Costo de la entrada (compras); recalcula el costo promedio', null=True),
+        ),
+        migrations.AddField(
+            model_name='producto',
+            name='costo_promedio',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='HistorialCosto',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateTimeField()),
+                ('cantidad', models.IntegerField(help_text='Unidades que entraron')),
+                ('costo_unitario', models.IntegerField(help_text='Costo de las unidades que entraron')),
+                ('stock_anterior', models.IntegerField()),
+                ('costo_anterior', models.IntegerField()),
+                ('costo_promedio', models.IntegerField()),
+                ('movimiento', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='cambios_costo', to='core.movimientostock')),
+                ('producto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='historial_costos', to='core.producto')),
+            ],
+            options={
+                'verbose_name': 'Historial de Costo',
+                'verbose_name_plural': 'Historial de Costos',
+                'ordering': ['-fecha', '-id'],
+                'indexes': [models.Index(fields=['producto', 'fecha'], name='historialcosto_prod_fecha_idx')],
+            },
+        ),
+        migrations.RunPython(completar_costos, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-19 17:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0017_costo_promedio'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='factura',
+            name='clave_idempotencia',
+            field=models.CharField(blank=True, help_text='Clave generada por el terminal que envió la factura (ingesta sin conexión); un reenvío no la duplica', max_length=64, null=True, unique=True),
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 5.2.4 on 2026-10-19 17:50
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Case, F, IntegerField, OuterRef, Subquery, Sum, When
+from django.db.models.functions import Coalesce
+
+
+def recalcular_saldos_abiertas(apps, schema_editor):
+    """Deja el saldo final de las cajas abiertas al día con sus movimientos (desde ahora se acumula)"""
+    Caja = apps.get_model('core', 'Caja')
+    MovimientoCaja = apps.get_model('core', 'MovimientoCaja')
+
+    neto = MovimientoCaja.objects.filter(caja=OuterRef('pk')).values('caja').annotate(
+        neto=Sum(Case(When(tipo='ingreso', then=F('monto')), default=-F('monto'), output_field=IntegerField()))
+    ).values('neto')
+    Caja.objects.filter(cerrada=False).update(
+        saldo_final=F('saldo_inicial') + Coalesce(Subquery(neto, output_field=IntegerField()), 0)
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0019_solicitud_idempotente'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='caja',
+            options={'ordering': ['-fecha', 'terminal'], 'verbose_name': 'Caja', 'verbose_name_plural': 'Cajas'},
+        ),
+        migrations.AddField(
+            model_name='caja',
+            name='terminal',
+            field=models.CharField(default='principal', help_text='Terminal o cajero; una caja por terminal y día', max_length=30),
+        ),
+        migrations.AlterField(
+            model_name='caja',
+            name='fecha',
+            field=models.DateField(),
+        ),
+        migrations.AddConstraint(
+            model_name='caja',
+            constraint=models.UniqueConstraint(fields=('fecha', 'terminal'), name='caja_fecha_terminal_uniq'),
+        ),
+        migrations.RunPython(recalcular_saldos_abiertas, migrations.RunPython.noop),
+    ]
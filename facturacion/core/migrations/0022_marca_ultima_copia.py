@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-19 18:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0021_fecha_actualizacion_replicacion'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='marcareplicacion',
+            name='ultima_copia',
+            field=models.DateTimeField(blank=True, help_text='Inicio de la última pasada incremental completa', null=True),
+        ),
+    ]
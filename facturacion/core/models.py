@@ -1,29 +1,161 @@
-from django.db import models
+from collections import namedtuple
+from contextlib import contextmanager
+
+from django.db import models, transaction
+from django.db.models import F
 from django.contrib.auth.models import User
 from django.utils import timezone
 
-class Producto(models.Model):
+class ActualizacionQuerySet(models.QuerySet):
+    """update() y bulk_update() también marcan fecha_actualizacion"""
+
+    def update(self, **kwargs):
+        kwargs.setdefault('fecha_actualizacion', timezone.now())
+        return super().update(**kwargs)
+
+class ActualizacionMixin(models.Model):
+    """
+    fecha_actualizacion indexada que se mueve con cualquier escritura (save()
+    completo o con update_fields, QuerySet.update, bulk_update), para que la
+    replicación incremental vea todas las filas modificadas
+    """
+    fecha_actualizacion = models.DateTimeField(auto_now=True, db_index=True)
+
+    objects = ActualizacionQuerySet.as_manager()
+
+    class Meta:
+        abstract = True
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if update_fields and 'fecha_actualizacion' not in update_fields:
+            kwargs['update_fields'] = [*update_fields, 'fecha_actualizacion']
+        super().save(*args, **kwargs)
+
+class ProductoQuerySet(ActualizacionQuerySet):
+    """Filtros por estado_stock sobre productos activos (usan producto_activo_estado_idx)"""
+
+    def en_estado(self, *estados):
+        return self.filter(activo=True, estado_stock__in=estados)
+
+    def stock_bajo(self):
+        """Con stock pero en o por debajo del mínimo"""
+        return self.en_estado(*Producto.ESTADOS_STOCK_BAJO)
+
+    def agotados(self):
+        return self.en_estado('agotado')
+
+    def conteo_por_estado(self):
+        """{estado: cantidad} de los productos activos en una sola consulta"""
+        conteos = dict.fromkeys(dict(Producto.ESTADO_STOCK_CHOICES), 0)
+        conteos.update(
+            self.filter(activo=True).order_by().values_list('estado_stock').annotate(cantidad=models.Count('id'))
+        )
+        return conteos
+
+class StockProductoMixin:
+    """
+    Evita que un save() completo pise stock, reservado y costo_promedio, que
+    mantienen MovimientoStock y ReservaStock con updates propios
+    """
+    CAMPOS_MANTENIDOS = ('stock', 'reservado', 'costo_promedio')
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and not field.generated and field.name not in self.CAMPOS_MANTENIDOS
+            ]
+        super().save(*args, **kwargs)
+
+class Producto(StockProductoMixin, ActualizacionMixin):
     codigo = models.CharField(max_length=50, unique=True)
     nombre = models.CharField(max_length=200)
     descripcion = models.TextField(blank=True, null=True)
     costo = models.IntegerField(default=0)
+    # Promedio ponderado de las compras; lo mantiene MovimientoStock.registrar_lote (ver HistorialCosto)
+    costo_promedio = models.IntegerField(default=0)
     precio = models.IntegerField()
     stock = models.IntegerField(default=0)
+    reservado = models.IntegerField(default=0, help_text='Unidades retenidas por facturas en carga (ReservaStock)')
+    # Lo calcula la base al escribir stock o reservado: leerlo es una columna, sin sumar reservas
+    disponible = models.GeneratedField(
+        expression=F('stock') - F('reservado'),
+        output_field=models.IntegerField(),
+        db_persist=True,
+        db_index=True,
+    )
     stock_minimo = models.IntegerField(default=10)
+    # Clasificación única de stock para listados, alertas y reportes; la base la
+    # recalcula al escribir stock o stock_minimo (ver clasificar_stock)
+    estado_stock = models.GeneratedField(
+        expression=models.Case(
+            models.When(stock__lte=0, then=models.Value('agotado')),
+            models.When(stock__lt=F('stock_minimo'), then=models.Value('critico')),
+            models.When(stock=F('stock_minimo'), then=models.Value('minimo')),
+            default=models.Value('normal'),
+        ),
+        output_field=models.CharField(max_length=10),
+        db_persist=True,
+    )
     iva = models.IntegerField(default=10)
     activo = models.BooleanField(default=True)
     fecha_creacion = models.DateTimeField(auto_now_add=True)
-    fecha_actualizacion = models.DateTimeField(auto_now=True)
+
+    objects = ProductoQuerySet.as_manager()
+
+    ESTADO_STOCK_CHOICES = [
+        ('agotado', 'Agotado'),
+        ('critico', 'Stock Crítico'),
+        ('minimo', 'Stock Mínimo'),
+        ('normal', 'Stock Normal'),
+    ]
+    ESTADOS_STOCK_BAJO = ('critico', 'minimo')
 
     class Meta:
         verbose_name = 'Producto'
         verbose_name_plural = 'Productos'
         ordering = ['nombre']
+        indexes = [
+            # Índices parciales: los conteos de alertas son lecturas de índice
+            models.Index(fields=['estado_stock'], condition=models.Q(activo=True), name='producto_activo_estado_idx'),
+        ]
 
     def __str__(self):
         return self.nombre
 
-class Proveedor(models.Model):
+    def save(self, *args, **kwargs):
+        # Sin compras registradas, el costo promedio arranca en el costo cargado
+        if self._state.adding and not self.costo_promedio:
+            self.costo_promedio = self.costo
+        super().save(*args, **kwargs)
+
+    @staticmethod
+    def clasificar_stock(stock, stock_minimo):
+        """Misma regla que estado_stock, para valores que todavía no están en la base"""
+        if stock <= 0:
+            return 'agotado'
+        if stock < stock_minimo:
+            return 'critico'
+        if stock == stock_minimo:
+            return 'minimo'
+        return 'normal'
+
+    def get_estado_stock_display(self):
+        return dict(self.ESTADO_STOCK_CHOICES).get(self.estado_stock, self.estado_stock)
+
+class SaldoContraparteMixin:
+    """Evita que un save() completo pise el saldo mantenido por MovimientoSaldo"""
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name != 'saldo'
+            ]
+        super().save(*args, **kwargs)
+
+class Proveedor(SaldoContraparteMixin, ActualizacionMixin):
     nombre = models.CharField(max_length=200)
     ruc = models.CharField(max_length=20, unique=True)
     direccion = models.TextField()
@@ -41,7 +173,7 @@ class Proveedor(models.Model):
     def __str__(self):
         return f'{self.nombre} ({self.ruc})'
 
-class Cliente(models.Model):
+class Cliente(SaldoContraparteMixin, ActualizacionMixin):
     nombre = models.CharField(max_length=200)
     ruc = models.CharField(max_length=20, unique=True)
     telefono = models.CharField(max_length=20)
@@ -58,7 +190,7 @@ class Cliente(models.Model):
     def __str__(self):
         return f'{self.nombre} ({self.ruc})'
 
-class Factura(models.Model):
+class Factura(ActualizacionMixin):
     TIPO_CHOICES = [
         ('compra', 'Compra'),
         ('venta', 'Venta'),
@@ -79,15 +211,33 @@ class Factura(models.Model):
     iva = models.IntegerField()
     total = models.IntegerField()
     estado = models.CharField(max_length=10, choices=ESTADO_CHOICES, default='pendiente')
+    fecha_vencimiento = models.DateField(null=True, blank=True, help_text='Si se deja vacío se usa el plazo configurado (dias_factura_vencida)')
+    monto_pendiente = models.IntegerField(default=0, help_text='Saldo pendiente desnormalizado (total menos pagos asignados)')
     observacion = models.TextField(blank=True, null=True)
     fecha_creacion = models.DateTimeField(auto_now_add=True)
     usuario = models.ForeignKey(User, on_delete=models.PROTECT)
+    clave_idempotencia = models.CharField(max_length=64, unique=True, null=True, blank=True, help_text='Clave generada por el terminal que envió la factura (ingesta sin conexión); un reenvío no la duplica')
+
+    TRAMOS_ANTIGUEDAD = [
+        ('por_vencer', 'Por vencer', None, -1),
+        ('dias_0_30', '0-30 días', 0, 30),
+        ('dias_31_60', '31-60 días', 31, 60),
+        ('dias_61_90', '61-90 días', 61, 90),
+        ('dias_mas_90', 'Más de 90 días', 91, None),
+    ]
 
     class Meta:
         verbose_name = 'Factura'
         verbose_name_plural = 'Facturas'
         ordering = ['-fecha']
         unique_together = ['tipo', 'numero']
+        indexes = [
+            # Estado de cuenta: recorrido por contraparte en orden cronológico
+            models.Index(fields=['cliente', 'fecha', 'id'], name='factura_cliente_fecha_idx'),
+            models.Index(fields=['proveedor', 'fecha', 'id'], name='factura_proveedor_fecha_idx'),
+            # Antigüedad de saldos y alertas de vencimiento: solo facturas pendientes
+            models.Index(fields=['tipo', 'fecha_vencimiento'], name='factura_pendiente_venc_idx', condition=models.Q(estado='pendiente')),
+        ]
 
     def __str__(self):
         if self.tipo == 'compra':
@@ -98,23 +248,209 @@ class Factura(models.Model):
     def save(self, *args, **kwargs):
         if not self.numero:
             # Generar número correlativo por tipo
-            ultima_factura = Factura.objects.filter(tipo=self.tipo).order_by('-numero').first()
-            if ultima_factura:
-                try:
-                    # Intentar extraer solo los dígitos del número
-                    import re
-                    numeros = re.findall(r'\d+', ultima_factura.numero)
-                    if numeros:
-                        ultimo_numero = int(numeros[-1])  # Tomar el último grupo de dígitos
-                        self.numero = str(ultimo_numero + 1).zfill(6)
-                    else:
-                        self.numero = '000001'
-                except (ValueError, IndexError):
-                    self.numero = '000001'
-            else:
-                self.numero = '000001'
+            self.numero = str(Factura.ultimo_numero(self.tipo) + 1).zfill(6)
+        
+        if not self.fecha_vencimiento:
+            self.fecha_vencimiento = self.calcular_vencimiento()
+        
+        if kwargs.get('update_fields') is None:
+            self.monto_pendiente = self.calcular_monto_pendiente()
         super().save(*args, **kwargs)
     
+    @classmethod
+    def ultimo_numero(cls, tipo):
+        """Último número correlativo usado para el tipo (0 si no hay facturas)"""
+        import re
+        
+        ultima_factura = cls.objects.filter(tipo=tipo).order_by('-numero').first()
+        if ultima_factura:
+            # Tomar el último grupo de dígitos del número
+            numeros = re.findall(r'\d+', ultima_factura.numero)
+            if numeros:
+                return int(numeros[-1])
+        return 0
+    
+    @classmethod
+    def dias_vencimiento(cls):
+        """Plazo configurado en días (dias_factura_vencida)"""
+        try:
+            return int(ConfiguracionSistema.get_valor('dias_factura_vencida', '30'))
+        except (TypeError, ValueError):
+            return 30
+    
+    def calcular_vencimiento(self, dias=None):
+        """Fecha de vencimiento según el plazo configurado en días"""
+        from datetime import timedelta
+        from django.utils.dateparse import parse_datetime
+        
+        fecha = self.fecha
+        if isinstance(fecha, str):
+            fecha = parse_datetime(fecha) or timezone.now()
+        if timezone.is_aware(fecha):
+            fecha = timezone.localtime(fecha)
+        
+        if dias is None:
+            dias = self.dias_vencimiento()
+        return fecha.date() + timedelta(days=dias)
+    
+    def calcular_monto_pendiente(self):
+        """Total menos pagos asignados; las facturas anuladas no tienen pendiente"""
+        if self.estado == 'anulada':
+            return 0
+        if self._state.adding:
+            return self.total or 0
+        return (self.total or 0) - self.total_pagado
+    
+    @classmethod
+    def vencidas(cls, tipo=None, fecha_corte=None):
+        """Facturas pendientes cuya fecha de vencimiento ya pasó"""
+        fecha_corte = fecha_corte or timezone.localdate()
+        facturas = cls.objects.filter(estado='pendiente', fecha_vencimiento__lt=fecha_corte)
+        if tipo:
+            facturas = facturas.filter(tipo=tipo)
+        return facturas
+    
+    @classmethod
+    def condicion_tramo(cls, tramo, fecha_corte):
+        """Condición Q sobre fecha_vencimiento para un tramo de antigüedad"""
+        from datetime import timedelta
+        
+        for clave, _, desde, hasta in cls.TRAMOS_ANTIGUEDAD:
+            if clave != tramo:
+                continue
+            condicion = models.Q()
+            # Días vencidos = fecha_corte - fecha_vencimiento
+            if desde is not None:
+                condicion &= models.Q(fecha_vencimiento__lte=fecha_corte - timedelta(days=desde))
+            if hasta is not None:
+                condicion &= models.Q(fecha_vencimiento__gte=fecha_corte - timedelta(days=hasta))
+            return condicion
+        raise ValueError(f'Tramo de antigüedad desconocido: {tramo}')
+    
+    @classmethod
+    def antiguedad_saldos(cls, tipo, fecha_corte=None):
+        """
+        Saldos pendientes por contraparte agrupados en tramos de antigüedad,
+        calculados en una sola consulta con agregaciones CASE.
+        """
+        fecha_corte = fecha_corte or timezone.localdate()
+        campo = 'proveedor' if tipo == 'compra' else 'cliente'
+        
+        tramos = {
+            clave: models.Sum(models.Case(
+                models.When(cls.condicion_tramo(clave, fecha_corte), then='monto_pendiente'),
+                default=models.Value(0),
+            ))
+            for clave, _, _, _ in cls.TRAMOS_ANTIGUEDAD
+        }
+        
+        return cls.objects.filter(
+            tipo=tipo, estado='pendiente', monto_pendiente__gt=0
+        ).values(
+            f'{campo}_id', f'{campo}__nombre'
+        ).annotate(
+            total=models.Sum('monto_pendiente'),
+            cantidad=models.Count('id'),
+            **tramos
+        ).order_by('-total')
+    
+    @classmethod
+    def anular_lote(cls, ids, usuario):
+        """
+        Anular varias facturas en una transacción: revierte stock y saldos
+        (ver _revertir) y libera en bloque las asignaciones de pagos, que quedan
+        disponibles para otras facturas. Las ya anuladas se ignoran.
+        Devuelve las facturas anuladas.
+        """
+        with transaction.atomic():
+            facturas = cls._revertir(ids, usuario, 'anulacion')
+            PagoFactura.objects.filter(factura__in=facturas).delete()
+            cls.objects.filter(pk__in=[factura.pk for factura in facturas]).update(estado='anulada', monto_pendiente=0)
+        return facturas
+    
+    @classmethod
+    def eliminar_lote(cls, ids, usuario):
+        """
+        Eliminar varias facturas en una transacción. Las no anuladas revierten
+        stock y saldos; las anuladas ya lo hicieron al anularse.
+        Devuelve la cantidad de facturas eliminadas.
+        """
+        with transaction.atomic():
+            cls._revertir(ids, usuario, 'eliminacion')
+            eliminadas = cls.objects.filter(pk__in=ids)
+            cantidad = eliminadas.count()
+            eliminadas.delete()
+        return cantidad
+    
+    @classmethod
+    def _revertir(cls, ids, usuario, origen):
+        """
+        Revertir facturas no anuladas (con las filas bloqueadas): el stock en un
+        solo registrar_lote y el saldo adeudado con un UPDATE agrupado por tipo
+        de contraparte (saldo = saldo - CASE pk ...) más el libro en bulk_create.
+        """
+        from django.db.models.functions import Coalesce
+        
+        pagado = PagoFactura.objects.filter(
+            factura=models.OuterRef('pk')
+        ).order_by().values('factura').annotate(total=models.Sum('monto')).values('total')
+        facturas = list(
+            cls.objects.select_for_update().filter(pk__in=ids).exclude(estado='anulada')
+            .annotate(pagado=Coalesce(models.Subquery(pagado), models.Value(0))).order_by('pk')
+        )
+        if not facturas:
+            return []
+        por_id = {factura.pk: factura for factura in facturas}
+        
+        # Stock: compra -> salida, venta -> entrada
+        entradas = []
+        detalles = DetalleFactura.objects.filter(factura__in=facturas).order_by('factura_id', 'id')
+        for factura_id, producto_id, cantidad in detalles.values_list('factura_id', 'producto_id', 'cantidad'):
+            factura = por_id[factura_id]
+            signo = -1 if factura.tipo == 'compra' else 1
+            if origen == 'anulacion':
+                referencia = f'Factura #{factura.id} (ANULADA)'
+                observacion = f'Anulación: Reversión de {factura.tipo} de {cantidad} unidades'
+            else:
+                referencia = f'Factura #{factura.numero} eliminada'
+                observacion = f'Eliminación de factura de {factura.tipo}'
+            entradas.append((producto_id, signo * cantidad, f'factura_{factura.tipo}', referencia, observacion))
+        MovimientoStock.registrar_lote(entradas, usuario)
+        
+        # Saldos: quitar lo que cada factura aún adeudaba
+        montos = {Cliente: {}, Proveedor: {}}
+        movimientos = []
+        for factura in facturas:
+            pendiente = factura.total - factura.pagado
+            if not pendiente:
+                continue
+            modelo, contraparte_id = (Proveedor, factura.proveedor_id) if factura.tipo == 'compra' else (Cliente, factura.cliente_id)
+            if contraparte_id is None:
+                continue
+            montos[modelo][contraparte_id] = montos[modelo].get(contraparte_id, 0) + pendiente
+            movimientos.append(MovimientoSaldo(
+                cliente_id=contraparte_id if modelo is Cliente else None,
+                proveedor_id=contraparte_id if modelo is Proveedor else None,
+                monto=-pendiente,
+                origen=origen,
+                factura=factura,
+                referencia=f'Factura #{factura.numero} ' + ('(ANULADA)' if origen == 'anulacion' else 'eliminada'),
+                usuario=usuario,
+            ))
+        for modelo, por_contraparte in montos.items():
+            if por_contraparte:
+                modelo.objects.filter(pk__in=por_contraparte).update(saldo=F('saldo') - models.Case(
+                    *[models.When(pk=pk, then=models.Value(monto)) for pk, monto in por_contraparte.items()],
+                    default=models.Value(0),
+                ))
+        MovimientoSaldo.objects.bulk_create(movimientos)
+        return facturas
+    
+    @property
+    def contraparte(self):
+        """Proveedor (compras) o cliente (ventas) cuyo saldo afecta la factura"""
+        return self.proveedor if self.tipo == 'compra' else self.cliente
+    
     @property
     def total_pagado(self):
         """Calcula el total pagado de la factura"""
@@ -125,6 +461,13 @@ class Factura(models.Model):
         """Calcula el saldo pendiente de la factura"""
         return self.total - self.total_pagado
     
+    @property
+    def dias_vencida(self):
+        """Días transcurridos desde el vencimiento (0 si aún no venció)"""
+        if not self.fecha_vencimiento or self.estado != 'pendiente':
+            return 0
+        return max(0, (timezone.localdate() - self.fecha_vencimiento).days)
+    
     @property
     def porcentaje_pagado(self):
         """Calcula el porcentaje pagado de la factura"""
@@ -152,12 +495,11 @@ class Factura(models.Model):
             return monto == self.saldo_pendiente
     
     def actualizar_estado(self):
-        """Actualiza el estado de la factura basado en los pagos realizados"""
-        if self.saldo_pendiente <= 0:
-            self.estado = 'pagada'
-        else:
-            self.estado = 'pendiente'
-        self.save(update_fields=['estado'])
+        """Actualiza el estado y el monto pendiente de la factura basado en los pagos realizados"""
+        if self.estado != 'anulada':
+            self.estado = 'pagada' if self.saldo_pendiente <= 0 else 'pendiente'
+        self.monto_pendiente = self.calcular_monto_pendiente()
+        self.save(update_fields=['estado', 'monto_pendiente'])
     
     @property
     def estado_actualizado(self):
@@ -167,7 +509,7 @@ class Factura(models.Model):
         else:
             return 'pendiente'
 
-class DetalleFactura(models.Model):
+class DetalleFactura(ActualizacionMixin):
     factura = models.ForeignKey(Factura, on_delete=models.CASCADE, related_name='detalles')
     producto = models.ForeignKey(Producto, on_delete=models.PROTECT)
     cantidad = models.IntegerField()
@@ -183,7 +525,7 @@ class DetalleFactura(models.Model):
     def __str__(self):
         return f'{self.producto} - {self.cantidad} unidades'
 
-class Pago(models.Model):
+class Pago(ActualizacionMixin):
     TIPO_CHOICES = [
         ('efectivo', 'Efectivo'),
         ('transferencia', 'Transferencia'),
@@ -236,25 +578,14 @@ class Pago(models.Model):
         if not self.puede_asignar_monto(monto):
             raise ValueError(f'No hay suficiente monto disponible. Disponible: {self.monto_disponible}, Solicitado: {monto}')
         
-        # Crear la asignación
+        # Crear la asignación (PagoFactura.save actualiza el saldo y el estado de la factura)
         PagoFactura.objects.create(
             pago=self,
             factura=factura,
             monto=monto
         )
-        
-        # Actualizar saldo del proveedor o cliente
-        if factura.tipo == 'compra' and factura.proveedor:
-            factura.proveedor.saldo -= monto
-            factura.proveedor.save()
-        elif factura.tipo == 'venta' and factura.cliente:
-            factura.cliente.saldo -= monto
-            factura.cliente.save()
-        
-        # Actualizar estado de la factura
-        factura.actualizar_estado()
 
-class PagoFactura(models.Model):
+class PagoFactura(ActualizacionMixin):
     """Modelo intermedio para relacionar pagos con facturas y asignar montos específicos"""
     pago = models.ForeignKey(Pago, on_delete=models.CASCADE, related_name='pagos_facturas')
     factura = models.ForeignKey(Factura, on_delete=models.CASCADE, related_name='pagos_facturas')
@@ -282,35 +613,111 @@ class PagoFactura(models.Model):
         if self.monto > monto_disponible:
             raise ValueError(f'El monto asignado ({self.monto:,}) excede el monto disponible del pago ({monto_disponible:,})')
         
-        super().save(*args, **kwargs)
-        
-        # Actualizar el estado de la factura después de guardar
-        self.factura.actualizar_estado()
+        creada = self._state.adding
         
-        # Actualizar saldo del proveedor o cliente
-        if self.factura.tipo == 'compra' and self.factura.proveedor:
-            self.factura.proveedor.saldo -= self.monto
-            self.factura.proveedor.save()
-        elif self.factura.tipo == 'venta' and self.factura.cliente:
-            self.factura.cliente.saldo += self.monto
-            self.factura.cliente.save()
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            
+            # Actualizar el estado de la factura después de guardar
+            self.factura.actualizar_estado()
+            
+            # Descontar el monto asignado del saldo del proveedor o cliente
+            if creada and self.factura.estado != 'anulada':
+                MovimientoSaldo.registrar_movimiento(
+                    contraparte=self.factura.contraparte,
+                    monto=-self.monto,
+                    origen='pago',
+                    usuario=self.pago.usuario,
+                    factura=self.factura,
+                    pago=self.pago,
+                    referencia=f'Pago #{self.pago_id} → Factura #{self.factura.numero}'
+                )
     
     def delete(self, *args, **kwargs):
         """Eliminar la asignación y restaurar saldos"""
-        # Guardar el monto antes de eliminar
-        monto_eliminado = self.monto
         factura = self.factura
         
-        # Solo manejar facturas de compra (proveedores)
-        if factura.tipo == 'compra' and factura.proveedor:
-            factura.proveedor.saldo += monto_eliminado
-            factura.proveedor.save()
+        with transaction.atomic():
+            # Las facturas anuladas ya no forman parte del saldo
+            if factura.estado != 'anulada':
+                MovimientoSaldo.registrar_movimiento(
+                    contraparte=factura.contraparte,
+                    monto=self.monto,
+                    origen='pago_eliminado',
+                    factura=factura,
+                    pago=self.pago,
+                    referencia=f'Asignación eliminada: Pago #{self.pago_id} → Factura #{factura.numero}'
+                )
+            
+            # Eliminar la asignación
+            super().delete(*args, **kwargs)
+            
+            # Actualizar el estado de la factura después de eliminar
+            factura.actualizar_estado()
+
+class MovimientoSaldo(models.Model):
+    """Libro inmutable de movimientos de saldo de clientes y proveedores"""
+    ORIGEN_CHOICES = [
+        ('factura', 'Factura'),
+        ('pago', 'Pago'),
+        ('pago_eliminado', 'Pago Eliminado'),
+        ('anulacion', 'Anulación de Factura'),
+        ('eliminacion', 'Eliminación de Factura'),
+        ('recalculo', 'Recálculo de Saldos'),
+    ]
+    
+    cliente = models.ForeignKey(Cliente, on_delete=models.PROTECT, null=True, blank=True, related_name='movimientos_saldo')
+    proveedor = models.ForeignKey(Proveedor, on_delete=models.PROTECT, null=True, blank=True, related_name='movimientos_saldo')
+    monto = models.IntegerField(help_text='Variación del saldo (positiva aumenta la deuda)')
+    origen = models.CharField(max_length=20, choices=ORIGEN_CHOICES)
+    factura = models.ForeignKey(Factura, on_delete=models.SET_NULL, null=True, blank=True, related_name='movimientos_saldo')
+    pago = models.ForeignKey(Pago, on_delete=models.SET_NULL, null=True, blank=True, related_name='movimientos_saldo')
+    referencia = models.CharField(max_length=100, blank=True, null=True)
+    usuario = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+    fecha = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        verbose_name = 'Movimiento de Saldo'
+        verbose_name_plural = 'Movimientos de Saldo'
+        ordering = ['-fecha', '-id']
+    
+    def __str__(self):
+        contraparte = self.cliente or self.proveedor
+        return f"{contraparte} - {self.get_origen_display()} ({self.monto:+,})"
+    
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            raise ValueError('Los movimientos de saldo son inmutables')
+        super().save(*args, **kwargs)
+    
+    def delete(self, *args, **kwargs):
+        raise ValueError('Los movimientos de saldo son inmutables')
+    
+    @classmethod
+    def registrar_movimiento(cls, contraparte, monto, origen, usuario=None, factura=None, pago=None, referencia=''):
+        """
+        Aplicar una variación al saldo de un cliente o proveedor con un
+        UPDATE atómico (saldo = saldo + monto) y registrarla en el libro.
+        """
+        if contraparte is None or not monto:
+            return None
         
-        # Eliminar la asignación
-        super().delete(*args, **kwargs)
+        with transaction.atomic():
+            type(contraparte).objects.filter(pk=contraparte.pk).update(saldo=F('saldo') + monto)
+            movimiento = cls.objects.create(
+                cliente=contraparte if isinstance(contraparte, Cliente) else None,
+                proveedor=contraparte if isinstance(contraparte, Proveedor) else None,
+                monto=monto,
+                origen=origen,
+                factura=factura,
+                pago=pago,
+                referencia=referencia[:100] if referencia else referencia,
+                usuario=usuario
+            )
         
-        # Actualizar el estado de la factura después de eliminar
-        factura.actualizar_estado()
+        # Mantener la instancia en memoria alineada sin releer la fila
+        contraparte.saldo += monto
+        return movimiento
 
 class Notificacion(models.Model):
     TIPO_CHOICES = [
@@ -324,16 +731,367 @@ class Notificacion(models.Model):
     fecha = models.DateTimeField(auto_now_add=True)
     leida = models.BooleanField(default=False)
     usuario = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True)
+    clave = models.CharField(max_length=100, null=True, blank=True, help_text='Clave de deduplicación: tipo de alerta + id de la entidad (ej. stock_bajo:15)')
+    repeticiones = models.PositiveIntegerField(default=1)
+    ultima_ocurrencia = models.DateTimeField(null=True, blank=True)
 
     class Meta:
         verbose_name = 'Notificación'
         verbose_name_plural = 'Notificaciones'
         ordering = ['-fecha']
+        constraints = [
+            # Una sola alerta activa por clave (global o por usuario)
+            models.UniqueConstraint(fields=['clave'], condition=models.Q(clave__isnull=False, usuario__isnull=True), name='notificacion_clave_global_unica'),
+            models.UniqueConstraint(fields=['clave', 'usuario'], condition=models.Q(clave__isnull=False, usuario__isnull=False), name='notificacion_clave_usuario_unica'),
+        ]
+        indexes = [
+            models.Index(fields=['leida', '-fecha'], name='notificacion_leida_fecha_idx'),
+        ]
 
     def __str__(self):
         return f'{self.tipo}: {self.mensaje[:50]}'
+    
+    @classmethod
+    def intervalo_renotificacion(cls):
+        """Tiempo mínimo entre avisos repetidos de una misma alerta (frecuencia_alertas, en horas)"""
+        from datetime import timedelta
+        try:
+            horas = float(ConfiguracionSistema.get_valor('frecuencia_alertas', '24'))
+        except (TypeError, ValueError):
+            horas = 24
+        return timedelta(hours=horas)
+    
+    @classmethod
+    def notificar(cls, clave, mensaje, tipo='warning', usuario=None):
+        """
+        Crear o actualizar la alerta identificada por `clave`. Si ya existe solo
+        se actualiza el mensaje y el contador; vuelve a marcarse como no leída
+        cuando pasó el intervalo de re-notificación.
+        """
+        from django.db import IntegrityError
+        ahora = timezone.now()
+        existentes = cls.objects.filter(clave=clave, usuario=usuario)
+        
+        actualizadas = existentes.filter(fecha__lt=ahora - cls.intervalo_renotificacion()).update(
+            mensaje=mensaje, tipo=tipo, leida=False, fecha=ahora,
+            ultima_ocurrencia=ahora, repeticiones=F('repeticiones') + 1
+        )
+        if actualizadas:
+            from .eventos import publicar_notificacion
+            publicar_notificacion(cls(mensaje=mensaje, tipo=tipo, usuario=usuario, fecha=ahora))
+            return True
+        
+        if existentes.update(mensaje=mensaje, tipo=tipo, ultima_ocurrencia=ahora, repeticiones=F('repeticiones') + 1):
+            return False
+        
+        try:
+            with transaction.atomic():
+                cls.objects.create(clave=clave, mensaje=mensaje, tipo=tipo, usuario=usuario, ultima_ocurrencia=ahora)
+            return True
+        except IntegrityError:
+            # Otro proceso la creó al mismo tiempo
+            return False
+    
+    @classmethod
+    def notificar_lote(cls, alertas, prefijos=None):
+        """
+        Registrar un lote de alertas globales [(clave, mensaje, tipo), ...] con un
+        INSERT ... ON CONFLICT DO NOTHING, un bulk_update de los textos que
+        cambiaron y dos UPDATE. Si se indican `prefijos`, las alertas de esos
+        tipos que ya no están en el lote se dan por resueltas.
+        """
+        ahora = timezone.now()
+        claves = [clave for clave, _, _ in alertas]
+        
+        with transaction.atomic():
+            cls.objects.bulk_create(
+                [cls(clave=clave, mensaje=mensaje, tipo=tipo, ultima_ocurrencia=ahora) for clave, mensaje, tipo in alertas],
+                ignore_conflicts=True,
+                batch_size=500
+            )
+            
+            globales = cls.objects.filter(clave__in=claves, usuario__isnull=True)
+            
+            # Las existentes conservan su fila pero actualizan el texto ("vencida hace N días", stock)
+            nuevas = {clave: (mensaje, tipo) for clave, mensaje, tipo in alertas}
+            cambiadas = []
+            for notificacion in globales.only('pk', 'clave', 'mensaje', 'tipo'):
+                mensaje, tipo = nuevas[notificacion.clave]
+                if (notificacion.mensaje, notificacion.tipo) != (mensaje, tipo):
+                    notificacion.mensaje, notificacion.tipo = mensaje, tipo
+                    cambiadas.append(notificacion)
+            if cambiadas:
+                cls.objects.bulk_update(cambiadas, ['mensaje', 'tipo'], batch_size=500)
+            # Las que superaron el intervalo vuelven a mostrarse como nuevas
+            renotificadas = globales.filter(fecha__lt=ahora - cls.intervalo_renotificacion()).update(
+                leida=False, fecha=ahora, repeticiones=F('repeticiones') + 1
+            )
+            globales.exclude(ultima_ocurrencia=ahora).update(ultima_ocurrencia=ahora)
+            
+            if prefijos:
+                cls.resolver_excepto(prefijos, claves)
+            
+            from .eventos import publicar_alertas
+            publicar_alertas()
+        
+        return renotificadas
+    
+    @classmethod
+    def resolver(cls, *claves):
+        """Liberar la clave de alertas cuya condición desapareció; quedan como historial"""
+        return cls.objects.filter(clave__in=claves).update(clave=None)
+    
+    @classmethod
+    def resolver_excepto(cls, prefijos, claves_activas):
+        """Resolver las alertas globales de los tipos indicados que no siguen activas"""
+        condicion = models.Q()
+        for prefijo in prefijos:
+            condicion |= models.Q(clave__startswith=f'{prefijo}:')
+        return cls.objects.filter(condicion, usuario__isnull=True).exclude(
+            clave__in=claves_activas
+        ).update(clave=None)
+    
+    @classmethod
+    def verificar_stock_producto(cls, producto, stock_anterior=None):
+        """Alerta de stock bajo/agotado solo cuando el producto cambia de situación"""
+        def situacion(stock):
+            if stock is None:
+                return 'normal'
+            estado = Producto.clasificar_stock(stock, producto.stock_minimo)
+            return 'stock_bajo' if estado in Producto.ESTADOS_STOCK_BAJO else estado
+        
+        actual = situacion(producto.stock)
+        if stock_anterior is not None and situacion(stock_anterior) == actual:
+            return
+        
+        clave_bajo = f'stock_bajo:{producto.pk}'
+        clave_agotado = f'agotado:{producto.pk}'
+        if actual == 'agotado':
+            cls.resolver(clave_bajo)
+            cls.notificar(clave_agotado, f'Producto agotado: {producto.nombre} (Código: {producto.codigo}) - Stock: 0', 'error')
+        elif actual == 'stock_bajo':
+            cls.resolver(clave_agotado)
+            cls.notificar(clave_bajo, f'Stock bajo: {producto.nombre} (Código: {producto.codigo}) - Stock actual: {producto.stock}, Mínimo: {producto.stock_minimo}', 'warning')
+        else:
+            cls.resolver(clave_bajo, clave_agotado)
+        
+        from .eventos import publicar_alertas
+        publicar_alertas()
+    
+    @classmethod
+    def compactar(cls, dias_leidas=30, dias_retencion=90):
+        """
+        Depurar la tabla: borra leídas antiguas, todo lo que supera la retención
+        y colapsa duplicados sin clave (mismo mensaje y usuario) dejando el más reciente.
+        """
+        from datetime import timedelta
+        ahora = timezone.now()
+        
+        leidas, _ = cls.objects.filter(leida=True, fecha__lt=ahora - timedelta(days=dias_leidas)).delete()
+        antiguas, _ = cls.objects.filter(fecha__lt=ahora - timedelta(days=dias_retencion)).delete()
+        
+        ultimas = cls.objects.filter(clave__isnull=True).values('mensaje', 'tipo', 'usuario').annotate(
+            ultima=models.Max('id')
+        ).values('ultima')
+        duplicadas, _ = cls.objects.filter(clave__isnull=True).exclude(id__in=models.Subquery(ultimas)).delete()
+        
+        return {'leidas': leidas, 'antiguas': antiguas, 'duplicadas': duplicadas}
 
-class ConfiguracionSistema(models.Model):
+class CorreoSaliente(models.Model):
+    """Bandeja de salida: los emails se encolan en la request y los envía el comando procesar_correos"""
+    ESTADO_CHOICES = [
+        ('pendiente', 'Pendiente'),
+        ('enviado', 'Enviado'),
+        ('agrupado', 'Incluido en resumen'),
+        ('fallido', 'Fallido'),
+    ]
+    CATEGORIA_CHOICES = [
+        ('alertas', 'Alertas del sistema'),
+        ('stock_bajo', 'Stock bajo'),
+        ('agotado', 'Producto agotado'),
+        ('factura_vencida', 'Factura vencida'),
+    ]
+    MAX_INTENTOS = 5
+    ESPERA_BASE = 60  # segundos; se duplica en cada reintento
+    RESERVA = 600  # segundos que un worker retiene los correos que está enviando
+
+    asunto = models.CharField(max_length=255)
+    cuerpo_texto = models.TextField()
+    cuerpo_html = models.TextField(blank=True)
+    remitente = models.CharField(max_length=255)
+    destinatarios = models.TextField(help_text='Emails separados por comas')
+    categoria = models.CharField(max_length=20, choices=CATEGORIA_CHOICES, default='alertas')
+    agrupable = models.BooleanField(default=False, help_text='Se envía dentro del resumen periódico (EMAIL_ALERT_FREQUENCY)')
+    estado = models.CharField(max_length=10, choices=ESTADO_CHOICES, default='pendiente')
+    intentos = models.PositiveIntegerField(default=0)
+    proximo_intento = models.DateTimeField(default=timezone.now)
+    ultimo_error = models.TextField(blank=True)
+    fecha_creacion = models.DateTimeField(auto_now_add=True)
+    fecha_envio = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = 'Correo saliente'
+        verbose_name_plural = 'Correos salientes'
+        ordering = ['-fecha_creacion']
+        indexes = [
+            models.Index(fields=['proximo_intento'], condition=models.Q(estado='pendiente'), name='correo_pendiente_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.get_estado_display()}: {self.asunto}'
+
+    @classmethod
+    def encolar(cls, asunto, cuerpo_html, destinatarios=None, categoria='alertas', agrupable=False):
+        """Registrar un email para envío diferido; no abre ninguna conexión SMTP"""
+        from django.conf import settings
+        from django.utils.html import strip_tags
+
+        if not getattr(settings, 'EMAIL_NOTIFICATIONS_ENABLED', False):
+            return None
+        if not destinatarios:
+            destinatarios = [settings.EMAIL_ADMIN_ADDRESS]
+
+        return cls.objects.create(
+            asunto=asunto,
+            cuerpo_texto=strip_tags(cuerpo_html),
+            cuerpo_html=cuerpo_html,
+            remitente=settings.EMAIL_FROM_ADDRESS,
+            destinatarios=','.join(destinatarios),
+            categoria=categoria,
+            agrupable=agrupable,
+        )
+
+    @classmethod
+    def intervalo_resumen(cls):
+        """Cada cuánto se agrupan las alertas individuales (EMAIL_ALERT_FREQUENCY, en horas; 0 = sin resumen)"""
+        from datetime import timedelta
+        from django.conf import settings
+        return timedelta(hours=float(getattr(settings, 'EMAIL_ALERT_FREQUENCY', 0) or 0))
+
+    @classmethod
+    def reservar(cls, limite=100):
+        """Tomar un lote de correos vencidos y reservarlos para este worker"""
+        from datetime import timedelta
+        ahora = timezone.now()
+        with transaction.atomic():
+            ids = list(
+                cls.objects.select_for_update(skip_locked=True)
+                .filter(estado='pendiente', agrupable=False, proximo_intento__lte=ahora)
+                .order_by('proximo_intento')
+                .values_list('id', flat=True)[:limite]
+            )
+            cls.objects.filter(id__in=ids).update(proximo_intento=ahora + timedelta(seconds=cls.RESERVA))
+        return list(cls.objects.filter(id__in=ids).order_by('id'))
+
+    @classmethod
+    def generar_resumen(cls, forzar=False):
+        """
+        Reunir las alertas agrupables pendientes en un solo email cuando la más
+        antigua cumplió el intervalo de resumen. Devuelve los resúmenes creados.
+        """
+        ahora = timezone.now()
+        intervalo = cls.intervalo_resumen()
+
+        with transaction.atomic():
+            pendientes = list(
+                cls.objects.select_for_update(skip_locked=True)
+                .filter(estado='pendiente', agrupable=True)
+                .order_by('fecha_creacion')
+            )
+            if not pendientes:
+                return []
+            if not forzar and intervalo and pendientes[0].fecha_creacion > ahora - intervalo:
+                return []
+
+            # Un resumen por cada grupo de destinatarios
+            grupos = {}
+            for correo in pendientes:
+                grupos.setdefault(correo.destinatarios, []).append(correo)
+
+            resumenes = []
+            for destinatarios, correos in grupos.items():
+                html = '<hr>'.join(f'<h3>{correo.asunto}</h3>{correo.cuerpo_html}' for correo in correos)
+                resumenes.append(cls.objects.create(
+                    asunto=f'Resumen de alertas Avícola CVA ({len(correos)}) - {timezone.localtime(ahora).strftime("%d/%m/%Y")}',
+                    cuerpo_texto='\n\n'.join(f'{correo.asunto}\n{correo.cuerpo_texto}' for correo in correos),
+                    cuerpo_html=html,
+                    remitente=correos[0].remitente,
+                    destinatarios=destinatarios,
+                    categoria='alertas',
+                ))
+            cls.objects.filter(id__in=[correo.id for correo in pendientes]).update(estado='agrupado', fecha_envio=ahora)
+        return resumenes
+
+    def como_mensaje(self, conexion):
+        from django.core.mail import EmailMultiAlternatives
+        mensaje = EmailMultiAlternatives(
+            self.asunto, self.cuerpo_texto, self.remitente,
+            [email.strip() for email in self.destinatarios.split(',') if email.strip()],
+            connection=conexion
+        )
+        if self.cuerpo_html:
+            mensaje.attach_alternative(self.cuerpo_html, 'text/html')
+        return mensaje
+
+    def registrar_fallo(self, error):
+        """Programar el reintento con espera exponencial o darlo por fallido"""
+        from datetime import timedelta
+        self.intentos += 1
+        self.ultimo_error = str(error)[:1000]
+        if self.intentos >= self.MAX_INTENTOS:
+            self.estado = 'fallido'
+        else:
+            self.proximo_intento = timezone.now() + timedelta(seconds=self.ESPERA_BASE * 2 ** (self.intentos - 1))
+        self.save(update_fields=['intentos', 'ultimo_error', 'estado', 'proximo_intento'])
+
+    @classmethod
+    def enviar_pendientes(cls, limite=100, forzar_resumen=False):
+        """
+        Enviar los correos vencidos reutilizando una sola conexión SMTP.
+        Devuelve (enviados, fallidos).
+        """
+        from django.core.mail import get_connection
+
+        cls.generar_resumen(forzar=forzar_resumen)
+        correos = cls.reservar(limite)
+        if not correos:
+            return 0, 0
+
+        enviados = fallidos = 0
+        conexion = get_connection(fail_silently=False)
+        try:
+            conexion.open()
+        except Exception as e:
+            for correo in correos:
+                correo.registrar_fallo(e)
+            return 0, len(correos)
+
+        try:
+            for correo in correos:
+                try:
+                    conexion.send_messages([correo.como_mensaje(conexion)])
+                except Exception as e:
+                    correo.registrar_fallo(e)
+                    fallidos += 1
+                    # La conexión puede haber quedado inválida; se reabre para el resto.
+                    # Si no se puede, los que quedan vuelven a la cola al vencer la reserva
+                    conexion.close()
+                    try:
+                        conexion.open()
+                    except Exception:
+                        break
+                else:
+                    cls.objects.filter(pk=correo.pk).update(
+                        estado='enviado', intentos=F('intentos') + 1,
+                        fecha_envio=timezone.now(), ultimo_error=''
+                    )
+                    enviados += 1
+        finally:
+            conexion.close()
+
+        return enviados, fallidos
+
+class ConfiguracionSistema(ActualizacionMixin):
     """Configuraciones del sistema"""
     CATEGORIA_CHOICES = [
         ('general', 'General'),
@@ -350,7 +1108,6 @@ class ConfiguracionSistema(models.Model):
     categoria = models.CharField(max_length=20, choices=CATEGORIA_CHOICES, default='general')
     activo = models.BooleanField(default=True)
     fecha_creacion = models.DateTimeField(auto_now_add=True)
-    fecha_actualizacion = models.DateTimeField(auto_now=True)
     
     class Meta:
         verbose_name = 'Configuración del Sistema'
@@ -405,6 +1162,7 @@ class MovimientoStock(models.Model):
         ('stock_inicial', 'Stock Inicial'),
         ('devolucion', 'Devolución'),
         ('merma', 'Merma'),
+        ('toma_inventario', 'Toma de Inventario'),
     ]
     
     producto = models.ForeignKey(Producto, on_delete=models.CASCADE, related_name='movimientos_stock')
@@ -417,50 +1175,737 @@ class MovimientoStock(models.Model):
     observacion = models.TextField(blank=True, null=True)
     usuario = models.ForeignKey(User, on_delete=models.PROTECT)
     fecha = models.DateTimeField(auto_now_add=True)
+    costo_unitario = models.IntegerField(null=True, blank=True, help_text='Costo de la entrada (compras); recalcula el costo promedio')
     
     class Meta:
         verbose_name = 'Movimiento de Stock'
         verbose_name_plural = 'Movimientos de Stock'
         ordering = ['-fecha']
+        indexes = [
+            # Stock a una fecha: deltas entre un snapshot de inventario y la fecha pedida
+            models.Index(fields=['fecha', 'producto'], name='movstock_fecha_producto_idx'),
+        ]
     
     def __str__(self):
         return f"{self.producto.nombre} - {self.get_tipo_display()} ({self.cantidad}) - {self.fecha.strftime('%d/%m/%Y %H:%M')}"
     
+    @classmethod
+    def registrar_lote(cls, entradas, usuario, permitir_negativo=True, reserva=None):
+        """
+        Aplicar varios movimientos de stock en una transacción.
+        
+        `entradas` son tuplas (producto_id, delta, origen, referencia[, observacion]);
+        delta positivo es entrada y negativo salida. Las filas de los productos se
+        bloquean en orden de id (select_for_update) para que dos ventas simultáneas
+        del mismo producto no se pisen ni se bloqueen mutuamente; el stock anterior
+        y nuevo de cada movimiento se encadena sobre el valor bloqueado.
+        
+        `reserva` es la clave de ReservaStock del borrador que se confirma: sus
+        reservas se consumen en la misma transacción. Sin `permitir_negativo` una
+        salida no puede tomar unidades reservadas por otras facturas.
+        
+        Las entradas con `costo_unitario` (líneas de compra) recalculan el costo
+        promedio ponderado del producto sobre el stock bloqueado y dejan el
+        cambio en HistorialCosto.
+        """
+        entradas = [EntradaStock(*entrada) for entrada in entradas if entrada[1]]
+        reservados = set(
+            ReservaStock.objects.filter(clave=reserva).values_list('producto_id', flat=True)
+        ) if reserva else set()
+        if not entradas and not reservados:
+            return []
+        
+        ahora = timezone.now()
+        with transaction.atomic():
+            productos = {
+                producto.pk: producto
+                for producto in Producto.objects.select_for_update().filter(
+                    pk__in={entrada.producto_id for entrada in entradas} | reservados
+                ).order_by('pk')
+            }
+            anteriores = {pk: producto.stock for pk, producto in productos.items()}
+            
+            if reserva:
+                reservas = list(ReservaStock.objects.select_for_update().filter(clave=reserva, producto_id__in=productos))
+                for reserva_stock in reservas:
+                    productos[reserva_stock.producto_id].reservado -= reserva_stock.cantidad
+                ReservaStock.objects.filter(pk__in=[reserva_stock.pk for reserva_stock in reservas]).delete()
+            
+            movimientos, cambios_costo = [], []
+            for entrada in entradas:
+                producto = productos[entrada.producto_id]
+                stock_anterior = producto.stock
+                producto.stock += entrada.delta
+                if entrada.delta < 0 and producto.stock < producto.reservado and not permitir_negativo:
+                    raise ValueError(
+                        f'No hay suficiente stock de {producto.nombre} '
+                        f'(disponible: {max(stock_anterior - producto.reservado, 0)})'
+                    )
+                movimiento = cls(
+                    producto=producto,
+                    tipo='entrada' if entrada.delta > 0 else 'salida',
+                    origen=entrada.origen,
+                    cantidad=abs(entrada.delta),
+                    stock_anterior=stock_anterior,
+                    stock_nuevo=producto.stock,
+                    referencia=entrada.referencia[:100] if entrada.referencia else entrada.referencia,
+                    observacion=entrada.observacion,
+                    usuario=usuario,
+                )
+                if entrada.delta > 0 and entrada.costo_unitario is not None:
+                    movimiento.costo_unitario = entrada.costo_unitario
+                    cambio = HistorialCosto.desde_movimiento(movimiento, producto.costo_promedio)
+                    producto.costo_promedio = cambio.costo_promedio
+                    cambios_costo.append(cambio)
+                movimientos.append(movimiento)
+            
+            cls.objects.bulk_create(movimientos)
+            for cambio in cambios_costo:
+                cambio.fecha = cambio.movimiento.fecha
+            HistorialCosto.objects.bulk_create(cambios_costo)
+            for producto in productos.values():
+                producto.fecha_actualizacion = ahora
+            Producto.objects.bulk_update(productos.values(), ['stock', 'reservado', 'costo_promedio', 'fecha_actualizacion'])
+        
+        # Alertas de stock solo al cruzar el mínimo o agotarse
+        for pk, producto in productos.items():
+            Notificacion.verificar_stock_producto(producto, anteriores[pk])
+        
+        return movimientos
+    
+    @classmethod
+    def registrar_ajustes(cls, cantidades, usuario, origen='ajuste_manual', referencia='', observacion=''):
+        """
+        Llevar el stock de varios productos a `cantidades` ({producto_id: stock})
+        con movimientos de ajuste, en una transacción y con las filas bloqueadas
+        en orden de id. Los productos que ya tienen ese stock no generan
+        movimiento. Devuelve {producto_id: movimiento}.
+        """
+        if not cantidades:
+            return {}
+        
+        ahora = timezone.now()
+        with transaction.atomic():
+            productos = list(Producto.objects.select_for_update().filter(pk__in=cantidades).order_by('pk'))
+            anteriores = {producto.pk: producto.stock for producto in productos}
+            
+            movimientos = {}
+            for producto in productos:
+                cantidad = cantidades[producto.pk]
+                if cantidad == producto.stock:
+                    continue
+                movimientos[producto.pk] = cls(
+                    producto=producto,
+                    tipo='ajuste',
+                    origen=origen,
+                    cantidad=cantidad,
+                    stock_anterior=producto.stock,
+                    stock_nuevo=cantidad,
+                    referencia=referencia[:100] if referencia else referencia,
+                    observacion=observacion,
+                    usuario=usuario,
+                )
+                producto.stock = cantidad
+                producto.fecha_actualizacion = ahora
+            
+            cls.objects.bulk_create(movimientos.values())
+            Producto.objects.bulk_update(
+                [producto for producto in productos if producto.pk in movimientos], ['stock', 'fecha_actualizacion']
+            )
+        
+        for producto in productos:
+            if producto.pk in movimientos:
+                Notificacion.verificar_stock_producto(producto, anteriores[producto.pk])
+        
+        return movimientos
+    
     @classmethod
     def registrar_movimiento(cls, producto, tipo, origen, cantidad, usuario, referencia='', observacion=''):
-        """Registrar un movimiento de stock"""
-        stock_anterior = producto.stock
-        
-        # Calcular el nuevo stock según el tipo de movimiento
-        if tipo == 'entrada':
-            stock_nuevo = stock_anterior + cantidad
-        elif tipo == 'salida':
-            stock_nuevo = stock_anterior - cantidad
-        elif tipo == 'ajuste':
-            stock_nuevo = cantidad  # Para ajustes, la cantidad es el nuevo stock
-        else:  # inicial
-            stock_nuevo = cantidad
-        
-        # Crear el registro de movimiento
-        movimiento = cls.objects.create(
-            producto=producto,
-            tipo=tipo,
-            origen=origen,
-            cantidad=cantidad,
-            stock_anterior=stock_anterior,
-            stock_nuevo=stock_nuevo,
-            referencia=referencia,
-            observacion=observacion,
-            usuario=usuario
-        )
+        """Registrar un movimiento de stock de un producto"""
+        if tipo in ('entrada', 'salida'):
+            delta = cantidad if tipo == 'entrada' else -cantidad
+            movimientos = cls.registrar_lote([(producto.pk, delta, origen, referencia, observacion)], usuario)
+            movimiento = movimientos[0] if movimientos else None
+            if movimiento:
+                producto.stock = movimiento.stock_nuevo
+            return movimiento
         
-        # Actualizar el stock del producto
-        producto.stock = stock_nuevo
-        producto.save()
+        # Ajuste o stock inicial: la cantidad es el nuevo stock
+        with transaction.atomic():
+            bloqueado = Producto.objects.select_for_update().get(pk=producto.pk)
+            stock_anterior = bloqueado.stock
+            movimiento = cls.objects.create(
+                producto=bloqueado,
+                tipo=tipo,
+                origen=origen,
+                cantidad=cantidad,
+                stock_anterior=stock_anterior,
+                stock_nuevo=cantidad,
+                referencia=referencia,
+                observacion=observacion,
+                usuario=usuario
+            )
+            Producto.objects.filter(pk=producto.pk).update(stock=cantidad, fecha_actualizacion=timezone.now())
         
+        producto.stock = cantidad
+        Notificacion.verificar_stock_producto(producto, stock_anterior)
         return movimiento
 
-class Denominacion(models.Model):
+
+# Entrada de MovimientoStock.registrar_lote
+EntradaStock = namedtuple(
+    'EntradaStock', ['producto_id', 'delta', 'origen', 'referencia', 'observacion', 'costo_unitario'],
+    defaults=['', None],
+)
+
+class HistorialCosto(models.Model):
+    """
+    Cada cambio del costo promedio ponderado de un producto.
+    
+    El costo a una fecha es el último registro anterior a ella, una búsqueda
+    sobre el índice (producto, fecha) sin recorrer las compras.
+    """
+    producto = models.ForeignKey(Producto, on_delete=models.CASCADE, related_name='historial_costos')
+    movimiento = models.ForeignKey(MovimientoStock, on_delete=models.SET_NULL, null=True, blank=True, related_name='cambios_costo')
+    fecha = models.DateTimeField()
+    cantidad = models.IntegerField(help_text='Unidades que entraron')
+    costo_unitario = models.IntegerField(help_text='Costo de las unidades que entraron')
+    stock_anterior = models.IntegerField()
+    costo_anterior = models.IntegerField()
+    costo_promedio = models.IntegerField()
+
+    class Meta:
+        verbose_name = 'Historial de Costo'
+        verbose_name_plural = 'Historial de Costos'
+        ordering = ['-fecha', '-id']
+        indexes = [
+            models.Index(fields=['producto', 'fecha'], name='historialcosto_prod_fecha_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.producto} - {self.costo_anterior} -> {self.costo_promedio} ({self.fecha:%d/%m/%Y})'
+
+    @staticmethod
+    def promedio(stock, costo_promedio, cantidad, costo_unitario):
+        """
+        Nuevo costo promedio al entrar `cantidad` unidades a `costo_unitario`.
+        El stock negativo no tiene costo: se promedia desde cero.
+        """
+        stock = max(stock, 0)
+        total = stock + cantidad
+        if total <= 0:
+            return costo_unitario
+        # Redondeo al guaraní más cercano, en enteros
+        return (stock * costo_promedio + cantidad * costo_unitario + total // 2) // total
+
+    @classmethod
+    def desde_movimiento(cls, movimiento, costo_anterior):
+        """Cambio de costo de una entrada con costo_unitario (sin guardar)"""
+        return cls(
+            producto_id=movimiento.producto_id,
+            movimiento=movimiento,
+            fecha=movimiento.fecha,
+            cantidad=movimiento.cantidad,
+            costo_unitario=movimiento.costo_unitario,
+            stock_anterior=movimiento.stock_anterior,
+            costo_anterior=costo_anterior,
+            costo_promedio=cls.promedio(
+                movimiento.stock_anterior, costo_anterior, movimiento.cantidad, movimiento.costo_unitario
+            ),
+        )
+
+    @classmethod
+    def subconsulta(cls, producto, fecha):
+        """Costo promedio vigente a `fecha` como expresión (para anotar con OuterRef)"""
+        return models.Subquery(
+            cls.objects.filter(producto=producto, fecha__lte=fecha)
+            .order_by('-fecha', '-id').values('costo_promedio')[:1]
+        )
+
+    @classmethod
+    def costo_a_fecha(cls, producto, fecha):
+        """Costo promedio del producto a `fecha`"""
+        registros = cls.objects.filter(producto=producto)
+        ultimo = registros.filter(fecha__lte=fecha).order_by('-fecha', '-id').first()
+        if ultimo:
+            return ultimo.costo_promedio
+        # Antes de la primera compra registrada vale el costo con el que arrancó
+        primero = registros.order_by('fecha', 'id').first()
+        return primero.costo_anterior if primero else producto.costo_promedio
+
+class ReservaStock(models.Model):
+    """
+    Unidades retenidas mientras se carga una factura de venta.
+
+    `clave` identifica el borrador (un uuid que genera el formulario). Cada
+    reserva suma a Producto.reservado, así Producto.disponible ya descuenta lo
+    que se está vendiendo en otras cajas. Al guardar la factura las reservas se
+    consumen en MovimientoStock.registrar_lote; las de borradores abandonados
+    vencen a los RESERVA_STOCK_MINUTOS sin renovar y las libera barrer_vencidas.
+    """
+    clave = models.CharField(max_length=64, db_index=True)
+    producto = models.ForeignKey(Producto, on_delete=models.CASCADE, related_name='reservas')
+    cantidad = models.IntegerField()
+    usuario = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+    vence = models.DateTimeField(db_index=True)
+    fecha = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = 'Reserva de Stock'
+        verbose_name_plural = 'Reservas de Stock'
+        unique_together = ['clave', 'producto']
+
+    def __str__(self):
+        return f'{self.producto} x {self.cantidad} ({self.clave[:8]})'
+
+    @staticmethod
+    def vencimiento():
+        from datetime import timedelta
+        from django.conf import settings
+        return timezone.now() + timedelta(minutes=getattr(settings, 'RESERVA_STOCK_MINUTOS', 15))
+
+    @classmethod
+    def sincronizar(cls, clave, cantidades, usuario=None):
+        """
+        Dejar las reservas del borrador `clave` en `cantidades` ({producto_id: unidades})
+        y renovar su vencimiento.
+
+        Solo se reserva lo disponible: si otra factura ya retuvo las unidades la
+        reserva queda por debajo de lo pedido. Devuelve, por producto pedido, lo
+        reservado, el disponible restante y lo que faltó.
+        """
+        cantidades = {int(pk): max(int(cantidad), 0) for pk, cantidad in cantidades.items()}
+        actuales = set(cls.objects.filter(clave=clave).values_list('producto_id', flat=True))
+        if not cantidades and not actuales:
+            return {}
+
+        vence = cls.vencimiento()
+        resultado = {}
+        with transaction.atomic():
+            # Mismo orden de bloqueo que registrar_lote: productos y después reservas
+            productos = list(Producto.objects.select_for_update().filter(
+                pk__in=set(cantidades) | actuales
+            ).order_by('pk'))
+            reservas = {
+                reserva.producto_id: reserva
+                for reserva in cls.objects.select_for_update().filter(clave=clave)
+            }
+
+            cambiados, nuevas, borrar = [], [], []
+            for producto in productos:
+                reserva = reservas.get(producto.pk)
+                actual = reserva.cantidad if reserva else 0
+                pedida = cantidades.get(producto.pk, 0)
+                # Lo reservado por este borrador ya está descontado de disponible
+                nueva = max(min(pedida, producto.stock - producto.reservado + actual), 0)
+                if nueva != actual:
+                    producto.reservado += nueva - actual
+                    cambiados.append(producto)
+                if reserva and not nueva:
+                    borrar.append(reserva.pk)
+                elif reserva:
+                    reserva.cantidad = nueva
+                elif nueva:
+                    nuevas.append(cls(clave=clave, producto=producto, cantidad=nueva, usuario=usuario, vence=vence))
+                if producto.pk in cantidades:
+                    resultado[producto.pk] = {
+                        'reservado': nueva,
+                        'disponible': producto.stock - producto.reservado,
+                        'faltante': pedida - nueva,
+                    }
+
+            if cambiados:
+                Producto.objects.bulk_update(cambiados, ['reservado'])
+            if borrar:
+                cls.objects.filter(pk__in=borrar).delete()
+            vigentes = [reserva for reserva in reservas.values() if reserva.pk not in borrar]
+            for reserva in vigentes:
+                reserva.vence = vence
+            if vigentes:
+                cls.objects.bulk_update(vigentes, ['cantidad', 'vence'])
+            if nuevas:
+                cls.objects.bulk_create(nuevas)
+
+        return resultado
+
+    @classmethod
+    def conciliar(cls, producto_ids):
+        """Recalcular Producto.reservado desde la suma de las reservas que quedan"""
+        from django.db.models.functions import Coalesce
+
+        total = cls.objects.filter(producto=models.OuterRef('pk')).order_by().values('producto').annotate(
+            total=models.Sum('cantidad')
+        ).values('total')
+        Producto.objects.filter(pk__in=producto_ids).update(reservado=Coalesce(models.Subquery(total), 0))
+
+    @classmethod
+    def liberar(cls, clave):
+        """Devolver a disponible todo lo reservado por un borrador"""
+        with transaction.atomic():
+            producto_ids = list(cls.objects.filter(clave=clave).values_list('producto_id', flat=True))
+            cls.sincronizar(clave, {})
+            if producto_ids:
+                cls.conciliar(producto_ids)
+
+    @classmethod
+    def barrer_vencidas(cls):
+        """
+        Liberar las reservas vencidas; devuelve cuántas se eliminaron. El
+        reservado de los productos afectados se recalcula desde las reservas
+        vigentes, así también se corrige cualquier desvío anterior.
+        """
+        ahora = timezone.now()
+        producto_ids = set(cls.objects.filter(vence__lt=ahora).values_list('producto_id', flat=True))
+        if not producto_ids:
+            return 0
+
+        with transaction.atomic():
+            # Mismo orden de bloqueo que sincronizar y registrar_lote
+            list(Producto.objects.select_for_update().filter(pk__in=producto_ids).order_by('pk').values_list('pk'))
+            eliminadas, _ = cls.objects.filter(vence__lt=ahora, producto_id__in=producto_ids).delete()
+            cls.conciliar(producto_ids)
+        return eliminadas
+
+class SolicitudIdempotente(models.Model):
+    """
+    Resultado de un POST que registra facturas o pagos, por token de formulario.
+
+    Cada formulario lleva un token ({% token_idempotencia %}); si el mismo token
+    vuelve (doble clic, reintento del navegador) el decorador idempotente
+    redirige al resultado original sin volver a ejecutar la vista. Las filas
+    vencen a las IDEMPOTENCIA_HORAS y las elimina barrer_vencidas.
+    """
+    clave = models.CharField(max_length=64, primary_key=True)
+    usuario = models.ForeignKey(User, on_delete=models.CASCADE)
+    vista = models.CharField(max_length=40)
+    resultado = models.CharField(max_length=255, help_text='URL a la que redirigió la solicitud original')
+    vence = models.DateTimeField(db_index=True)
+
+    class Meta:
+        verbose_name = 'Solicitud Idempotente'
+        verbose_name_plural = 'Solicitudes Idempotentes'
+
+    def __str__(self):
+        return f'{self.vista} {self.clave[:8]} -> {self.resultado}'
+
+    @classmethod
+    def resultado_previo(cls, clave, usuario):
+        """URL del resultado ya registrado para el token (None si es nuevo o venció)"""
+        return cls.objects.filter(clave=clave, usuario=usuario, vence__gte=timezone.now()).values_list('resultado', flat=True).first()
+
+    @classmethod
+    def registrar(cls, clave, usuario, vista, resultado):
+        from datetime import timedelta
+        from django.conf import settings
+
+        vence = timezone.now() + timedelta(hours=getattr(settings, 'IDEMPOTENCIA_HORAS', 24))
+        cls.objects.update_or_create(clave=clave, defaults={
+            'usuario': usuario, 'vista': vista, 'resultado': resultado[:255], 'vence': vence,
+        })
+
+    @staticmethod
+    @contextmanager
+    def bloqueo(clave):
+        """
+        Advisory lock de PostgreSQL sobre el token mientras se ejecuta la vista:
+        un duplicado concurrente espera acá y después encuentra el resultado.
+        En otras bases (SQLite de desarrollo) no bloquea.
+        """
+        import hashlib
+        from django.db import connection
+
+        if connection.vendor != 'postgresql':
+            yield
+            return
+        llave = int.from_bytes(hashlib.blake2b(clave.encode(), digest_size=8).digest(), 'big', signed=True)
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_advisory_lock(%s)', [llave])
+        try:
+            yield
+        finally:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT pg_advisory_unlock(%s)', [llave])
+
+    @classmethod
+    def barrer_vencidas(cls):
+        """Eliminar los tokens vencidos; devuelve cuántos se eliminaron"""
+        eliminadas, _ = cls.objects.filter(vence__lt=timezone.now()).delete()
+        return eliminadas
+
+class InventarioSnapshot(models.Model):
+    """
+    Stock y costo de todos los productos en un instante.
+
+    El stock a una fecha parte del snapshot más cercano (anterior o posterior;
+    el stock actual cuenta como el último) y suma o resta los movimientos de
+    stock entre ambos instantes, así no hace falta recorrer el libro desde el
+    principio. El primer snapshot de cada mes queda como mensual y se conserva;
+    los diarios se depuran con purgar().
+    """
+    PERIODO_CHOICES = [
+        ('diario', 'Diario'),
+        ('mensual', 'Mensual'),
+    ]
+
+    fecha = models.DateTimeField()
+    periodo = models.CharField(max_length=10, choices=PERIODO_CHOICES)
+    producto = models.ForeignKey(Producto, on_delete=models.CASCADE, related_name='snapshots_inventario')
+    stock = models.IntegerField()
+    # Costo promedio ponderado al tomar el snapshot (el mismo que valoriza HistorialCosto)
+    costo = models.IntegerField()
+
+    class Meta:
+        verbose_name = 'Snapshot de Inventario'
+        verbose_name_plural = 'Snapshots de Inventario'
+        ordering = ['-fecha']
+        unique_together = ['fecha', 'producto']
+
+    def __str__(self):
+        return f'{self.producto} {self.fecha:%d/%m/%Y %H:%M}: {self.stock}'
+
+    @classmethod
+    def tomar(cls, periodo=None):
+        """
+        Copiar stock y costo promedio de todos los productos con un INSERT ... SELECT.
+        Sin `periodo` es mensual si todavía no hay uno en el mes, si no diario.
+        Devuelve (fecha, filas).
+        """
+        from django.db import connections, router
+
+        ahora = timezone.now()
+        if periodo is None:
+            inicio_mes = timezone.localtime(ahora).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+            ya_hay_mensual = cls.objects.filter(periodo='mensual', fecha__gte=inicio_mes).exists()
+            periodo = 'diario' if ya_hay_mensual else 'mensual'
+
+        conexion = connections[router.db_for_write(cls)]
+        qn = conexion.ops.quote_name
+        destino = ', '.join(qn(cls._meta.get_field(nombre).column) for nombre in ['fecha', 'periodo', 'producto', 'stock', 'costo'])
+        origen = ', '.join(qn(Producto._meta.get_field(nombre).column) for nombre in ['id', 'stock', 'costo_promedio'])
+        sql = (
+            f'INSERT INTO {qn(cls._meta.db_table)} ({destino}) '
+            f'SELECT %s, %s, {origen} FROM {qn(Producto._meta.db_table)}'
+        )
+        with transaction.atomic(using=conexion.alias), conexion.cursor() as cursor:
+            cursor.execute(sql, [cls._meta.get_field('fecha').get_db_prep_save(ahora, connection=conexion), periodo])
+            return ahora, cursor.rowcount
+
+    @classmethod
+    def purgar(cls, dias):
+        """Eliminar los snapshots diarios de más de `dias` días; los mensuales se conservan"""
+        from datetime import timedelta
+        eliminados, _ = cls.objects.filter(periodo='diario', fecha__lt=timezone.now() - timedelta(days=dias)).delete()
+        return eliminados
+
+    @staticmethod
+    def corte(fecha):
+        """Instante límite: una fecha sin hora se toma al cierre del día"""
+        from datetime import date, datetime, time, timedelta
+        if isinstance(fecha, datetime):
+            return fecha if timezone.is_aware(fecha) else timezone.make_aware(fecha)
+        if isinstance(fecha, date):
+            return timezone.make_aware(datetime.combine(fecha + timedelta(days=1), time.min))
+        raise TypeError('Se esperaba una fecha')
+
+    @classmethod
+    def _deltas(cls, desde, hasta, productos):
+        """Variación neta de stock por producto con desde <= fecha < hasta (None: sin límite)"""
+        from django.db.models import Sum
+        movimientos = MovimientoStock.objects.filter(fecha__gte=desde)
+        if hasta is not None:
+            movimientos = movimientos.filter(fecha__lt=hasta)
+        if productos is not None:
+            movimientos = movimientos.filter(producto_id__in=productos)
+        return dict(
+            movimientos.values('producto_id').annotate(
+                delta=Sum(F('stock_nuevo') - F('stock_anterior'))
+            ).values_list('producto_id', 'delta').order_by()
+        )
+
+    @classmethod
+    def _vecinos(cls, corte):
+        """Fechas del snapshot anterior (<= corte) y posterior (> corte), o None"""
+        from django.db.models import Max, Min
+        anterior = cls.objects.filter(fecha__lte=corte).aggregate(fecha=Max('fecha'))['fecha']
+        posterior = cls.objects.filter(fecha__gt=corte).aggregate(fecha=Min('fecha'))['fecha']
+        return anterior, posterior
+
+    @classmethod
+    def stock_a_fecha(cls, fecha, productos=None):
+        """
+        {producto_id: stock} al instante `fecha` (una fecha sin hora es al cierre
+        del día) para todos los productos o los ids de `productos`.
+        """
+        corte = cls.corte(fecha)
+        productos = None if productos is None else list(productos)
+        anterior, posterior = cls._vecinos(corte)
+        # El stock actual es el snapshot más reciente
+        siguiente = posterior or timezone.now()
+
+        if anterior is not None and corte - anterior <= siguiente - corte:
+            # Snapshot anterior más los movimientos hasta el corte
+            base = cls.objects.filter(fecha=anterior)
+            signo, desde, hasta = 1, anterior, corte
+        else:
+            # Snapshot posterior (o el stock actual, sin límite superior) menos los movimientos desde el corte
+            if posterior:
+                base = cls.objects.filter(fecha=posterior)
+            else:
+                base = Producto.objects.annotate(producto_id=F('id'))
+            signo, desde, hasta = -1, corte, posterior
+
+        if productos is not None:
+            base = base.filter(producto_id__in=productos)
+        stock = dict(base.values_list('producto_id', 'stock'))
+        for producto_id, delta in cls._deltas(desde, hasta, productos).items():
+            stock[producto_id] = stock.get(producto_id, 0) + signo * delta
+        return stock
+
+    @classmethod
+    def valorizacion_a_fecha(cls, fecha, productos=None):
+        """
+        {producto_id: {'stock', 'costo', 'valor'}} al instante `fecha`, con el
+        costo promedio ponderado vigente entonces (HistorialCosto.costo_a_fecha,
+        resuelto para todos los productos en una consulta)
+        """
+        from django.db.models.functions import Coalesce
+
+        corte = cls.corte(fecha)
+        stock = cls.stock_a_fecha(corte, productos)
+
+        # Antes de la primera compra registrada vale el costo con el que arrancó
+        inicial = HistorialCosto.objects.filter(producto=models.OuterRef('pk')).order_by('fecha', 'id').values('costo_anterior')[:1]
+        costos = dict(
+            Producto.objects.filter(pk__in=stock).annotate(
+                costo_corte=Coalesce(
+                    HistorialCosto.subconsulta(models.OuterRef('pk'), corte),
+                    models.Subquery(inicial),
+                    F('costo_promedio'),
+                )
+            ).values_list('id', 'costo_corte')
+        )
+
+        return {
+            producto_id: {
+                'stock': cantidad,
+                'costo': costos.get(producto_id, 0),
+                'valor': cantidad * costos.get(producto_id, 0),
+            }
+            for producto_id, cantidad in stock.items()
+        }
+
+
+class TomaInventario(ActualizacionMixin):
+    """
+    Conteo físico de inventario: se cargan las cantidades contadas (grilla o
+    CSV), se revisan las diferencias y al aplicarla todos los ajustes se
+    registran juntos con MovimientoStock.registrar_ajustes.
+    """
+    ESTADO_CHOICES = [
+        ('borrador', 'Borrador'),
+        ('aplicada', 'Aplicada'),
+        ('cancelada', 'Cancelada'),
+    ]
+
+    descripcion = models.CharField(max_length=200, blank=True)
+    estado = models.CharField(max_length=10, choices=ESTADO_CHOICES, default='borrador')
+    usuario = models.ForeignKey(User, on_delete=models.PROTECT, related_name='tomas_inventario')
+    fecha = models.DateTimeField(auto_now_add=True)
+    fecha_aplicacion = models.DateTimeField(null=True, blank=True)
+    usuario_aplicacion = models.ForeignKey(
+        User, on_delete=models.PROTECT, null=True, blank=True, related_name='tomas_inventario_aplicadas'
+    )
+
+    class Meta:
+        verbose_name = 'Toma de Inventario'
+        verbose_name_plural = 'Tomas de Inventario'
+        ordering = ['-fecha']
+
+    def __str__(self):
+        return f'Toma #{self.pk} {self.fecha:%d/%m/%Y} ({self.get_estado_display()})'
+
+    def guardar_conteos(self, cantidades):
+        """
+        Registrar cantidades contadas ({producto_id: cantidad}); None quita el
+        conteo del producto. Un solo upsert para todas las filas.
+        """
+        borrar = [producto_id for producto_id, cantidad in cantidades.items() if cantidad is None]
+        if borrar:
+            self.conteos.filter(producto_id__in=borrar).delete()
+        ConteoInventario.objects.bulk_create(
+            [
+                ConteoInventario(toma=self, producto_id=producto_id, cantidad_contada=cantidad)
+                for producto_id, cantidad in cantidades.items() if cantidad is not None
+            ],
+            update_conflicts=True,
+            unique_fields=['toma', 'producto'],
+            update_fields=['cantidad_contada', 'fecha_actualizacion'],
+        )
+
+    def diferencias(self):
+        """
+        Conteos con el stock y costo del sistema y la diferencia, en una consulta.
+        Antes de aplicar se comparan contra el stock actual; después, contra el
+        stock que había al aplicar.
+        """
+        conteos = self.conteos.select_related('producto').order_by('producto__nombre')
+        if self.estado == 'aplicada':
+            conteos = conteos.annotate(sistema=F('stock_sistema'), costo_unitario=F('costo'))
+        else:
+            conteos = conteos.annotate(sistema=F('producto__stock'), costo_unitario=F('producto__costo_promedio'))
+        return conteos.annotate(diferencia=F('cantidad_contada') - F('sistema')).annotate(
+            valor_diferencia=F('diferencia') * F('costo_unitario')
+        )
+
+    def aplicar(self, usuario):
+        """Registrar todos los ajustes y fijar el stock del sistema de cada conteo"""
+        with transaction.atomic():
+            toma = TomaInventario.objects.select_for_update().get(pk=self.pk)
+            if toma.estado != 'borrador':
+                raise ValueError('La toma de inventario ya fue aplicada o cancelada')
+
+            conteos = list(self.conteos.all())
+            cantidades = {conteo.producto_id: conteo.cantidad_contada for conteo in conteos}
+            # El stock anterior se lee sobre la fila bloqueada por registrar_ajustes
+            costos = dict(Producto.objects.filter(pk__in=cantidades).values_list('id', 'costo_promedio'))
+            movimientos = MovimientoStock.registrar_ajustes(
+                cantidades, usuario, origen='toma_inventario',
+                referencia=f'Toma de inventario #{self.pk}', observacion=self.descripcion,
+            )
+            stock_actual = dict(Producto.objects.filter(pk__in=cantidades).values_list('id', 'stock'))
+            for conteo in conteos:
+                movimiento = movimientos.get(conteo.producto_id)
+                conteo.stock_sistema = movimiento.stock_anterior if movimiento else stock_actual[conteo.producto_id]
+                conteo.costo = costos[conteo.producto_id]
+            ConteoInventario.objects.bulk_update(conteos, ['stock_sistema', 'costo'])
+
+            self.estado = 'aplicada'
+            self.fecha_aplicacion = timezone.now()
+            self.usuario_aplicacion = usuario
+            self.save(update_fields=['estado', 'fecha_aplicacion', 'usuario_aplicacion'])
+        return movimientos
+
+
+class ConteoInventario(ActualizacionMixin):
+    """Cantidad contada de un producto en una toma de inventario"""
+    toma = models.ForeignKey(TomaInventario, on_delete=models.CASCADE, related_name='conteos')
+    producto = models.ForeignKey(Producto, on_delete=models.PROTECT, related_name='conteos_inventario')
+    cantidad_contada = models.IntegerField()
+    # Se completan al aplicar la toma
+    stock_sistema = models.IntegerField(null=True, blank=True)
+    # Costo promedio del producto al aplicar la toma
+    costo = models.IntegerField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = 'Conteo de Inventario'
+        verbose_name_plural = 'Conteos de Inventario'
+        unique_together = ['toma', 'producto']
+
+    def __str__(self):
+        return f'{self.producto}: {self.cantidad_contada}'
+
+
+class Denominacion(ActualizacionMixin):
     """Modelo para las denominaciones de billetes y monedas"""
     VALOR_CHOICES = [
         (100000, '100.000 Gs.'),
@@ -495,9 +1940,19 @@ class Denominacion(models.Model):
         """Calcular el subtotal de esta denominación"""
         return self.valor * self.cantidad
 
-class Caja(models.Model):
-    """Modelo para control de caja diario"""
-    fecha = models.DateField(unique=True)
+class Caja(ActualizacionMixin):
+    """
+    Caja diaria de un terminal o cajero.
+
+    Cada cajero abre y cierra su propia caja (con su arqueo de denominaciones),
+    así los cobros de distintas cajas no compiten por la misma fila. Los pagos
+    se registran en la caja abierta por el usuario o, si no tiene, en la
+    principal; consolidado() suma todas las cajas de un día.
+    """
+    TERMINAL_PRINCIPAL = 'principal'
+
+    fecha = models.DateField()
+    terminal = models.CharField(max_length=30, default=TERMINAL_PRINCIPAL, help_text='Terminal o cajero; una caja por terminal y día')
     saldo_inicial = models.IntegerField(default=0)
     saldo_final = models.IntegerField(default=0)
     saldo_real = models.IntegerField(default=0)
@@ -512,10 +1967,13 @@ class Caja(models.Model):
     class Meta:
         verbose_name = 'Caja'
         verbose_name_plural = 'Cajas'
-        ordering = ['-fecha']
+        ordering = ['-fecha', 'terminal']
+        constraints = [
+            models.UniqueConstraint(fields=['fecha', 'terminal'], name='caja_fecha_terminal_uniq'),
+        ]
     
     def __str__(self):
-        return f"Caja {self.fecha.strftime('%d/%m/%Y')} - {'Cerrada' if self.cerrada else 'Abierta'}"
+        return f"Caja {self.terminal} {self.fecha.strftime('%d/%m/%Y')} - {'Cerrada' if self.cerrada else 'Abierta'}"
     
     def calcular_saldo_inicial_denominaciones(self):
         """Calcular el saldo inicial basado en las denominaciones de apertura"""
@@ -540,6 +1998,12 @@ class Caja(models.Model):
         self.saldo_final = self.saldo_inicial + total_ingresos - total_egresos
         return self.saldo_final
     
+    def acumular_saldo_final(self, delta):
+        """Sumar `delta` al saldo final en la base (saldo_final = saldo_final + delta)"""
+        if delta:
+            Caja.objects.filter(pk=self.pk).update(saldo_final=F('saldo_final') + delta)
+            self.saldo_final += delta
+    
     def calcular_diferencia(self):
         """Calcular diferencia entre saldo final y saldo real"""
         self.diferencia = self.saldo_real - self.saldo_final
@@ -576,65 +2040,71 @@ class Caja(models.Model):
         return saldo_real
     
     @classmethod
-    def obtener_caja_activa(cls, fecha=None):
+    def caja_de_usuario(cls, usuario=None, fecha=None):
         """
-        Obtener la caja activa para una fecha específica o el día actual
+        Caja abierta en la que registra el usuario: la que abrió él o, si no
+        tiene una, la del terminal principal. Con `fecha` solo se busca en ese día.
+        """
+        abiertas = cls.objects.filter(cerrada=False).order_by('fecha')
+        if fecha is not None:
+            abiertas = abiertas.filter(fecha=fecha)
+        caja = abiertas.filter(usuario_apertura=usuario).first() if usuario is not None else None
+        return caja or abiertas.filter(terminal=cls.TERMINAL_PRINCIPAL).first()
+    
+    @classmethod
+    def obtener_caja_activa(cls, fecha=None, usuario=None):
+        """
+        Obtener la caja activa del usuario para una fecha específica o el día actual
         """
         if fecha is None:
             fecha = timezone.now().date()
         
-        # Buscar caja activa para la fecha específica
-        caja = cls.objects.filter(
-            fecha=fecha,
-            cerrada=False
-        ).first()
-        
-        # Si no hay caja para hoy, buscar la caja más reciente abierta
-        if not caja:
-            caja = cls.objects.filter(
-                cerrada=False
-            ).order_by('-fecha').first()
-        
-        return caja
+        # Si no hay caja para la fecha, la más antigua que siga abierta
+        return cls.caja_de_usuario(usuario, fecha) or cls.caja_de_usuario(usuario)
     
     @classmethod
-    def validar_caja_activa_hoy(cls):
+    def validar_caja_activa_hoy(cls, usuario=None):
         """
-        Valida que la caja activa sea del día actual.
+        Valida que la caja activa del usuario sea del día actual.
         Retorna (caja_activa, necesita_cierre) donde:
         - caja_activa: la caja activa (puede ser None)
-        - necesita_cierre: True si hay una caja abierta de días anteriores
-        """
-        fecha_hoy = timezone.now().date()
-        
-        # Buscar caja activa para hoy
-        caja_hoy = cls.objects.filter(
-            fecha=fecha_hoy,
-            cerrada=False
-        ).first()
-        
-        # Buscar caja activa de días anteriores
-        caja_anterior = cls.objects.filter(
-            cerrada=False
-        ).exclude(fecha=fecha_hoy).first()
-        
-        if caja_anterior:
-            # Hay una caja abierta de días anteriores
-            return caja_anterior, True
-        elif caja_hoy:
-            # Hay una caja abierta para hoy
-            return caja_hoy, False
-        else:
-            # No hay caja abierta
-            return None, False
+        - necesita_cierre: True si esa caja quedó abierta de un día anterior
+        Las cajas de otros terminales no bloquean al usuario.
+        """
+        caja = cls.caja_de_usuario(usuario)
+        if caja and caja.fecha != timezone.now().date():
+            return caja, True
+        return caja, False
+    
+    @classmethod
+    def consolidado(cls, fecha):
+        """
+        Cajas de un día con sus ingresos y egresos (una sola consulta agrupada)
+        y los totales del día sumados sobre esas filas.
+        """
+        cajas = list(
+            cls.objects.filter(fecha=fecha)
+            .select_related('usuario_apertura', 'usuario_cierre')
+            .annotate(
+                ingresos=models.Sum('movimientos__monto', filter=models.Q(movimientos__tipo='ingreso'), default=0),
+                egresos=models.Sum('movimientos__monto', filter=models.Q(movimientos__tipo='egreso'), default=0),
+                cantidad_movimientos=models.Count('movimientos'),
+            )
+            .order_by('terminal')
+        )
+        campos = ['saldo_inicial', 'ingresos', 'egresos', 'saldo_final', 'saldo_real', 'diferencia', 'cantidad_movimientos']
+        totales = {campo: sum(getattr(caja, campo) for caja in cajas) for campo in campos}
+        totales['abiertas'] = sum(1 for caja in cajas if not caja.cerrada)
+        totales['cajas'] = len(cajas)
+        return cajas, totales
     
     @classmethod
-    def obtener_ultimo_saldo_cierre(cls):
+    def obtener_ultimo_saldo_cierre(cls, terminal=TERMINAL_PRINCIPAL):
         """
-        Obtener el saldo final de la última caja cerrada
+        Obtener el saldo final de la última caja cerrada del terminal
         """
         ultima_caja_cerrada = cls.objects.filter(
-            cerrada=True
+            cerrada=True, terminal=terminal
         ).order_by('-fecha').first()
         
         if ultima_caja_cerrada:
@@ -642,12 +2112,12 @@ class Caja(models.Model):
         return 0
     
     @classmethod
-    def obtener_denominaciones_ultimo_cierre(cls):
+    def obtener_denominaciones_ultimo_cierre(cls, terminal=TERMINAL_PRINCIPAL):
         """
-        Obtener las denominaciones de cierre de la última caja cerrada
+        Obtener las denominaciones de cierre de la última caja cerrada del terminal
         """
         ultima_caja_cerrada = cls.objects.filter(
-            cerrada=True
+            cerrada=True, terminal=terminal
         ).order_by('-fecha').first()
         
         if ultima_caja_cerrada:
@@ -705,14 +2175,13 @@ class MovimientoCaja(models.Model):
             usuario=usuario
         )
         
-        # Actualizar saldo final de la caja
-        caja.calcular_saldo_final()
-        caja.save()
+        # Saldo final con un UPDATE atómico: sin releer los movimientos ni pisar la fila entera
+        caja.acumular_saldo_final(monto if tipo == 'ingreso' else -monto)
         
         return movimiento
 
 
-class Gasto(models.Model):
+class Gasto(ActualizacionMixin):
     """Modelo para registrar gastos diarios"""
     CATEGORIA_CHOICES = [
         ('combustible', 'Combustible'),
@@ -762,7 +2231,7 @@ class Gasto(models.Model):
             self._movimiento_creado = True
 
 
-class PermisoUsuario(models.Model):
+class PermisoUsuario(ActualizacionMixin):
     """Modelo para definir permisos de módulos por usuario"""
     MODULO_CHOICES = [
         ('dashboard', 'Dashboard'),
@@ -786,7 +2255,6 @@ class PermisoUsuario(models.Model):
     puede_editar = models.BooleanField(default=False)
     puede_eliminar = models.BooleanField(default=False)
     fecha_creacion = models.DateTimeField(auto_now_add=True)
-    fecha_actualizacion = models.DateTimeField(auto_now=True)
     
     class Meta:
         verbose_name = 'Permiso de Usuario'
@@ -829,3 +2297,116 @@ class PermisoUsuario(models.Model):
                     'puede_eliminar': False
                 }
             )
+
+
+class BloqueoPlanificador(models.Model):
+    """Lease en la base que define qué servidor ejecuta las tareas programadas"""
+    nombre = models.CharField(max_length=50, unique=True)
+    servidor = models.CharField(max_length=255)
+    vence = models.DateTimeField()
+
+    class Meta:
+        verbose_name = 'Bloqueo del planificador'
+        verbose_name_plural = 'Bloqueos del planificador'
+
+    def __str__(self):
+        return f'{self.nombre}: {self.servidor} hasta {self.vence}'
+
+    @classmethod
+    def adquirir(cls, nombre, servidor, duracion):
+        """
+        Tomar o renovar el lease. Solo lo consigue quien ya lo tiene o cuando
+        el anterior venció; devuelve True si este servidor es el líder.
+        """
+        from django.db import IntegrityError
+        ahora = timezone.now()
+        renovado = cls.objects.filter(nombre=nombre).filter(
+            models.Q(servidor=servidor) | models.Q(vence__lt=ahora)
+        ).update(servidor=servidor, vence=ahora + duracion)
+        if renovado:
+            return True
+        try:
+            with transaction.atomic():
+                cls.objects.create(nombre=nombre, servidor=servidor, vence=ahora + duracion)
+            return True
+        except IntegrityError:
+            return False
+
+    @classmethod
+    def liberar(cls, nombre, servidor):
+        cls.objects.filter(nombre=nombre, servidor=servidor).delete()
+
+
+class EjecucionTarea(models.Model):
+    """Historial de ejecuciones de las tareas programadas"""
+    ESTADO_CHOICES = [
+        ('en_curso', 'En curso'),
+        ('ok', 'Correcta'),
+        ('error', 'Con error'),
+    ]
+
+    tarea = models.CharField(max_length=50)
+    servidor = models.CharField(max_length=255)
+    inicio = models.DateTimeField()
+    fin = models.DateTimeField(null=True, blank=True)
+    duracion_ms = models.PositiveIntegerField(null=True, blank=True)
+    estado = models.CharField(max_length=10, choices=ESTADO_CHOICES, default='en_curso')
+    resultado = models.TextField(blank=True)
+
+    class Meta:
+        verbose_name = 'Ejecución de tarea'
+        verbose_name_plural = 'Ejecuciones de tareas'
+        ordering = ['-inicio']
+        indexes = [
+            models.Index(fields=['tarea', '-inicio'], name='ejecucion_tarea_inicio_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.tarea} {self.inicio:%d/%m/%Y %H:%M} ({self.get_estado_display()})'
+
+    @classmethod
+    def ultimas_ejecuciones(cls):
+        """Inicio de la última ejecución de cada tarea en una sola consulta"""
+        return dict(cls.objects.values_list('tarea').annotate(ultima=models.Max('inicio')).order_by())
+
+
+class RegistroEliminacion(models.Model):
+    """Tombstone de filas borradas, para replicar las eliminaciones de forma incremental"""
+    tabla = models.CharField(max_length=100)
+    registro_id = models.BigIntegerField()
+    fecha = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = 'Registro de eliminación'
+        verbose_name_plural = 'Registros de eliminación'
+        indexes = [
+            models.Index(fields=['tabla', 'id'], name='eliminacion_tabla_id_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.tabla} #{self.registro_id}'
+
+
+class MarcaReplicacion(models.Model):
+    """Marca de agua por tabla y base destino de la replicación incremental"""
+    destino = models.CharField(max_length=50)
+    tabla = models.CharField(max_length=100)
+    ultimo_id = models.BigIntegerField(default=0)
+    ultima_actualizacion = models.DateTimeField(null=True, blank=True)
+    ultima_eliminacion = models.BigIntegerField(default=0, help_text='Último RegistroEliminacion aplicado')
+    filas_origen = models.PositiveIntegerField(default=0)
+    filas_destino = models.PositiveIntegerField(default=0)
+    bloques_corregidos = models.PositiveIntegerField(default=0)
+    verificada = models.BooleanField(default=False)
+    ultima_copia = models.DateTimeField(null=True, blank=True, help_text='Inicio de la última pasada incremental completa')
+    fecha = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = 'Marca de replicación'
+        verbose_name_plural = 'Marcas de replicación'
+        constraints = [
+            models.UniqueConstraint(fields=['destino', 'tabla'], name='marca_replicacion_unica'),
+        ]
+
+    def __str__(self):
+        return f'{self.destino}/{self.tabla}: id>{self.ultimo_id}'
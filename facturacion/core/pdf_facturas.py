@@ -0,0 +1,277 @@
+"""
+PDF de facturas con reportlab.
+
+Cada PDF se guarda en el storage bajo la huella (sha256) de los datos que se
+imprimen más VERSION_PDF: una reimpresión sin cambios lee el archivo ya
+generado y cualquier cambio en la factura, sus detalles, la contraparte o el
+encabezado de la empresa produce una huella nueva. Al cambiar el diseño se sube
+VERSION_PDF.
+
+renderizar_pdf recibe solo diccionarios (sin ORM), así el modo por lotes puede
+repartir las facturas entre procesos.
+"""
+import hashlib
+import io
+import json
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from xml.sax.saxutils import escape
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db.models import Prefetch
+from django.utils import timezone
+
+from .models import ConfiguracionSistema, DetalleFactura, Factura
+
+VERSION_PDF = 1
+DIRECTORIO = 'facturas_pdf'
+MINIMO_POOL = 20  # con menos facturas por generar no compensa levantar procesos
+
+
+def formato_gs(valor):
+    """Número con punto como separador de miles (igual que intcomma_dot)"""
+    return f'{int(valor or 0):,}'.replace(',', '.')
+
+
+def encabezado_empresa():
+    return {
+        'nombre': ConfiguracionSistema.get_valor('nombre_empresa', 'Avícola CVA'),
+        'pais': ConfiguracionSistema.get_valor('pais', 'Paraguay'),
+        'moneda': ConfiguracionSistema.get_valor('moneda', 'Gs.'),
+    }
+
+
+def facturas_con_detalles(queryset=None):
+    """Facturas con contraparte y detalles/productos precargados"""
+    queryset = Factura.objects.all() if queryset is None else queryset
+    return queryset.select_related('cliente', 'proveedor').prefetch_related(
+        Prefetch('detalles', queryset=DetalleFactura.objects.select_related('producto').order_by('id'))
+    )
+
+
+def datos_factura(factura, empresa=None):
+    """Todo lo que se imprime, como tipos simples (serializable y picklable)"""
+    contraparte = factura.cliente if factura.tipo == 'venta' else factura.proveedor
+    return {
+        'version': VERSION_PDF,
+        'empresa': empresa or encabezado_empresa(),
+        'id': factura.pk,
+        'tipo': factura.tipo,
+        'tipo_display': factura.get_tipo_display(),
+        'numero': factura.numero,
+        'fecha': timezone.localtime(factura.fecha).strftime('%d/%m/%Y %H:%M'),
+        'vencimiento': factura.fecha_vencimiento.strftime('%d/%m/%Y') if factura.fecha_vencimiento else '',
+        'estado': factura.get_estado_display(),
+        'contraparte': {
+            'nombre': contraparte.nombre if contraparte else '',
+            'ruc': contraparte.ruc if contraparte else '',
+            'telefono': contraparte.telefono if contraparte else '',
+        },
+        'observacion': factura.observacion or '',
+        'detalles': [
+            {
+                'codigo': detalle.producto.codigo,
+                'producto': detalle.producto.nombre,
+                'cantidad': detalle.cantidad,
+                'precio_unitario': detalle.precio_unitario,
+                'tasa': detalle.producto.iva,
+                'subtotal': detalle.subtotal,
+                'iva': detalle.iva,
+            }
+            for detalle in factura.detalles.all()
+        ],
+        'subtotal': factura.subtotal,
+        'iva': factura.iva,
+        'total': factura.total,
+    }
+
+
+def huella(datos):
+    contenido = json.dumps(datos, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(contenido.encode('utf-8')).hexdigest()
+
+
+def ruta_cache(clave):
+    return f'{DIRECTORIO}/{clave[:2]}/{clave}.pdf'
+
+
+def _historia(datos, estilos):
+    """Flowables de una factura"""
+    from reportlab.lib import colors
+    from reportlab.lib.units import mm
+    from reportlab.platypus import Paragraph, Spacer, Table, TableStyle
+
+    empresa = datos['empresa']
+    moneda = empresa['moneda']
+    historia = [
+        Paragraph(escape(empresa['nombre']), estilos['Title']),
+        Paragraph(escape(empresa['pais']), estilos['Normal']),
+        Spacer(1, 6 * mm),
+    ]
+
+    etiqueta = 'Cliente' if datos['tipo'] == 'venta' else 'Proveedor'
+    cabecera = Table([
+        [f"Factura de {datos['tipo_display']}", f"N° {datos['numero']}"],
+        ['Fecha', datos['fecha']],
+        ['Vencimiento', datos['vencimiento'] or '-'],
+        [etiqueta, datos['contraparte']['nombre']],
+        ['RUC', datos['contraparte']['ruc']],
+        ['Estado', datos['estado']],
+    ], colWidths=[40 * mm, 130 * mm])
+    cabecera.setStyle(TableStyle([
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTNAME', (0, 1), (0, -1), 'Helvetica-Bold'),
+        ('BOTTOMPADDING', (0, 0), (-1, -1), 2),
+    ]))
+    historia += [cabecera, Spacer(1, 6 * mm)]
+
+    # Valor de venta por columna de tasa, como en la factura impresa
+    filas = [['Código', 'Descripción', 'Cant.', 'Precio unit.', 'IVA 5%', 'IVA 10%']]
+    gravadas = {5: 0, 10: 0}
+    liquidacion = {5: 0, 10: 0}
+    for detalle in datos['detalles']:
+        tasa = 5 if detalle['tasa'] == 5 else 10
+        gravadas[tasa] += detalle['subtotal']
+        liquidacion[tasa] += detalle['iva']
+        filas.append([
+            detalle['codigo'],
+            Paragraph(escape(detalle['producto']), estilos['BodyText']),
+            formato_gs(detalle['cantidad']),
+            formato_gs(detalle['precio_unitario']),
+            formato_gs(detalle['subtotal']) if tasa == 5 else '',
+            formato_gs(detalle['subtotal']) if tasa == 10 else '',
+        ])
+    filas.append(['', 'Subtotales', '', '', formato_gs(gravadas[5]), formato_gs(gravadas[10])])
+
+    detalle = Table(filas, colWidths=[22 * mm, 66 * mm, 16 * mm, 24 * mm, 21 * mm, 21 * mm], repeatRows=1)
+    detalle.setStyle(TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#366092')),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTNAME', (0, -1), (-1, -1), 'Helvetica-Bold'),
+        ('ALIGN', (2, 0), (-1, -1), 'RIGHT'),
+        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+        ('GRID', (0, 0), (-1, -1), 0.25, colors.grey),
+        ('FONTSIZE', (0, 0), (-1, -1), 8),
+    ]))
+    historia += [detalle, Spacer(1, 4 * mm)]
+
+    totales = Table([
+        ['Total a pagar', f"{moneda} {formato_gs(datos['total'])}"],
+        ['Liquidación IVA 5%', f'{moneda} {formato_gs(liquidacion[5])}'],
+        ['Liquidación IVA 10%', f'{moneda} {formato_gs(liquidacion[10])}'],
+        ['Total IVA', f"{moneda} {formato_gs(datos['iva'])}"],
+    ], colWidths=[50 * mm, 40 * mm], hAlign='RIGHT')
+    totales.setStyle(TableStyle([
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('ALIGN', (1, 0), (1, -1), 'RIGHT'),
+        ('LINEBELOW', (0, 0), (-1, 0), 0.5, colors.black),
+    ]))
+    historia.append(totales)
+
+    if datos['observacion']:
+        historia += [Spacer(1, 4 * mm), Paragraph(f"Observación: {escape(datos['observacion'])}", estilos['Italic'])]
+    return historia
+
+
+def renderizar_pdf(lista_datos):
+    """Un PDF con una o más facturas (cada una empieza en página nueva)"""
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.styles import getSampleStyleSheet
+    from reportlab.lib.units import mm
+    from reportlab.platypus import PageBreak, SimpleDocTemplate
+
+    estilos = getSampleStyleSheet()
+    salida = io.BytesIO()
+    documento = SimpleDocTemplate(
+        salida, pagesize=A4, leftMargin=15 * mm, rightMargin=15 * mm, topMargin=15 * mm, bottomMargin=15 * mm,
+        title='Facturas' if len(lista_datos) > 1 else f"Factura {lista_datos[0]['numero']}",
+        invariant=1,  # sin fecha de creación: mismos datos, mismos bytes
+    )
+    historia = []
+    for indice, datos in enumerate(lista_datos):
+        if indice:
+            historia.append(PageBreak())
+        historia += _historia(datos, estilos)
+    documento.build(historia)
+    return salida.getvalue()
+
+
+def _renderizar_una(datos):
+    return renderizar_pdf([datos])
+
+
+def _leer_cache(clave):
+    ruta = ruta_cache(clave)
+    if default_storage.exists(ruta):
+        with default_storage.open(ruta, 'rb') as archivo:
+            return archivo.read()
+    return None
+
+
+def _guardar_cache(clave, contenido):
+    ruta = ruta_cache(clave)
+    if not default_storage.exists(ruta):
+        default_storage.save(ruta, ContentFile(contenido))
+
+
+def pdf_factura(factura):
+    """(contenido, huella) del PDF de una factura, generándolo solo si no está en caché"""
+    factura = facturas_con_detalles(Factura.objects.filter(pk=factura.pk)).get()
+    datos = datos_factura(factura)
+    clave = huella(datos)
+    contenido = _leer_cache(clave)
+    if contenido is None:
+        contenido = renderizar_pdf([datos])
+        _guardar_cache(clave, contenido)
+    return contenido, clave
+
+
+def pdf_lote(facturas, formato='zip', procesos=None):
+    """
+    Facturas en un ZIP (un PDF por factura, usando la caché y generando las
+    faltantes en un pool de procesos) o en un único PDF de varias páginas.
+    Devuelve (contenido, estadisticas).
+    """
+    empresa = encabezado_empresa()
+    lista = [datos_factura(factura, empresa) for factura in facturas_con_detalles(facturas).order_by('fecha', 'id')]
+    claves = [huella(datos) for datos in lista]
+    estadisticas = {'facturas': len(lista), 'en_cache': 0, 'generadas': 0}
+
+    if formato == 'pdf':
+        # Un solo documento lo escribe un solo proceso; se cachea el lote completo
+        clave = hashlib.sha256(''.join(claves).encode('ascii')).hexdigest()
+        contenido = _leer_cache(clave)
+        if contenido is None:
+            contenido = renderizar_pdf(lista) if lista else b''
+            if lista:
+                _guardar_cache(clave, contenido)
+            estadisticas['generadas'] = len(lista)
+        else:
+            estadisticas['en_cache'] = len(lista)
+        return contenido, estadisticas
+
+    pdfs = {clave: _leer_cache(clave) for clave in claves}
+    faltantes = [(clave, datos) for clave, datos in zip(claves, lista) if pdfs[clave] is None]
+    estadisticas['en_cache'] = len(lista) - len(faltantes)
+    estadisticas['generadas'] = len(faltantes)
+
+    if len(faltantes) >= MINIMO_POOL and procesos != 1:
+        with ProcessPoolExecutor(max_workers=procesos) as pool:
+            generados = pool.map(_renderizar_una, [datos for _, datos in faltantes], chunksize=8)
+            for (clave, _), contenido in zip(faltantes, generados):
+                pdfs[clave] = contenido
+                _guardar_cache(clave, contenido)
+    else:
+        for clave, datos in faltantes:
+            pdfs[clave] = renderizar_pdf([datos])
+            _guardar_cache(clave, pdfs[clave])
+
+    salida = io.BytesIO()
+    # Los PDF ya vienen comprimidos
+    with zipfile.ZipFile(salida, 'w', compression=zipfile.ZIP_STORED) as zf:
+        for clave, datos in zip(claves, lista):
+            nombre = f"factura_{datos['tipo']}_{datos['numero'] or datos['id']}_{datos['id']}.pdf"
+            zf.writestr(nombre, pdfs[clave])
+    return salida.getvalue(), estadisticas
@@ -0,0 +1,149 @@
+"""
+Registro de tareas periódicas que ejecuta el comando run_scheduler.
+
+Cada tarea declara su intervalo como función para que los cambios en
+ConfiguracionSistema se apliquen sin reiniciar el planificador.
+"""
+import io
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management import call_command
+from django.utils import timezone
+
+from .models import ConfiguracionSistema, EjecucionTarea
+
+TAREAS = {}
+
+
+class Tarea:
+    def __init__(self, nombre, funcion, intervalo, descripcion=''):
+        self.nombre = nombre
+        self.funcion = funcion
+        self._intervalo = intervalo
+        self.descripcion = descripcion
+
+    @property
+    def intervalo(self):
+        """Intervalo vigente; None deshabilita la tarea"""
+        return self._intervalo() if callable(self._intervalo) else self._intervalo
+
+    def vencida(self, ultima, ahora):
+        intervalo = self.intervalo
+        if intervalo is None:
+            return False
+        return ultima is None or ultima + intervalo <= ahora
+
+    def ejecutar(self, servidor):
+        """Ejecutar la tarea registrando inicio, duración y resultado"""
+        ejecucion = EjecucionTarea.objects.create(tarea=self.nombre, servidor=servidor, inicio=timezone.now())
+        comienzo = time.monotonic()
+        try:
+            resultado = self.funcion()
+            ejecucion.estado = 'ok'
+            ejecucion.resultado = '' if resultado is None else str(resultado)
+        except Exception as e:
+            ejecucion.estado = 'error'
+            ejecucion.resultado = f'{type(e).__name__}: {e}'
+        ejecucion.fin = timezone.now()
+        ejecucion.duracion_ms = int((time.monotonic() - comienzo) * 1000)
+        ejecucion.save(update_fields=['estado', 'resultado', 'fin', 'duracion_ms'])
+        return ejecucion
+
+
+def tarea(nombre, intervalo, descripcion=''):
+    """Decorador para registrar una tarea periódica"""
+    def registrar(funcion):
+        TAREAS[nombre] = Tarea(nombre, funcion, intervalo, descripcion or (funcion.__doc__ or '').strip())
+        return funcion
+    return registrar
+
+
+def horas_configuradas(clave, por_defecto):
+    """Intervalo en horas leído de ConfiguracionSistema (0 o vacío deshabilita)"""
+    def intervalo():
+        try:
+            horas = float(ConfiguracionSistema.get_valor(clave, por_defecto))
+        except (TypeError, ValueError):
+            horas = float(por_defecto)
+        return timedelta(hours=horas) if horas > 0 else None
+    return intervalo
+
+
+def _comando(nombre, *args):
+    """Ejecutar un comando de manage.py y devolver su salida"""
+    salida = io.StringIO()
+    call_command(nombre, *args, stdout=salida)
+    return salida.getvalue().strip()
+
+
+@tarea('alertas', horas_configuradas('frecuencia_alertas', '24'))
+def verificar_alertas():
+    """Buscar stock bajo, agotados y facturas vencidas"""
+    from .views import verificar_alertas_stock
+    return f'{verificar_alertas_stock()} alertas re-notificadas'
+
+
+@tarea('correos', timedelta(minutes=1))
+def enviar_correos():
+    """Enviar la bandeja de salida y el resumen de alertas (EMAIL_ALERT_FREQUENCY)"""
+    from .models import CorreoSaliente
+    enviados, fallidos = CorreoSaliente.enviar_pendientes()
+    return f'{enviados} enviados, {fallidos} con error'
+
+
+@tarea('reservas_stock', timedelta(minutes=1))
+def liberar_reservas():
+    """Devolver a disponible el stock de facturas en carga abandonadas"""
+    from .models import ReservaStock
+    return f'{ReservaStock.barrer_vencidas()} reservas vencidas liberadas'
+
+
+@tarea('tokens_idempotencia', timedelta(hours=1))
+def barrer_tokens_idempotencia():
+    """Eliminar los resultados vencidos de formularios de facturas y pagos"""
+    from .models import SolicitudIdempotente
+    return f'{SolicitudIdempotente.barrer_vencidas()} tokens vencidos eliminados'
+
+
+@tarea('recalcular_saldos', timedelta(days=1))
+def recalcular_saldos():
+    """Conciliar los saldos acumulados de clientes y proveedores"""
+    return _comando('recalcular_saldos')
+
+
+@tarea('snapshot_inventario', timedelta(days=1))
+def snapshot_inventario():
+    """Snapshot de stock y costo para consultar el inventario a una fecha"""
+    return _comando('snapshot_inventario', f'--dias-diarios={getattr(settings, "INVENTARIO_SNAPSHOTS_DIARIOS_DIAS", 90)}')
+
+
+@tarea('compactar_notificaciones', timedelta(days=1))
+def compactar_notificaciones():
+    """Depurar notificaciones leídas y antiguas"""
+    return _comando('compactar_notificaciones')
+
+
+def _intervalo_replicacion():
+    if 'supabase' not in settings.DATABASES:
+        return None
+    return timedelta(minutes=getattr(settings, 'REPLICACION_INTERVALO_MINUTOS', 1440))
+
+
+@tarea('backup_supabase', _intervalo_replicacion)
+def backup_supabase():
+    """Replicar los cambios a Supabase (mantiene al día la réplica de reportes)"""
+    return _comando('backup_supabase', '--sin-verificar')
+
+
+@tarea('verificar_supabase', lambda: timedelta(days=1) if 'supabase' in settings.DATABASES else None)
+def verificar_supabase():
+    """Replicar y comparar conteos y checksums por bloque con Supabase"""
+    return _comando('backup_supabase')
+
+
+@tarea('backup_local', timedelta(days=1))
+def backup_local():
+    """Respaldo local comprimido con manifiesto"""
+    return _comando('backup_local')
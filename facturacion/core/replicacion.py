@@ -0,0 +1,327 @@
+"""
+Replicación incremental de la base local hacia otra base (Supabase u otra
+Postgres/SQLite de prueba).
+
+Por cada tabla se guarda una marca de agua (MarcaReplicacion) y solo se envían:
+  * filas con id mayor al último replicado,
+  * filas con fecha_actualizacion posterior a la última vista (si la tabla la tiene),
+  * eliminaciones registradas en RegistroEliminacion (tombstones).
+
+Los modelos de core que se modifican heredan ActualizacionMixin, que mueve
+fecha_actualizacion también en QuerySet.update(), bulk_update() y
+save(update_fields=...). Las tablas sin esa columna (movimientos, historiales,
+tablas intermedias de auth) solo reciben inserciones y borrados.
+
+Una verificación final compara conteos y checksums por bloques de ids; los
+bloques distintos se vuelven a copiar completos. Entre dos Postgres el checksum
+se calcula en el servidor y solo viajan los hashes.
+"""
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.apps import apps
+from django.db import connections, transaction
+from django.db.models import Max, Min, Q
+from django.core.management.color import no_style
+from django.utils import timezone
+
+from .models import MarcaReplicacion, RegistroEliminacion
+
+TAMANO_LOTE = 1000
+TAMANO_BLOQUE = 1000
+# Las filas escritas por transacciones que confirman después de leer el techo
+# tienen fecha_actualizacion anterior: se vuelve a mirar este margen en cada pasada
+MARGEN_ACTUALIZACION = timedelta(minutes=1)
+# Lo mismo con los ids: una transacción que tomó un id bajo puede confirmar después
+# de leer el techo, así que se vuelven a copiar (upsert) los últimos ids de cada tabla.
+# Es lo único que cubre las tablas de solo inserción (movimientos, historial de costos)
+MARGEN_IDS = 1000
+
+# Apps cuyas tablas se copian (incluidas las intermedias de grupos y permisos)
+APPS_REPLICADAS = ('contenttypes', 'auth', 'core')
+
+# Tablas operativas, de vida corta o propias de la replicación que no se copian
+EXCLUIDOS = {
+    'core.notificacion', 'core.correosaliente', 'core.bloqueoplanificador',
+    'core.ejecuciontarea', 'core.registroeliminacion', 'core.marcareplicacion',
+    'core.reservastock', 'core.solicitudidempotente',
+}
+
+
+def modelos_replicados():
+    """Modelos replicados, ordenados para que los padres vayan antes que los hijos"""
+    modelos = [
+        modelo for app in APPS_REPLICADAS
+        for modelo in apps.get_app_config(app).get_models(include_auto_created=True)
+        if es_replicado(modelo)
+    ]
+    return niveles_dependencia(modelos)
+
+
+def niveles_dependencia(modelos):
+    """Agrupar modelos en niveles: cada nivel solo referencia modelos de niveles anteriores"""
+    pendientes = {
+        modelo: {
+            campo.related_model for campo in modelo._meta.concrete_fields
+            if campo.is_relation and campo.related_model in modelos and campo.related_model is not modelo
+        }
+        for modelo in modelos
+    }
+    niveles = []
+    while pendientes:
+        listos = [modelo for modelo, padres in pendientes.items() if not padres & set(pendientes)]
+        if not listos:
+            raise ValueError('Dependencia circular entre modelos replicados')
+        niveles.append(listos)
+        for modelo in listos:
+            del pendientes[modelo]
+    return niveles
+
+
+def es_replicado(modelo):
+    return modelo._meta.app_label in APPS_REPLICADAS and modelo._meta.label_lower not in EXCLUIDOS
+
+
+def columnas_escribibles(modelo):
+    """concrete_fields sin las columnas generadas, que la base calcula sola"""
+    return [campo for campo in modelo._meta.concrete_fields if not getattr(campo, 'generated', False)]
+
+
+def _normalizar(valor):
+    """Representación estable entre motores para el checksum calculado en Python"""
+    if isinstance(valor, datetime):
+        if valor.tzinfo is not None:
+            valor = valor.astimezone(dt_timezone.utc).replace(tzinfo=None)
+        return valor.isoformat()
+    return str(valor)
+
+
+def upsert_filas(modelo, filas, alias):
+    """
+    INSERT ... ON CONFLICT DO UPDATE en crudo con filas en el orden de
+    columnas_escribibles. A diferencia de bulk_create respeta los valores de auto_now.
+    """
+    if not filas:
+        return
+    conexion = connections[alias]
+    campos = columnas_escribibles(modelo)
+    qn = conexion.ops.quote_name
+    pk = modelo._meta.pk.column
+    columnas = ', '.join(qn(campo.column) for campo in campos)
+    actualizar = ', '.join(
+        f'{qn(campo.column)} = EXCLUDED.{qn(campo.column)}' for campo in campos if not campo.primary_key
+    )
+    sql = (
+        f'INSERT INTO {qn(modelo._meta.db_table)} ({columnas}) VALUES ({", ".join(["%s"] * len(campos))}) '
+        f'ON CONFLICT ({qn(pk)}) DO UPDATE SET {actualizar}'
+    )
+    valores = [
+        [campo.get_db_prep_save(valor, connection=conexion) for campo, valor in zip(campos, fila)]
+        for fila in filas
+    ]
+    with conexion.cursor() as cursor:
+        cursor.executemany(sql, valores)
+
+
+def reiniciar_secuencias(modelos, alias):
+    """Alinear las secuencias de ids tras insertar filas con id explícito"""
+    conexion = connections[alias]
+    sentencias = conexion.ops.sequence_reset_sql(no_style(), modelos)
+    if sentencias:
+        with conexion.cursor() as cursor:
+            for sql in sentencias:
+                cursor.execute(sql)
+
+
+class Replicador:
+    def __init__(self, destino, origen='default', hilos=4, lote=TAMANO_LOTE, verificar=True, log=None):
+        self.origen = origen
+        self.destino = destino
+        # SQLite no admite escrituras concurrentes: con ese destino se copia en serie
+        self.hilos = 1 if connections[destino].vendor == 'sqlite' else hilos
+        self.lote = lote
+        self.verificar = verificar
+        self.log = log or (lambda mensaje: None)
+
+    # -- utilidades ---------------------------------------------------------
+
+    def _marca(self, modelo):
+        marca, _ = MarcaReplicacion.objects.using(self.origen).get_or_create(
+            destino=self.destino, tabla=modelo._meta.label_lower
+        )
+        return marca
+
+    def _copiar(self, modelo, filtro):
+        """Copiar en lotes por clave las filas del origen que cumplen `filtro`"""
+        atributos = [campo.attname for campo in columnas_escribibles(modelo)]
+        pk = modelo._meta.pk.attname
+        indice_pk = atributos.index(pk)
+        consulta = modelo._base_manager.using(self.origen).filter(filtro).order_by(pk)
+        copiadas = 0
+        ultimo = None
+        while True:
+            pagina = consulta if ultimo is None else consulta.filter(**{f'{pk}__gt': ultimo})
+            filas = list(pagina.values_list(*atributos)[:self.lote])
+            if not filas:
+                break
+            with transaction.atomic(using=self.destino):
+                upsert_filas(modelo, filas, self.destino)
+            copiadas += len(filas)
+            ultimo = filas[-1][indice_pk]
+            if len(filas) < self.lote:
+                break
+        return copiadas
+
+    # -- fases --------------------------------------------------------------
+
+    def aplicar_eliminaciones(self, modelo):
+        """Borrar en destino las filas con tombstone posterior a la marca"""
+        marca = self._marca(modelo)
+        tombstones = RegistroEliminacion.objects.using(self.origen).filter(
+            tabla=modelo._meta.label_lower, id__gt=marca.ultima_eliminacion
+        )
+        hasta = tombstones.aggregate(ultimo=Max('id'))['ultimo']
+        if hasta is None:
+            return 0
+        ids = list(tombstones.filter(id__lte=hasta).values_list('registro_id', flat=True))
+        borradas = 0
+        for inicio in range(0, len(ids), self.lote):
+            borradas += modelo._base_manager.using(self.destino).filter(pk__in=ids[inicio:inicio + self.lote]).delete()[0]
+        marca.ultima_eliminacion = hasta
+        marca.save(using=self.origen, update_fields=['ultima_eliminacion', 'fecha'])
+        return borradas
+
+    def copiar_cambios(self, modelo):
+        """Enviar filas nuevas y (si hay fecha_actualizacion) modificadas desde la marca"""
+        marca = self._marca(modelo)
+        pk = modelo._meta.pk.attname
+        tiene_actualizacion = any(campo.name == 'fecha_actualizacion' for campo in modelo._meta.concrete_fields)
+
+        # Se fija el techo antes de copiar para que la marca no salte filas que llegan durante la copia
+        inicio = timezone.now()
+        techo = modelo._base_manager.using(self.origen).aggregate(
+            id=Max(pk), **({'actualizacion': Max('fecha_actualizacion')} if tiene_actualizacion else {})
+        )
+        if techo['id'] is None:
+            marca.ultima_copia = inicio
+            marca.save(using=self.origen, update_fields=['ultima_copia', 'fecha'])
+            return 0
+
+        filtro = Q(**{f'{pk}__gt': max(marca.ultimo_id - MARGEN_IDS, 0)})
+        if tiene_actualizacion and marca.ultima_actualizacion:
+            filtro |= Q(fecha_actualizacion__gt=marca.ultima_actualizacion)
+        filtro &= Q(**{f'{pk}__lte': techo['id']})
+
+        copiadas = self._copiar(modelo, filtro)
+        if copiadas:
+            reiniciar_secuencias([modelo], self.destino)
+
+        marca.ultimo_id = techo['id']
+        if tiene_actualizacion and techo['actualizacion']:
+            marca.ultima_actualizacion = techo['actualizacion'] - MARGEN_ACTUALIZACION
+        # La réplica refleja el origen hasta el momento en que se leyó el techo
+        marca.ultima_copia = inicio
+        marca.save(using=self.origen, update_fields=['ultimo_id', 'ultima_actualizacion', 'ultima_copia', 'fecha'])
+        return copiadas
+
+    def checksums(self, modelo, alias):
+        """{bloque: (filas, hash)} de una tabla en la base indicada"""
+        conexion = connections[alias]
+        pk = modelo._meta.pk
+        if connections[self.origen].vendor == connections[self.destino].vendor == 'postgresql':
+            qn = conexion.ops.quote_name
+            tabla = qn(modelo._meta.db_table)
+            columna = qn(pk.column)
+            with conexion.cursor() as cursor:
+                cursor.execute(
+                    f'SELECT t.{columna} / %s, COUNT(*), md5(string_agg(md5(t::text), \'\' ORDER BY t.{columna})) '
+                    f'FROM {tabla} t GROUP BY 1',
+                    [TAMANO_BLOQUE]
+                )
+                return {bloque: (filas, hash_) for bloque, filas, hash_ in cursor.fetchall()}
+
+        resultado = {}
+        atributos = [campo.attname for campo in columnas_escribibles(modelo)]
+        indice_pk = atributos.index(pk.attname)
+        filas = modelo._base_manager.using(alias).order_by(pk.attname).values_list(*atributos)
+        for fila in filas.iterator(chunk_size=self.lote):
+            bloque = fila[indice_pk] // TAMANO_BLOQUE
+            filas_bloque, hash_ = resultado.get(bloque, (0, hashlib.md5()))
+            hash_.update('|'.join(_normalizar(valor) for valor in fila).encode())
+            resultado[bloque] = (filas_bloque + 1, hash_)
+        return {bloque: (filas_bloque, hash_.hexdigest()) for bloque, (filas_bloque, hash_) in resultado.items()}
+
+    def verificar_tabla(self, modelo):
+        """Comparar conteos y checksums por bloque y volver a copiar los bloques distintos"""
+        marca = self._marca(modelo)
+        origen = self.checksums(modelo, self.origen)
+        destino = self.checksums(modelo, self.destino)
+        pk = modelo._meta.pk.attname
+
+        distintos = sorted(bloque for bloque in set(origen) | set(destino) if origen.get(bloque) != destino.get(bloque))
+        for bloque in distintos:
+            rango = {f'{pk}__gte': bloque * TAMANO_BLOQUE, f'{pk}__lt': (bloque + 1) * TAMANO_BLOQUE}
+            ids_origen = modelo._base_manager.using(self.origen).filter(**rango).values_list(pk, flat=True)
+            with transaction.atomic(using=self.destino):
+                modelo._base_manager.using(self.destino).filter(**rango).exclude(**{f'{pk}__in': list(ids_origen)}).delete()
+            self._copiar(modelo, Q(**rango))
+
+        marca.filas_origen = sum(filas for filas, _ in origen.values())
+        marca.filas_destino = modelo._base_manager.using(self.destino).count() if distintos else sum(filas for filas, _ in destino.values())
+        marca.bloques_corregidos = len(distintos)
+        marca.verificada = marca.filas_origen == marca.filas_destino
+        marca.save(using=self.origen, update_fields=['filas_origen', 'filas_destino', 'bloques_corregidos', 'verificada', 'fecha'])
+        return marca
+
+    # -- ejecución ----------------------------------------------------------
+
+    def _en_hilo(self, funcion, modelo):
+        try:
+            return modelo, funcion(modelo)
+        finally:
+            # Cada hilo abre sus propias conexiones
+            connections.close_all()
+
+    def _por_niveles(self, niveles, funcion):
+        resultados = {}
+        with ThreadPoolExecutor(max_workers=self.hilos) as ejecutor:
+            for nivel in niveles:
+                for modelo, resultado in ejecutor.map(lambda modelo: self._en_hilo(funcion, modelo), nivel):
+                    resultados[modelo] = resultado
+        return resultados
+
+    def ejecutar(self):
+        niveles = modelos_replicados()
+
+        # Los hijos se borran antes que los padres
+        for nivel in reversed(niveles):
+            for modelo in nivel:
+                borradas = self.aplicar_eliminaciones(modelo)
+                if borradas:
+                    self.log(f'{modelo._meta.label}: {borradas} eliminadas')
+
+        for modelo, copiadas in self._por_niveles(niveles, self.copiar_cambios).items():
+            if copiadas:
+                self.log(f'{modelo._meta.label}: {copiadas} filas enviadas')
+
+        marcas = []
+        if self.verificar:
+            for modelo, marca in self._por_niveles(niveles, self.verificar_tabla).items():
+                marcas.append(marca)
+                estado = 'OK' if marca.verificada else 'DIFERENCIA'
+                corregidos = f', {marca.bloques_corregidos} bloques corregidos' if marca.bloques_corregidos else ''
+                self.log(f'{modelo._meta.label}: {marca.filas_origen}/{marca.filas_destino} filas {estado}{corregidos}')
+
+        self.depurar_eliminaciones()
+        return marcas
+
+    def depurar_eliminaciones(self):
+        """Borrar tombstones ya aplicados en todos los destinos conocidos"""
+        for tabla in RegistroEliminacion.objects.using(self.origen).values_list('tabla', flat=True).distinct():
+            aplicado = MarcaReplicacion.objects.using(self.origen).filter(tabla=tabla).aggregate(
+                minimo=Min('ultima_eliminacion')
+            )['minimo']
+            if aplicado:
+                RegistroEliminacion.objects.using(self.origen).filter(tabla=tabla, id__lte=aplicado).delete()
+
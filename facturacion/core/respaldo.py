@@ -0,0 +1,381 @@
+"""
+Respaldo local comprimido y restauración por tabla o rango de fechas.
+
+El archivo es un .zip (deflate) con un manifest.json y, por cada tabla, trozos
+de hasta TAMANO_TROZO ids:
+  * en Postgres cada trozo es la salida de COPY ... TO STDOUT (CSV),
+  * con otros motores se usa values_list por lotes y se guarda como JSON Lines.
+
+El manifiesto guarda columnas, nivel de dependencia, filas y, en las tablas con
+campo `fecha`, el rango de fechas de cada trozo para saltear los que no hacen
+falta al restaurar un período.
+"""
+import io
+import json
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+from decimal import Decimal
+
+from django.apps import apps
+from django.db import connections, transaction
+from django.db.models import Count, Max, Min
+from django.utils import timezone
+
+from .replicacion import columnas_escribibles, niveles_dependencia, upsert_filas, reiniciar_secuencias
+
+VERSION_FORMATO = 1
+TAMANO_TROZO = 50000
+TAMANO_LOTE = 2000
+
+# Apps respaldadas: además de core, las tablas de Django que referencian a usuarios
+# (grupos, permisos, tablas intermedias y el historial del admin)
+APPS_RESPALDO = ('contenttypes', 'auth', 'admin', 'core')
+
+# Estado interno que no tiene sentido restaurar (y tokens de idempotencia,
+# de vida corta y con clave de texto, que no se puede trocear por rangos de id)
+EXCLUIDOS = {
+    'core.bloqueoplanificador', 'core.marcareplicacion', 'core.registroeliminacion',
+    'core.solicitudidempotente',
+}
+
+# Tablas que admiten restauración por rango de fechas por defecto
+TABLAS_CON_FECHA = ['core.factura', 'core.movimientostock']
+
+
+def modelos_respaldo():
+    modelos = [
+        modelo for app in APPS_RESPALDO
+        for modelo in apps.get_app_config(app).get_models(include_auto_created=True)
+        if modelo._meta.label_lower not in EXCLUIDOS
+    ]
+    return niveles_dependencia(modelos)
+
+
+def modelos_dependientes(tablas):
+    """Modelos fuera de `tablas` con claves foráneas hacia alguna de ellas"""
+    incluidas = {tabla['tabla'] for tabla in tablas}
+    return [
+        modelo for modelo in apps.get_models(include_auto_created=True)
+        if modelo._meta.label_lower not in incluidas and any(
+            campo.is_relation and campo.related_model._meta.label_lower in incluidas
+            for campo in modelo._meta.concrete_fields
+        )
+    ]
+
+
+def _campo_fecha(modelo):
+    """Campo `fecha` con hora usado para filtrar períodos (None si la tabla no lo tiene)"""
+    from django.db.models import DateTimeField
+    return next((
+        campo for campo in modelo._meta.concrete_fields
+        if campo.name == 'fecha' and isinstance(campo, DateTimeField)
+    ), None)
+
+
+def _a_json(valor):
+    if isinstance(valor, (datetime, date)):
+        return valor.isoformat()
+    if isinstance(valor, Decimal):
+        return str(valor)
+    return valor
+
+
+def _copy_salida(cursor, sql, archivo):
+    """COPY ... TO STDOUT con psycopg2 o psycopg 3"""
+    crudo = cursor.cursor
+    if hasattr(crudo, 'copy_expert'):
+        crudo.copy_expert(sql, archivo)
+    else:
+        with crudo.copy(sql) as copia:
+            for datos in copia:
+                archivo.write(datos)
+
+
+def _copy_entrada(cursor, sql, archivo):
+    """COPY ... FROM STDIN con psycopg2 o psycopg 3"""
+    crudo = cursor.cursor
+    if hasattr(crudo, 'copy_expert'):
+        crudo.copy_expert(sql, archivo)
+    else:
+        with crudo.copy(sql) as copia:
+            while datos := archivo.read(1 << 16):
+                copia.write(datos)
+
+
+# -- respaldo -----------------------------------------------------------------
+
+def crear_respaldo(ruta, alias='default', log=None):
+    """Volcar las tablas al archivo `ruta`; devuelve el manifiesto"""
+    log = log or (lambda mensaje: None)
+    conexion = connections[alias]
+    usar_copy = conexion.vendor == 'postgresql'
+    qn = conexion.ops.quote_name
+
+    manifiesto = {
+        'version': VERSION_FORMATO,
+        'creado': timezone.now().isoformat(),
+        'motor': conexion.vendor,
+        'tablas': [],
+    }
+
+    with zipfile.ZipFile(ruta, 'w', compression=zipfile.ZIP_DEFLATED, compresslevel=6) as zf:
+        # Una sola transacción REPEATABLE READ en Postgres para una foto consistente
+        with transaction.atomic(using=alias):
+            if usar_copy:
+                with conexion.cursor() as cursor:
+                    cursor.execute('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ')
+
+            for nivel, modelos in enumerate(modelos_respaldo()):
+                for modelo in modelos:
+                    tabla = _respaldar_tabla(zf, modelo, nivel, alias, usar_copy, qn)
+                    manifiesto['tablas'].append(tabla)
+                    log(f"{tabla['tabla']}: {tabla['filas']} filas en {len(tabla['trozos'])} trozos")
+
+        zf.writestr('manifest.json', json.dumps(manifiesto, indent=2))
+    return manifiesto
+
+
+def _respaldar_tabla(zf, modelo, nivel, alias, usar_copy, qn):
+    etiqueta = modelo._meta.label_lower
+    campos = columnas_escribibles(modelo)
+    pk = modelo._meta.pk
+    campo_fecha = _campo_fecha(modelo)
+    manager = modelo._base_manager.using(alias)
+
+    tabla = {
+        'tabla': etiqueta,
+        'db_table': modelo._meta.db_table,
+        'columnas': [campo.column for campo in campos],
+        'nivel': nivel,
+        'filas': 0,
+        'trozos': [],
+    }
+
+    rango = manager.aggregate(minimo=Min(pk.attname), maximo=Max(pk.attname))
+    if rango['minimo'] is None:
+        return tabla
+
+    inicio = rango['minimo']
+    while inicio <= rango['maximo']:
+        fin = inicio + TAMANO_TROZO
+        filtro = {f'{pk.attname}__gte': inicio, f'{pk.attname}__lt': fin}
+        resumen = manager.filter(**filtro).aggregate(
+            filas=Count(pk.attname),
+            **({'fecha_min': Min(campo_fecha.attname), 'fecha_max': Max(campo_fecha.attname)} if campo_fecha else {})
+        )
+        if resumen['filas']:
+            formato = 'csv' if usar_copy else 'jsonl'
+            archivo = f'{etiqueta}/{len(tabla["trozos"]):06d}.{formato}'
+            with zf.open(archivo, 'w', force_zip64=True) as destino:
+                if usar_copy:
+                    columnas = ', '.join(qn(columna) for columna in tabla['columnas'])
+                    sql = (
+                        f'COPY (SELECT {columnas} FROM {qn(modelo._meta.db_table)} '
+                        f'WHERE {qn(pk.column)} >= {int(inicio)} AND {qn(pk.column)} < {int(fin)} '
+                        f'ORDER BY {qn(pk.column)}) TO STDOUT WITH (FORMAT csv)'
+                    )
+                    with connections[alias].cursor() as cursor:
+                        _copy_salida(cursor, sql, destino)
+                else:
+                    texto = io.TextIOWrapper(destino, encoding='utf-8')
+                    filas = manager.filter(**filtro).order_by(pk.attname).values_list(*[campo.attname for campo in campos])
+                    for fila in filas.iterator(chunk_size=TAMANO_LOTE):
+                        texto.write(json.dumps([_a_json(valor) for valor in fila]) + '\n')
+                    texto.flush()
+                    texto.detach()
+
+            tabla['trozos'].append({
+                'archivo': archivo,
+                'formato': formato,
+                'filas': resumen['filas'],
+                'desde_id': inicio,
+                'hasta_id': fin,
+                'fecha_min': _a_json(resumen.get('fecha_min')),
+                'fecha_max': _a_json(resumen.get('fecha_max')),
+            })
+            tabla['filas'] += resumen['filas']
+        inicio = fin
+
+    return tabla
+
+
+# -- restauración -------------------------------------------------------------
+
+def leer_manifiesto(ruta):
+    with zipfile.ZipFile(ruta) as zf:
+        manifiesto = json.loads(zf.read('manifest.json'))
+    if manifiesto.get('version') != VERSION_FORMATO:
+        raise ValueError(f"Versión de respaldo no soportada: {manifiesto.get('version')}")
+    return manifiesto
+
+
+def _trozos_en_rango(tabla, desde, hasta):
+    """Trozos cuyo rango de fechas se superpone con [desde, hasta)"""
+    for trozo in tabla['trozos']:
+        if desde is not None and trozo['fecha_max'] and datetime.fromisoformat(trozo['fecha_max']) < desde:
+            continue
+        if hasta is not None and trozo['fecha_min'] and datetime.fromisoformat(trozo['fecha_min']) >= hasta:
+            continue
+        yield trozo
+
+
+def _restaurar_tabla(ruta, tabla, alias, directo, desde, hasta):
+    """Cargar los trozos de una tabla; `directo` copia sin upsert sobre una tabla vacía"""
+    modelo = apps.get_model(tabla['tabla'])
+    campos = columnas_escribibles(modelo)
+    if [campo.column for campo in campos] != tabla['columnas']:
+        raise ValueError(f"Las columnas de {tabla['tabla']} no coinciden con el esquema actual")
+
+    conexion = connections[alias]
+    campo_fecha = _campo_fecha(modelo)
+    filtrar_fecha = desde is not None or hasta is not None
+    cargadas = 0
+
+    try:
+        with zipfile.ZipFile(ruta) as zf, transaction.atomic(using=alias):
+            for trozo in _trozos_en_rango(tabla, desde, hasta) if filtrar_fecha else tabla['trozos']:
+                with zf.open(trozo['archivo']) as archivo:
+                    if trozo['formato'] == 'csv':
+                        cargadas += _cargar_csv(conexion, modelo, tabla, archivo, directo, campo_fecha, desde, hasta)
+                    else:
+                        cargadas += _cargar_jsonl(alias, modelo, campos, archivo, campo_fecha, desde, hasta)
+            reiniciar_secuencias([modelo], alias)
+    finally:
+        connections.close_all()
+    return cargadas
+
+
+def _cargar_csv(conexion, modelo, tabla, archivo, directo, campo_fecha, desde, hasta):
+    if conexion.vendor != 'postgresql':
+        raise ValueError('Los trozos CSV (COPY) solo se pueden restaurar en Postgres')
+    qn = conexion.ops.quote_name
+    columnas = ', '.join(qn(columna) for columna in tabla['columnas'])
+
+    with conexion.cursor() as cursor:
+        if directo:
+            _copy_entrada(cursor, f'COPY {qn(tabla["db_table"])} ({columnas}) FROM STDIN WITH (FORMAT csv)', archivo)
+            return cursor.rowcount
+
+        # Tabla temporal + INSERT ... ON CONFLICT para no pisar ni duplicar filas existentes
+        cursor.execute(
+            f'CREATE TEMP TABLE restauracion (LIKE {qn(tabla["db_table"])} INCLUDING DEFAULTS) ON COMMIT DROP'
+        )
+        _copy_entrada(cursor, f'COPY restauracion ({columnas}) FROM STDIN WITH (FORMAT csv)', archivo)
+
+        condiciones, parametros = ['TRUE'], []
+        if campo_fecha and desde is not None:
+            condiciones.append(f'{qn(campo_fecha.column)} >= %s')
+            parametros.append(desde)
+        if campo_fecha and hasta is not None:
+            condiciones.append(f'{qn(campo_fecha.column)} < %s')
+            parametros.append(hasta)
+        actualizar = ', '.join(
+            f'{qn(campo.column)} = EXCLUDED.{qn(campo.column)}'
+            for campo in columnas_escribibles(modelo) if not campo.primary_key
+        )
+        cursor.execute(
+            f'INSERT INTO {qn(tabla["db_table"])} ({columnas}) SELECT {columnas} FROM restauracion '
+            f'WHERE {" AND ".join(condiciones)} '
+            f'ON CONFLICT ({qn(modelo._meta.pk.column)}) DO UPDATE SET {actualizar}',
+            parametros
+        )
+        cargadas = cursor.rowcount
+        cursor.execute('DROP TABLE restauracion')
+        return cargadas
+
+
+def _cargar_jsonl(alias, modelo, campos, archivo, campo_fecha, desde, hasta):
+    indice_fecha = campos.index(campo_fecha) if campo_fecha else None
+    lote, cargadas = [], 0
+    for linea in io.TextIOWrapper(archivo, encoding='utf-8'):
+        fila = [campo.to_python(valor) for campo, valor in zip(campos, json.loads(linea))]
+        if indice_fecha is not None:
+            fecha = fila[indice_fecha]
+            if (desde is not None and fecha < desde) or (hasta is not None and fecha >= hasta):
+                continue
+        lote.append(fila)
+        if len(lote) >= TAMANO_LOTE:
+            upsert_filas(modelo, lote, alias)
+            cargadas += len(lote)
+            lote = []
+    upsert_filas(modelo, lote, alias)
+    return cargadas + len(lote)
+
+
+def vaciar_tablas(tablas, alias='default', truncar=False):
+    """
+    Borrar el contenido actual de las tablas antes de restaurar. Nunca se vacía
+    en cascada: si una tabla fuera de la selección con claves foráneas hacia
+    ella tiene filas, se aborta sin tocar nada (salvo el estado interno de
+    EXCLUIDOS, que se descarta). TRUNCATE solo en la restauración completa;
+    con tablas sueltas, DELETE de hijos a padres.
+    """
+    conexion = connections[alias]
+    qn = conexion.ops.quote_name
+    with transaction.atomic(using=alias), conexion.cursor() as cursor:
+        dependientes = modelos_dependientes(tablas)
+        con_filas = [
+            modelo._meta.label_lower for modelo in dependientes
+            if modelo._meta.label_lower not in EXCLUIDOS and modelo._base_manager.using(alias).exists()
+        ]
+        if con_filas:
+            raise ValueError(
+                f"Tablas fuera del respaldo referencian a las restauradas y tienen filas: {', '.join(con_filas)}"
+            )
+        if truncar and conexion.vendor == 'postgresql':
+            # Postgres exige truncar juntas las tablas que se referencian, aunque estén vacías
+            nombres = ', '.join(
+                [qn(tabla['db_table']) for tabla in tablas] + [qn(modelo._meta.db_table) for modelo in dependientes]
+            )
+            cursor.execute(f'TRUNCATE {nombres} RESTART IDENTITY')
+        else:
+            for modelo in dependientes:
+                cursor.execute(f'DELETE FROM {qn(modelo._meta.db_table)}')
+            # Hijos primero para respetar las claves foráneas
+            for tabla in sorted(tablas, key=lambda tabla: -tabla['nivel']):
+                cursor.execute(f'DELETE FROM {qn(tabla["db_table"])}')
+
+
+def restaurar_respaldo(ruta, alias='default', tablas=None, desde=None, hasta=None, reemplazar=False, hilos=4, log=None):
+    """
+    Restaurar el respaldo. Sin `reemplazar` las filas se insertan o actualizan
+    por id; con `reemplazar` se vacían antes las tablas restauradas. `desde` y
+    `hasta` (datetimes aware) limitan las tablas con campo fecha a ese período.
+    Las tablas del mismo nivel de dependencias se cargan en paralelo.
+    """
+    log = log or (lambda mensaje: None)
+    manifiesto = leer_manifiesto(ruta)
+    filtrar_fecha = desde is not None or hasta is not None
+
+    seleccion = [
+        tabla for tabla in manifiesto['tablas']
+        if (tablas is None or tabla['tabla'] in tablas)
+    ]
+    if filtrar_fecha:
+        sin_fecha = [tabla['tabla'] for tabla in seleccion if not _campo_fecha(apps.get_model(tabla['tabla']))]
+        if sin_fecha:
+            raise ValueError(f"Sin campo fecha para filtrar: {', '.join(sin_fecha)}")
+    if not seleccion:
+        raise ValueError('Ninguna tabla del respaldo coincide con la selección')
+
+    directo = reemplazar and not filtrar_fecha
+    if reemplazar:
+        vaciar_tablas(seleccion, alias, truncar=tablas is None)
+
+    if connections[alias].vendor == 'sqlite':
+        hilos = 1
+
+    resultado = {}
+    niveles = sorted({tabla['nivel'] for tabla in seleccion})
+    with ThreadPoolExecutor(max_workers=hilos) as ejecutor:
+        for nivel in niveles:
+            del_nivel = [tabla for tabla in seleccion if tabla['nivel'] == nivel]
+            futuros = {
+                tabla['tabla']: ejecutor.submit(_restaurar_tabla, ruta, tabla, alias, directo, desde, hasta)
+                for tabla in del_nivel
+            }
+            for etiqueta, futuro in futuros.items():
+                resultado[etiqueta] = futuro.result()
+                log(f'{etiqueta}: {resultado[etiqueta]} filas restauradas')
+    return resultado
@@ -0,0 +1,105 @@
+"""
+Lecturas de reportes en la réplica (settings.REPLICA_LECTURA).
+
+Las vistas marcadas con @usar_replica leen los modelos replicados desde la
+réplica mientras su retraso no supere REPLICA_RETRASO_MAXIMO; si está atrasada
+o no responde, la vista usa la base principal. Las escrituras siempre van a
+'default'.
+"""
+import logging
+import threading
+import time
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections
+from django.utils import timezone
+
+from .replicacion import es_replicado, modelos_replicados
+
+logger = logging.getLogger(__name__)
+
+# Alias de lectura activo en la vista actual (seguro con hilos y con async)
+alias_lectura = ContextVar('alias_lectura', default=None)
+
+INTERVALO_REVISION = 30  # segundos que se reutiliza el último chequeo de retraso
+
+_estado = {'revisado': 0.0, 'disponible': False}
+_lock = threading.Lock()
+
+
+class RouterReplica:
+    def db_for_read(self, model, **hints):
+        alias = alias_lectura.get()
+        if alias and es_replicado(model):
+            return alias
+        return None
+
+    def db_for_write(self, model, **hints):
+        # Explícito: sin esto un objeto leído de la réplica se guardaría en ella
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        bases = {'default', getattr(settings, 'REPLICA_LECTURA', None)}
+        if obj1._state.db in bases and obj2._state.db in bases:
+            return True
+        return None
+
+
+def retraso_replica(alias):
+    """Segundos de retraso de la réplica, o None si no se puede medir"""
+    conexion = connections[alias]
+    if conexion.vendor == 'postgresql':
+        with conexion.cursor() as cursor:
+            cursor.execute('SELECT pg_is_in_recovery()')
+            if cursor.fetchone()[0]:
+                # Réplica física de Postgres (streaming)
+                cursor.execute('SELECT EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())')
+                retraso = cursor.fetchone()[0]
+                return float(retraso) if retraso is not None else None
+
+    # Copia mantenida por backup_supabase: el retraso lo marca la tabla copiada
+    # hace más tiempo (una pasada cortada a la mitad deja las demás atrás)
+    from .models import MarcaReplicacion
+    tablas = {modelo._meta.label_lower for nivel in modelos_replicados() for modelo in nivel}
+    copias = dict(
+        MarcaReplicacion.objects.using('default')
+        .filter(destino=alias, tabla__in=tablas)
+        .values_list('tabla', 'ultima_copia')
+    )
+    if set(copias) != tablas or None in copias.values():
+        return None
+    return (timezone.now() - min(copias.values())).total_seconds()
+
+
+def replica_disponible():
+    """Alias de la réplica si está configurada y al día; None para leer de la principal"""
+    alias = getattr(settings, 'REPLICA_LECTURA', None)
+    if not alias or alias not in settings.DATABASES:
+        return None
+
+    ahora = time.monotonic()
+    with _lock:
+        if ahora - _estado['revisado'] < INTERVALO_REVISION:
+            return alias if _estado['disponible'] else None
+
+    try:
+        retraso = retraso_replica(alias)
+    except Exception as e:
+        logger.warning('Réplica %s no disponible: %s', alias, e)
+        retraso = None
+
+    maximo = getattr(settings, 'REPLICA_RETRASO_MAXIMO', 900)
+    disponible = retraso is not None and retraso <= maximo
+    if retraso is not None and not disponible:
+        logger.info('Réplica %s atrasada %.0f s (máximo %s s); se lee de la principal', alias, retraso, maximo)
+
+    with _lock:
+        _estado.update(revisado=ahora, disponible=disponible)
+    return alias if disponible else None
+
+
+def marcar_no_disponible():
+    """Forzar la lectura desde la principal hasta el próximo chequeo"""
+    with _lock:
+        _estado.update(revisado=time.monotonic(), disponible=False)
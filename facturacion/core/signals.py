@@ -1,20 +1,11 @@
-from django.db.models.signals import post_save, pre_save
+from django.apps import apps
+from django.db.models.signals import post_save, post_delete, m2m_changed
 from django.dispatch import receiver
 from django.contrib.auth.models import User
 from django.utils import timezone
-from .models import Producto, Factura, DetalleFactura, Notificacion, Pago, Caja, MovimientoCaja, PagoFactura
-
-@receiver(pre_save, sender=Producto)
-def verificar_stock_minimo(sender, instance, **kwargs):
-    """
-    Señal que verifica si un producto está por debajo del stock mínimo
-    y crea una notificación si es necesario
-    """
-    if instance.stock and instance.stock_minimo and instance.stock <= instance.stock_minimo:
-        Notificacion.objects.create(
-            mensaje=f'Stock bajo en producto {instance.nombre}. Stock actual: {instance.stock}',
-            tipo='warning'
-        )
+from .models import Producto, Factura, DetalleFactura, Notificacion, Pago, Caja, MovimientoCaja, PagoFactura, RegistroEliminacion
+from .eventos import publicar_notificacion
+from .replicacion import es_replicado
 
 @receiver(post_save, sender=Factura)
 def actualizar_stock_productos(sender, instance, created, **kwargs):
@@ -27,7 +18,7 @@ def actualizar_stock_productos(sender, instance, created, **kwargs):
             producto = detalle.producto
             if producto.stock is not None:  # Solo si el producto maneja stock
                 producto.stock -= detalle.cantidad
-                producto.save()
+                producto.save(update_fields=['stock'])
 
 @receiver(post_save, sender=User)
 def crear_notificacion_usuario(sender, instance, created, **kwargs):
@@ -40,6 +31,51 @@ def crear_notificacion_usuario(sender, instance, created, **kwargs):
             tipo='info'
         )
 
+@receiver(post_save, sender=Notificacion)
+def publicar_notificacion_nueva(sender, instance, created, **kwargs):
+    """
+    Señal que envía las notificaciones nuevas a los usuarios conectados por SSE
+    """
+    if created:
+        publicar_notificacion(instance)
+
+def registrar_eliminacion(sender, instance, using, **kwargs):
+    """
+    Señal que deja un tombstone por cada fila borrada en la base principal
+    para que la replicación incremental la elimine en el destino
+    """
+    if using == 'default':
+        RegistroEliminacion.objects.create(tabla=sender._meta.label_lower, registro_id=instance.pk)
+
+def registrar_eliminacion_m2m(sender, instance, action, model, pk_set, using, **kwargs):
+    """
+    Tombstones de las tablas intermedias (grupos y permisos de usuarios):
+    remove() y clear() las borran sin post_delete
+    """
+    if using != 'default' or action not in ('pre_remove', 'pre_clear'):
+        return
+    filas = sender._base_manager.using(using)
+    for campo in sender._meta.concrete_fields:
+        if not campo.is_relation:
+            continue
+        if isinstance(instance, campo.related_model):
+            filas = filas.filter(**{campo.attname: instance.pk})
+        elif campo.related_model is model and pk_set is not None:
+            filas = filas.filter(**{f'{campo.attname}__in': pk_set})
+    RegistroEliminacion.objects.bulk_create([
+        RegistroEliminacion(tabla=sender._meta.label_lower, registro_id=pk)
+        for pk in filas.values_list('pk', flat=True)
+    ])
+
+# Solo en los modelos replicados, para no anular el borrado rápido del resto
+for modelo in apps.get_models(include_auto_created=True):
+    if not es_replicado(modelo):
+        continue
+    if modelo._meta.auto_created:
+        m2m_changed.connect(registrar_eliminacion_m2m, sender=modelo, dispatch_uid=f'tombstone_{modelo._meta.label_lower}')
+    else:
+        post_delete.connect(registrar_eliminacion, sender=modelo, dispatch_uid=f'tombstone_{modelo._meta.label_lower}')
+
 @receiver(post_save, sender=PagoFactura)
 def crear_movimiento_caja_pago_factura(sender, instance, created, **kwargs):
     """
@@ -60,10 +96,7 @@ def crear_movimiento_caja_pago_factura(sender, instance, created, **kwargs):
                 
                 try:
                     # Obtener la caja del día actual
-                    caja_hoy = Caja.objects.filter(
-                        fecha=timezone.now().date(),
-                        cerrada=False
-                    ).first()
+                    caja_hoy = Caja.caja_de_usuario(pago.usuario, timezone.now().date())
                     
                     print(f"Caja activa encontrada: {caja_hoy}")
                     
@@ -90,10 +123,7 @@ def crear_movimiento_caja_pago_factura(sender, instance, created, **kwargs):
                 
                 try:
                     # Obtener la caja del día actual
-                    caja_hoy = Caja.objects.filter(
-                        fecha=timezone.now().date(),
-                        cerrada=False
-                    ).first()
+                    caja_hoy = Caja.caja_de_usuario(pago.usuario, timezone.now().date())
                     
                     print(f"Caja activa encontrada (proveedor): {caja_hoy}")
                     
@@ -3,6 +3,13 @@ from django.contrib.humanize.templatetags.humanize import intcomma
 
 register = template.Library()
 
+@register.simple_tag
+def token_idempotencia():
+    """Campo oculto con un token nuevo: el decorador idempotente descarta los reenvíos del formulario"""
+    import uuid
+    from django.utils.html import format_html
+    return format_html('<input type="hidden" name="token_idempotencia" value="{}">', uuid.uuid4().hex)
+
 @register.filter
 def sub(value, arg):
     """Resta el argumento del valor"""
@@ -20,13 +27,14 @@ def intcomma_dot(value):
             return '0'
         
         # Convertir a string y formatear
-        num_str = str(int(value))
+        numero = int(value)
+        num_str = str(abs(numero))
         result = ''
         for i, digit in enumerate(reversed(num_str)):
             if i > 0 and i % 3 == 0:
                 result = '.' + result
             result = digit + result
-        return result
+        return '-' + result if numero < 0 else result
     except (ValueError, TypeError):
         return str(value) if value is not None else '0'
 
@@ -0,0 +1,134 @@
+from django.contrib.auth.models import User
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from .consultas import afirmar_presupuesto
+from .models import Caja, Cliente, DetalleFactura, Factura, Pago, Producto, Proveedor
+
+
+class PresupuestoConsultasTests(TestCase):
+    """Las vistas con @presupuesto_consultas no deben crecer con la cantidad de filas (N+1)"""
+
+    FACTURAS = 20
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_superuser('admin', 'admin@example.com', 'clave')
+        productos = Producto.objects.bulk_create([
+            Producto(codigo=f'P{i:03d}', nombre=f'Producto {i}', precio=1000 * (i + 1), stock=100, costo=500)
+            for i in range(5)
+        ])
+        clientes = Cliente.objects.bulk_create([
+            Cliente(nombre=f'Cliente {i}', ruc=f'8000{i}', telefono='0', email=f'c{i}@example.com')
+            for i in range(5)
+        ])
+        proveedor = Proveedor.objects.create(
+            nombre='Proveedor', ruc='90000', direccion='-', telefono='0', email='p@example.com'
+        )
+        facturas = Factura.objects.bulk_create([
+            Factura(
+                tipo='venta' if i % 2 else 'compra', numero=f'{i:06d}', usuario=cls.usuario,
+                cliente=clientes[i % len(clientes)] if i % 2 else None,
+                proveedor=None if i % 2 else proveedor,
+                subtotal=10000, iva=1000, total=11000, monto_pendiente=11000,
+            )
+            for i in range(cls.FACTURAS)
+        ])
+        DetalleFactura.objects.bulk_create([
+            DetalleFactura(
+                factura=factura, producto=producto, cantidad=1, precio_unitario=producto.precio,
+                iva=0, subtotal=producto.precio, total=producto.precio,
+            )
+            for factura in facturas for producto in productos[:3]
+        ])
+
+    def setUp(self):
+        self.client.force_login(self.usuario)
+
+    def test_listados(self):
+        for nombre in ['dashboard', 'productos_list', 'factura_list', 'pagos_dashboard']:
+            with self.subTest(vista=nombre):
+                response = afirmar_presupuesto(self.client, reverse(nombre))
+                self.assertEqual(response.status_code, 200)
+
+    def test_reportes(self):
+        for nombre in ['reportes_dashboard', 'reporte_antiguedad_saldos', 'reporte_ventas_detallado']:
+            with self.subTest(vista=nombre):
+                response = afirmar_presupuesto(self.client, reverse(nombre))
+                self.assertEqual(response.status_code, 200)
+
+    def test_reporte_ventas_compras(self):
+        response = afirmar_presupuesto(self.client, reverse('reporte_ventas_detallado') + '?tipo=compra')
+        self.assertEqual(response.status_code, 200)
+
+    def test_exportar_detalles(self):
+        response = afirmar_presupuesto(self.client, reverse('exportar_detalles_facturas_excel'))
+        self.assertEqual(response.status_code, 200)
+
+
+class IdempotenteTests(TestCase):
+    """Un token solo se consume cuando la operación se registró"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_superuser('admin', 'admin@example.com', 'clave')
+        proveedor = Proveedor.objects.create(
+            nombre='Proveedor', ruc='90000', direccion='-', telefono='0', email='p@example.com'
+        )
+        cls.factura = Factura.objects.create(
+            tipo='compra', numero='000001', usuario=cls.usuario, proveedor=proveedor,
+            subtotal=10000, iva=0, total=10000,
+        )
+
+    def setUp(self):
+        self.client.force_login(self.usuario)
+
+    def test_reenvio_despues_de_redireccion_por_error(self):
+        url = reverse('pago_crear', args=[self.factura.pk])
+        datos = {'monto_total': 4000, 'tipo': 'efectivo', 'referencia': '', 'observacion': '', 'token_idempotencia': 'a' * 32}
+
+        # Sin caja abierta la vista redirige a abrirla sin registrar el pago
+        response = self.client.post(url, datos)
+        self.assertRedirects(response, reverse('caja_abrir'), fetch_redirect_response=False)
+        self.assertFalse(Pago.objects.exists())
+
+        # Con la caja abierta, el mismo formulario (mismo token) registra el pago
+        Caja.objects.create(fecha=timezone.localdate(), usuario_apertura=self.usuario)
+        response = self.client.post(url, datos)
+        self.assertRedirects(response, reverse('factura_pagos', args=[self.factura.pk]), fetch_redirect_response=False)
+        self.assertEqual(Pago.objects.count(), 1)
+
+        # Un reenvío posterior ya no lo duplica
+        self.client.post(url, datos)
+        self.assertEqual(Pago.objects.count(), 1)
+
+
+class AntiguedadSaldosTests(TestCase):
+    """El parámetro `contraparte` del reporte no debe provocar errores 500"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_superuser('admin', 'admin@example.com', 'clave')
+        cls.cliente = Cliente.objects.create(nombre='Cliente', ruc='80000', telefono='0', email='c@example.com')
+        for numero, cliente in [('000001', cls.cliente), ('000002', None)]:
+            Factura.objects.create(
+                tipo='venta', numero=numero, usuario=cls.usuario, cliente=cliente,
+                subtotal=10000, iva=0, total=10000, monto_pendiente=10000,
+            )
+
+    def setUp(self):
+        self.client.force_login(self.usuario)
+
+    def test_detalle_por_contraparte(self):
+        url = reverse('reporte_antiguedad_saldos')
+        casos = [(str(self.cliente.pk), ['000001']), ('ninguno', ['000002']), ('abc', None)]
+        for valor, numeros in casos:
+            with self.subTest(contraparte=valor):
+                response = self.client.get(url, {'contraparte': valor})
+                self.assertEqual(response.status_code, 200)
+                detalle = response.context['detalle']
+                if numeros is None:
+                    self.assertIsNone(detalle)
+                else:
+                    self.assertEqual([f.numero for f in detalle], numeros)
@@ -3,11 +3,62 @@ from django.contrib.auth.views import LoginView, LogoutView
 from django.contrib.auth import logout, authenticate, login
 from django.shortcuts import redirect, render
 from django.contrib import messages
-from . import views, views_pagos, views_caja, views_reportes, views_permisos
+from django.utils.functional import cached_property
+from importlib import import_module
+from . import views_eventos
 from django.contrib.auth import get_user_model
 
 User = get_user_model()
 
+
+class VistaDiferida:
+    """
+    Vista que importa su módulo recién en la primera request. Así el arranque de
+    cada worker no carga todos los módulos de vistas (ni sus dependencias).
+    """
+
+    # Atributos que Django consulta al armar el resolver: no deben forzar la importación
+    SIN_IMPORTAR = {'view_class', 'view_initkwargs'}
+
+    def __init__(self, modulo, nombre):
+        self.__module__ = modulo
+        self.__name__ = self.__qualname__ = nombre
+
+    @cached_property
+    def vista(self):
+        return getattr(import_module(self.__module__), self.__name__)
+
+    def __call__(self, request, *args, **kwargs):
+        return self.vista(request, *args, **kwargs)
+
+    def __getattr__(self, atributo):
+        # csrf_exempt, presupuesto_consultas, etc. se leen de la vista real
+        if atributo in self.SIN_IMPORTAR or atributo.startswith('__'):
+            raise AttributeError(atributo)
+        return getattr(self.vista, atributo)
+
+
+class ModuloDiferido:
+    """Módulo de vistas de un subsistema; `modulo.vista` devuelve una VistaDiferida"""
+
+    def __init__(self, modulo):
+        self._modulo = modulo
+
+    def __getattr__(self, nombre):
+        return VistaDiferida(self._modulo, nombre)
+
+
+# Un módulo por subsistema; cada uno se importa con la primera request que lo usa.
+# views_eventos queda importado: la vista SSE es async y Django lo detecta por la función.
+views = ModuloDiferido('core.views')                      # facturación, productos, contrapartes
+views_pagos = ModuloDiferido('core.views_pagos')          # pagos
+views_caja = ModuloDiferido('core.views_caja')            # caja
+views_reportes = ModuloDiferido('core.views_reportes')    # reportes
+views_exportar = ModuloDiferido('core.views_exportar')    # exportaciones
+views_estado_cuenta = ModuloDiferido('core.views_estado_cuenta')
+views_permisos = ModuloDiferido('core.views_permisos')
+views_inventario = ModuloDiferido('core.views_inventario')
+
 def logout_view(request):
     logout(request)
     return redirect('login')
@@ -54,6 +105,8 @@ urlpatterns = [
     path('proveedores/<int:pk>/editar/', views.proveedor_editar, name='proveedor_editar'),
     path('proveedores/<int:pk>/eliminar/', views.proveedor_eliminar, name='proveedor_eliminar'),
     path('proveedores/<int:pk>/reactivar/', views.proveedor_reactivar, name='proveedor_reactivar'),
+    path('proveedores/<int:pk>/estado-cuenta/', views_estado_cuenta.estado_cuenta, {'tipo_contraparte': 'proveedor'}, name='estado_cuenta_proveedor'),
+    path('proveedores/<int:pk>/estado-cuenta/exportar/', views_estado_cuenta.exportar_estado_cuenta_excel, {'tipo_contraparte': 'proveedor'}, name='exportar_estado_cuenta_proveedor'),
     
     # Clientes
     path('clientes/', views.clientes_list, name='clientes_list'),
@@ -61,11 +114,16 @@ urlpatterns = [
     path('clientes/<int:pk>/editar/', views.cliente_editar, name='cliente_editar'),
     path('clientes/<int:pk>/eliminar/', views.cliente_eliminar, name='cliente_eliminar'),
     path('clientes/<int:pk>/reactivar/', views.cliente_reactivar, name='cliente_reactivar'),
+    path('clientes/<int:pk>/estado-cuenta/', views_estado_cuenta.estado_cuenta, {'tipo_contraparte': 'cliente'}, name='estado_cuenta_cliente'),
+    path('clientes/<int:pk>/estado-cuenta/exportar/', views_estado_cuenta.exportar_estado_cuenta_excel, {'tipo_contraparte': 'cliente'}, name='exportar_estado_cuenta_cliente'),
     
     # Facturas
     path('facturas/', views.factura_list, name='factura_list'),
     path('facturas/crear/', views.factura_crear, name='factura_crear'),
     path('facturas/<int:pk>/', views.factura_ver, name='factura_ver'),
+    path('facturas/<int:pk>/pdf/', views.factura_pdf, name='factura_pdf'),
+    path('facturas/pdf/', views.facturas_pdf_lote, name='facturas_pdf_lote'),
+    path('facturas/lote/', views.facturas_lote, name='facturas_lote'),
     path('facturas/<int:pk>/editar/', views.factura_editar, name='factura_editar'),
     path('facturas/<int:pk>/eliminar/', views.factura_eliminar, name='factura_eliminar'),
     path('facturas/<int:pk>/anular/', views.factura_anular, name='factura_anular'),
@@ -74,6 +132,13 @@ urlpatterns = [
     
     # Stock
     path('stock/movimientos/', views.stock_movimientos, name='stock_movimientos'),
+    path('stock/tomas/', views_inventario.tomas_inventario_list, name='tomas_inventario_list'),
+    path('stock/tomas/nueva/', views_inventario.toma_inventario_crear, name='toma_inventario_crear'),
+    path('stock/tomas/<int:pk>/', views_inventario.toma_inventario_ver, name='toma_inventario_ver'),
+    path('stock/tomas/<int:pk>/guardar/', views_inventario.toma_inventario_guardar, name='toma_inventario_guardar'),
+    path('stock/tomas/<int:pk>/aplicar/', views_inventario.toma_inventario_aplicar, name='toma_inventario_aplicar'),
+    path('stock/tomas/<int:pk>/cancelar/', views_inventario.toma_inventario_cancelar, name='toma_inventario_cancelar'),
+    path('stock/tomas/<int:pk>/exportar/', views_inventario.toma_inventario_exportar, name='toma_inventario_exportar'),
     
     # Pagos
     path('facturas/<int:pk>/pagos/', views.factura_pagos, name='factura_pagos'),
@@ -94,18 +159,21 @@ urlpatterns = [
     path('api/clientes/buscar/', views.buscar_clientes, name='buscar_clientes'),
     path('api/clientes/crear/', views.cliente_crear_ajax, name='cliente_crear_ajax'),
     path('api/productos/buscar/', views.buscar_productos, name='buscar_productos'),
+    path('api/reservas/', views.reservar_stock, name='reservar_stock'),
+    path('api/ingesta/facturas/', views.ingesta_facturas, name='ingesta_facturas'),
     path('api/dashboard/data/', views.dashboard_data, name='dashboard_data'),
 
     # Exportaciones a Excel
-    path('exportar/facturas/excel/', views.exportar_facturas_excel, name='exportar_facturas_excel'),
-    path('exportar/productos/excel/', views.exportar_productos_excel, name='exportar_productos_excel'),
-    path('exportar/proveedores/excel/', views.exportar_proveedores_excel, name='exportar_proveedores_excel'),
-    path('exportar/detalles-facturas/excel/', views.exportar_detalles_facturas_excel, name='exportar_detalles_facturas_excel'),
+    path('exportar/facturas/excel/', views_exportar.exportar_facturas_excel, name='exportar_facturas_excel'),
+    path('exportar/productos/excel/', views_exportar.exportar_productos_excel, name='exportar_productos_excel'),
+    path('exportar/proveedores/excel/', views_exportar.exportar_proveedores_excel, name='exportar_proveedores_excel'),
+    path('exportar/detalles-facturas/excel/', views_exportar.exportar_detalles_facturas_excel, name='exportar_detalles_facturas_excel'),
     
     # Sistema de Alertas
     path('notificaciones/', views.notificaciones_list, name='notificaciones_list'),
     path('notificaciones/<int:pk>/marcar-leida/', views.marcar_notificacion_leida, name='marcar_notificacion_leida'),
     path('api/notificaciones/', views.obtener_notificaciones_ajax, name='obtener_notificaciones_ajax'),
+    path('api/eventos/', views_eventos.eventos_stream, name='eventos_stream'),
     
     # Sistema de Email
     path('enviar-alertas-email/', views.enviar_alertas_email, name='enviar_alertas_email'),
@@ -130,6 +198,8 @@ urlpatterns = [
     path('reportes/tendencias-ventas/', views_reportes.reporte_tendencias_ventas, name='reporte_tendencias_ventas'),
     path('reportes/analisis-clientes/', views_reportes.reporte_analisis_clientes, name='reporte_analisis_clientes'),
     path('reportes/eficiencia-operativa/', views_reportes.reporte_eficiencia_operativa, name='reporte_eficiencia_operativa'),
+    path('reportes/antiguedad-saldos/', views_reportes.reporte_antiguedad_saldos, name='reporte_antiguedad_saldos'),
+    path('reportes/antiguedad-saldos/exportar/', views_reportes.exportar_antiguedad_saldos_excel, name='exportar_antiguedad_saldos_excel'),
     
     # Módulo de Pagos a Proveedores
     path('pagos-proveedores/', views.pagos_proveedores_dashboard, name='pagos_proveedores_dashboard'),
@@ -143,6 +213,7 @@ urlpatterns = [
     # MÓDULO DE CONTROL DE CAJA
     path('caja/', views_caja.caja_list, name='caja_list'),
     path('caja/abrir/', views_caja.caja_abrir, name='caja_abrir'),
+    path('caja/consolidado/', views_caja.caja_consolidado, name='caja_consolidado'),
     path('caja/<int:caja_id>/', views_caja.caja_ver, name='caja_ver'),
     path('caja/<int:caja_id>/cerrar/', views_caja.caja_cerrar, name='caja_cerrar'),
     path('caja/<int:caja_id>/gasto/crear/', views.gasto_crear, name='gasto_crear'),
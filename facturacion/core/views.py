@@ -4,13 +4,16 @@ from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.db.models import Sum, Count, F, Q
 from django.http import JsonResponse
-from django.db import models
+from django.views.decorators.csrf import csrf_exempt
+from django.db import models, transaction
 from django.forms import modelformset_factory
-from .models import Producto, Proveedor, Cliente, Factura, DetalleFactura, Pago, PagoFactura, Notificacion, MovimientoStock, ConfiguracionSistema, Caja, Gasto, MovimientoCaja, Denominacion
+from .models import Producto, Proveedor, Cliente, Factura, DetalleFactura, Pago, PagoFactura, Notificacion, MovimientoStock, ConfiguracionSistema, Caja, Gasto, MovimientoCaja, Denominacion, MovimientoSaldo, CorreoSaliente, ReservaStock
 from .forms import ProductoForm, ProductoCrearForm, ProveedorForm, ClienteForm, FacturaForm, DetalleFacturaFormSet, PagoForm, PagoMultipleForm, AsignacionPagoForm, PagoFacturaFormSet
-from .decorators import puede_ver_modulo, puede_crear_modulo, puede_editar_modulo, puede_eliminar_modulo
+from .decorators import puede_ver_modulo, puede_crear_modulo, puede_editar_modulo, puede_eliminar_modulo, usar_replica, idempotente
+from .consultas import presupuesto_consultas
 
 @login_required
+@presupuesto_consultas(60)
 def dashboard(request):
     """Vista del dashboard principal"""
     from datetime import datetime, timedelta
@@ -26,8 +29,9 @@ def dashboard(request):
     total_proveedores = Proveedor.objects.filter(activo=True).count()
     facturas_pendientes = Factura.objects.filter(estado='pendiente').count()
     total_por_pagar = Factura.objects.filter(estado='pendiente').aggregate(total=Sum('total'))['total'] or 0
-    productos_stock_bajo_count = Producto.objects.filter(activo=True, stock__gt=0, stock__lte=F('stock_minimo')).count()
-    productos_stock_bajo = Producto.objects.filter(activo=True, stock__gt=0, stock__lte=F('stock_minimo'))
+    por_estado = Producto.objects.conteo_por_estado()
+    productos_stock_bajo_count = sum(por_estado[estado] for estado in Producto.ESTADOS_STOCK_BAJO)
+    productos_stock_bajo = Producto.objects.stock_bajo()
     
     # Métricas adicionales
     facturas_mes = Factura.objects.filter(fecha__gte=inicio_mes).count()
@@ -35,9 +39,9 @@ def dashboard(request):
     facturas_pagadas = Factura.objects.filter(estado='pagada').count()
     total_pagado = Factura.objects.filter(estado='pagada').aggregate(total=Sum('total'))['total'] or 0
     
-    # Productos con stock crítico (stock = 0)
-    productos_agotados_count = Producto.objects.filter(activo=True, stock=0).count()
-    productos_agotados = Producto.objects.filter(activo=True, stock=0)
+    # Productos agotados (stock <= 0)
+    productos_agotados_count = por_estado['agotado']
+    productos_agotados = Producto.objects.agotados()
     
     # Top 5 productos con más stock
     productos_top_stock = Producto.objects.filter(activo=True).order_by('-stock')[:5]
@@ -82,8 +86,8 @@ def dashboard(request):
     estados_data = [item['count'] for item in estados_facturas]
     
     # Productos por categoría de stock
-    productos_stock_alto_count = Producto.objects.filter(activo=True, stock__gt=F('stock_minimo')).count()
-    productos_stock_alto = Producto.objects.filter(activo=True, stock__gt=F('stock_minimo'))
+    productos_stock_alto_count = por_estado['normal']
+    productos_stock_alto = Producto.objects.en_estado('normal')
     
     # Productos más vendidos (últimos 30 días)
     productos_vendidos = DetalleFactura.objects.filter(
@@ -144,9 +148,7 @@ def dashboard(request):
         'productos_stock_alto_count': productos_stock_alto_count,
         
         # Productos por categoría de stock para gráfico
-        'productos_stock_medio_count': Producto.objects.filter(
-            activo=True, 
-            stock__gt=F('stock_minimo'), 
+        'productos_stock_medio_count': Producto.objects.en_estado('normal').filter(
             stock__lte=F('stock_minimo') * 2
         ).count(),
         
@@ -233,6 +235,7 @@ def dashboard_data(request):
 
 @login_required
 @puede_ver_modulo('productos')
+@presupuesto_consultas(15)
 def productos_list(request):
     """Lista de productos"""
     # Filtros
@@ -247,19 +250,12 @@ def productos_list(request):
             Q(nombre__icontains=q) | Q(codigo__icontains=q)
         )
     
-    if estado:
-        if estado == 'normal':
-            productos = productos.filter(stock__gt=F('stock_minimo'))
-        elif estado == 'minimo':
-            productos = productos.filter(stock=F('stock_minimo'))
-        elif estado == 'critico':
-            productos = productos.filter(stock__lt=F('stock_minimo'))
-        elif estado == 'agotado':
-            productos = productos.filter(stock=0)
+    if estado in dict(Producto.ESTADO_STOCK_CHOICES):
+        productos = productos.en_estado(estado)
     
     return render(request, 'productos_list.html', {
         'productos': productos,
-        'productos_stock_bajo': Producto.objects.filter(activo=True, stock__lte=F('stock_minimo')).count()
+        'productos_stock_bajo': Producto.objects.stock_bajo().count()
     })
 
 @login_required
@@ -330,36 +326,16 @@ def producto_ajustar_stock(request, pk):
             if cantidad <= 0:
                 raise ValueError('La cantidad debe ser mayor a 0')
             
-            # Registrar el movimiento de stock
-            if tipo_movimiento == 'entrada':
-                MovimientoStock.registrar_movimiento(
-                    producto=producto,
-                    tipo='entrada',
-                    origen='ajuste_manual',
-                    cantidad=cantidad,
-                    usuario=request.user,
-                    observacion=observacion
-                )
-            elif tipo_movimiento == 'salida':
-                if producto.stock < cantidad:
-                    raise ValueError('No hay suficiente stock disponible')
-                MovimientoStock.registrar_movimiento(
-                    producto=producto,
-                    tipo='salida',
-                    origen='ajuste_manual',
-                    cantidad=cantidad,
-                    usuario=request.user,
-                    observacion=observacion
-                )
+            if tipo_movimiento not in ('entrada', 'salida'):
+                raise ValueError('Tipo de movimiento inválido')
             
-            # Crear notificación si el stock es bajo
-            if producto.stock <= producto.stock_minimo:
-                Notificacion.objects.create(
-                    mensaje=f'Stock bajo en producto {producto.nombre} ({producto.stock} unidades)',
-                    tipo='warning'
-                )
+            # El stock suficiente se valida sobre la fila bloqueada, no sobre la leída al inicio
+            delta = cantidad if tipo_movimiento == 'entrada' else -cantidad
+            movimiento, = MovimientoStock.registrar_lote(
+                [(producto.pk, delta, 'ajuste_manual', '', observacion)], request.user, permitir_negativo=False
+            )
             
-            messages.success(request, f'Stock ajustado correctamente. Nuevo stock: {producto.stock}')
+            messages.success(request, f'Stock ajustado correctamente. Nuevo stock: {movimiento.stock_nuevo}')
         except ValueError as e:
             messages.error(request, str(e))
         
@@ -575,6 +551,7 @@ def cliente_reactivar(request, pk):
 # ============================================================================
 
 @login_required
+@presupuesto_consultas(15)
 def factura_list(request):
     """Lista de facturas"""
     tipo = request.GET.get('tipo', 'compra')  # Por defecto mostrar compras
@@ -605,7 +582,7 @@ def factura_list(request):
     if estado:
         facturas = facturas.filter(estado=estado)
     
-    facturas = facturas.order_by('-numero')
+    facturas = facturas.select_related('proveedor', 'cliente').order_by('-numero')
     
     return render(request, 'factura_list.html', {
         'facturas': facturas,
@@ -615,17 +592,22 @@ def factura_list(request):
     })
 
 @login_required
+@idempotente
 def factura_crear(request):
     """Crear una nueva factura"""
     from datetime import datetime
+    import uuid
     
     tipo = request.GET.get('tipo', 'compra')
     fecha_actual = datetime.now().strftime('%Y-%m-%dT%H:%M')
+    # Clave del borrador: agrupa las reservas de stock de esta venta
+    reserva = request.POST.get('reserva') or uuid.uuid4().hex
     
     if request.method == 'POST':
         # Crear factura manualmente
         tipo = request.POST.get('tipo')
         fecha = request.POST.get('fecha')
+        fecha_vencimiento = request.POST.get('fecha_vencimiento')
         proveedor_id = request.POST.get('proveedor')
         cliente_id = request.POST.get('cliente')
         observacion = request.POST.get('observacion')
@@ -636,7 +618,8 @@ def factura_crear(request):
             return render(request, 'factura_form.html', {
                 'tipo': tipo,
                 'titulo': f'Nueva Factura de {tipo.title()}',
-                'fecha_actual': fecha_actual
+                'fecha_actual': fecha_actual,
+                'reserva': reserva
             })
         
         if tipo == 'venta' and not cliente_id:
@@ -644,13 +627,15 @@ def factura_crear(request):
             return render(request, 'factura_form.html', {
                 'tipo': tipo,
                 'titulo': f'Nueva Factura de {tipo.title()}',
-                'fecha_actual': fecha_actual
+                'fecha_actual': fecha_actual,
+                'reserva': reserva
             })
         
         # Crear factura
         factura = Factura()
         factura.tipo = tipo
         factura.fecha = fecha
+        factura.fecha_vencimiento = fecha_vencimiento or None
         factura.observacion = observacion
         factura.usuario = request.user
         
@@ -668,6 +653,7 @@ def factura_crear(request):
         
         # Procesar detalles
         detalles_data = []
+        movimientos_stock = []
         i = 0
         print(f"POST data: {request.POST}")
         
@@ -700,20 +686,15 @@ def factura_crear(request):
                 detalle.save()
                 print(f"Detalle guardado: subtotal={detalle.subtotal}, iva={detalle.iva}")
                 
-                # Actualizar stock y registrar movimiento
+                # Movimiento de stock (se registran todos juntos al final)
                 if tipo == 'compra':
-                    # Registrar movimiento de entrada para compras
-                    MovimientoStock.registrar_movimiento(
-                        producto=producto,
-                        tipo='entrada',
-                        origen='factura_compra',
-                        cantidad=int(cantidad),
-                        usuario=request.user,
-                        referencia=f'Factura #{factura.id}',
-                        observacion=f'Compra de {cantidad} unidades a Gs. {precio_unitario} c/u'
-                    )
+                    # El costo de la línea actualiza el costo promedio ponderado al registrarse
+                    movimientos_stock.append((
+                        producto.pk, int(cantidad), 'factura_compra', f'Factura #{factura.id}',
+                        f'Compra de {cantidad} unidades a Gs. {precio_unitario} c/u', int(precio_unitario)
+                    ))
                     
-                    # Para facturas de compra, actualizar costo si es diferente
+                    # Último costo de compra (el promedio lo mantiene registrar_lote)
                     nuevo_costo = int(precio_unitario)
                     if producto.costo != nuevo_costo:
                         print(f"Actualizando costo del producto {producto.nombre}: {producto.costo} -> {nuevo_costo}")
@@ -726,18 +707,13 @@ def factura_crear(request):
                             print(f"Actualizando precio de venta del producto {producto.nombre}: {producto.precio} -> {nuevo_precio_venta}")
                             producto.precio = nuevo_precio_venta
                     
-                    producto.save()
+                    # Sin tocar el stock: lo actualiza el libro de movimientos
+                    producto.save(update_fields=['costo', 'precio', 'fecha_actualizacion'])
                 else:
-                    # Registrar movimiento de salida para ventas
-                    MovimientoStock.registrar_movimiento(
-                        producto=producto,
-                        tipo='salida',
-                        origen='factura_venta',
-                        cantidad=int(cantidad),
-                        usuario=request.user,
-                        referencia=f'Factura #{factura.id}',
-                        observacion=f'Venta de {cantidad} unidades a Gs. {precio_unitario} c/u'
-                    )
+                    movimientos_stock.append((
+                        producto.pk, -int(cantidad), 'factura_venta', f'Factura #{factura.id}',
+                        f'Venta de {cantidad} unidades a Gs. {precio_unitario} c/u'
+                    ))
             else:
                 print(f"Detalle {i} omitido: datos incompletos")
             
@@ -745,6 +721,25 @@ def factura_crear(request):
         
         print(f"Total de detalles procesados: {i}")
         
+        # Un solo bloqueo por producto y un bulk_create para todas las líneas; la
+        # venta consume sus reservas y no puede tomar lo reservado por otra caja
+        try:
+            if tipo == 'compra':
+                MovimientoStock.registrar_lote(movimientos_stock, request.user)
+            else:
+                MovimientoStock.registrar_lote(
+                    movimientos_stock, request.user, permitir_negativo=False, reserva=reserva
+                )
+        except ValueError as e:
+            factura.delete()
+            messages.error(request, str(e))
+            return render(request, 'factura_form.html', {
+                'tipo': tipo,
+                'titulo': f'Nueva Factura de {tipo.title()}',
+                'fecha_actual': fecha_actual,
+                'reserva': reserva
+            })
+        
         # Verificar que la factura tenga al menos un producto
         if i == 0:
             # Eliminar la factura vacía
@@ -753,7 +748,8 @@ def factura_crear(request):
             return render(request, 'factura_form.html', {
                 'tipo': tipo,
                 'titulo': f'Nueva Factura de {tipo.title()}',
-                'fecha_actual': fecha_actual
+                'fecha_actual': fecha_actual,
+                'reserva': reserva
             })
         
         # Calcular totales con IVA discriminado
@@ -780,20 +776,25 @@ def factura_crear(request):
         factura.save()
         
         # Actualizar saldo del proveedor o cliente según el tipo de factura
-        if factura.tipo == 'compra' and factura.proveedor:
-            factura.proveedor.saldo += factura.total
-            factura.proveedor.save()
-        elif factura.tipo == 'venta' and factura.cliente:
-            factura.cliente.saldo += factura.total
-            factura.cliente.save()
+        MovimientoSaldo.registrar_movimiento(
+            contraparte=factura.contraparte,
+            monto=factura.total,
+            origen='factura',
+            usuario=request.user,
+            factura=factura,
+            referencia=f'Factura #{factura.numero}'
+        )
         
+        # Registrada: el decorador idempotente recuerda esta redirección
+        request.idempotente_ok = True
         messages.success(request, f'Factura de {factura.get_tipo_display()} creada correctamente.')
         return redirect(f'{reverse("factura_list")}?tipo={factura.tipo}')
     
     return render(request, 'factura_form.html', {
         'tipo': tipo,
         'titulo': f'Nueva Factura de {tipo.title()}',
-        'fecha_actual': fecha_actual
+        'fecha_actual': fecha_actual,
+        'reserva': reserva
     })
 
 @login_required
@@ -825,42 +826,8 @@ def factura_eliminar(request, pk):
     factura = get_object_or_404(Factura, pk=pk)
     if request.method == 'POST':
         try:
-            # Revertir movimientos de stock según el tipo de factura
-            for detalle in factura.detalles.all():
-                producto = detalle.producto
-                if factura.tipo == 'compra':
-                    # Si es factura de compra, registrar salida (reversión de entrada)
-                    MovimientoStock.registrar_movimiento(
-                        producto=producto,
-                        tipo='salida',
-                        origen='factura_compra',
-                        cantidad=detalle.cantidad,
-                        usuario=request.user,
-                        referencia=f'Factura #{factura.numero} eliminada',
-                        observacion='Eliminación de factura de compra'
-                    )
-                else:
-                    # Si es factura de venta, registrar entrada (reversión de salida)
-                    MovimientoStock.registrar_movimiento(
-                        producto=producto,
-                        tipo='entrada',
-                        origen='factura_venta',
-                        cantidad=detalle.cantidad,
-                        usuario=request.user,
-                        referencia=f'Factura #{factura.numero} eliminada',
-                        observacion='Eliminación de factura de venta'
-                    )
-            
-            # Restaurar saldos de proveedor/cliente si hay pagos
-            if factura.tipo == 'compra' and factura.proveedor:
-                factura.proveedor.saldo -= factura.total_pagado
-                factura.proveedor.save()
-            elif factura.tipo == 'venta' and factura.cliente:
-                factura.cliente.saldo -= factura.total_pagado
-                factura.cliente.save()
-            
-            # Eliminar la factura (esto también eliminará los pagos por CASCADE)
-            factura.delete()
+            # Stock, saldo y borrado (con sus asignaciones de pagos) en una transacción
+            Factura.eliminar_lote([factura.pk], request.user)
             
             messages.success(request, 'Factura eliminada correctamente.')
             return redirect('factura_list')
@@ -883,44 +850,8 @@ def factura_anular(request, pk):
     
     if request.method == 'POST':
         try:
-            # Revertir movimientos de stock antes de anular
-            for detalle in factura.detalles.all():
-                if factura.tipo == 'compra':
-                    # Para compras anuladas, registrar salida (reversión de entrada)
-                    MovimientoStock.registrar_movimiento(
-                        producto=detalle.producto,
-                        tipo='salida',
-                        origen='factura_compra',
-                        cantidad=detalle.cantidad,
-                        usuario=request.user,
-                        referencia=f'Factura #{factura.id} (ANULADA)',
-                        observacion=f'Anulación: Reversión de compra de {detalle.cantidad} unidades'
-                    )
-                else:
-                    # Para ventas anuladas, registrar entrada (reversión de salida)
-                    MovimientoStock.registrar_movimiento(
-                        producto=detalle.producto,
-                        tipo='entrada',
-                        origen='factura_venta',
-                        cantidad=detalle.cantidad,
-                        usuario=request.user,
-                        referencia=f'Factura #{factura.id} (ANULADA)',
-                        observacion=f'Anulación: Reversión de venta de {detalle.cantidad} unidades'
-                    )
-            
-            # Actualizar saldo del proveedor o cliente antes de anular
-            if factura.tipo == 'compra' and factura.proveedor and factura.estado == 'pendiente':
-                # Reducir el saldo del proveedor ya que la factura ya no está pendiente
-                factura.proveedor.saldo -= factura.total
-                factura.proveedor.save()
-            elif factura.tipo == 'venta' and factura.cliente and factura.estado == 'pendiente':
-                # Reducir el saldo del cliente ya que la factura ya no está pendiente
-                factura.cliente.saldo -= factura.total
-                factura.cliente.save()
-            
-            # Cambiar el estado a anulada
-            factura.estado = 'anulada'
-            factura.save(update_fields=['estado'])
+            # Stock, saldo, asignaciones de pagos y estado en una transacción
+            Factura.anular_lote([factura.pk], request.user)
             
             messages.success(request, 'Factura anulada correctamente.')
             return redirect('factura_ver', pk=pk)
@@ -931,6 +862,37 @@ def factura_anular(request, pk):
     
     return render(request, 'factura_confirm_anular.html', {'factura': factura})
 
+@login_required
+def facturas_lote(request):
+    """Anular o eliminar las facturas seleccionadas en la lista (cierres de mes)"""
+    tipo = request.POST.get('tipo', 'compra')
+    destino = f"{reverse('factura_list')}?tipo={tipo}"
+    if request.method != 'POST':
+        return redirect(destino)
+    
+    ids = [int(pk) for pk in request.POST.getlist('facturas') if pk.isdigit()]
+    accion = request.POST.get('accion')
+    if not ids:
+        messages.warning(request, 'No se seleccionaron facturas.')
+        return redirect(destino)
+    
+    try:
+        if accion == 'anular':
+            anuladas = Factura.anular_lote(ids, request.user)
+            omitidas = len(ids) - len(anuladas)
+            messages.success(request, f'{len(anuladas)} factura(s) anulada(s).')
+            if omitidas:
+                messages.info(request, f'{omitidas} factura(s) ya estaban anuladas.')
+        elif accion == 'eliminar':
+            eliminadas = Factura.eliminar_lote(ids, request.user)
+            messages.success(request, f'{eliminadas} factura(s) eliminada(s).')
+        else:
+            messages.error(request, 'Acción inválida.')
+    except Exception as e:
+        messages.error(request, f'Error al procesar las facturas: {str(e)}')
+    
+    return redirect(destino)
+
 @login_required
 def factura_ver(request, pk):
     """Ver detalle de factura"""
@@ -938,13 +900,77 @@ def factura_ver(request, pk):
     return render(request, 'factura_ver.html', {'factura': factura})
 
 @login_required
+def factura_pdf(request, pk):
+    """PDF de la factura (se reutiliza el ya generado si la factura no cambió)"""
+    from django.http import HttpResponse, HttpResponseNotModified
+    from .pdf_facturas import pdf_factura
+
+    factura = get_object_or_404(Factura, pk=pk)
+    contenido, clave = pdf_factura(factura)
+    etag = f'"{clave}"'
+    if request.headers.get('If-None-Match') == etag:
+        return HttpResponseNotModified()
+
+    response = HttpResponse(contenido, content_type='application/pdf')
+    response['Content-Disposition'] = f'inline; filename="factura_{factura.tipo}_{factura.numero or factura.pk}.pdf"'
+    response['ETag'] = etag
+    return response
+
+@login_required
+def facturas_pdf_lote(request):
+    """
+    Facturas del período filtrado en un ZIP (un PDF por factura) o en un único
+    PDF. El período es obligatorio y la cantidad está limitada por
+    PDF_LOTE_MAXIMO; los lotes grandes se generan con imprimir_facturas.
+    """
+    from django.conf import settings
+    from django.http import HttpResponse, HttpResponseBadRequest
+    from django.utils.dateparse import parse_date
+    from .pdf_facturas import pdf_lote
+
+    tipo = request.GET.get('tipo', 'compra')
+    desde = request.GET.get('desde', '')
+    hasta = request.GET.get('hasta', '')
+    formato = 'pdf' if request.GET.get('formato') == 'pdf' else 'zip'
+
+    try:
+        fecha_desde, fecha_hasta = parse_date(desde), parse_date(hasta)
+    except ValueError:
+        fecha_desde = fecha_hasta = None
+    if tipo not in dict(Factura.TIPO_CHOICES) or fecha_desde is None or fecha_hasta is None:
+        return HttpResponseBadRequest('Indique tipo y un período válido (desde y hasta, AAAA-MM-DD).')
+
+    facturas = Factura.objects.filter(
+        tipo=tipo, fecha__date__gte=fecha_desde, fecha__date__lte=fecha_hasta
+    ).exclude(estado='anulada')
+    maximo = getattr(settings, 'PDF_LOTE_MAXIMO', 500)
+    cantidad = facturas.count()
+    if cantidad > maximo:
+        return HttpResponseBadRequest(
+            f'El período tiene {cantidad} facturas y el máximo por descarga es {maximo}: '
+            f'acorte el período o use el comando imprimir_facturas.'
+        )
+
+    # Un solo proceso: el pool de procesos queda para imprimir_facturas, no para el worker web
+    contenido, estadisticas = pdf_lote(facturas, formato=formato, procesos=1)
+    if not estadisticas['facturas']:
+        messages.warning(request, 'No hay facturas en el período seleccionado.')
+        return redirect(f'{reverse("factura_list")}?{request.GET.urlencode()}')
+
+    nombre = f'facturas_{tipo}_{fecha_desde:%Y-%m-%d}_{fecha_hasta:%Y-%m-%d}.{formato}'
+    response = HttpResponse(contenido, content_type='application/pdf' if formato == 'pdf' else 'application/zip')
+    response['Content-Disposition'] = f'attachment; filename="{nombre}"'
+    return response
+
+@login_required
+@idempotente
 def factura_pagos(request, pk):
     """Ver y gestionar pagos de una factura"""
     factura = get_object_or_404(Factura, pk=pk)
     pagos_facturas = factura.pagos_facturas.select_related('pago', 'pago__usuario').all()
     
     # Validar caja activa del día actual
-    caja_activa, necesita_cierre = Caja.validar_caja_activa_hoy()
+    caja_activa, necesita_cierre = Caja.validar_caja_activa_hoy(request.user)
     
     if necesita_cierre:
         messages.error(request, f'Hay una caja abierta del {caja_activa.fecha.strftime("%d/%m/%Y")} que debe ser cerrada antes de realizar pagos.')
@@ -969,16 +995,7 @@ def factura_pagos(request, pk):
                 monto=pago.monto_total
             )
             
-            # Actualizar saldo del proveedor o cliente según el tipo de factura
-            if factura.tipo == 'compra' and factura.proveedor:
-                factura.proveedor.saldo -= pago.monto_total
-                factura.proveedor.save()
-            elif factura.tipo == 'venta' and factura.cliente:
-                factura.cliente.saldo -= pago.monto_total
-                factura.cliente.save()
-            
-            # Actualizar estado de la factura
-            factura.actualizar_estado()
+            # PagoFactura.save actualiza el saldo del proveedor/cliente y el estado de la factura
             
             # Mensaje informativo con detalles del pago
             monto_billete = form.cleaned_data.get('monto_billete')
@@ -996,6 +1013,8 @@ def factura_pagos(request, pk):
                 else:
                     mensaje += f' Se ha creado automáticamente un egreso en la caja del día.'
             
+            # Registrado: el decorador idempotente recuerda esta redirección
+            request.idempotente_ok = True
             messages.success(request, mensaje)
             
             return redirect('factura_pagos', pk=pk)
@@ -1088,136 +1107,7 @@ def pagos_dashboard(request):
     ).select_related('proveedor').order_by('-fecha')[:5]
     
     # Caja activa
-    caja_activa = Caja.obtener_caja_activa()
-    
-    context = {
-        'total_pagos_clientes': total_pagos_clientes,
-        'total_pagos_proveedores': total_pagos_proveedores,
-        'pagos_recientes': pagos_recientes,
-        'facturas_pendientes_clientes': facturas_pendientes_clientes,
-        'facturas_pendientes_proveedores': facturas_pendientes_proveedores,
-        'caja_activa': caja_activa,
-    }
-    
-    return render(request, 'pagos_dashboard.html', context)
-
-@login_required
-def pagos_clientes_list(request):
-    """Lista de pagos de clientes (facturas de venta)"""
-    # Obtener facturas de venta con pagos
-    facturas_venta = Factura.objects.filter(
-        tipo='venta'
-    ).select_related('cliente').prefetch_related('pagos').order_by('-fecha')
-    
-    # Filtros
-    q = request.GET.get('q', '')
-    estado = request.GET.get('estado', '')
-    desde = request.GET.get('desde', '')
-    hasta = request.GET.get('hasta', '')
-    
-    if q:
-        facturas_venta = facturas_venta.filter(
-            Q(cliente__nombre__icontains=q) | 
-            Q(numero__icontains=q) |
-            Q(cliente__ruc__icontains=q)
-        )
-    
-    if estado:
-        facturas_venta = facturas_venta.filter(estado=estado)
-    
-    if desde:
-        facturas_venta = facturas_venta.filter(fecha__date__gte=desde)
-    
-    if hasta:
-        facturas_venta = facturas_venta.filter(fecha__date__lte=hasta)
-    
-    # Paginación
-    from django.core.paginator import Paginator
-    paginator = Paginator(facturas_venta, 20)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
-    
-    context = {
-        'facturas': page_obj,
-        'tipo': 'venta',
-        'titulo': 'Pagos de Clientes',
-        'subtitulo': 'Facturas de Venta - Gestión de Cobros',
-    }
-    
-    return render(request, 'pagos_list.html', context)
-
-@login_required
-def pagos_proveedores_list(request):
-    """Lista de pagos a proveedores (facturas de compra)"""
-    # Obtener facturas de compra con pagos
-    facturas_compra = Factura.objects.filter(
-        tipo='compra'
-    ).select_related('proveedor').prefetch_related('pagos').order_by('-fecha')
-    
-    # Filtros
-    q = request.GET.get('q', '')
-    estado = request.GET.get('estado', '')
-    desde = request.GET.get('desde', '')
-    hasta = request.GET.get('hasta', '')
-    
-    if q:
-        facturas_compra = facturas_compra.filter(
-            Q(proveedor__nombre__icontains=q) | 
-            Q(numero__icontains=q) |
-            Q(proveedor__ruc__icontains=q)
-        )
-    
-    if estado:
-        facturas_compra = facturas_compra.filter(estado=estado)
-    
-    if desde:
-        facturas_compra = facturas_compra.filter(fecha__date__gte=desde)
-    
-    if hasta:
-        facturas_compra = facturas_compra.filter(fecha__date__lte=hasta)
-    
-    # Paginación
-    from django.core.paginator import Paginator
-    paginator = Paginator(facturas_compra, 20)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
-    
-    context = {
-        'facturas': page_obj,
-        'tipo': 'compra',
-        'titulo': 'Pagos a Proveedores',
-        'subtitulo': 'Facturas de Compra - Gestión de Pagos',
-    }
-    
-    return render(request, 'pagos_list.html', context)
-
-# ============================================================================
-# PAGOS
-# ============================================================================
-
-@login_required
-def pagos_dashboard(request):
-    """Dashboard principal del módulo de pagos"""
-    # Obtener estadísticas de pagos
-    total_pagos_clientes = Pago.objects.filter(factura__tipo='venta').count()
-    total_pagos_proveedores = Pago.objects.filter(factura__tipo='compra').count()
-    
-    # Pagos recientes
-    pagos_recientes = Pago.objects.select_related('factura', 'usuario').order_by('-fecha')[:10]
-    
-    # Facturas pendientes
-    facturas_pendientes_clientes = Factura.objects.filter(
-        tipo='venta', 
-        estado='pendiente'
-    ).select_related('cliente').order_by('-fecha')[:5]
-    
-    facturas_pendientes_proveedores = Factura.objects.filter(
-        tipo='compra', 
-        estado='pendiente'
-    ).select_related('proveedor').order_by('-fecha')[:5]
-    
-    # Caja activa
-    caja_activa = Caja.obtener_caja_activa()
+    caja_activa = Caja.obtener_caja_activa(usuario=request.user)
     
     context = {
         'total_pagos_clientes': total_pagos_clientes,
@@ -1322,12 +1212,13 @@ def pagos_proveedores_list(request):
 
 # Pagos
 @login_required
+@idempotente
 def pago_crear(request, factura_id):
     """Crear un nuevo pago"""
     factura = get_object_or_404(Factura, pk=factura_id)
     
     # Validar caja activa del día actual
-    caja_activa, necesita_cierre = Caja.validar_caja_activa_hoy()
+    caja_activa, necesita_cierre = Caja.validar_caja_activa_hoy(request.user)
     
     if necesita_cierre:
         messages.error(request, f'Hay una caja abierta del {caja_activa.fecha.strftime("%d/%m/%Y")} que debe ser cerrada antes de realizar pagos.')
@@ -1352,16 +1243,10 @@ def pago_crear(request, factura_id):
                 monto=pago.monto_total
             )
             
-            # Actualizar saldo del proveedor o cliente según el tipo de factura
-            if factura.tipo == 'compra' and factura.proveedor:
-                factura.proveedor.saldo -= pago.monto_total
-                factura.proveedor.save()
-            elif factura.tipo == 'venta' and factura.cliente:
-                factura.cliente.saldo -= pago.monto_total
-                factura.cliente.save()
+            # PagoFactura.save actualiza el saldo del proveedor/cliente y el estado de la factura
             
-            # Actualizar estado de la factura
-            factura.actualizar_estado()
+            # Registrado: el decorador idempotente recuerda esta redirección
+            request.idempotente_ok = True
             
             # Mensaje informativo sobre la caja
             if caja_activa:
@@ -1383,29 +1268,6 @@ def pago_crear(request, factura_id):
         'caja_activa': caja_activa
     })
 
-@login_required
-def pago_eliminar(request, pk):
-    """Eliminar un pago"""
-    pago = get_object_or_404(Pago, pk=pk)
-    factura_id = pago.factura.id
-    if request.method == 'POST':
-        # Restaurar saldo del proveedor o cliente antes de eliminar el pago
-        if pago.factura.tipo == 'compra' and pago.factura.proveedor:
-            pago.factura.proveedor.saldo += pago.monto
-            pago.factura.proveedor.save()
-        elif pago.factura.tipo == 'venta' and pago.factura.cliente:
-            pago.factura.cliente.saldo += pago.monto
-            pago.factura.cliente.save()
-        
-        pago.delete()
-        
-        # Actualizar estado de la factura después de eliminar el pago
-        pago.factura.actualizar_estado()
-        
-        messages.success(request, 'Pago eliminado correctamente.')
-        return redirect('factura_pagos', pk=factura_id)
-    return render(request, 'pago_confirm_delete.html', {'pago': pago})
-
 # API endpoints
 @login_required
 def get_producto_info(request):
@@ -1416,11 +1278,69 @@ def get_producto_info(request):
         return JsonResponse({
             'precio': float(producto.precio),
             'iva': float(producto.iva),
-            'stock': producto.stock
+            'stock': producto.stock,
+            'disponible': producto.disponible
         })
     except Producto.DoesNotExist:
         return JsonResponse({'error': 'Producto no encontrado'}, status=404)
 
+@login_required
+def reservar_stock(request):
+    """Sincronizar las reservas de stock de una venta en carga via AJAX"""
+    if request.method != 'POST':
+        return JsonResponse({'success': False, 'error': 'Método no permitido'}, status=405)
+    
+    clave = request.POST.get('clave', '').strip()
+    productos = request.POST.getlist('producto')
+    cantidades = request.POST.getlist('cantidad')
+    if not clave or len(clave) > 64 or len(productos) != len(cantidades):
+        return JsonResponse({'success': False, 'error': 'Datos de reserva inválidos'}, status=400)
+    
+    try:
+        resultado = ReservaStock.sincronizar(clave, dict(zip(productos, cantidades)), request.user)
+    except ValueError:
+        return JsonResponse({'success': False, 'error': 'Datos de reserva inválidos'}, status=400)
+    
+    return JsonResponse({'success': True, 'productos': resultado})
+
+@csrf_exempt
+def ingesta_facturas(request):
+    """
+    Recibir un lote de facturas de venta en JSON (terminales de reparto sin conexión).
+    Idempotente: las facturas cuya clave ya se registró vuelven como 'duplicada'.
+    """
+    import json
+    from django.conf import settings
+    from .ingesta import ingerir_lote
+    from .models import PermisoUsuario
+    
+    if not request.user.is_authenticated:
+        return JsonResponse({'success': False, 'error': 'Autenticación requerida'}, status=401)
+    if not (request.user.is_superuser or PermisoUsuario.tiene_permiso(request.user, 'facturas_venta', 'crear')):
+        return JsonResponse({'success': False, 'error': 'Sin permiso para crear facturas de venta'}, status=403)
+    if request.method != 'POST':
+        return JsonResponse({'success': False, 'error': 'Método no permitido'}, status=405)
+    # Solo JSON: un formulario de otro sitio no puede enviar este tipo de contenido
+    if request.content_type != 'application/json':
+        return JsonResponse({'success': False, 'error': 'Se espera application/json'}, status=415)
+    
+    try:
+        datos = json.loads(request.body)
+        facturas = datos['facturas']
+        if not isinstance(facturas, list) or not all(isinstance(factura, dict) for factura in facturas):
+            raise ValueError
+    except (ValueError, KeyError, TypeError):
+        return JsonResponse({'success': False, 'error': 'Lote inválido'}, status=400)
+    maximo = getattr(settings, 'INGESTA_LOTE_MAXIMO', 1000)
+    if len(facturas) > maximo:
+        return JsonResponse({'success': False, 'error': f'El lote supera el máximo de {maximo} facturas'}, status=413)
+    
+    resultados = ingerir_lote(facturas, request.user, str(datos.get('terminal') or '')[:50])
+    resumen = {estado: 0 for estado in ('creada', 'duplicada', 'rechazada')}
+    for resultado in resultados:
+        resumen[resultado['estado']] += 1
+    return JsonResponse({'success': True, 'resumen': resumen, 'facturas': resultados})
+
 @login_required
 def calcular_total_factura(request):
     """Calcular totales de factura via AJAX"""
@@ -1477,9 +1397,9 @@ def buscar_productos(request):
         filtro = Q(nombre__icontains=q) | Q(codigo__icontains=q)
         filtro &= Q(activo=True)
         
-        # Para facturas de venta, solo mostrar productos con stock
+        # Para facturas de venta, solo mostrar productos con stock sin reservar
         if tipo_factura == 'venta':
-            filtro &= Q(stock__gt=0)
+            filtro &= Q(disponible__gt=0)
         
         productos = Producto.objects.filter(filtro)[:10]
         
@@ -1503,6 +1423,7 @@ def buscar_productos(request):
                     'codigo': p.codigo, 
                     'precio': p.precio,  # Usar precio de venta para ventas
                     'stock': p.stock, 
+                    'disponible': p.disponible,
                     'iva': p.iva
                 })
         
@@ -1612,447 +1533,63 @@ def cliente_crear_ajax(request):
     return JsonResponse({'success': False, 'error': 'Método no permitido'})
 
 
-
-
 # ============================================================================
-# EXPORTACIÓN A EXCEL
+# SISTEMA DE ALERTAS
 # ============================================================================
 
-def exportar_facturas_excel(request):
-    """Exportar facturas a Excel"""
-    from openpyxl import Workbook
-    from openpyxl.styles import Font, PatternFill, Alignment
-    from openpyxl.utils import get_column_letter
-    from django.http import HttpResponse
-    from datetime import datetime
+def obtener_alertas_stock(request):
+    """Obtener alertas de stock bajo y productos agotados"""
+    productos_stock_bajo = Producto.objects.stock_bajo().order_by('stock')
+    productos_agotados = Producto.objects.agotados().order_by('nombre')
     
-    # Obtener parámetros de filtro
-    tipo = request.GET.get('tipo', '')
-    q = request.GET.get('q', '')
-    desde = request.GET.get('desde', '')
-    hasta = request.GET.get('hasta', '')
+    # Facturas pendientes con la fecha de vencimiento cumplida
+    facturas_vencidas = Factura.vencidas().order_by('fecha_vencimiento')
     
-    # Filtrar facturas
-    facturas = Factura.objects.all()
-    if tipo:
-        facturas = facturas.filter(tipo=tipo)
-    if q:
-        facturas = facturas.filter(
-            Q(numero__icontains=q) |
-            Q(proveedor__nombre__icontains=q) |
-            Q(cliente__nombre__icontains=q)
-        )
-    if desde:
-        facturas = facturas.filter(fecha__gte=desde)
-    if hasta:
-        facturas = facturas.filter(fecha__lte=hasta)
+    alertas = {
+        'stock_bajo': productos_stock_bajo,
+        'agotados': productos_agotados,
+        'facturas_vencidas': facturas_vencidas,
+        'total_alertas': productos_stock_bajo.count() + productos_agotados.count() + facturas_vencidas.count()
+    }
     
-    facturas = facturas.order_by('-fecha')
-    
-    # Crear workbook
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Facturas"
-    
-    # Estilos
-    header_font = Font(bold=True, color="FFFFFF")
-    header_fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
-    header_alignment = Alignment(horizontal="center", vertical="center")
-    
-    # Encabezados
-    headers = [
-        'ID', 'Fecha', 'Tipo', 'Número', 'Proveedor/Cliente', 
-        'Estado', 'Subtotal 5%', 'Subtotal 10%', 'IVA', 'Total'
-    ]
-    
-    for col, header in enumerate(headers, 1):
-        cell = ws.cell(row=1, column=col, value=header)
-        cell.font = header_font
-        cell.fill = header_fill
-        cell.alignment = header_alignment
-    
-    # Datos
-    for row, factura in enumerate(facturas, 2):
-        ws.cell(row=row, column=1, value=factura.id)
-        ws.cell(row=row, column=2, value=factura.fecha.strftime('%d/%m/%Y'))
-        ws.cell(row=row, column=3, value=factura.get_tipo_display())
-        ws.cell(row=row, column=4, value=factura.numero or f"#{factura.id}")
-        
-        if factura.tipo == 'compra':
-            ws.cell(row=row, column=5, value=str(factura.proveedor))
-        else:
-            ws.cell(row=row, column=5, value=str(factura.cliente))
-        
-        ws.cell(row=row, column=6, value=factura.get_estado_display())
-        ws.cell(row=row, column=7, value=factura.subtotal_5 or 0)
-        ws.cell(row=row, column=8, value=factura.subtotal_10 or 0)
-        ws.cell(row=row, column=9, value=factura.iva or 0)
-        ws.cell(row=row, column=10, value=factura.total or 0)
-    
-    # Ajustar ancho de columnas
-    for column in ws.columns:
-        max_length = 0
-        column_letter = get_column_letter(column[0].column)
-        for cell in column:
-            try:
-                if len(str(cell.value)) > max_length:
-                    max_length = len(str(cell.value))
-            except:
-                pass
-        adjusted_width = min(max_length + 2, 50)
-        ws.column_dimensions[column_letter].width = adjusted_width
-    
-    # Crear respuesta
-    response = HttpResponse(
-        content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-    )
-    response['Content-Disposition'] = f'attachment; filename="facturas_{datetime.now().strftime("%Y%m%d_%H%M%S")}.xlsx"'
+    return alertas
+
+def crear_notificacion(mensaje, tipo='warning', usuario=None):
+    """Crear una notificación en el sistema"""
+    from .models import Notificacion
     
-    wb.save(response)
-    return response
+    notificacion = Notificacion.objects.create(
+        mensaje=mensaje,
+        tipo=tipo,
+        usuario=usuario
+    )
+    return notificacion
 
-def exportar_productos_excel(request):
-    """Exportar productos a Excel"""
-    from openpyxl import Workbook
-    from openpyxl.styles import Font, PatternFill, Alignment
-    from openpyxl.utils import get_column_letter
-    from django.http import HttpResponse
-    from datetime import datetime
+def verificar_alertas_stock():
+    """Verificar y registrar alertas automáticas de stock y facturas vencidas sin duplicarlas"""
+    alertas = []
     
-    # Obtener parámetros de filtro
-    q = request.GET.get('q', '')
-    estado = request.GET.get('estado', '')
-    
-    # Filtrar productos
-    productos = Producto.objects.all()
-    if q:
-        productos = productos.filter(
-            Q(nombre__icontains=q) | Q(codigo__icontains=q)
-        )
-    if estado:
-        if estado == 'normal':
-            productos = productos.filter(stock__gt=F('stock_minimo'))
-        elif estado == 'minimo':
-            productos = productos.filter(stock=F('stock_minimo'))
-        elif estado == 'critico':
-            productos = productos.filter(stock__lt=F('stock_minimo'))
-    
-    productos = productos.order_by('nombre')
-    
-    # Crear workbook
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Productos"
-    
-    # Estilos
-    header_font = Font(bold=True, color="FFFFFF")
-    header_fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
-    header_alignment = Alignment(horizontal="center", vertical="center")
-    
-    # Encabezados
-    headers = [
-        'Código', 'Nombre', 'Stock', 'Stock Mínimo', 'Costo', 
-        'Precio', 'IVA (%)', 'Estado'
-    ]
-    
-    for col, header in enumerate(headers, 1):
-        cell = ws.cell(row=1, column=col, value=header)
-        cell.font = header_font
-        cell.fill = header_fill
-        cell.alignment = header_alignment
-    
-    # Datos
-    for row, producto in enumerate(productos, 2):
-        ws.cell(row=row, column=1, value=producto.codigo)
-        ws.cell(row=row, column=2, value=producto.nombre)
-        ws.cell(row=row, column=3, value=producto.stock)
-        ws.cell(row=row, column=4, value=producto.stock_minimo)
-        ws.cell(row=row, column=5, value=producto.costo or 0)
-        ws.cell(row=row, column=6, value=producto.precio or 0)
-        ws.cell(row=row, column=7, value=producto.iva)
-        
-        # Estado
-        if producto.stock <= producto.stock_minimo:
-            estado = "Stock Crítico" if producto.stock < producto.stock_minimo else "Stock Mínimo"
-        else:
-            estado = "Stock Normal"
-        ws.cell(row=row, column=8, value=estado)
-    
-    # Ajustar ancho de columnas
-    for column in ws.columns:
-        max_length = 0
-        column_letter = get_column_letter(column[0].column)
-        for cell in column:
-            try:
-                if len(str(cell.value)) > max_length:
-                    max_length = len(str(cell.value))
-            except:
-                pass
-        adjusted_width = min(max_length + 2, 50)
-        ws.column_dimensions[column_letter].width = adjusted_width
-    
-    # Crear respuesta
-    response = HttpResponse(
-        content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-    )
-    response['Content-Disposition'] = f'attachment; filename="productos_{datetime.now().strftime("%Y%m%d_%H%M%S")}.xlsx"'
-    
-    wb.save(response)
-    return response
-
-def exportar_proveedores_excel(request):
-    """Exportar proveedores a Excel"""
-    from openpyxl import Workbook
-    from openpyxl.styles import Font, PatternFill, Alignment
-    from openpyxl.utils import get_column_letter
-    from django.http import HttpResponse
-    from datetime import datetime
-    
-    # Obtener parámetros de filtro
-    q = request.GET.get('q', '')
-    estado = request.GET.get('estado', '')
-    
-    # Filtrar proveedores
-    proveedores = Proveedor.objects.all()
-    if q:
-        proveedores = proveedores.filter(
-            Q(nombre__icontains=q) | Q(ruc__icontains=q)
-        )
-    if estado:
-        if estado == 'activo':
-            proveedores = proveedores.filter(activo=True)
-        elif estado == 'inactivo':
-            proveedores = proveedores.filter(activo=False)
-    
-    proveedores = proveedores.order_by('nombre')
-    
-    # Crear workbook
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Proveedores"
-    
-    # Estilos
-    header_font = Font(bold=True, color="FFFFFF")
-    header_fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
-    header_alignment = Alignment(horizontal="center", vertical="center")
-    
-    # Encabezados
-    headers = [
-        'Nombre', 'RIF/RUC', 'Dirección', 'Teléfono', 'Email', 
-        'Estado', 'Saldo'
-    ]
-    
-    for col, header in enumerate(headers, 1):
-        cell = ws.cell(row=1, column=col, value=header)
-        cell.font = header_font
-        cell.fill = header_fill
-        cell.alignment = header_alignment
-    
-    # Datos
-    for row, proveedor in enumerate(proveedores, 2):
-        ws.cell(row=row, column=1, value=proveedor.nombre)
-        ws.cell(row=row, column=2, value=proveedor.ruc)
-        ws.cell(row=row, column=3, value=proveedor.direccion or '')
-        ws.cell(row=row, column=4, value=proveedor.telefono or '')
-        ws.cell(row=row, column=5, value=proveedor.email or '')
-        ws.cell(row=row, column=6, value="Activo" if proveedor.activo else "Inactivo")
-        ws.cell(row=row, column=7, value=proveedor.saldo or 0)
-    
-    # Ajustar ancho de columnas
-    for column in ws.columns:
-        max_length = 0
-        column_letter = get_column_letter(column[0].column)
-        for cell in column:
-            try:
-                if len(str(cell.value)) > max_length:
-                    max_length = len(str(cell.value))
-            except:
-                pass
-        adjusted_width = min(max_length + 2, 50)
-        ws.column_dimensions[column_letter].width = adjusted_width
-    
-    # Crear respuesta
-    response = HttpResponse(
-        content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-    )
-    response['Content-Disposition'] = f'attachment; filename="proveedores_{datetime.now().strftime("%Y%m%d_%H%M%S")}.xlsx"'
-    
-    wb.save(response)
-    return response
-
-def exportar_detalles_facturas_excel(request):
-    """Exportar detalles de facturas a Excel"""
-    from openpyxl import Workbook
-    from openpyxl.styles import Font, PatternFill, Alignment
-    from openpyxl.utils import get_column_letter
-    from django.http import HttpResponse
-    from datetime import datetime
-    
-    # Obtener parámetros de filtro
-    q = request.GET.get('q', '')
-    tipo = request.GET.get('tipo', '')
-    desde = request.GET.get('desde', '')
-    hasta = request.GET.get('hasta', '')
-    
-    # Filtrar detalles
-    detalles = DetalleFactura.objects.all()
-    if q:
-        detalles = detalles.filter(
-            Q(producto__nombre__icontains=q) | Q(producto__codigo__icontains=q)
-        )
-    if tipo:
-        detalles = detalles.filter(factura__tipo=tipo)
-    if desde:
-        detalles = detalles.filter(factura__fecha__gte=desde)
-    if hasta:
-        detalles = detalles.filter(factura__fecha__lte=hasta)
-    
-    detalles = detalles.order_by('-factura__fecha')
-    
-    # Crear workbook
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Detalles Facturas"
-    
-    # Estilos
-    header_font = Font(bold=True, color="FFFFFF")
-    header_fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
-    header_alignment = Alignment(horizontal="center", vertical="center")
-    
-    # Encabezados
-    headers = [
-        'Fecha Factura', 'Número Factura', 'Tipo', 'Producto', 'Código', 
-        'Cantidad', 'Precio Unitario', 'Subtotal', 'IVA', 'Total'
-    ]
-    
-    for col, header in enumerate(headers, 1):
-        cell = ws.cell(row=1, column=col, value=header)
-        cell.font = header_font
-        cell.fill = header_fill
-        cell.alignment = header_alignment
-    
-    # Datos
-    for row, detalle in enumerate(detalles, 2):
-        ws.cell(row=row, column=1, value=detalle.factura.fecha.strftime('%d/%m/%Y'))
-        ws.cell(row=row, column=2, value=detalle.factura.numero or f"#{detalle.factura.id}")
-        ws.cell(row=row, column=3, value=detalle.factura.get_tipo_display())
-        ws.cell(row=row, column=4, value=detalle.producto.nombre)
-        ws.cell(row=row, column=5, value=detalle.producto.codigo)
-        ws.cell(row=row, column=6, value=detalle.cantidad)
-        ws.cell(row=row, column=7, value=detalle.precio_unitario)
-        ws.cell(row=row, column=8, value=detalle.subtotal)
-        ws.cell(row=row, column=9, value=detalle.iva)
-        ws.cell(row=row, column=10, value=detalle.total)
-    
-    # Ajustar ancho de columnas
-    for column in ws.columns:
-        max_length = 0
-        column_letter = get_column_letter(column[0].column)
-        for cell in column:
-            try:
-                if len(str(cell.value)) > max_length:
-                    max_length = len(str(cell.value))
-            except:
-                pass
-        adjusted_width = min(max_length + 2, 50)
-        ws.column_dimensions[column_letter].width = adjusted_width
-    
-    # Crear respuesta
-    response = HttpResponse(
-        content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-    )
-    response['Content-Disposition'] = f'attachment; filename="detalles_facturas_{datetime.now().strftime("%Y%m%d_%H%M%S")}.xlsx"'
-    
-    wb.save(response)
-    return response
-
-# ============================================================================
-# SISTEMA DE ALERTAS
-# ============================================================================
-
-def obtener_alertas_stock(request):
-    """Obtener alertas de stock bajo y productos agotados"""
-    from django.db.models import F
-    
-    # Productos con stock bajo (stock <= stock_minimo)
-    productos_stock_bajo = Producto.objects.filter(
-        activo=True,
-        stock__lte=F('stock_minimo'),
-        stock__gt=0
-    ).order_by('stock')
-    
-    # Productos agotados (stock = 0)
-    productos_agotados = Producto.objects.filter(
-        activo=True,
-        stock=0
-    ).order_by('nombre')
-    
-    # Facturas pendientes de pago (más de 30 días)
-    from datetime import datetime, timedelta
-    fecha_limite = datetime.now() - timedelta(days=30)
-    facturas_vencidas = Factura.objects.filter(
-        estado='pendiente',
-        fecha__lt=fecha_limite
-    ).order_by('fecha')
-    
-    alertas = {
-        'stock_bajo': productos_stock_bajo,
-        'agotados': productos_agotados,
-        'facturas_vencidas': facturas_vencidas,
-        'total_alertas': productos_stock_bajo.count() + productos_agotados.count() + facturas_vencidas.count()
-    }
-    
-    return alertas
-
-def crear_notificacion(mensaje, tipo='warning', usuario=None):
-    """Crear una notificación en el sistema"""
-    from .models import Notificacion
-    
-    notificacion = Notificacion.objects.create(
-        mensaje=mensaje,
-        tipo=tipo,
-        usuario=usuario
-    )
-    return notificacion
-
-def verificar_alertas_stock():
-    """Verificar y crear alertas automáticas de stock"""
-    from django.db.models import F
-    from datetime import datetime
-    
-    # Verificar productos con stock bajo
-    productos_stock_bajo = Producto.objects.filter(
-        activo=True,
-        stock__lte=F('stock_minimo'),
-        stock__gt=0
-    )
+    # Productos con stock bajo
+    productos_stock_bajo = Producto.objects.stock_bajo().values_list('id', 'nombre', 'codigo', 'stock', 'stock_minimo')
     
-    for producto in productos_stock_bajo:
-        mensaje = f"Stock bajo: {producto.nombre} (Código: {producto.codigo}) - Stock actual: {producto.stock}, Mínimo: {producto.stock_minimo}"
-        crear_notificacion(mensaje, 'warning')
+    for producto_id, nombre, codigo, stock, stock_minimo in productos_stock_bajo:
+        mensaje = f"Stock bajo: {nombre} (Código: {codigo}) - Stock actual: {stock}, Mínimo: {stock_minimo}"
+        alertas.append((f'stock_bajo:{producto_id}', mensaje, 'warning'))
     
-    # Verificar productos agotados
-    productos_agotados = Producto.objects.filter(
-        activo=True,
-        stock=0
-    )
+    # Productos agotados
+    productos_agotados = Producto.objects.agotados().values_list('id', 'nombre', 'codigo')
     
-    for producto in productos_agotados:
-        mensaje = f"Producto agotado: {producto.nombre} (Código: {producto.codigo}) - Stock: 0"
-        crear_notificacion(mensaje, 'error')
+    for producto_id, nombre, codigo in productos_agotados:
+        mensaje = f"Producto agotado: {nombre} (Código: {codigo}) - Stock: 0"
+        alertas.append((f'agotado:{producto_id}', mensaje, 'error'))
     
-    # Verificar facturas vencidas
-    from datetime import timedelta
-    fecha_limite = datetime.now() - timedelta(days=30)
-    facturas_vencidas = Factura.objects.filter(
-        estado='pendiente',
-        fecha__lt=fecha_limite
-    )
+    # Facturas vencidas
+    for factura in Factura.vencidas().only('id', 'tipo', 'fecha_vencimiento', 'monto_pendiente', 'estado'):
+        mensaje = f"Factura vencida: #{factura.id} - {factura.get_tipo_display()} - Vencida hace {factura.dias_vencida} días - Pendiente: Gs. {factura.monto_pendiente:,}"
+        alertas.append((f'factura_vencida:{factura.id}', mensaje, 'error'))
     
-    for factura in facturas_vencidas:
-        dias_vencida = (datetime.now() - factura.fecha.replace(tzinfo=None)).days
-        mensaje = f"Factura vencida: #{factura.id} - {factura.get_tipo_display()} - Vencida hace {dias_vencida} días - Total: Gs. {factura.total:,}"
-        crear_notificacion(mensaje, 'error')
+    # Un solo INSERT ... ON CONFLICT DO NOTHING; las alertas que desaparecieron se resuelven
+    return Notificacion.notificar_lote(alertas, prefijos=['stock_bajo', 'agotado', 'factura_vencida'])
 
 @login_required
 def notificaciones_list(request):
@@ -2083,13 +1620,19 @@ def marcar_notificacion_leida(request, pk):
 
 @login_required
 def obtener_notificaciones_ajax(request):
-    """Obtener notificaciones no leídas para AJAX"""
+    """Obtener notificaciones no leídas del usuario (y globales) para AJAX"""
+    from django.db.models import Window
+    
+    # El total viaja en cada fila con una función de ventana: una sola consulta
     notificaciones = Notificacion.objects.filter(
+        models.Q(usuario=request.user) | models.Q(usuario__isnull=True),
         leida=False
-    ).order_by('-fecha')[:5]
+    ).annotate(total=Window(Count('id'))).order_by('-fecha')[:5]
     
     data = []
+    total = 0
     for notif in notificaciones:
+        total = notif.total
         data.append({
             'id': notif.id,
             'mensaje': notif.mensaje,
@@ -2097,30 +1640,18 @@ def obtener_notificaciones_ajax(request):
             'fecha': notif.fecha.strftime('%d/%m/%Y %H:%M')
         })
     
-    return JsonResponse({'notificaciones': data, 'count': notificaciones.count()})
+    return JsonResponse({'notificaciones': data, 'count': total})
 
 # ============================================================================
 # SISTEMA DE EMAIL
 # ============================================================================
 
-from django.core.mail import send_mail, EmailMultiAlternatives
 from django.template.loader import render_to_string
-from django.utils.html import strip_tags
 from django.conf import settings
 from datetime import datetime, timedelta
 
 def enviar_email_alertas(alertas, destinatarios=None):
-    """Enviar email con alertas del sistema"""
-    if not getattr(settings, 'EMAIL_NOTIFICATIONS_ENABLED', False):
-        return False
-    
-    if not destinatarios:
-        destinatarios = [settings.EMAIL_ADMIN_ADDRESS]
-    
-    # Calcular días vencidos para facturas
-    for factura in alertas.get('facturas_vencidas', []):
-        factura.dias_vencida = (datetime.now() - factura.fecha.replace(tzinfo=None)).days
-    
+    """Encolar email con alertas del sistema; lo envía el comando procesar_correos"""
     # Renderizar template HTML
     html_content = render_to_string('emails/alertas_diarias.html', {
         'alertas': alertas,
@@ -2128,81 +1659,30 @@ def enviar_email_alertas(alertas, destinatarios=None):
         'fecha': datetime.now().strftime('%d/%m/%Y %H:%M'),
     })
     
-    # Crear versión texto plano
-    text_content = strip_tags(html_content)
-    
-    # Configurar email
     subject = f"🚨 Alertas del Sistema Avícola CVA - {datetime.now().strftime('%d/%m/%Y')}"
-    from_email = settings.EMAIL_FROM_ADDRESS
-    
-    # Enviar email
-    try:
-        msg = EmailMultiAlternatives(subject, text_content, from_email, destinatarios)
-        msg.attach_alternative(html_content, "text/html")
-        msg.send()
-        return True
-    except Exception as e:
-        print(f"Error enviando email: {e}")
-        return False
+    return CorreoSaliente.encolar(subject, html_content, destinatarios) is not None
 
 def enviar_email_stock_bajo(producto):
-    """Enviar email específico para stock bajo"""
-    if not getattr(settings, 'EMAIL_NOTIFICATIONS_ENABLED', False):
-        return False
-    
+    """Encolar email de stock bajo; se agrupa en el resumen periódico"""
     subject = f"⚠️ Stock Bajo: {producto.nombre}"
     html_content = render_to_string('emails/stock_bajo.html', {
         'producto': producto,
         'fecha': datetime.now().strftime('%d/%m/%Y %H:%M'),
     })
-    text_content = strip_tags(html_content)
-    
-    try:
-        msg = EmailMultiAlternatives(
-            subject, 
-            text_content, 
-            settings.EMAIL_FROM_ADDRESS, 
-            [settings.EMAIL_ADMIN_ADDRESS]
-        )
-        msg.attach_alternative(html_content, "text/html")
-        msg.send()
-        return True
-    except Exception as e:
-        print(f"Error enviando email de stock bajo: {e}")
-        return False
+    return CorreoSaliente.encolar(subject, html_content, categoria='stock_bajo', agrupable=True) is not None
 
 def enviar_email_producto_agotado(producto):
-    """Enviar email específico para producto agotado"""
-    if not getattr(settings, 'EMAIL_NOTIFICATIONS_ENABLED', False):
-        return False
-    
+    """Encolar email de producto agotado; se agrupa en el resumen periódico"""
     subject = f"❌ Producto Agotado: {producto.nombre}"
     html_content = render_to_string('emails/producto_agotado.html', {
         'producto': producto,
         'fecha': datetime.now().strftime('%d/%m/%Y %H:%M'),
     })
-    text_content = strip_tags(html_content)
-    
-    try:
-        msg = EmailMultiAlternatives(
-            subject, 
-            text_content, 
-            settings.EMAIL_FROM_ADDRESS, 
-            [settings.EMAIL_ADMIN_ADDRESS]
-        )
-        msg.attach_alternative(html_content, "text/html")
-        msg.send()
-        return True
-    except Exception as e:
-        print(f"Error enviando email de producto agotado: {e}")
-        return False
+    return CorreoSaliente.encolar(subject, html_content, categoria='agotado', agrupable=True) is not None
 
 def enviar_email_factura_vencida(factura):
-    """Enviar email específico para factura vencida"""
-    if not getattr(settings, 'EMAIL_NOTIFICATIONS_ENABLED', False):
-        return False
-    
-    dias_vencida = (datetime.now() - factura.fecha.replace(tzinfo=None)).days
+    """Encolar email de factura vencida; se agrupa en el resumen periódico"""
+    dias_vencida = factura.dias_vencida
     subject = f"💰 Factura Vencida #{factura.numero} - {dias_vencida} días"
     
     html_content = render_to_string('emails/factura_vencida.html', {
@@ -2210,31 +1690,17 @@ def enviar_email_factura_vencida(factura):
         'dias_vencida': dias_vencida,
         'fecha': datetime.now().strftime('%d/%m/%Y %H:%M'),
     })
-    text_content = strip_tags(html_content)
-    
-    try:
-        msg = EmailMultiAlternatives(
-            subject, 
-            text_content, 
-            settings.EMAIL_FROM_ADDRESS, 
-            [settings.EMAIL_ADMIN_ADDRESS]
-        )
-        msg.attach_alternative(html_content, "text/html")
-        msg.send()
-        return True
-    except Exception as e:
-        print(f"Error enviando email de factura vencida: {e}")
-        return False
+    return CorreoSaliente.encolar(subject, html_content, categoria='factura_vencida', agrupable=True) is not None
 
 @login_required
 def enviar_alertas_email(request):
-    """Vista para enviar alertas por email manualmente"""
+    """Vista para encolar el email de alertas manualmente"""
     alertas = obtener_alertas_stock(request)
     
     if enviar_email_alertas(alertas):
-        messages.success(request, 'Email de alertas enviado correctamente.')
+        messages.success(request, 'Email de alertas encolado; se enviará en el próximo ciclo de envío.')
     else:
-        messages.error(request, 'Error al enviar el email de alertas.')
+        messages.error(request, 'Las notificaciones por email están deshabilitadas.')
     
     return redirect('dashboard')
 
@@ -2476,6 +1942,8 @@ def backup_supabase_view(request):
 # ============================================================================
 
 @login_required
+@usar_replica
+@presupuesto_consultas(20)
 def reportes_dashboard(request):
     """Dashboard principal de reportes"""
     
@@ -2519,6 +1987,7 @@ def reportes_dashboard(request):
     return render(request, 'reportes_dashboard.html', context)
 
 @login_required
+@presupuesto_consultas(15)
 def reporte_ventas_detallado(request):
     """Reporte detallado de ventas"""
     # Obtener parámetros de filtro
@@ -2535,7 +2004,7 @@ def reporte_ventas_detallado(request):
         query = query.filter(fecha__lte=fecha_fin)
     
     # Obtener datos
-    facturas = query.order_by('-fecha')
+    facturas = query.select_related('cliente', 'proveedor').order_by('-fecha')
     total_facturas = facturas.count()
     total_ventas = facturas.aggregate(total=Sum('total'))['total'] or 0
     
@@ -2564,12 +2033,10 @@ def reporte_productos_analisis(request):
     ).order_by('-cantidad_vendida')[:20]
     
     # Productos con stock bajo
-    productos_stock_bajo = Producto.objects.filter(
-        stock__lte=F('stock_minimo')
-    ).values('nombre', 'stock', 'stock_minimo', 'precio')
+    productos_stock_bajo = Producto.objects.stock_bajo().values('nombre', 'stock', 'stock_minimo', 'precio')
     
     # Productos agotados
-    productos_agotados = Producto.objects.filter(stock=0).values('nombre', 'precio')
+    productos_agotados = Producto.objects.agotados().values('nombre', 'precio')
     
     context = {
         'productos_mas_vendidos': productos_mas_vendidos,
@@ -2602,10 +2069,7 @@ def reporte_clientes_proveedores(request):
     ).order_by('-total_ventas')
     
     # Facturas vencidas
-    facturas_vencidas = Factura.objects.filter(
-        estado='pendiente',
-        fecha__lt=datetime.now() - timedelta(days=30)
-    ).select_related('cliente', 'proveedor')
+    facturas_vencidas = Factura.vencidas().select_related('cliente', 'proveedor').order_by('fecha_vencimiento')
     
     context = {
         'clientes_analisis': clientes_analisis,
@@ -2617,10 +2081,11 @@ def reporte_clientes_proveedores(request):
     return render(request, 'reporte_clientes_proveedores.html', context)
 
 @login_required
+@idempotente
 def pago_multiple_crear(request):
     """Crear un pago que puede asignarse a múltiples facturas"""
     # Validar caja activa del día actual
-    caja_activa, necesita_cierre = Caja.validar_caja_activa_hoy()
+    caja_activa, necesita_cierre = Caja.validar_caja_activa_hoy(request.user)
     
     if necesita_cierre:
         messages.error(request, f'Hay una caja abierta del {caja_activa.fecha.strftime("%d/%m/%Y")} que debe ser cerrada antes de realizar pagos.')
@@ -2650,6 +2115,8 @@ def pago_multiple_crear(request):
             pago = form.save(commit=False)
             pago.usuario = request.user
             pago.save()
+            # Registrado: el decorador idempotente recuerda esta redirección
+            request.idempotente_ok = True
             
             # Asignación automática desde la factura más antigua
             monto_disponible = pago.monto_total
@@ -2840,21 +2307,12 @@ def pago_eliminar(request, pk):
     pago = get_object_or_404(Pago, pk=pk)
     
     if request.method == 'POST':
-        # Restaurar saldos de todas las facturas afectadas
-        for pago_factura in pago.pagos_facturas.all():
-            factura = pago_factura.factura
-            if factura.tipo == 'compra' and factura.proveedor:
-                factura.proveedor.saldo += pago_factura.monto
-                factura.proveedor.save()
-            elif factura.tipo == 'venta' and factura.cliente:
-                factura.cliente.saldo += pago_factura.monto
-                factura.cliente.save()
+        # Eliminar las asignaciones una a una para restaurar saldos y estados de las facturas
+        with transaction.atomic():
+            for pago_factura in pago.pagos_facturas.select_related('factura', 'factura__cliente', 'factura__proveedor'):
+                pago_factura.delete()
             
-            # Actualizar estado de la factura
-            factura.actualizar_estado()
-        
-        # Eliminar el pago (esto también eliminará las asignaciones por CASCADE)
-        pago.delete()
+            pago.delete()
         
         messages.success(request, 'Pago eliminado correctamente.')
         return redirect('factura_list')
@@ -2873,16 +2331,7 @@ def asignacion_eliminar(request, pk):
         return redirect('pago_ver', pago_id=pago.pk)
     
     if request.method == 'POST':
-        # Restaurar saldo del proveedor
-        factura = asignacion.factura
-        if factura.proveedor:
-            factura.proveedor.saldo += asignacion.monto
-            factura.proveedor.save()
-        
-        # Actualizar estado de la factura
-        factura.actualizar_estado()
-        
-        # Eliminar la asignación
+        # Eliminar la asignación (restaura el saldo del proveedor y el estado de la factura)
         asignacion.delete()
         
         messages.success(request, 'Asignación eliminada correctamente.')
@@ -2909,18 +2358,14 @@ def pagos_proveedores_dashboard(request):
     
     proveedores_pendientes = Proveedor.objects.filter(activo=True, saldo__gt=0).count()
     
-    facturas_vencidas = Factura.objects.filter(
-        tipo='compra',
-        estado='pendiente',
-        fecha_vencimiento__lt=hoy
-    ).count()
+    facturas_vencidas = Factura.vencidas(tipo='compra', fecha_corte=hoy).count()
     
     # Proveedores con saldo pendiente
     proveedores_con_saldo = Proveedor.objects.filter(
         activo=True, 
         saldo__gt=0
     ).annotate(
-        facturas_pendientes_count=Count('facturas', filter=Q(facturas__estado='pendiente'))
+        facturas_pendientes_count=Count('factura', filter=Q(factura__estado='pendiente'))
     ).order_by('-saldo')[:10]
     
     # Facturas recientes
@@ -2946,10 +2391,11 @@ def pagos_proveedores_dashboard(request):
     return render(request, 'pagos_proveedores_dashboard.html', context)
 
 @login_required
+@idempotente
 def pago_proveedor_crear(request):
     """Crear pago específico para proveedores"""
     # Validar caja activa del día actual
-    caja_activa, necesita_cierre = Caja.validar_caja_activa_hoy()
+    caja_activa, necesita_cierre = Caja.validar_caja_activa_hoy(request.user)
     
     if necesita_cierre:
         messages.error(request, f'Hay una caja abierta del {caja_activa.fecha.strftime("%d/%m/%Y")} que debe ser cerrada antes de realizar pagos.')
@@ -3003,6 +2449,8 @@ def pago_proveedor_crear(request):
                 return redirect('pagos_proveedores_dashboard')
             
             pago.save()
+            # Registrado: el decorador idempotente recuerda esta redirección
+            request.idempotente_ok = True
             
             # Asignación automática desde la factura más antigua
             monto_disponible = pago.monto_total
@@ -3042,10 +2490,6 @@ def pago_proveedor_crear(request):
                     
                     monto_disponible -= monto_a_asignar
             
-            # Actualizar saldo del proveedor
-            proveedor.saldo = max(0, proveedor.saldo - pago.monto_total)
-            proveedor.save()
-            
             messages.success(
                 request, 
                 f'Pago creado exitosamente. Se asignaron {len(facturas_asignadas)} facturas automáticamente.'
@@ -3151,12 +2595,12 @@ def pago_proveedor_eliminar(request, pago_id):
     pago = get_object_or_404(Pago, pk=pago_id, proveedor__isnull=False)
     
     if request.method == 'POST':
-        # Restaurar saldo del proveedor
-        pago.proveedor.saldo += pago.monto_total
-        pago.proveedor.save()
-        
-        # Eliminar el pago (las asignaciones se eliminan en cascada)
-        pago.delete()
+        # Eliminar las asignaciones una a una para restaurar el saldo del proveedor
+        with transaction.atomic():
+            for asignacion in pago.pagos_facturas.select_related('factura', 'factura__proveedor'):
+                asignacion.delete()
+            
+            pago.delete()
         
         messages.success(request, 'Pago eliminado correctamente.')
         next_url = request.GET.get('next')
@@ -3176,11 +2620,7 @@ def asignacion_proveedor_eliminar(request, asignacion_id):
     asignacion = get_object_or_404(PagoFactura, pk=asignacion_id)
     
     if request.method == 'POST':
-        # Restaurar saldo del proveedor
-        asignacion.pago.proveedor.saldo += asignacion.monto
-        asignacion.pago.proveedor.save()
-        
-        # Eliminar la asignación
+        # Eliminar la asignación (restaura el saldo del proveedor)
         asignacion.delete()
         
         messages.success(request, 'Asignación eliminada correctamente.')
@@ -3254,48 +2694,8 @@ def pagos_proveedores_reportes(request):
 
 @login_required
 def pagos_proveedores_vencidas(request):
-    """Lista de facturas vencidas de proveedores"""
-    from datetime import datetime
-    
-    hoy = datetime.now().date()
-    
-    # Facturas vencidas
-    facturas_vencidas = Factura.objects.filter(
-        tipo='compra',
-        estado='pendiente',
-        fecha_vencimiento__lt=hoy
-    ).select_related('proveedor').order_by('fecha_vencimiento')
-    
-    # Agrupar por proveedor
-    proveedores_vencidas = {}
-    for factura in facturas_vencidas:
-        if factura.proveedor not in proveedores_vencidas:
-            proveedores_vencidas[factura.proveedor] = {
-                'facturas': [],
-                'total_vencido': 0,
-                'dias_vencido_promedio': 0
-            }
-        
-        dias_vencido = (hoy - factura.fecha_vencimiento).days
-        proveedores_vencidas[factura.proveedor]['facturas'].append({
-            'factura': factura,
-            'dias_vencido': dias_vencido
-        })
-        proveedores_vencidas[factura.proveedor]['total_vencido'] += factura.saldo_pendiente
-    
-    # Calcular días vencido promedio por proveedor
-    for proveedor_data in proveedores_vencidas.values():
-        dias_totales = sum(f['dias_vencido'] for f in proveedor_data['facturas'])
-        proveedor_data['dias_vencido_promedio'] = dias_totales / len(proveedor_data['facturas'])
-    
-    context = {
-        'facturas_vencidas': facturas_vencidas,
-        'proveedores_vencidas': proveedores_vencidas,
-        'total_facturas_vencidas': facturas_vencidas.count(),
-        'total_monto_vencido': sum(f.saldo_pendiente for f in facturas_vencidas),
-    }
-    
-    return render(request, 'pagos_proveedores_vencidas.html', context)
+    """Facturas vencidas de proveedores: reporte de antigüedad de cuentas por pagar"""
+    return redirect(f'{reverse("reporte_antiguedad_saldos")}?tipo=compra')
 
 @login_required
 def reporte_pagos_proveedores(request):
@@ -3843,3224 +3243,3 @@ def reporte_caja(request):
     }
     
     return render(request, 'reporte_caja.html', context)
-
-
-
-
-# ============================================================================
-
-@login_required
-def caja_list(request):
-    """Lista de cajas"""
-    cajas = Caja.objects.select_related('usuario_apertura', 'usuario_cierre').order_by('-fecha')
-    
-    # Estadísticas generales
-    total_cajas = cajas.count()
-    cajas_abiertas = cajas.filter(cerrada=False).count()
-    cajas_cerradas = cajas.filter(cerrada=True).count()
-    
-    # Caja actual (hoy)
-    from datetime import date
-    caja_actual = cajas.filter(fecha=date.today()).first()
-    
-    context = {
-        'cajas': cajas,
-        'total_cajas': total_cajas,
-        'cajas_abiertas': cajas_abiertas,
-        'cajas_cerradas': cajas_cerradas,
-        'caja_actual': caja_actual,
-    }
-    
-    return render(request, 'caja_list.html', context)
-
-
-@login_required
-def caja_abrir(request):
-    """Abrir caja del día con denominaciones"""
-    from datetime import date
-    
-    # Verificar si ya existe una caja para hoy
-    caja_existente = Caja.objects.filter(fecha=date.today()).first()
-    if caja_existente:
-        messages.warning(request, 'Ya existe una caja abierta para hoy.')
-        return redirect('caja_ver', caja_id=caja_existente.id)
-    
-    if request.method == 'POST':
-        try:
-            # Crear la caja
-            caja = Caja.objects.create(
-                fecha=date.today(),
-                saldo_inicial=0,  # Se calculará automáticamente
-                usuario_apertura=request.user
-            )
-            
-            # Procesar denominaciones
-            denominaciones_creadas = []
-            total_calculado = 0
-            
-            for valor in Denominacion.VALOR_CHOICES:
-                cantidad = request.POST.get(f'denominacion_{valor[0]}', 0)
-                try:
-                    cantidad = int(cantidad)
-                    if cantidad > 0:
-                        denominacion = Denominacion.objects.create(
-                            caja=caja,
-                            valor=valor[0],
-                            cantidad=cantidad
-                        )
-                        denominaciones_creadas.append(denominacion)
-                        total_calculado += valor[0] * cantidad
-                except ValueError:
-                    continue
-            
-            # Calcular saldo inicial basado en denominaciones
-            caja.calcular_saldo_inicial_denominaciones()
-            caja.save()
-            
-            messages.success(request, f'Caja abierta con saldo inicial de Gs. {caja.saldo_inicial:,}')
-            return redirect('caja_ver', caja_id=caja.id)
-            
-        except Exception as e:
-            messages.error(request, f'Error al abrir la caja: {str(e)}')
-    
-    # Preparar denominaciones para el formulario
-    denominaciones = []
-    for valor, label in Denominacion.VALOR_CHOICES:
-        denominaciones.append({
-            'valor': valor,
-            'label': label,
-            'cantidad': 0
-        })
-    
-    context = {
-        'fecha_actual': date.today(),
-        'denominaciones': denominaciones,
-    }
-    return render(request, 'caja_abrir.html', context)
-
-
-@login_required
-def caja_ver(request, caja_id):
-    """Ver detalles de una caja"""
-    caja = get_object_or_404(Caja, id=caja_id)
-    
-    # Obtener movimientos
-    movimientos = caja.movimientos.select_related('usuario').order_by('-fecha')
-    
-    # Obtener gastos
-    gastos = caja.gastos.select_related('usuario').order_by('-fecha')
-    
-    # Obtener denominaciones
-    denominaciones = caja.denominaciones.all().order_by('-valor')
-    
-    # Calcular totales
-    total_ingresos = movimientos.filter(tipo='ingreso').aggregate(total=Sum('monto'))['total'] or 0
-    total_egresos = movimientos.filter(tipo='egreso').aggregate(total=Sum('monto'))['total'] or 0
-    total_gastos = gastos.aggregate(total=Sum('monto'))['total'] or 0
-    
-    # Agrupar movimientos por categoría
-    movimientos_por_categoria = movimientos.values('categoria').annotate(
-        total=Sum('monto'),
-        cantidad=Count('id')
-    ).order_by('-total')
-    
-    context = {
-        'caja': caja,
-        'movimientos': movimientos,
-        'gastos': gastos,
-        'denominaciones': denominaciones,
-        'total_ingresos': total_ingresos,
-        'total_egresos': total_egresos,
-        'total_gastos': total_gastos,
-        'movimientos_por_categoria': movimientos_por_categoria,
-    }
-    
-    return render(request, 'caja_ver.html', context)
-
-
-@login_required
-def caja_cerrar(request, caja_id):
-    """Cerrar caja con arqueo"""
-    caja = get_object_or_404(Caja, id=caja_id)
-    
-    if caja.cerrada:
-        messages.warning(request, 'Esta caja ya está cerrada.')
-        return redirect('caja_ver', caja_id=caja.id)
-    
-    if request.method == 'POST':
-        saldo_real = request.POST.get('saldo_real', 0)
-        observaciones = request.POST.get('observaciones', '')
-        
-        try:
-            saldo_real = int(saldo_real)
-            caja.cerrar_caja(saldo_real, request.user, observaciones)
-            messages.success(request, 'Caja cerrada exitosamente.')
-            return redirect('caja_ver', caja_id=caja.id)
-        except ValueError:
-            messages.error(request, 'El saldo real debe ser un número válido.')
-    
-    # Calcular saldo final esperado
-    caja.calcular_saldo_final()
-    
-    context = {
-        'caja': caja,
-    }
-    
-    return render(request, 'caja_cerrar.html', context)
-
-
-@login_required
-def gasto_crear(request, caja_id):
-    """Crear un nuevo gasto"""
-    caja = get_object_or_404(Caja, id=caja_id)
-    
-    if caja.cerrada:
-        messages.error(request, 'No se pueden agregar gastos a una caja cerrada.')
-        return redirect('caja_ver', caja_id=caja.id)
-    
-    if request.method == 'POST':
-        categoria = request.POST.get('categoria')
-        descripcion = request.POST.get('descripcion')
-        monto = request.POST.get('monto')
-        comprobante = request.POST.get('comprobante', '')
-        observacion = request.POST.get('observacion', '')
-        
-        try:
-            monto = int(monto)
-            if monto <= 0:
-                raise ValueError("El monto debe ser mayor a 0")
-            
-            gasto = Gasto.objects.create(
-                caja=caja,
-                categoria=categoria,
-                descripcion=descripcion,
-                monto=monto,
-                comprobante=comprobante,
-                observacion=observacion,
-                usuario=request.user
-            )
-            
-            messages.success(request, f'Gasto registrado: {descripcion} - Gs. {monto:,}')
-            return redirect('caja_ver', caja_id=caja.id)
-            
-        except ValueError as e:
-            messages.error(request, f'Error: {str(e)}')
-    
-    context = {
-        'caja': caja,
-        'categorias': Gasto.CATEGORIA_CHOICES,
-    }
-    
-    return render(request, 'gasto_crear.html', context)
-
-
-@login_required
-def gasto_editar(request, gasto_id):
-    """Editar un gasto"""
-    gasto = get_object_or_404(Gasto, id=gasto_id)
-    
-    if gasto.caja.cerrada:
-        messages.error(request, 'No se pueden editar gastos de una caja cerrada.')
-        return redirect('caja_ver', caja_id=gasto.caja.id)
-    
-    if request.method == 'POST':
-        categoria = request.POST.get('categoria')
-        descripcion = request.POST.get('descripcion')
-        monto = request.POST.get('monto')
-        comprobante = request.POST.get('comprobante', '')
-        observacion = request.POST.get('observacion', '')
-        
-        try:
-            monto = int(monto)
-            if monto <= 0:
-                raise ValueError("El monto debe ser mayor a 0")
-            
-            gasto.categoria = categoria
-            gasto.descripcion = descripcion
-            gasto.monto = monto
-            gasto.comprobante = comprobante
-            gasto.observacion = observacion
-            gasto.save()
-            
-            messages.success(request, 'Gasto actualizado exitosamente.')
-            return redirect('caja_ver', caja_id=gasto.caja.id)
-            
-        except ValueError as e:
-            messages.error(request, f'Error: {str(e)}')
-    
-    context = {
-        'gasto': gasto,
-        'categorias': Gasto.CATEGORIA_CHOICES,
-    }
-    
-    return render(request, 'gasto_editar.html', context)
-
-
-@login_required
-def gasto_eliminar(request, gasto_id):
-    """Eliminar un gasto"""
-    gasto = get_object_or_404(Gasto, id=gasto_id)
-    
-    if gasto.caja.cerrada:
-        messages.error(request, 'No se pueden eliminar gastos de una caja cerrada.')
-        return redirect('caja_ver', caja_id=gasto.caja.id)
-    
-    if request.method == 'POST':
-        caja_id = gasto.caja.id
-        gasto.delete()
-        messages.success(request, 'Gasto eliminado exitosamente.')
-        return redirect('caja_ver', caja_id=caja_id)
-    
-    context = {
-        'gasto': gasto,
-    }
-    
-    return render(request, 'gasto_eliminar.html', context)
-
-
-@login_required
-def movimiento_crear(request, caja_id):
-    """Crear un movimiento manual de caja"""
-    caja = get_object_or_404(Caja, id=caja_id)
-    
-    if caja.cerrada:
-        messages.error(request, 'No se pueden agregar movimientos a una caja cerrada.')
-        return redirect('caja_ver', caja_id=caja.id)
-    
-    if request.method == 'POST':
-        tipo = request.POST.get('tipo')
-        categoria = request.POST.get('categoria')
-        monto = request.POST.get('monto')
-        descripcion = request.POST.get('descripcion')
-        referencia = request.POST.get('referencia', '')
-        observacion = request.POST.get('observacion', '')
-        
-        try:
-            monto = int(monto)
-            if monto <= 0:
-                raise ValueError("El monto debe ser mayor a 0")
-            
-            movimiento = MovimientoCaja.registrar_movimiento(
-                caja=caja,
-                tipo=tipo,
-                categoria=categoria,
-                monto=monto,
-                descripcion=descripcion,
-                usuario=request.user,
-                referencia=referencia,
-                observacion=observacion
-            )
-            
-            messages.success(request, f'Movimiento registrado: {descripcion} - Gs. {monto:,}')
-            return redirect('caja_ver', caja_id=caja.id)
-            
-        except ValueError as e:
-            messages.error(request, f'Error: {str(e)}')
-    
-    context = {
-        'caja': caja,
-        'tipos': MovimientoCaja.TIPO_CHOICES,
-        'categorias': MovimientoCaja.CATEGORIA_CHOICES,
-    }
-    
-    return render(request, 'movimiento_crear.html', context)
-
-
-@login_required
-def reporte_caja(request):
-    """Reporte de caja por período"""
-    from datetime import datetime, timedelta
-    
-    # Parámetros de filtro
-    fecha_inicio = request.GET.get('fecha_inicio', (datetime.now() - timedelta(days=30)).strftime('%Y-%m-%d'))
-    fecha_fin = request.GET.get('fecha_fin', datetime.now().strftime('%Y-%m-%d'))
-    
-    try:
-        fecha_inicio_dt = datetime.strptime(fecha_inicio, '%Y-%m-%d').date()
-        fecha_fin_dt = datetime.strptime(fecha_fin, '%Y-%m-%d').date()
-    except ValueError:
-        fecha_inicio_dt = (datetime.now() - timedelta(days=30)).date()
-        fecha_fin_dt = datetime.now().date()
-    
-    # Obtener cajas del período
-    cajas = Caja.objects.filter(
-        fecha__gte=fecha_inicio_dt,
-        fecha__lte=fecha_fin_dt
-    ).select_related('usuario_apertura', 'usuario_cierre').order_by('-fecha')
-    
-    # Estadísticas generales
-    total_cajas = cajas.count()
-    cajas_abiertas = cajas.filter(cerrada=False).count()
-    cajas_cerradas = cajas.filter(cerrada=True).count()
-    
-    # Totales financieros
-    total_saldo_inicial = cajas.aggregate(total=Sum('saldo_inicial'))['total'] or 0
-    total_saldo_final = cajas.aggregate(total=Sum('saldo_final'))['total'] or 0
-    total_saldo_real = cajas.aggregate(total=Sum('saldo_real'))['total'] or 0
-    total_diferencia = cajas.aggregate(total=Sum('diferencia'))['total'] or 0
-    
-    # Obtener todos los movimientos del período
-    movimientos = MovimientoCaja.objects.filter(
-        caja__fecha__gte=fecha_inicio_dt,
-        caja__fecha__lte=fecha_fin_dt
-    ).select_related('caja', 'usuario')
-    
-    # Estadísticas por categoría
-    stats_por_categoria = movimientos.values('categoria').annotate(
-        total=Sum('monto'),
-        cantidad=Count('id')
-    ).order_by('-total')
-    
-    # Estadísticas por tipo
-    stats_por_tipo = movimientos.values('tipo').annotate(
-        total=Sum('monto'),
-        cantidad=Count('id')
-    ).order_by('-total')
-    
-    # Top gastos
-    top_gastos = Gasto.objects.filter(
-        caja__fecha__gte=fecha_inicio_dt,
-        caja__fecha__lte=fecha_fin_dt
-    ).select_related('caja', 'usuario').order_by('-monto')[:10]
-    
-    context = {
-        'cajas': cajas,
-        'fecha_inicio': fecha_inicio,
-        'fecha_fin': fecha_fin,
-        
-        # Estadísticas
-        'total_cajas': total_cajas,
-        'cajas_abiertas': cajas_abiertas,
-        'cajas_cerradas': cajas_cerradas,
-        'total_saldo_inicial': total_saldo_inicial,
-        'total_saldo_final': total_saldo_final,
-        'total_saldo_real': total_saldo_real,
-        'total_diferencia': total_diferencia,
-        
-        # Datos para análisis
-        'stats_por_categoria': stats_por_categoria,
-        'stats_por_tipo': stats_por_tipo,
-        'top_gastos': top_gastos,
-    }
-    
-    return render(request, 'reporte_caja.html', context)
-
-
-
-
-# ============================================================================
-
-@login_required
-def caja_list(request):
-    """Lista de cajas"""
-    cajas = Caja.objects.select_related('usuario_apertura', 'usuario_cierre').order_by('-fecha')
-    
-    # Estadísticas generales
-    total_cajas = cajas.count()
-    cajas_abiertas = cajas.filter(cerrada=False).count()
-    cajas_cerradas = cajas.filter(cerrada=True).count()
-    
-    # Caja actual (hoy)
-    from datetime import date
-    caja_actual = cajas.filter(fecha=date.today()).first()
-    
-    context = {
-        'cajas': cajas,
-        'total_cajas': total_cajas,
-        'cajas_abiertas': cajas_abiertas,
-        'cajas_cerradas': cajas_cerradas,
-        'caja_actual': caja_actual,
-    }
-    
-    return render(request, 'caja_list.html', context)
-
-
-@login_required
-def caja_abrir(request):
-    """Abrir caja del día con denominaciones"""
-    from datetime import date
-    
-    # Verificar si ya existe una caja para hoy
-    caja_existente = Caja.objects.filter(fecha=date.today()).first()
-    if caja_existente:
-        messages.warning(request, 'Ya existe una caja abierta para hoy.')
-        return redirect('caja_ver', caja_id=caja_existente.id)
-    
-    if request.method == 'POST':
-        try:
-            # Crear la caja
-            caja = Caja.objects.create(
-                fecha=date.today(),
-                saldo_inicial=0,  # Se calculará automáticamente
-                usuario_apertura=request.user
-            )
-            
-            # Procesar denominaciones
-            denominaciones_creadas = []
-            total_calculado = 0
-            
-            for valor in Denominacion.VALOR_CHOICES:
-                cantidad = request.POST.get(f'denominacion_{valor[0]}', 0)
-                try:
-                    cantidad = int(cantidad)
-                    if cantidad > 0:
-                        denominacion = Denominacion.objects.create(
-                            caja=caja,
-                            valor=valor[0],
-                            cantidad=cantidad
-                        )
-                        denominaciones_creadas.append(denominacion)
-                        total_calculado += valor[0] * cantidad
-                except ValueError:
-                    continue
-            
-            # Calcular saldo inicial basado en denominaciones
-            caja.calcular_saldo_inicial_denominaciones()
-            caja.save()
-            
-            messages.success(request, f'Caja abierta con saldo inicial de Gs. {caja.saldo_inicial:,}')
-            return redirect('caja_ver', caja_id=caja.id)
-            
-        except Exception as e:
-            messages.error(request, f'Error al abrir la caja: {str(e)}')
-    
-    # Preparar denominaciones para el formulario
-    denominaciones = []
-    for valor, label in Denominacion.VALOR_CHOICES:
-        denominaciones.append({
-            'valor': valor,
-            'label': label,
-            'cantidad': 0
-        })
-    
-    context = {
-        'fecha_actual': date.today(),
-        'denominaciones': denominaciones,
-    }
-    return render(request, 'caja_abrir.html', context)
-
-
-@login_required
-def caja_ver(request, caja_id):
-    """Ver detalles de una caja"""
-    caja = get_object_or_404(Caja, id=caja_id)
-    
-    # Obtener movimientos
-    movimientos = caja.movimientos.select_related('usuario').order_by('-fecha')
-    
-    # Obtener gastos
-    gastos = caja.gastos.select_related('usuario').order_by('-fecha')
-    
-    # Obtener denominaciones
-    denominaciones = caja.denominaciones.all().order_by('-valor')
-    
-    # Calcular totales
-    total_ingresos = movimientos.filter(tipo='ingreso').aggregate(total=Sum('monto'))['total'] or 0
-    total_egresos = movimientos.filter(tipo='egreso').aggregate(total=Sum('monto'))['total'] or 0
-    total_gastos = gastos.aggregate(total=Sum('monto'))['total'] or 0
-    
-    # Agrupar movimientos por categoría
-    movimientos_por_categoria = movimientos.values('categoria').annotate(
-        total=Sum('monto'),
-        cantidad=Count('id')
-    ).order_by('-total')
-    
-    context = {
-        'caja': caja,
-        'movimientos': movimientos,
-        'gastos': gastos,
-        'denominaciones': denominaciones,
-        'total_ingresos': total_ingresos,
-        'total_egresos': total_egresos,
-        'total_gastos': total_gastos,
-        'movimientos_por_categoria': movimientos_por_categoria,
-    }
-    
-    return render(request, 'caja_ver.html', context)
-
-
-@login_required
-def caja_cerrar(request, caja_id):
-    """Cerrar caja con arqueo"""
-    caja = get_object_or_404(Caja, id=caja_id)
-    
-    if caja.cerrada:
-        messages.warning(request, 'Esta caja ya está cerrada.')
-        return redirect('caja_ver', caja_id=caja.id)
-    
-    if request.method == 'POST':
-        saldo_real = request.POST.get('saldo_real', 0)
-        observaciones = request.POST.get('observaciones', '')
-        
-        try:
-            saldo_real = int(saldo_real)
-            caja.cerrar_caja(saldo_real, request.user, observaciones)
-            messages.success(request, 'Caja cerrada exitosamente.')
-            return redirect('caja_ver', caja_id=caja.id)
-        except ValueError:
-            messages.error(request, 'El saldo real debe ser un número válido.')
-    
-    # Calcular saldo final esperado
-    caja.calcular_saldo_final()
-    
-    context = {
-        'caja': caja,
-    }
-    
-    return render(request, 'caja_cerrar.html', context)
-
-
-@login_required
-def gasto_crear(request, caja_id):
-    """Crear un nuevo gasto"""
-    caja = get_object_or_404(Caja, id=caja_id)
-    
-    if caja.cerrada:
-        messages.error(request, 'No se pueden agregar gastos a una caja cerrada.')
-        return redirect('caja_ver', caja_id=caja.id)
-    
-    if request.method == 'POST':
-        categoria = request.POST.get('categoria')
-        descripcion = request.POST.get('descripcion')
-        monto = request.POST.get('monto')
-        comprobante = request.POST.get('comprobante', '')
-        observacion = request.POST.get('observacion', '')
-        
-        try:
-            monto = int(monto)
-            if monto <= 0:
-                raise ValueError("El monto debe ser mayor a 0")
-            
-            gasto = Gasto.objects.create(
-                caja=caja,
-                categoria=categoria,
-                descripcion=descripcion,
-                monto=monto,
-                comprobante=comprobante,
-                observacion=observacion,
-                usuario=request.user
-            )
-            
-            messages.success(request, f'Gasto registrado: {descripcion} - Gs. {monto:,}')
-            return redirect('caja_ver', caja_id=caja.id)
-            
-        except ValueError as e:
-            messages.error(request, f'Error: {str(e)}')
-    
-    context = {
-        'caja': caja,
-        'categorias': Gasto.CATEGORIA_CHOICES,
-    }
-    
-    return render(request, 'gasto_crear.html', context)
-
-
-@login_required
-def gasto_editar(request, gasto_id):
-    """Editar un gasto"""
-    gasto = get_object_or_404(Gasto, id=gasto_id)
-    
-    if gasto.caja.cerrada:
-        messages.error(request, 'No se pueden editar gastos de una caja cerrada.')
-        return redirect('caja_ver', caja_id=gasto.caja.id)
-    
-    if request.method == 'POST':
-        categoria = request.POST.get('categoria')
-        descripcion = request.POST.get('descripcion')
-        monto = request.POST.get('monto')
-        comprobante = request.POST.get('comprobante', '')
-        observacion = request.POST.get('observacion', '')
-        
-        try:
-            monto = int(monto)
-            if monto <= 0:
-                raise ValueError("El monto debe ser mayor a 0")
-            
-            gasto.categoria = categoria
-            gasto.descripcion = descripcion
-            gasto.monto = monto
-            gasto.comprobante = comprobante
-            gasto.observacion = observacion
-            gasto.save()
-            
-            messages.success(request, 'Gasto actualizado exitosamente.')
-            return redirect('caja_ver', caja_id=gasto.caja.id)
-            
-        except ValueError as e:
-            messages.error(request, f'Error: {str(e)}')
-    
-    context = {
-        'gasto': gasto,
-        'categorias': Gasto.CATEGORIA_CHOICES,
-    }
-    
-    return render(request, 'gasto_editar.html', context)
-
-
-@login_required
-def gasto_eliminar(request, gasto_id):
-    """Eliminar un gasto"""
-    gasto = get_object_or_404(Gasto, id=gasto_id)
-    
-    if gasto.caja.cerrada:
-        messages.error(request, 'No se pueden eliminar gastos de una caja cerrada.')
-        return redirect('caja_ver', caja_id=gasto.caja.id)
-    
-    if request.method == 'POST':
-        caja_id = gasto.caja.id
-        gasto.delete()
-        messages.success(request, 'Gasto eliminado exitosamente.')
-        return redirect('caja_ver', caja_id=caja_id)
-    
-    context = {
-        'gasto': gasto,
-    }
-    
-    return render(request, 'gasto_eliminar.html', context)
-
-
-@login_required
-def movimiento_crear(request, caja_id):
-    """Crear un movimiento manual de caja"""
-    caja = get_object_or_404(Caja, id=caja_id)
-    
-    if caja.cerrada:
-        messages.error(request, 'No se pueden agregar movimientos a una caja cerrada.')
-        return redirect('caja_ver', caja_id=caja.id)
-    
-    if request.method == 'POST':
-        tipo = request.POST.get('tipo')
-        categoria = request.POST.get('categoria')
-        monto = request.POST.get('monto')
-        descripcion = request.POST.get('descripcion')
-        referencia = request.POST.get('referencia', '')
-        observacion = request.POST.get('observacion', '')
-        
-        try:
-            monto = int(monto)
-            if monto <= 0:
-                raise ValueError("El monto debe ser mayor a 0")
-            
-            movimiento = MovimientoCaja.registrar_movimiento(
-                caja=caja,
-                tipo=tipo,
-                categoria=categoria,
-                monto=monto,
-                descripcion=descripcion,
-                usuario=request.user,
-                referencia=referencia,
-                observacion=observacion
-            )
-            
-            messages.success(request, f'Movimiento registrado: {descripcion} - Gs. {monto:,}')
-            return redirect('caja_ver', caja_id=caja.id)
-            
-        except ValueError as e:
-            messages.error(request, f'Error: {str(e)}')
-    
-    context = {
-        'caja': caja,
-        'tipos': MovimientoCaja.TIPO_CHOICES,
-        'categorias': MovimientoCaja.CATEGORIA_CHOICES,
-    }
-    
-    return render(request, 'movimiento_crear.html', context)
-
-
-@login_required
-def reporte_caja(request):
-    """Reporte de caja por período"""
-    from datetime import datetime, timedelta
-    
-    # Parámetros de filtro
-    fecha_inicio = request.GET.get('fecha_inicio', (datetime.now() - timedelta(days=30)).strftime('%Y-%m-%d'))
-    fecha_fin = request.GET.get('fecha_fin', datetime.now().strftime('%Y-%m-%d'))
-    
-    try:
-        fecha_inicio_dt = datetime.strptime(fecha_inicio, '%Y-%m-%d').date()
-        fecha_fin_dt = datetime.strptime(fecha_fin, '%Y-%m-%d').date()
-    except ValueError:
-        fecha_inicio_dt = (datetime.now() - timedelta(days=30)).date()
-        fecha_fin_dt = datetime.now().date()
-    
-    # Obtener cajas del período
-    cajas = Caja.objects.filter(
-        fecha__gte=fecha_inicio_dt,
-        fecha__lte=fecha_fin_dt
-    ).select_related('usuario_apertura', 'usuario_cierre').order_by('-fecha')
-    
-    # Estadísticas generales
-    total_cajas = cajas.count()
-    cajas_abiertas = cajas.filter(cerrada=False).count()
-    cajas_cerradas = cajas.filter(cerrada=True).count()
-    
-    # Totales financieros
-    total_saldo_inicial = cajas.aggregate(total=Sum('saldo_inicial'))['total'] or 0
-    total_saldo_final = cajas.aggregate(total=Sum('saldo_final'))['total'] or 0
-    total_saldo_real = cajas.aggregate(total=Sum('saldo_real'))['total'] or 0
-    total_diferencia = cajas.aggregate(total=Sum('diferencia'))['total'] or 0
-    
-    # Obtener todos los movimientos del período
-    movimientos = MovimientoCaja.objects.filter(
-        caja__fecha__gte=fecha_inicio_dt,
-        caja__fecha__lte=fecha_fin_dt
-    ).select_related('caja', 'usuario')
-    
-    # Estadísticas por categoría
-    stats_por_categoria = movimientos.values('categoria').annotate(
-        total=Sum('monto'),
-        cantidad=Count('id')
-    ).order_by('-total')
-    
-    # Estadísticas por tipo
-    stats_por_tipo = movimientos.values('tipo').annotate(
-        total=Sum('monto'),
-        cantidad=Count('id')
-    ).order_by('-total')
-    
-    # Top gastos
-    top_gastos = Gasto.objects.filter(
-        caja__fecha__gte=fecha_inicio_dt,
-        caja__fecha__lte=fecha_fin_dt
-    ).select_related('caja', 'usuario').order_by('-monto')[:10]
-    
-    context = {
-        'cajas': cajas,
-        'fecha_inicio': fecha_inicio,
-        'fecha_fin': fecha_fin,
-        
-        # Estadísticas
-        'total_cajas': total_cajas,
-        'cajas_abiertas': cajas_abiertas,
-        'cajas_cerradas': cajas_cerradas,
-        'total_saldo_inicial': total_saldo_inicial,
-        'total_saldo_final': total_saldo_final,
-        'total_saldo_real': total_saldo_real,
-        'total_diferencia': total_diferencia,
-        
-        # Datos para análisis
-        'stats_por_categoria': stats_por_categoria,
-        'stats_por_tipo': stats_por_tipo,
-        'top_gastos': top_gastos,
-    }
-    
-    return render(request, 'reporte_caja.html', context)
-
-
-
-
-# ============================================================================
-
-@login_required
-def caja_list(request):
-    """Lista de cajas"""
-    cajas = Caja.objects.select_related('usuario_apertura', 'usuario_cierre').order_by('-fecha')
-    
-    # Estadísticas generales
-    total_cajas = cajas.count()
-    cajas_abiertas = cajas.filter(cerrada=False).count()
-    cajas_cerradas = cajas.filter(cerrada=True).count()
-    
-    # Caja actual (hoy)
-    from datetime import date
-    caja_actual = cajas.filter(fecha=date.today()).first()
-    
-    context = {
-        'cajas': cajas,
-        'total_cajas': total_cajas,
-        'cajas_abiertas': cajas_abiertas,
-        'cajas_cerradas': cajas_cerradas,
-        'caja_actual': caja_actual,
-    }
-    
-    return render(request, 'caja_list.html', context)
-
-
-@login_required
-def caja_abrir(request):
-    """Abrir caja del día con denominaciones"""
-    from datetime import date
-    
-    # Verificar si ya existe una caja para hoy
-    caja_existente = Caja.objects.filter(fecha=date.today()).first()
-    if caja_existente:
-        messages.warning(request, 'Ya existe una caja abierta para hoy.')
-        return redirect('caja_ver', caja_id=caja_existente.id)
-    
-    if request.method == 'POST':
-        try:
-            # Crear la caja
-            caja = Caja.objects.create(
-                fecha=date.today(),
-                saldo_inicial=0,  # Se calculará automáticamente
-                usuario_apertura=request.user
-            )
-            
-            # Procesar denominaciones
-            denominaciones_creadas = []
-            total_calculado = 0
-            
-            for valor in Denominacion.VALOR_CHOICES:
-                cantidad = request.POST.get(f'denominacion_{valor[0]}', 0)
-                try:
-                    cantidad = int(cantidad)
-                    if cantidad > 0:
-                        denominacion = Denominacion.objects.create(
-                            caja=caja,
-                            valor=valor[0],
-                            cantidad=cantidad
-                        )
-                        denominaciones_creadas.append(denominacion)
-                        total_calculado += valor[0] * cantidad
-                except ValueError:
-                    continue
-            
-            # Calcular saldo inicial basado en denominaciones
-            caja.calcular_saldo_inicial_denominaciones()
-            caja.save()
-            
-            messages.success(request, f'Caja abierta con saldo inicial de Gs. {caja.saldo_inicial:,}')
-            return redirect('caja_ver', caja_id=caja.id)
-            
-        except Exception as e:
-            messages.error(request, f'Error al abrir la caja: {str(e)}')
-    
-    # Preparar denominaciones para el formulario
-    denominaciones = []
-    for valor, label in Denominacion.VALOR_CHOICES:
-        denominaciones.append({
-            'valor': valor,
-            'label': label,
-            'cantidad': 0
-        })
-    
-    context = {
-        'fecha_actual': date.today(),
-        'denominaciones': denominaciones,
-    }
-    return render(request, 'caja_abrir.html', context)
-
-
-@login_required
-def caja_ver(request, caja_id):
-    """Ver detalles de una caja"""
-    caja = get_object_or_404(Caja, id=caja_id)
-    
-    # Obtener movimientos
-    movimientos = caja.movimientos.select_related('usuario').order_by('-fecha')
-    
-    # Obtener gastos
-    gastos = caja.gastos.select_related('usuario').order_by('-fecha')
-    
-    # Obtener denominaciones
-    denominaciones = caja.denominaciones.all().order_by('-valor')
-    
-    # Calcular totales
-    total_ingresos = movimientos.filter(tipo='ingreso').aggregate(total=Sum('monto'))['total'] or 0
-    total_egresos = movimientos.filter(tipo='egreso').aggregate(total=Sum('monto'))['total'] or 0
-    total_gastos = gastos.aggregate(total=Sum('monto'))['total'] or 0
-    
-    # Agrupar movimientos por categoría
-    movimientos_por_categoria = movimientos.values('categoria').annotate(
-        total=Sum('monto'),
-        cantidad=Count('id')
-    ).order_by('-total')
-    
-    context = {
-        'caja': caja,
-        'movimientos': movimientos,
-        'gastos': gastos,
-        'denominaciones': denominaciones,
-        'total_ingresos': total_ingresos,
-        'total_egresos': total_egresos,
-        'total_gastos': total_gastos,
-        'movimientos_por_categoria': movimientos_por_categoria,
-    }
-    
-    return render(request, 'caja_ver.html', context)
-
-
-@login_required
-def caja_cerrar(request, caja_id):
-    """Cerrar caja con arqueo"""
-    caja = get_object_or_404(Caja, id=caja_id)
-    
-    if caja.cerrada:
-        messages.warning(request, 'Esta caja ya está cerrada.')
-        return redirect('caja_ver', caja_id=caja.id)
-    
-    if request.method == 'POST':
-        saldo_real = request.POST.get('saldo_real', 0)
-        observaciones = request.POST.get('observaciones', '')
-        
-        try:
-            saldo_real = int(saldo_real)
-            caja.cerrar_caja(saldo_real, request.user, observaciones)
-            messages.success(request, 'Caja cerrada exitosamente.')
-            return redirect('caja_ver', caja_id=caja.id)
-        except ValueError:
-            messages.error(request, 'El saldo real debe ser un número válido.')
-    
-    # Calcular saldo final esperado
-    caja.calcular_saldo_final()
-    
-    context = {
-        'caja': caja,
-    }
-    
-    return render(request, 'caja_cerrar.html', context)
-
-
-@login_required
-def gasto_crear(request, caja_id):
-    """Crear un nuevo gasto"""
-    caja = get_object_or_404(Caja, id=caja_id)
-    
-    if caja.cerrada:
-        messages.error(request, 'No se pueden agregar gastos a una caja cerrada.')
-        return redirect('caja_ver', caja_id=caja.id)
-    
-    if request.method == 'POST':
-        categoria = request.POST.get('categoria')
-        descripcion = request.POST.get('descripcion')
-        monto = request.POST.get('monto')
-        comprobante = request.POST.get('comprobante', '')
-        observacion = request.POST.get('observacion', '')
-        
-        try:
-            monto = int(monto)
-            if monto <= 0:
-                raise ValueError("El monto debe ser mayor a 0")
-            
-            gasto = Gasto.objects.create(
-                caja=caja,
-                categoria=categoria,
-                descripcion=descripcion,
-                monto=monto,
-                comprobante=comprobante,
-                observacion=observacion,
-                usuario=request.user
-            )
-            
-            messages.success(request, f'Gasto registrado: {descripcion} - Gs. {monto:,}')
-            return redirect('caja_ver', caja_id=caja.id)
-            
-        except ValueError as e:
-            messages.error(request, f'Error: {str(e)}')
-    
-    context = {
-        'caja': caja,
-        'categorias': Gasto.CATEGORIA_CHOICES,
-    }
-    
-    return render(request, 'gasto_crear.html', context)
-
-
-@login_required
-def gasto_editar(request, gasto_id):
-    """Editar un gasto"""
-    gasto = get_object_or_404(Gasto, id=gasto_id)
-    
-    if gasto.caja.cerrada:
-        messages.error(request, 'No se pueden editar gastos de una caja cerrada.')
-        return redirect('caja_ver', caja_id=gasto.caja.id)
-    
-    if request.method == 'POST':
-        categoria = request.POST.get('categoria')
-        descripcion = request.POST.get('descripcion')
-        monto = request.POST.get('monto')
-        comprobante = request.POST.get('comprobante', '')
-        observacion = request.POST.get('observacion', '')
-        
-        try:
-            monto = int(monto)
-            if monto <= 0:
-                raise ValueError("El monto debe ser mayor a 0")
-            
-            gasto.categoria = categoria
-            gasto.descripcion = descripcion
-            gasto.monto = monto
-            gasto.comprobante = comprobante
-            gasto.observacion = observacion
-            gasto.save()
-            
-            messages.success(request, 'Gasto actualizado exitosamente.')
-            return redirect('caja_ver', caja_id=gasto.caja.id)
-            
-        except ValueError as e:
-            messages.error(request, f'Error: {str(e)}')
-    
-    context = {
-        'gasto': gasto,
-        'categorias': Gasto.CATEGORIA_CHOICES,
-    }
-    
-    return render(request, 'gasto_editar.html', context)
-
-
-@login_required
-def gasto_eliminar(request, gasto_id):
-    """Eliminar un gasto"""
-    gasto = get_object_or_404(Gasto, id=gasto_id)
-    
-    if gasto.caja.cerrada:
-        messages.error(request, 'No se pueden eliminar gastos de una caja cerrada.')
-        return redirect('caja_ver', caja_id=gasto.caja.id)
-    
-    if request.method == 'POST':
-        caja_id = gasto.caja.id
-        gasto.delete()
-        messages.success(request, 'Gasto eliminado exitosamente.')
-        return redirect('caja_ver', caja_id=caja_id)
-    
-    context = {
-        'gasto': gasto,
-    }
-    
-    return render(request, 'gasto_eliminar.html', context)
-
-
-@login_required
-def movimiento_crear(request, caja_id):
-    """Crear un movimiento manual de caja"""
-    caja = get_object_or_404(Caja, id=caja_id)
-    
-    if caja.cerrada:
-        messages.error(request, 'No se pueden agregar movimientos a una caja cerrada.')
-        return redirect('caja_ver', caja_id=caja.id)
-    
-    if request.method == 'POST':
-        tipo = request.POST.get('tipo')
-        categoria = request.POST.get('categoria')
-        monto = request.POST.get('monto')
-        descripcion = request.POST.get('descripcion')
-        referencia = request.POST.get('referencia', '')
-        observacion = request.POST.get('observacion', '')
-        
-        try:
-            monto = int(monto)
-            if monto <= 0:
-                raise ValueError("El monto debe ser mayor a 0")
-            
-            movimiento = MovimientoCaja.registrar_movimiento(
-                caja=caja,
-                tipo=tipo,
-                categoria=categoria,
-                monto=monto,
-                descripcion=descripcion,
-                usuario=request.user,
-                referencia=referencia,
-                observacion=observacion
-            )
-            
-            messages.success(request, f'Movimiento registrado: {descripcion} - Gs. {monto:,}')
-            return redirect('caja_ver', caja_id=caja.id)
-            
-        except ValueError as e:
-            messages.error(request, f'Error: {str(e)}')
-    
-    context = {
-        'caja': caja,
-        'tipos': MovimientoCaja.TIPO_CHOICES,
-        'categorias': MovimientoCaja.CATEGORIA_CHOICES,
-    }
-    
-    return render(request, 'movimiento_crear.html', context)
-
-
-@login_required
-def reporte_caja(request):
-    """Reporte de caja por período"""
-    from datetime import datetime, timedelta
-    
-    # Parámetros de filtro
-    fecha_inicio = request.GET.get('fecha_inicio', (datetime.now() - timedelta(days=30)).strftime('%Y-%m-%d'))
-    fecha_fin = request.GET.get('fecha_fin', datetime.now().strftime('%Y-%m-%d'))
-    
-    try:
-        fecha_inicio_dt = datetime.strptime(fecha_inicio, '%Y-%m-%d').date()
-        fecha_fin_dt = datetime.strptime(fecha_fin, '%Y-%m-%d').date()
-    except ValueError:
-        fecha_inicio_dt = (datetime.now() - timedelta(days=30)).date()
-        fecha_fin_dt = datetime.now().date()
-    
-    # Obtener cajas del período
-    cajas = Caja.objects.filter(
-        fecha__gte=fecha_inicio_dt,
-        fecha__lte=fecha_fin_dt
-    ).select_related('usuario_apertura', 'usuario_cierre').order_by('-fecha')
-    
-    # Estadísticas generales
-    total_cajas = cajas.count()
-    cajas_abiertas = cajas.filter(cerrada=False).count()
-    cajas_cerradas = cajas.filter(cerrada=True).count()
-    
-    # Totales financieros
-    total_saldo_inicial = cajas.aggregate(total=Sum('saldo_inicial'))['total'] or 0
-    total_saldo_final = cajas.aggregate(total=Sum('saldo_final'))['total'] or 0
-    total_saldo_real = cajas.aggregate(total=Sum('saldo_real'))['total'] or 0
-    total_diferencia = cajas.aggregate(total=Sum('diferencia'))['total'] or 0
-    
-    # Obtener todos los movimientos del período
-    movimientos = MovimientoCaja.objects.filter(
-        caja__fecha__gte=fecha_inicio_dt,
-        caja__fecha__lte=fecha_fin_dt
-    ).select_related('caja', 'usuario')
-    
-    # Estadísticas por categoría
-    stats_por_categoria = movimientos.values('categoria').annotate(
-        total=Sum('monto'),
-        cantidad=Count('id')
-    ).order_by('-total')
-    
-    # Estadísticas por tipo
-    stats_por_tipo = movimientos.values('tipo').annotate(
-        total=Sum('monto'),
-        cantidad=Count('id')
-    ).order_by('-total')
-    
-    # Top gastos
-    top_gastos = Gasto.objects.filter(
-        caja__fecha__gte=fecha_inicio_dt,
-        caja__fecha__lte=fecha_fin_dt
-    ).select_related('caja', 'usuario').order_by('-monto')[:10]
-    
-    context = {
-        'cajas': cajas,
-        'fecha_inicio': fecha_inicio,
-        'fecha_fin': fecha_fin,
-        
-        # Estadísticas
-        'total_cajas': total_cajas,
-        'cajas_abiertas': cajas_abiertas,
-        'cajas_cerradas': cajas_cerradas,
-        'total_saldo_inicial': total_saldo_inicial,
-        'total_saldo_final': total_saldo_final,
-        'total_saldo_real': total_saldo_real,
-        'total_diferencia': total_diferencia,
-        
-        # Datos para análisis
-        'stats_por_categoria': stats_por_categoria,
-        'stats_por_tipo': stats_por_tipo,
-        'top_gastos': top_gastos,
-    }
-    
-    return render(request, 'reporte_caja.html', context)
-
-
-
-
-# ============================================================================
-
-@login_required
-def caja_list(request):
-    """Lista de cajas"""
-    cajas = Caja.objects.select_related('usuario_apertura', 'usuario_cierre').order_by('-fecha')
-    
-    # Estadísticas generales
-    total_cajas = cajas.count()
-    cajas_abiertas = cajas.filter(cerrada=False).count()
-    cajas_cerradas = cajas.filter(cerrada=True).count()
-    
-    # Caja actual (hoy)
-    from datetime import date
-    caja_actual = cajas.filter(fecha=date.today()).first()
-    
-    context = {
-        'cajas': cajas,
-        'total_cajas': total_cajas,
-        'cajas_abiertas': cajas_abiertas,
-        'cajas_cerradas': cajas_cerradas,
-        'caja_actual': caja_actual,
-    }
-    
-    return render(request, 'caja_list.html', context)
-
-
-@login_required
-def caja_abrir(request):
-    """Abrir caja del día con denominaciones"""
-    from datetime import date
-    
-    # Verificar si ya existe una caja para hoy
-    caja_existente = Caja.objects.filter(fecha=date.today()).first()
-    if caja_existente:
-        messages.warning(request, 'Ya existe una caja abierta para hoy.')
-        return redirect('caja_ver', caja_id=caja_existente.id)
-    
-    if request.method == 'POST':
-        try:
-            # Crear la caja
-            caja = Caja.objects.create(
-                fecha=date.today(),
-                saldo_inicial=0,  # Se calculará automáticamente
-                usuario_apertura=request.user
-            )
-            
-            # Procesar denominaciones
-            denominaciones_creadas = []
-            total_calculado = 0
-            
-            for valor in Denominacion.VALOR_CHOICES:
-                cantidad = request.POST.get(f'denominacion_{valor[0]}', 0)
-                try:
-                    cantidad = int(cantidad)
-                    if cantidad > 0:
-                        denominacion = Denominacion.objects.create(
-                            caja=caja,
-                            valor=valor[0],
-                            cantidad=cantidad
-                        )
-                        denominaciones_creadas.append(denominacion)
-                        total_calculado += valor[0] * cantidad
-                except ValueError:
-                    continue
-            
-            # Calcular saldo inicial basado en denominaciones
-            caja.calcular_saldo_inicial_denominaciones()
-            caja.save()
-            
-            messages.success(request, f'Caja abierta con saldo inicial de Gs. {caja.saldo_inicial:,}')
-            return redirect('caja_ver', caja_id=caja.id)
-            
-        except Exception as e:
-            messages.error(request, f'Error al abrir la caja: {str(e)}')
-    
-    # Preparar denominaciones para el formulario
-    denominaciones = []
-    for valor, label in Denominacion.VALOR_CHOICES:
-        denominaciones.append({
-            'valor': valor,
-            'label': label,
-            'cantidad': 0
-        })
-    
-    context = {
-        'fecha_actual': date.today(),
-        'denominaciones': denominaciones,
-    }
-    return render(request, 'caja_abrir.html', context)
-
-
-@login_required
-def caja_ver(request, caja_id):
-    """Ver detalles de una caja"""
-    caja = get_object_or_404(Caja, id=caja_id)
-    
-    # Obtener movimientos
-    movimientos = caja.movimientos.select_related('usuario').order_by('-fecha')
-    
-    # Obtener gastos
-    gastos = caja.gastos.select_related('usuario').order_by('-fecha')
-    
-    # Obtener denominaciones
-    denominaciones = caja.denominaciones.all().order_by('-valor')
-    
-    # Calcular totales
-    total_ingresos = movimientos.filter(tipo='ingreso').aggregate(total=Sum('monto'))['total'] or 0
-    total_egresos = movimientos.filter(tipo='egreso').aggregate(total=Sum('monto'))['total'] or 0
-    total_gastos = gastos.aggregate(total=Sum('monto'))['total'] or 0
-    
-    # Agrupar movimientos por categoría
-    movimientos_por_categoria = movimientos.values('categoria').annotate(
-        total=Sum('monto'),
-        cantidad=Count('id')
-    ).order_by('-total')
-    
-    context = {
-        'caja': caja,
-        'movimientos': movimientos,
-        'gastos': gastos,
-        'denominaciones': denominaciones,
-        'total_ingresos': total_ingresos,
-        'total_egresos': total_egresos,
-        'total_gastos': total_gastos,
-        'movimientos_por_categoria': movimientos_por_categoria,
-    }
-    
-    return render(request, 'caja_ver.html', context)
-
-
-@login_required
-def caja_cerrar(request, caja_id):
-    """Cerrar caja con arqueo"""
-    caja = get_object_or_404(Caja, id=caja_id)
-    
-    if caja.cerrada:
-        messages.warning(request, 'Esta caja ya está cerrada.')
-        return redirect('caja_ver', caja_id=caja.id)
-    
-    if request.method == 'POST':
-        saldo_real = request.POST.get('saldo_real', 0)
-        observaciones = request.POST.get('observaciones', '')
-        
-        try:
-            saldo_real = int(saldo_real)
-            caja.cerrar_caja(saldo_real, request.user, observaciones)
-            messages.success(request, 'Caja cerrada exitosamente.')
-            return redirect('caja_ver', caja_id=caja.id)
-        except ValueError:
-            messages.error(request, 'El saldo real debe ser un número válido.')
-    
-    # Calcular saldo final esperado
-    caja.calcular_saldo_final()
-    
-    context = {
-        'caja': caja,
-    }
-    
-    return render(request, 'caja_cerrar.html', context)
-
-
-@login_required
-def gasto_crear(request, caja_id):
-    """Crear un nuevo gasto"""
-    caja = get_object_or_404(Caja, id=caja_id)
-    
-    if caja.cerrada:
-        messages.error(request, 'No se pueden agregar gastos a una caja cerrada.')
-        return redirect('caja_ver', caja_id=caja.id)
-    
-    if request.method == 'POST':
-        categoria = request.POST.get('categoria')
-        descripcion = request.POST.get('descripcion')
-        monto = request.POST.get('monto')
-        comprobante = request.POST.get('comprobante', '')
-        observacion = request.POST.get('observacion', '')
-        
-        try:
-            monto = int(monto)
-            if monto <= 0:
-                raise ValueError("El monto debe ser mayor a 0")
-            
-            gasto = Gasto.objects.create(
-                caja=caja,
-                categoria=categoria,
-                descripcion=descripcion,
-                monto=monto,
-                comprobante=comprobante,
-                observacion=observacion,
-                usuario=request.user
-            )
-            
-            messages.success(request, f'Gasto registrado: {descripcion} - Gs. {monto:,}')
-            return redirect('caja_ver', caja_id=caja.id)
-            
-        except ValueError as e:
-            messages.error(request, f'Error: {str(e)}')
-    
-    context = {
-        'caja': caja,
-        'categorias': Gasto.CATEGORIA_CHOICES,
-    }
-    
-    return render(request, 'gasto_crear.html', context)
-
-
-@login_required
-def gasto_editar(request, gasto_id):
-    """Editar un gasto"""
-    gasto = get_object_or_404(Gasto, id=gasto_id)
-    
-    if gasto.caja.cerrada:
-        messages.error(request, 'No se pueden editar gastos de una caja cerrada.')
-        return redirect('caja_ver', caja_id=gasto.caja.id)
-    
-    if request.method == 'POST':
-        categoria = request.POST.get('categoria')
-        descripcion = request.POST.get('descripcion')
-        monto = request.POST.get('monto')
-        comprobante = request.POST.get('comprobante', '')
-        observacion = request.POST.get('observacion', '')
-        
-        try:
-            monto = int(monto)
-            if monto <= 0:
-                raise ValueError("El monto debe ser mayor a 0")
-            
-            gasto.categoria = categoria
-            gasto.descripcion = descripcion
-            gasto.monto = monto
-            gasto.comprobante = comprobante
-            gasto.observacion = observacion
-            gasto.save()
-            
-            messages.success(request, 'Gasto actualizado exitosamente.')
-            return redirect('caja_ver', caja_id=gasto.caja.id)
-            
-        except ValueError as e:
-            messages.error(request, f'Error: {str(e)}')
-    
-    context = {
-        'gasto': gasto,
-        'categorias': Gasto.CATEGORIA_CHOICES,
-    }
-    
-    return render(request, 'gasto_editar.html', context)
-
-
-@login_required
-def gasto_eliminar(request, gasto_id):
-    """Eliminar un gasto"""
-    gasto = get_object_or_404(Gasto, id=gasto_id)
-    
-    if gasto.caja.cerrada:
-        messages.error(request, 'No se pueden eliminar gastos de una caja cerrada.')
-        return redirect('caja_ver', caja_id=gasto.caja.id)
-    
-    if request.method == 'POST':
-        caja_id = gasto.caja.id
-        gasto.delete()
-        messages.success(request, 'Gasto eliminado exitosamente.')
-        return redirect('caja_ver', caja_id=caja_id)
-    
-    context = {
-        'gasto': gasto,
-    }
-    
-    return render(request, 'gasto_eliminar.html', context)
-
-
-@login_required
-def movimiento_crear(request, caja_id):
-    """Crear un movimiento manual de caja"""
-    caja = get_object_or_404(Caja, id=caja_id)
-    
-    if caja.cerrada:
-        messages.error(request, 'No se pueden agregar movimientos a una caja cerrada.')
-        return redirect('caja_ver', caja_id=caja.id)
-    
-    if request.method == 'POST':
-        tipo = request.POST.get('tipo')
-        categoria = request.POST.get('categoria')
-        monto = request.POST.get('monto')
-        descripcion = request.POST.get('descripcion')
-        referencia = request.POST.get('referencia', '')
-        observacion = request.POST.get('observacion', '')
-        
-        try:
-            monto = int(monto)
-            if monto <= 0:
-                raise ValueError("El monto debe ser mayor a 0")
-            
-            movimiento = MovimientoCaja.registrar_movimiento(
-                caja=caja,
-                tipo=tipo,
-                categoria=categoria,
-                monto=monto,
-                descripcion=descripcion,
-                usuario=request.user,
-                referencia=referencia,
-                observacion=observacion
-            )
-            
-            messages.success(request, f'Movimiento registrado: {descripcion} - Gs. {monto:,}')
-            return redirect('caja_ver', caja_id=caja.id)
-            
-        except ValueError as e:
-            messages.error(request, f'Error: {str(e)}')
-    
-    context = {
-        'caja': caja,
-        'tipos': MovimientoCaja.TIPO_CHOICES,
-        'categorias': MovimientoCaja.CATEGORIA_CHOICES,
-    }
-    
-    return render(request, 'movimiento_crear.html', context)
-
-
-@login_required
-def reporte_caja(request):
-    """Reporte de caja por período"""
-    from datetime import datetime, timedelta
-    
-    # Parámetros de filtro
-    fecha_inicio = request.GET.get('fecha_inicio', (datetime.now() - timedelta(days=30)).strftime('%Y-%m-%d'))
-    fecha_fin = request.GET.get('fecha_fin', datetime.now().strftime('%Y-%m-%d'))
-    
-    try:
-        fecha_inicio_dt = datetime.strptime(fecha_inicio, '%Y-%m-%d').date()
-        fecha_fin_dt = datetime.strptime(fecha_fin, '%Y-%m-%d').date()
-    except ValueError:
-        fecha_inicio_dt = (datetime.now() - timedelta(days=30)).date()
-        fecha_fin_dt = datetime.now().date()
-    
-    # Obtener cajas del período
-    cajas = Caja.objects.filter(
-        fecha__gte=fecha_inicio_dt,
-        fecha__lte=fecha_fin_dt
-    ).select_related('usuario_apertura', 'usuario_cierre').order_by('-fecha')
-    
-    # Estadísticas generales
-    total_cajas = cajas.count()
-    cajas_abiertas = cajas.filter(cerrada=False).count()
-    cajas_cerradas = cajas.filter(cerrada=True).count()
-    
-    # Totales financieros
-    total_saldo_inicial = cajas.aggregate(total=Sum('saldo_inicial'))['total'] or 0
-    total_saldo_final = cajas.aggregate(total=Sum('saldo_final'))['total'] or 0
-    total_saldo_real = cajas.aggregate(total=Sum('saldo_real'))['total'] or 0
-    total_diferencia = cajas.aggregate(total=Sum('diferencia'))['total'] or 0
-    
-    # Obtener todos los movimientos del período
-    movimientos = MovimientoCaja.objects.filter(
-        caja__fecha__gte=fecha_inicio_dt,
-        caja__fecha__lte=fecha_fin_dt
-    ).select_related('caja', 'usuario')
-    
-    # Estadísticas por categoría
-    stats_por_categoria = movimientos.values('categoria').annotate(
-        total=Sum('monto'),
-        cantidad=Count('id')
-    ).order_by('-total')
-    
-    # Estadísticas por tipo
-    stats_por_tipo = movimientos.values('tipo').annotate(
-        total=Sum('monto'),
-        cantidad=Count('id')
-    ).order_by('-total')
-    
-    # Top gastos
-    top_gastos = Gasto.objects.filter(
-        caja__fecha__gte=fecha_inicio_dt,
-        caja__fecha__lte=fecha_fin_dt
-    ).select_related('caja', 'usuario').order_by('-monto')[:10]
-    
-    context = {
-        'cajas': cajas,
-        'fecha_inicio': fecha_inicio,
-        'fecha_fin': fecha_fin,
-        
-        # Estadísticas
-        'total_cajas': total_cajas,
-        'cajas_abiertas': cajas_abiertas,
-        'cajas_cerradas': cajas_cerradas,
-        'total_saldo_inicial': total_saldo_inicial,
-        'total_saldo_final': total_saldo_final,
-        'total_saldo_real': total_saldo_real,
-        'total_diferencia': total_diferencia,
-        
-        # Datos para análisis
-        'stats_por_categoria': stats_por_categoria,
-        'stats_por_tipo': stats_por_tipo,
-        'top_gastos': top_gastos,
-    }
-    
-    return render(request, 'reporte_caja.html', context)
-
-
-
-
-# ============================================================================
-
-@login_required
-def caja_list(request):
-    """Lista de cajas"""
-    cajas = Caja.objects.select_related('usuario_apertura', 'usuario_cierre').order_by('-fecha')
-    
-    # Estadísticas generales
-    total_cajas = cajas.count()
-    cajas_abiertas = cajas.filter(cerrada=False).count()
-    cajas_cerradas = cajas.filter(cerrada=True).count()
-    
-    # Caja actual (hoy)
-    from datetime import date
-    caja_actual = cajas.filter(fecha=date.today()).first()
-    
-    context = {
-        'cajas': cajas,
-        'total_cajas': total_cajas,
-        'cajas_abiertas': cajas_abiertas,
-        'cajas_cerradas': cajas_cerradas,
-        'caja_actual': caja_actual,
-    }
-    
-    return render(request, 'caja_list.html', context)
-
-
-@login_required
-def caja_abrir(request):
-    """Abrir caja del día con denominaciones"""
-    from datetime import date
-    
-    # Verificar si ya existe una caja para hoy
-    caja_existente = Caja.objects.filter(fecha=date.today()).first()
-    if caja_existente:
-        messages.warning(request, 'Ya existe una caja abierta para hoy.')
-        return redirect('caja_ver', caja_id=caja_existente.id)
-    
-    if request.method == 'POST':
-        try:
-            # Crear la caja
-            caja = Caja.objects.create(
-                fecha=date.today(),
-                saldo_inicial=0,  # Se calculará automáticamente
-                usuario_apertura=request.user
-            )
-            
-            # Procesar denominaciones
-            denominaciones_creadas = []
-            total_calculado = 0
-            
-            for valor in Denominacion.VALOR_CHOICES:
-                cantidad = request.POST.get(f'denominacion_{valor[0]}', 0)
-                try:
-                    cantidad = int(cantidad)
-                    if cantidad > 0:
-                        denominacion = Denominacion.objects.create(
-                            caja=caja,
-                            valor=valor[0],
-                            cantidad=cantidad
-                        )
-                        denominaciones_creadas.append(denominacion)
-                        total_calculado += valor[0] * cantidad
-                except ValueError:
-                    continue
-            
-            # Calcular saldo inicial basado en denominaciones
-            caja.calcular_saldo_inicial_denominaciones()
-            caja.save()
-            
-            messages.success(request, f'Caja abierta con saldo inicial de Gs. {caja.saldo_inicial:,}')
-            return redirect('caja_ver', caja_id=caja.id)
-            
-        except Exception as e:
-            messages.error(request, f'Error al abrir la caja: {str(e)}')
-    
-    # Preparar denominaciones para el formulario
-    denominaciones = []
-    for valor, label in Denominacion.VALOR_CHOICES:
-        denominaciones.append({
-            'valor': valor,
-            'label': label,
-            'cantidad': 0
-        })
-    
-    context = {
-        'fecha_actual': date.today(),
-        'denominaciones': denominaciones,
-    }
-    return render(request, 'caja_abrir.html', context)
-
-
-@login_required
-def caja_ver(request, caja_id):
-    """Ver detalles de una caja"""
-    caja = get_object_or_404(Caja, id=caja_id)
-    
-    # Obtener movimientos
-    movimientos = caja.movimientos.select_related('usuario').order_by('-fecha')
-    
-    # Obtener gastos
-    gastos = caja.gastos.select_related('usuario').order_by('-fecha')
-    
-    # Obtener denominaciones
-    denominaciones = caja.denominaciones.all().order_by('-valor')
-    
-    # Calcular totales
-    total_ingresos = movimientos.filter(tipo='ingreso').aggregate(total=Sum('monto'))['total'] or 0
-    total_egresos = movimientos.filter(tipo='egreso').aggregate(total=Sum('monto'))['total'] or 0
-    total_gastos = gastos.aggregate(total=Sum('monto'))['total'] or 0
-    
-    # Agrupar movimientos por categoría
-    movimientos_por_categoria = movimientos.values('categoria').annotate(
-        total=Sum('monto'),
-        cantidad=Count('id')
-    ).order_by('-total')
-    
-    context = {
-        'caja': caja,
-        'movimientos': movimientos,
-        'gastos': gastos,
-        'denominaciones': denominaciones,
-        'total_ingresos': total_ingresos,
-        'total_egresos': total_egresos,
-        'total_gastos': total_gastos,
-        'movimientos_por_categoria': movimientos_por_categoria,
-    }
-    
-    return render(request, 'caja_ver.html', context)
-
-
-@login_required
-def caja_cerrar(request, caja_id):
-    """Cerrar caja con arqueo"""
-    caja = get_object_or_404(Caja, id=caja_id)
-    
-    if caja.cerrada:
-        messages.warning(request, 'Esta caja ya está cerrada.')
-        return redirect('caja_ver', caja_id=caja.id)
-    
-    if request.method == 'POST':
-        saldo_real = request.POST.get('saldo_real', 0)
-        observaciones = request.POST.get('observaciones', '')
-        
-        try:
-            saldo_real = int(saldo_real)
-            caja.cerrar_caja(saldo_real, request.user, observaciones)
-            messages.success(request, 'Caja cerrada exitosamente.')
-            return redirect('caja_ver', caja_id=caja.id)
-        except ValueError:
-            messages.error(request, 'El saldo real debe ser un número válido.')
-    
-    # Calcular saldo final esperado
-    caja.calcular_saldo_final()
-    
-    context = {
-        'caja': caja,
-    }
-    
-    return render(request, 'caja_cerrar.html', context)
-
-
-@login_required
-def gasto_crear(request, caja_id):
-    """Crear un nuevo gasto"""
-    caja = get_object_or_404(Caja, id=caja_id)
-    
-    if caja.cerrada:
-        messages.error(request, 'No se pueden agregar gastos a una caja cerrada.')
-        return redirect('caja_ver', caja_id=caja.id)
-    
-    if request.method == 'POST':
-        categoria = request.POST.get('categoria')
-        descripcion = request.POST.get('descripcion')
-        monto = request.POST.get('monto')
-        comprobante = request.POST.get('comprobante', '')
-        observacion = request.POST.get('observacion', '')
-        
-        try:
-            monto = int(monto)
-            if monto <= 0:
-                raise ValueError("El monto debe ser mayor a 0")
-            
-            gasto = Gasto.objects.create(
-                caja=caja,
-                categoria=categoria,
-                descripcion=descripcion,
-                monto=monto,
-                comprobante=comprobante,
-                observacion=observacion,
-                usuario=request.user
-            )
-            
-            messages.success(request, f'Gasto registrado: {descripcion} - Gs. {monto:,}')
-            return redirect('caja_ver', caja_id=caja.id)
-            
-        except ValueError as e:
-            messages.error(request, f'Error: {str(e)}')
-    
-    context = {
-        'caja': caja,
-        'categorias': Gasto.CATEGORIA_CHOICES,
-    }
-    
-    return render(request, 'gasto_crear.html', context)
-
-
-@login_required
-def gasto_editar(request, gasto_id):
-    """Editar un gasto"""
-    gasto = get_object_or_404(Gasto, id=gasto_id)
-    
-    if gasto.caja.cerrada:
-        messages.error(request, 'No se pueden editar gastos de una caja cerrada.')
-        return redirect('caja_ver', caja_id=gasto.caja.id)
-    
-    if request.method == 'POST':
-        categoria = request.POST.get('categoria')
-        descripcion = request.POST.get('descripcion')
-        monto = request.POST.get('monto')
-        comprobante = request.POST.get('comprobante', '')
-        observacion = request.POST.get('observacion', '')
-        
-        try:
-            monto = int(monto)
-            if monto <= 0:
-                raise ValueError("El monto debe ser mayor a 0")
-            
-            gasto.categoria = categoria
-            gasto.descripcion = descripcion
-            gasto.monto = monto
-            gasto.comprobante = comprobante
-            gasto.observacion = observacion
-            gasto.save()
-            
-            messages.success(request, 'Gasto actualizado exitosamente.')
-            return redirect('caja_ver', caja_id=gasto.caja.id)
-            
-        except ValueError as e:
-            messages.error(request, f'Error: {str(e)}')
-    
-    context = {
-        'gasto': gasto,
-        'categorias': Gasto.CATEGORIA_CHOICES,
-    }
-    
-    return render(request, 'gasto_editar.html', context)
-
-
-@login_required
-def gasto_eliminar(request, gasto_id):
-    """Eliminar un gasto"""
-    gasto = get_object_or_404(Gasto, id=gasto_id)
-    
-    if gasto.caja.cerrada:
-        messages.error(request, 'No se pueden eliminar gastos de una caja cerrada.')
-        return redirect('caja_ver', caja_id=gasto.caja.id)
-    
-    if request.method == 'POST':
-        caja_id = gasto.caja.id
-        gasto.delete()
-        messages.success(request, 'Gasto eliminado exitosamente.')
-        return redirect('caja_ver', caja_id=caja_id)
-    
-    context = {
-        'gasto': gasto,
-    }
-    
-    return render(request, 'gasto_eliminar.html', context)
-
-
-@login_required
-def movimiento_crear(request, caja_id):
-    """Crear un movimiento manual de caja"""
-    caja = get_object_or_404(Caja, id=caja_id)
-    
-    if caja.cerrada:
-        messages.error(request, 'No se pueden agregar movimientos a una caja cerrada.')
-        return redirect('caja_ver', caja_id=caja.id)
-    
-    if request.method == 'POST':
-        tipo = request.POST.get('tipo')
-        categoria = request.POST.get('categoria')
-        monto = request.POST.get('monto')
-        descripcion = request.POST.get('descripcion')
-        referencia = request.POST.get('referencia', '')
-        observacion = request.POST.get('observacion', '')
-        
-        try:
-            monto = int(monto)
-            if monto <= 0:
-                raise ValueError("El monto debe ser mayor a 0")
-            
-            movimiento = MovimientoCaja.registrar_movimiento(
-                caja=caja,
-                tipo=tipo,
-                categoria=categoria,
-                monto=monto,
-                descripcion=descripcion,
-                usuario=request.user,
-                referencia=referencia,
-                observacion=observacion
-            )
-            
-            messages.success(request, f'Movimiento registrado: {descripcion} - Gs. {monto:,}')
-            return redirect('caja_ver', caja_id=caja.id)
-            
-        except ValueError as e:
-            messages.error(request, f'Error: {str(e)}')
-    
-    context = {
-        'caja': caja,
-        'tipos': MovimientoCaja.TIPO_CHOICES,
-        'categorias': MovimientoCaja.CATEGORIA_CHOICES,
-    }
-    
-    return render(request, 'movimiento_crear.html', context)
-
-
-@login_required
-def reporte_caja(request):
-    """Reporte de caja por período"""
-    from datetime import datetime, timedelta
-    
-    # Parámetros de filtro
-    fecha_inicio = request.GET.get('fecha_inicio', (datetime.now() - timedelta(days=30)).strftime('%Y-%m-%d'))
-    fecha_fin = request.GET.get('fecha_fin', datetime.now().strftime('%Y-%m-%d'))
-    
-    try:
-        fecha_inicio_dt = datetime.strptime(fecha_inicio, '%Y-%m-%d').date()
-        fecha_fin_dt = datetime.strptime(fecha_fin, '%Y-%m-%d').date()
-    except ValueError:
-        fecha_inicio_dt = (datetime.now() - timedelta(days=30)).date()
-        fecha_fin_dt = datetime.now().date()
-    
-    # Obtener cajas del período
-    cajas = Caja.objects.filter(
-        fecha__gte=fecha_inicio_dt,
-        fecha__lte=fecha_fin_dt
-    ).select_related('usuario_apertura', 'usuario_cierre').order_by('-fecha')
-    
-    # Estadísticas generales
-    total_cajas = cajas.count()
-    cajas_abiertas = cajas.filter(cerrada=False).count()
-    cajas_cerradas = cajas.filter(cerrada=True).count()
-    
-    # Totales financieros
-    total_saldo_inicial = cajas.aggregate(total=Sum('saldo_inicial'))['total'] or 0
-    total_saldo_final = cajas.aggregate(total=Sum('saldo_final'))['total'] or 0
-    total_saldo_real = cajas.aggregate(total=Sum('saldo_real'))['total'] or 0
-    total_diferencia = cajas.aggregate(total=Sum('diferencia'))['total'] or 0
-    
-    # Obtener todos los movimientos del período
-    movimientos = MovimientoCaja.objects.filter(
-        caja__fecha__gte=fecha_inicio_dt,
-        caja__fecha__lte=fecha_fin_dt
-    ).select_related('caja', 'usuario')
-    
-    # Estadísticas por categoría
-    stats_por_categoria = movimientos.values('categoria').annotate(
-        total=Sum('monto'),
-        cantidad=Count('id')
-    ).order_by('-total')
-    
-    # Estadísticas por tipo
-    stats_por_tipo = movimientos.values('tipo').annotate(
-        total=Sum('monto'),
-        cantidad=Count('id')
-    ).order_by('-total')
-    
-    # Top gastos
-    top_gastos = Gasto.objects.filter(
-        caja__fecha__gte=fecha_inicio_dt,
-        caja__fecha__lte=fecha_fin_dt
-    ).select_related('caja', 'usuario').order_by('-monto')[:10]
-    
-    context = {
-        'cajas': cajas,
-        'fecha_inicio': fecha_inicio,
-        'fecha_fin': fecha_fin,
-        
-        # Estadísticas
-        'total_cajas': total_cajas,
-        'cajas_abiertas': cajas_abiertas,
-        'cajas_cerradas': cajas_cerradas,
-        'total_saldo_inicial': total_saldo_inicial,
-        'total_saldo_final': total_saldo_final,
-        'total_saldo_real': total_saldo_real,
-        'total_diferencia': total_diferencia,
-        
-        # Datos para análisis
-        'stats_por_categoria': stats_por_categoria,
-        'stats_por_tipo': stats_por_tipo,
-        'top_gastos': top_gastos,
-    }
-    
-    return render(request, 'reporte_caja.html', context)
-
-
-
-
-# ============================================================================
-
-@login_required
-def caja_list(request):
-    """Lista de cajas"""
-    cajas = Caja.objects.select_related('usuario_apertura', 'usuario_cierre').order_by('-fecha')
-    
-    # Estadísticas generales
-    total_cajas = cajas.count()
-    cajas_abiertas = cajas.filter(cerrada=False).count()
-    cajas_cerradas = cajas.filter(cerrada=True).count()
-    
-    # Caja actual (hoy)
-    from datetime import date
-    caja_actual = cajas.filter(fecha=date.today()).first()
-    
-    context = {
-        'cajas': cajas,
-        'total_cajas': total_cajas,
-        'cajas_abiertas': cajas_abiertas,
-        'cajas_cerradas': cajas_cerradas,
-        'caja_actual': caja_actual,
-    }
-    
-    return render(request, 'caja_list.html', context)
-
-
-@login_required
-def caja_abrir(request):
-    """Abrir caja del día con denominaciones"""
-    from datetime import date
-    
-    # Verificar si ya existe una caja para hoy
-    caja_existente = Caja.objects.filter(fecha=date.today()).first()
-    if caja_existente:
-        messages.warning(request, 'Ya existe una caja abierta para hoy.')
-        return redirect('caja_ver', caja_id=caja_existente.id)
-    
-    if request.method == 'POST':
-        try:
-            # Crear la caja
-            caja = Caja.objects.create(
-                fecha=date.today(),
-                saldo_inicial=0,  # Se calculará automáticamente
-                usuario_apertura=request.user
-            )
-            
-            # Procesar denominaciones
-            denominaciones_creadas = []
-            total_calculado = 0
-            
-            for valor in Denominacion.VALOR_CHOICES:
-                cantidad = request.POST.get(f'denominacion_{valor[0]}', 0)
-                try:
-                    cantidad = int(cantidad)
-                    if cantidad > 0:
-                        denominacion = Denominacion.objects.create(
-                            caja=caja,
-                            valor=valor[0],
-                            cantidad=cantidad
-                        )
-                        denominaciones_creadas.append(denominacion)
-                        total_calculado += valor[0] * cantidad
-                except ValueError:
-                    continue
-            
-            # Calcular saldo inicial basado en denominaciones
-            caja.calcular_saldo_inicial_denominaciones()
-            caja.save()
-            
-            messages.success(request, f'Caja abierta con saldo inicial de Gs. {caja.saldo_inicial:,}')
-            return redirect('caja_ver', caja_id=caja.id)
-            
-        except Exception as e:
-            messages.error(request, f'Error al abrir la caja: {str(e)}')
-    
-    # Preparar denominaciones para el formulario
-    denominaciones = []
-    for valor, label in Denominacion.VALOR_CHOICES:
-        denominaciones.append({
-            'valor': valor,
-            'label': label,
-            'cantidad': 0
-        })
-    
-    context = {
-        'fecha_actual': date.today(),
-        'denominaciones': denominaciones,
-    }
-    return render(request, 'caja_abrir.html', context)
-
-
-@login_required
-def caja_ver(request, caja_id):
-    """Ver detalles de una caja"""
-    caja = get_object_or_404(Caja, id=caja_id)
-    
-    # Obtener movimientos
-    movimientos = caja.movimientos.select_related('usuario').order_by('-fecha')
-    
-    # Obtener gastos
-    gastos = caja.gastos.select_related('usuario').order_by('-fecha')
-    
-    # Obtener denominaciones
-    denominaciones = caja.denominaciones.all().order_by('-valor')
-    
-    # Calcular totales
-    total_ingresos = movimientos.filter(tipo='ingreso').aggregate(total=Sum('monto'))['total'] or 0
-    total_egresos = movimientos.filter(tipo='egreso').aggregate(total=Sum('monto'))['total'] or 0
-    total_gastos = gastos.aggregate(total=Sum('monto'))['total'] or 0
-    
-    # Agrupar movimientos por categoría
-    movimientos_por_categoria = movimientos.values('categoria').annotate(
-        total=Sum('monto'),
-        cantidad=Count('id')
-    ).order_by('-total')
-    
-    context = {
-        'caja': caja,
-        'movimientos': movimientos,
-        'gastos': gastos,
-        'denominaciones': denominaciones,
-        'total_ingresos': total_ingresos,
-        'total_egresos': total_egresos,
-        'total_gastos': total_gastos,
-        'movimientos_por_categoria': movimientos_por_categoria,
-    }
-    
-    return render(request, 'caja_ver.html', context)
-
-
-@login_required
-def caja_cerrar(request, caja_id):
-    """Cerrar caja con arqueo"""
-    caja = get_object_or_404(Caja, id=caja_id)
-    
-    if caja.cerrada:
-        messages.warning(request, 'Esta caja ya está cerrada.')
-        return redirect('caja_ver', caja_id=caja.id)
-    
-    if request.method == 'POST':
-        saldo_real = request.POST.get('saldo_real', 0)
-        observaciones = request.POST.get('observaciones', '')
-        
-        try:
-            saldo_real = int(saldo_real)
-            caja.cerrar_caja(saldo_real, request.user, observaciones)
-            messages.success(request, 'Caja cerrada exitosamente.')
-            return redirect('caja_ver', caja_id=caja.id)
-        except ValueError:
-            messages.error(request, 'El saldo real debe ser un número válido.')
-    
-    # Calcular saldo final esperado
-    caja.calcular_saldo_final()
-    
-    context = {
-        'caja': caja,
-    }
-    
-    return render(request, 'caja_cerrar.html', context)
-
-
-@login_required
-def gasto_crear(request, caja_id):
-    """Crear un nuevo gasto"""
-    caja = get_object_or_404(Caja, id=caja_id)
-    
-    if caja.cerrada:
-        messages.error(request, 'No se pueden agregar gastos a una caja cerrada.')
-        return redirect('caja_ver', caja_id=caja.id)
-    
-    if request.method == 'POST':
-        categoria = request.POST.get('categoria')
-        descripcion = request.POST.get('descripcion')
-        monto = request.POST.get('monto')
-        comprobante = request.POST.get('comprobante', '')
-        observacion = request.POST.get('observacion', '')
-        
-        try:
-            monto = int(monto)
-            if monto <= 0:
-                raise ValueError("El monto debe ser mayor a 0")
-            
-            gasto = Gasto.objects.create(
-                caja=caja,
-                categoria=categoria,
-                descripcion=descripcion,
-                monto=monto,
-                comprobante=comprobante,
-                observacion=observacion,
-                usuario=request.user
-            )
-            
-            messages.success(request, f'Gasto registrado: {descripcion} - Gs. {monto:,}')
-            return redirect('caja_ver', caja_id=caja.id)
-            
-        except ValueError as e:
-            messages.error(request, f'Error: {str(e)}')
-    
-    context = {
-        'caja': caja,
-        'categorias': Gasto.CATEGORIA_CHOICES,
-    }
-    
-    return render(request, 'gasto_crear.html', context)
-
-
-@login_required
-def gasto_editar(request, gasto_id):
-    """Editar un gasto"""
-    gasto = get_object_or_404(Gasto, id=gasto_id)
-    
-    if gasto.caja.cerrada:
-        messages.error(request, 'No se pueden editar gastos de una caja cerrada.')
-        return redirect('caja_ver', caja_id=gasto.caja.id)
-    
-    if request.method == 'POST':
-        categoria = request.POST.get('categoria')
-        descripcion = request.POST.get('descripcion')
-        monto = request.POST.get('monto')
-        comprobante = request.POST.get('comprobante', '')
-        observacion = request.POST.get('observacion', '')
-        
-        try:
-            monto = int(monto)
-            if monto <= 0:
-                raise ValueError("El monto debe ser mayor a 0")
-            
-            gasto.categoria = categoria
-            gasto.descripcion = descripcion
-            gasto.monto = monto
-            gasto.comprobante = comprobante
-            gasto.observacion = observacion
-            gasto.save()
-            
-            messages.success(request, 'Gasto actualizado exitosamente.')
-            return redirect('caja_ver', caja_id=gasto.caja.id)
-            
-        except ValueError as e:
-            messages.error(request, f'Error: {str(e)}')
-    
-    context = {
-        'gasto': gasto,
-        'categorias': Gasto.CATEGORIA_CHOICES,
-    }
-    
-    return render(request, 'gasto_editar.html', context)
-
-
-@login_required
-def gasto_eliminar(request, gasto_id):
-    """Eliminar un gasto"""
-    gasto = get_object_or_404(Gasto, id=gasto_id)
-    
-    if gasto.caja.cerrada:
-        messages.error(request, 'No se pueden eliminar gastos de una caja cerrada.')
-        return redirect('caja_ver', caja_id=gasto.caja.id)
-    
-    if request.method == 'POST':
-        caja_id = gasto.caja.id
-        gasto.delete()
-        messages.success(request, 'Gasto eliminado exitosamente.')
-        return redirect('caja_ver', caja_id=caja_id)
-    
-    context = {
-        'gasto': gasto,
-    }
-    
-    return render(request, 'gasto_eliminar.html', context)
-
-
-@login_required
-def movimiento_crear(request, caja_id):
-    """Crear un movimiento manual de caja"""
-    caja = get_object_or_404(Caja, id=caja_id)
-    
-    if caja.cerrada:
-        messages.error(request, 'No se pueden agregar movimientos a una caja cerrada.')
-        return redirect('caja_ver', caja_id=caja.id)
-    
-    if request.method == 'POST':
-        tipo = request.POST.get('tipo')
-        categoria = request.POST.get('categoria')
-        monto = request.POST.get('monto')
-        descripcion = request.POST.get('descripcion')
-        referencia = request.POST.get('referencia', '')
-        observacion = request.POST.get('observacion', '')
-        
-        try:
-            monto = int(monto)
-            if monto <= 0:
-                raise ValueError("El monto debe ser mayor a 0")
-            
-            movimiento = MovimientoCaja.registrar_movimiento(
-                caja=caja,
-                tipo=tipo,
-                categoria=categoria,
-                monto=monto,
-                descripcion=descripcion,
-                usuario=request.user,
-                referencia=referencia,
-                observacion=observacion
-            )
-            
-            messages.success(request, f'Movimiento registrado: {descripcion} - Gs. {monto:,}')
-            return redirect('caja_ver', caja_id=caja.id)
-            
-        except ValueError as e:
-            messages.error(request, f'Error: {str(e)}')
-    
-    context = {
-        'caja': caja,
-        'tipos': MovimientoCaja.TIPO_CHOICES,
-        'categorias': MovimientoCaja.CATEGORIA_CHOICES,
-    }
-    
-    return render(request, 'movimiento_crear.html', context)
-
-
-@login_required
-def reporte_caja(request):
-    """Reporte de caja por período"""
-    from datetime import datetime, timedelta
-    
-    # Parámetros de filtro
-    fecha_inicio = request.GET.get('fecha_inicio', (datetime.now() - timedelta(days=30)).strftime('%Y-%m-%d'))
-    fecha_fin = request.GET.get('fecha_fin', datetime.now().strftime('%Y-%m-%d'))
-    
-    try:
-        fecha_inicio_dt = datetime.strptime(fecha_inicio, '%Y-%m-%d').date()
-        fecha_fin_dt = datetime.strptime(fecha_fin, '%Y-%m-%d').date()
-    except ValueError:
-        fecha_inicio_dt = (datetime.now() - timedelta(days=30)).date()
-        fecha_fin_dt = datetime.now().date()
-    
-    # Obtener cajas del período
-    cajas = Caja.objects.filter(
-        fecha__gte=fecha_inicio_dt,
-        fecha__lte=fecha_fin_dt
-    ).select_related('usuario_apertura', 'usuario_cierre').order_by('-fecha')
-    
-    # Estadísticas generales
-    total_cajas = cajas.count()
-    cajas_abiertas = cajas.filter(cerrada=False).count()
-    cajas_cerradas = cajas.filter(cerrada=True).count()
-    
-    # Totales financieros
-    total_saldo_inicial = cajas.aggregate(total=Sum('saldo_inicial'))['total'] or 0
-    total_saldo_final = cajas.aggregate(total=Sum('saldo_final'))['total'] or 0
-    total_saldo_real = cajas.aggregate(total=Sum('saldo_real'))['total'] or 0
-    total_diferencia = cajas.aggregate(total=Sum('diferencia'))['total'] or 0
-    
-    # Obtener todos los movimientos del período
-    movimientos = MovimientoCaja.objects.filter(
-        caja__fecha__gte=fecha_inicio_dt,
-        caja__fecha__lte=fecha_fin_dt
-    ).select_related('caja', 'usuario')
-    
-    # Estadísticas por categoría
-    stats_por_categoria = movimientos.values('categoria').annotate(
-        total=Sum('monto'),
-        cantidad=Count('id')
-    ).order_by('-total')
-    
-    # Estadísticas por tipo
-    stats_por_tipo = movimientos.values('tipo').annotate(
-        total=Sum('monto'),
-        cantidad=Count('id')
-    ).order_by('-total')
-    
-    # Top gastos
-    top_gastos = Gasto.objects.filter(
-        caja__fecha__gte=fecha_inicio_dt,
-        caja__fecha__lte=fecha_fin_dt
-    ).select_related('caja', 'usuario').order_by('-monto')[:10]
-    
-    context = {
-        'cajas': cajas,
-        'fecha_inicio': fecha_inicio,
-        'fecha_fin': fecha_fin,
-        
-        # Estadísticas
-        'total_cajas': total_cajas,
-        'cajas_abiertas': cajas_abiertas,
-        'cajas_cerradas': cajas_cerradas,
-        'total_saldo_inicial': total_saldo_inicial,
-        'total_saldo_final': total_saldo_final,
-        'total_saldo_real': total_saldo_real,
-        'total_diferencia': total_diferencia,
-        
-        # Datos para análisis
-        'stats_por_categoria': stats_por_categoria,
-        'stats_por_tipo': stats_por_tipo,
-        'top_gastos': top_gastos,
-    }
-    
-    return render(request, 'reporte_caja.html', context)
-
-
-
-
-# ============================================================================
-
-@login_required
-def caja_list(request):
-    """Lista de cajas"""
-    cajas = Caja.objects.select_related('usuario_apertura', 'usuario_cierre').order_by('-fecha')
-    
-    # Estadísticas generales
-    total_cajas = cajas.count()
-    cajas_abiertas = cajas.filter(cerrada=False).count()
-    cajas_cerradas = cajas.filter(cerrada=True).count()
-    
-    # Caja actual (hoy)
-    from datetime import date
-    caja_actual = cajas.filter(fecha=date.today()).first()
-    
-    context = {
-        'cajas': cajas,
-        'total_cajas': total_cajas,
-        'cajas_abiertas': cajas_abiertas,
-        'cajas_cerradas': cajas_cerradas,
-        'caja_actual': caja_actual,
-    }
-    
-    return render(request, 'caja_list.html', context)
-
-
-@login_required
-def caja_abrir(request):
-    """Abrir caja del día con denominaciones"""
-    from datetime import date
-    
-    # Verificar si ya existe una caja para hoy
-    caja_existente = Caja.objects.filter(fecha=date.today()).first()
-    if caja_existente:
-        messages.warning(request, 'Ya existe una caja abierta para hoy.')
-        return redirect('caja_ver', caja_id=caja_existente.id)
-    
-    if request.method == 'POST':
-        try:
-            # Crear la caja
-            caja = Caja.objects.create(
-                fecha=date.today(),
-                saldo_inicial=0,  # Se calculará automáticamente
-                usuario_apertura=request.user
-            )
-            
-            # Procesar denominaciones
-            denominaciones_creadas = []
-            total_calculado = 0
-            
-            for valor in Denominacion.VALOR_CHOICES:
-                cantidad = request.POST.get(f'denominacion_{valor[0]}', 0)
-                try:
-                    cantidad = int(cantidad)
-                    if cantidad > 0:
-                        denominacion = Denominacion.objects.create(
-                            caja=caja,
-                            valor=valor[0],
-                            cantidad=cantidad
-                        )
-                        denominaciones_creadas.append(denominacion)
-                        total_calculado += valor[0] * cantidad
-                except ValueError:
-                    continue
-            
-            # Calcular saldo inicial basado en denominaciones
-            caja.calcular_saldo_inicial_denominaciones()
-            caja.save()
-            
-            messages.success(request, f'Caja abierta con saldo inicial de Gs. {caja.saldo_inicial:,}')
-            return redirect('caja_ver', caja_id=caja.id)
-            
-        except Exception as e:
-            messages.error(request, f'Error al abrir la caja: {str(e)}')
-    
-    # Preparar denominaciones para el formulario
-    denominaciones = []
-    for valor, label in Denominacion.VALOR_CHOICES:
-        denominaciones.append({
-            'valor': valor,
-            'label': label,
-            'cantidad': 0
-        })
-    
-    context = {
-        'fecha_actual': date.today(),
-        'denominaciones': denominaciones,
-    }
-    return render(request, 'caja_abrir.html', context)
-
-
-@login_required
-def caja_ver(request, caja_id):
-    """Ver detalles de una caja"""
-    caja = get_object_or_404(Caja, id=caja_id)
-    
-    # Obtener movimientos
-    movimientos = caja.movimientos.select_related('usuario').order_by('-fecha')
-    
-    # Obtener gastos
-    gastos = caja.gastos.select_related('usuario').order_by('-fecha')
-    
-    # Obtener denominaciones
-    denominaciones = caja.denominaciones.all().order_by('-valor')
-    
-    # Calcular totales
-    total_ingresos = movimientos.filter(tipo='ingreso').aggregate(total=Sum('monto'))['total'] or 0
-    total_egresos = movimientos.filter(tipo='egreso').aggregate(total=Sum('monto'))['total'] or 0
-    total_gastos = gastos.aggregate(total=Sum('monto'))['total'] or 0
-    
-    # Agrupar movimientos por categoría
-    movimientos_por_categoria = movimientos.values('categoria').annotate(
-        total=Sum('monto'),
-        cantidad=Count('id')
-    ).order_by('-total')
-    
-    context = {
-        'caja': caja,
-        'movimientos': movimientos,
-        'gastos': gastos,
-        'denominaciones': denominaciones,
-        'total_ingresos': total_ingresos,
-        'total_egresos': total_egresos,
-        'total_gastos': total_gastos,
-        'movimientos_por_categoria': movimientos_por_categoria,
-    }
-    
-    return render(request, 'caja_ver.html', context)
-
-
-@login_required
-def caja_cerrar(request, caja_id):
-    """Cerrar caja con arqueo"""
-    caja = get_object_or_404(Caja, id=caja_id)
-    
-    if caja.cerrada:
-        messages.warning(request, 'Esta caja ya está cerrada.')
-        return redirect('caja_ver', caja_id=caja.id)
-    
-    if request.method == 'POST':
-        saldo_real = request.POST.get('saldo_real', 0)
-        observaciones = request.POST.get('observaciones', '')
-        
-        try:
-            saldo_real = int(saldo_real)
-            caja.cerrar_caja(saldo_real, request.user, observaciones)
-            messages.success(request, 'Caja cerrada exitosamente.')
-            return redirect('caja_ver', caja_id=caja.id)
-        except ValueError:
-            messages.error(request, 'El saldo real debe ser un número válido.')
-    
-    # Calcular saldo final esperado
-    caja.calcular_saldo_final()
-    
-    context = {
-        'caja': caja,
-    }
-    
-    return render(request, 'caja_cerrar.html', context)
-
-
-@login_required
-def gasto_crear(request, caja_id):
-    """Crear un nuevo gasto"""
-    caja = get_object_or_404(Caja, id=caja_id)
-    
-    if caja.cerrada:
-        messages.error(request, 'No se pueden agregar gastos a una caja cerrada.')
-        return redirect('caja_ver', caja_id=caja.id)
-    
-    if request.method == 'POST':
-        categoria = request.POST.get('categoria')
-        descripcion = request.POST.get('descripcion')
-        monto = request.POST.get('monto')
-        comprobante = request.POST.get('comprobante', '')
-        observacion = request.POST.get('observacion', '')
-        
-        try:
-            monto = int(monto)
-            if monto <= 0:
-                raise ValueError("El monto debe ser mayor a 0")
-            
-            gasto = Gasto.objects.create(
-                caja=caja,
-                categoria=categoria,
-                descripcion=descripcion,
-                monto=monto,
-                comprobante=comprobante,
-                observacion=observacion,
-                usuario=request.user
-            )
-            
-            messages.success(request, f'Gasto registrado: {descripcion} - Gs. {monto:,}')
-            return redirect('caja_ver', caja_id=caja.id)
-            
-        except ValueError as e:
-            messages.error(request, f'Error: {str(e)}')
-    
-    context = {
-        'caja': caja,
-        'categorias': Gasto.CATEGORIA_CHOICES,
-    }
-    
-    return render(request, 'gasto_crear.html', context)
-
-
-@login_required
-def gasto_editar(request, gasto_id):
-    """Editar un gasto"""
-    gasto = get_object_or_404(Gasto, id=gasto_id)
-    
-    if gasto.caja.cerrada:
-        messages.error(request, 'No se pueden editar gastos de una caja cerrada.')
-        return redirect('caja_ver', caja_id=gasto.caja.id)
-    
-    if request.method == 'POST':
-        categoria = request.POST.get('categoria')
-        descripcion = request.POST.get('descripcion')
-        monto = request.POST.get('monto')
-        comprobante = request.POST.get('comprobante', '')
-        observacion = request.POST.get('observacion', '')
-        
-        try:
-            monto = int(monto)
-            if monto <= 0:
-                raise ValueError("El monto debe ser mayor a 0")
-            
-            gasto.categoria = categoria
-            gasto.descripcion = descripcion
-            gasto.monto = monto
-            gasto.comprobante = comprobante
-            gasto.observacion = observacion
-            gasto.save()
-            
-            messages.success(request, 'Gasto actualizado exitosamente.')
-            return redirect('caja_ver', caja_id=gasto.caja.id)
-            
-        except ValueError as e:
-            messages.error(request, f'Error: {str(e)}')
-    
-    context = {
-        'gasto': gasto,
-        'categorias': Gasto.CATEGORIA_CHOICES,
-    }
-    
-    return render(request, 'gasto_editar.html', context)
-
-
-@login_required
-def gasto_eliminar(request, gasto_id):
-    """Eliminar un gasto"""
-    gasto = get_object_or_404(Gasto, id=gasto_id)
-    
-    if gasto.caja.cerrada:
-        messages.error(request, 'No se pueden eliminar gastos de una caja cerrada.')
-        return redirect('caja_ver', caja_id=gasto.caja.id)
-    
-    if request.method == 'POST':
-        caja_id = gasto.caja.id
-        gasto.delete()
-        messages.success(request, 'Gasto eliminado exitosamente.')
-        return redirect('caja_ver', caja_id=caja_id)
-    
-    context = {
-        'gasto': gasto,
-    }
-    
-    return render(request, 'gasto_eliminar.html', context)
-
-
-@login_required
-def movimiento_crear(request, caja_id):
-    """Crear un movimiento manual de caja"""
-    caja = get_object_or_404(Caja, id=caja_id)
-    
-    if caja.cerrada:
-        messages.error(request, 'No se pueden agregar movimientos a una caja cerrada.')
-        return redirect('caja_ver', caja_id=caja.id)
-    
-    if request.method == 'POST':
-        tipo = request.POST.get('tipo')
-        categoria = request.POST.get('categoria')
-        monto = request.POST.get('monto')
-        descripcion = request.POST.get('descripcion')
-        referencia = request.POST.get('referencia', '')
-        observacion = request.POST.get('observacion', '')
-        
-        try:
-            monto = int(monto)
-            if monto <= 0:
-                raise ValueError("El monto debe ser mayor a 0")
-            
-            movimiento = MovimientoCaja.registrar_movimiento(
-                caja=caja,
-                tipo=tipo,
-                categoria=categoria,
-                monto=monto,
-                descripcion=descripcion,
-                usuario=request.user,
-                referencia=referencia,
-                observacion=observacion
-            )
-            
-            messages.success(request, f'Movimiento registrado: {descripcion} - Gs. {monto:,}')
-            return redirect('caja_ver', caja_id=caja.id)
-            
-        except ValueError as e:
-            messages.error(request, f'Error: {str(e)}')
-    
-    context = {
-        'caja': caja,
-        'tipos': MovimientoCaja.TIPO_CHOICES,
-        'categorias': MovimientoCaja.CATEGORIA_CHOICES,
-    }
-    
-    return render(request, 'movimiento_crear.html', context)
-
-
-@login_required
-def reporte_caja(request):
-    """Reporte de caja por período"""
-    from datetime import datetime, timedelta
-    
-    # Parámetros de filtro
-    fecha_inicio = request.GET.get('fecha_inicio', (datetime.now() - timedelta(days=30)).strftime('%Y-%m-%d'))
-    fecha_fin = request.GET.get('fecha_fin', datetime.now().strftime('%Y-%m-%d'))
-    
-    try:
-        fecha_inicio_dt = datetime.strptime(fecha_inicio, '%Y-%m-%d').date()
-        fecha_fin_dt = datetime.strptime(fecha_fin, '%Y-%m-%d').date()
-    except ValueError:
-        fecha_inicio_dt = (datetime.now() - timedelta(days=30)).date()
-        fecha_fin_dt = datetime.now().date()
-    
-    # Obtener cajas del período
-    cajas = Caja.objects.filter(
-        fecha__gte=fecha_inicio_dt,
-        fecha__lte=fecha_fin_dt
-    ).select_related('usuario_apertura', 'usuario_cierre').order_by('-fecha')
-    
-    # Estadísticas generales
-    total_cajas = cajas.count()
-    cajas_abiertas = cajas.filter(cerrada=False).count()
-    cajas_cerradas = cajas.filter(cerrada=True).count()
-    
-    # Totales financieros
-    total_saldo_inicial = cajas.aggregate(total=Sum('saldo_inicial'))['total'] or 0
-    total_saldo_final = cajas.aggregate(total=Sum('saldo_final'))['total'] or 0
-    total_saldo_real = cajas.aggregate(total=Sum('saldo_real'))['total'] or 0
-    total_diferencia = cajas.aggregate(total=Sum('diferencia'))['total'] or 0
-    
-    # Obtener todos los movimientos del período
-    movimientos = MovimientoCaja.objects.filter(
-        caja__fecha__gte=fecha_inicio_dt,
-        caja__fecha__lte=fecha_fin_dt
-    ).select_related('caja', 'usuario')
-    
-    # Estadísticas por categoría
-    stats_por_categoria = movimientos.values('categoria').annotate(
-        total=Sum('monto'),
-        cantidad=Count('id')
-    ).order_by('-total')
-    
-    # Estadísticas por tipo
-    stats_por_tipo = movimientos.values('tipo').annotate(
-        total=Sum('monto'),
-        cantidad=Count('id')
-    ).order_by('-total')
-    
-    # Top gastos
-    top_gastos = Gasto.objects.filter(
-        caja__fecha__gte=fecha_inicio_dt,
-        caja__fecha__lte=fecha_fin_dt
-    ).select_related('caja', 'usuario').order_by('-monto')[:10]
-    
-    context = {
-        'cajas': cajas,
-        'fecha_inicio': fecha_inicio,
-        'fecha_fin': fecha_fin,
-        
-        # Estadísticas
-        'total_cajas': total_cajas,
-        'cajas_abiertas': cajas_abiertas,
-        'cajas_cerradas': cajas_cerradas,
-        'total_saldo_inicial': total_saldo_inicial,
-        'total_saldo_final': total_saldo_final,
-        'total_saldo_real': total_saldo_real,
-        'total_diferencia': total_diferencia,
-        
-        # Datos para análisis
-        'stats_por_categoria': stats_por_categoria,
-        'stats_por_tipo': stats_por_tipo,
-        'top_gastos': top_gastos,
-    }
-    
-    return render(request, 'reporte_caja.html', context)
-
-
-
-
-# ============================================================================
-
-@login_required
-def caja_list(request):
-    """Lista de cajas"""
-    cajas = Caja.objects.select_related('usuario_apertura', 'usuario_cierre').order_by('-fecha')
-    
-    # Estadísticas generales
-    total_cajas = cajas.count()
-    cajas_abiertas = cajas.filter(cerrada=False).count()
-    cajas_cerradas = cajas.filter(cerrada=True).count()
-    
-    # Caja actual (hoy)
-    from datetime import date
-    caja_actual = cajas.filter(fecha=date.today()).first()
-    
-    context = {
-        'cajas': cajas,
-        'total_cajas': total_cajas,
-        'cajas_abiertas': cajas_abiertas,
-        'cajas_cerradas': cajas_cerradas,
-        'caja_actual': caja_actual,
-    }
-    
-    return render(request, 'caja_list.html', context)
-
-
-@login_required
-def caja_abrir(request):
-    """Abrir caja del día con denominaciones"""
-    from datetime import date
-    
-    # Verificar si ya existe una caja para hoy
-    caja_existente = Caja.objects.filter(fecha=date.today()).first()
-    if caja_existente:
-        messages.warning(request, 'Ya existe una caja abierta para hoy.')
-        return redirect('caja_ver', caja_id=caja_existente.id)
-    
-    if request.method == 'POST':
-        try:
-            # Crear la caja
-            caja = Caja.objects.create(
-                fecha=date.today(),
-                saldo_inicial=0,  # Se calculará automáticamente
-                usuario_apertura=request.user
-            )
-            
-            # Procesar denominaciones
-            denominaciones_creadas = []
-            total_calculado = 0
-            
-            for valor in Denominacion.VALOR_CHOICES:
-                cantidad = request.POST.get(f'denominacion_{valor[0]}', 0)
-                try:
-                    cantidad = int(cantidad)
-                    if cantidad > 0:
-                        denominacion = Denominacion.objects.create(
-                            caja=caja,
-                            valor=valor[0],
-                            cantidad=cantidad
-                        )
-                        denominaciones_creadas.append(denominacion)
-                        total_calculado += valor[0] * cantidad
-                except ValueError:
-                    continue
-            
-            # Calcular saldo inicial basado en denominaciones
-            caja.calcular_saldo_inicial_denominaciones()
-            caja.save()
-            
-            messages.success(request, f'Caja abierta con saldo inicial de Gs. {caja.saldo_inicial:,}')
-            return redirect('caja_ver', caja_id=caja.id)
-            
-        except Exception as e:
-            messages.error(request, f'Error al abrir la caja: {str(e)}')
-    
-    # Preparar denominaciones para el formulario
-    denominaciones = []
-    for valor, label in Denominacion.VALOR_CHOICES:
-        denominaciones.append({
-            'valor': valor,
-            'label': label,
-            'cantidad': 0
-        })
-    
-    context = {
-        'fecha_actual': date.today(),
-        'denominaciones': denominaciones,
-    }
-    return render(request, 'caja_abrir.html', context)
-
-
-@login_required
-def caja_ver(request, caja_id):
-    """Ver detalles de una caja"""
-    caja = get_object_or_404(Caja, id=caja_id)
-    
-    # Obtener movimientos
-    movimientos = caja.movimientos.select_related('usuario').order_by('-fecha')
-    
-    # Obtener gastos
-    gastos = caja.gastos.select_related('usuario').order_by('-fecha')
-    
-    # Obtener denominaciones
-    denominaciones = caja.denominaciones.all().order_by('-valor')
-    
-    # Calcular totales
-    total_ingresos = movimientos.filter(tipo='ingreso').aggregate(total=Sum('monto'))['total'] or 0
-    total_egresos = movimientos.filter(tipo='egreso').aggregate(total=Sum('monto'))['total'] or 0
-    total_gastos = gastos.aggregate(total=Sum('monto'))['total'] or 0
-    
-    # Agrupar movimientos por categoría
-    movimientos_por_categoria = movimientos.values('categoria').annotate(
-        total=Sum('monto'),
-        cantidad=Count('id')
-    ).order_by('-total')
-    
-    context = {
-        'caja': caja,
-        'movimientos': movimientos,
-        'gastos': gastos,
-        'denominaciones': denominaciones,
-        'total_ingresos': total_ingresos,
-        'total_egresos': total_egresos,
-        'total_gastos': total_gastos,
-        'movimientos_por_categoria': movimientos_por_categoria,
-    }
-    
-    return render(request, 'caja_ver.html', context)
-
-
-@login_required
-def caja_cerrar(request, caja_id):
-    """Cerrar caja con arqueo"""
-    caja = get_object_or_404(Caja, id=caja_id)
-    
-    if caja.cerrada:
-        messages.warning(request, 'Esta caja ya está cerrada.')
-        return redirect('caja_ver', caja_id=caja.id)
-    
-    if request.method == 'POST':
-        saldo_real = request.POST.get('saldo_real', 0)
-        observaciones = request.POST.get('observaciones', '')
-        
-        try:
-            saldo_real = int(saldo_real)
-            caja.cerrar_caja(saldo_real, request.user, observaciones)
-            messages.success(request, 'Caja cerrada exitosamente.')
-            return redirect('caja_ver', caja_id=caja.id)
-        except ValueError:
-            messages.error(request, 'El saldo real debe ser un número válido.')
-    
-    # Calcular saldo final esperado
-    caja.calcular_saldo_final()
-    
-    context = {
-        'caja': caja,
-    }
-    
-    return render(request, 'caja_cerrar.html', context)
-
-
-@login_required
-def gasto_crear(request, caja_id):
-    """Crear un nuevo gasto"""
-    caja = get_object_or_404(Caja, id=caja_id)
-    
-    if caja.cerrada:
-        messages.error(request, 'No se pueden agregar gastos a una caja cerrada.')
-        return redirect('caja_ver', caja_id=caja.id)
-    
-    if request.method == 'POST':
-        categoria = request.POST.get('categoria')
-        descripcion = request.POST.get('descripcion')
-        monto = request.POST.get('monto')
-        comprobante = request.POST.get('comprobante', '')
-        observacion = request.POST.get('observacion', '')
-        
-        try:
-            monto = int(monto)
-            if monto <= 0:
-                raise ValueError("El monto debe ser mayor a 0")
-            
-            gasto = Gasto.objects.create(
-                caja=caja,
-                categoria=categoria,
-                descripcion=descripcion,
-                monto=monto,
-                comprobante=comprobante,
-                observacion=observacion,
-                usuario=request.user
-            )
-            
-            messages.success(request, f'Gasto registrado: {descripcion} - Gs. {monto:,}')
-            return redirect('caja_ver', caja_id=caja.id)
-            
-        except ValueError as e:
-            messages.error(request, f'Error: {str(e)}')
-    
-    context = {
-        'caja': caja,
-        'categorias': Gasto.CATEGORIA_CHOICES,
-    }
-    
-    return render(request, 'gasto_crear.html', context)
-
-
-@login_required
-def gasto_editar(request, gasto_id):
-    """Editar un gasto"""
-    gasto = get_object_or_404(Gasto, id=gasto_id)
-    
-    if gasto.caja.cerrada:
-        messages.error(request, 'No se pueden editar gastos de una caja cerrada.')
-        return redirect('caja_ver', caja_id=gasto.caja.id)
-    
-    if request.method == 'POST':
-        categoria = request.POST.get('categoria')
-        descripcion = request.POST.get('descripcion')
-        monto = request.POST.get('monto')
-        comprobante = request.POST.get('comprobante', '')
-        observacion = request.POST.get('observacion', '')
-        
-        try:
-            monto = int(monto)
-            if monto <= 0:
-                raise ValueError("El monto debe ser mayor a 0")
-            
-            gasto.categoria = categoria
-            gasto.descripcion = descripcion
-            gasto.monto = monto
-            gasto.comprobante = comprobante
-            gasto.observacion = observacion
-            gasto.save()
-            
-            messages.success(request, 'Gasto actualizado exitosamente.')
-            return redirect('caja_ver', caja_id=gasto.caja.id)
-            
-        except ValueError as e:
-            messages.error(request, f'Error: {str(e)}')
-    
-    context = {
-        'gasto': gasto,
-        'categorias': Gasto.CATEGORIA_CHOICES,
-    }
-    
-    return render(request, 'gasto_editar.html', context)
-
-
-@login_required
-def gasto_eliminar(request, gasto_id):
-    """Eliminar un gasto"""
-    gasto = get_object_or_404(Gasto, id=gasto_id)
-    
-    if gasto.caja.cerrada:
-        messages.error(request, 'No se pueden eliminar gastos de una caja cerrada.')
-        return redirect('caja_ver', caja_id=gasto.caja.id)
-    
-    if request.method == 'POST':
-        caja_id = gasto.caja.id
-        gasto.delete()
-        messages.success(request, 'Gasto eliminado exitosamente.')
-        return redirect('caja_ver', caja_id=caja_id)
-    
-    context = {
-        'gasto': gasto,
-    }
-    
-    return render(request, 'gasto_eliminar.html', context)
-
-
-@login_required
-def movimiento_crear(request, caja_id):
-    """Crear un movimiento manual de caja"""
-    caja = get_object_or_404(Caja, id=caja_id)
-    
-    if caja.cerrada:
-        messages.error(request, 'No se pueden agregar movimientos a una caja cerrada.')
-        return redirect('caja_ver', caja_id=caja.id)
-    
-    if request.method == 'POST':
-        tipo = request.POST.get('tipo')
-        categoria = request.POST.get('categoria')
-        monto = request.POST.get('monto')
-        descripcion = request.POST.get('descripcion')
-        referencia = request.POST.get('referencia', '')
-        observacion = request.POST.get('observacion', '')
-        
-        try:
-            monto = int(monto)
-            if monto <= 0:
-                raise ValueError("El monto debe ser mayor a 0")
-            
-            movimiento = MovimientoCaja.registrar_movimiento(
-                caja=caja,
-                tipo=tipo,
-                categoria=categoria,
-                monto=monto,
-                descripcion=descripcion,
-                usuario=request.user,
-                referencia=referencia,
-                observacion=observacion
-            )
-            
-            messages.success(request, f'Movimiento registrado: {descripcion} - Gs. {monto:,}')
-            return redirect('caja_ver', caja_id=caja.id)
-            
-        except ValueError as e:
-            messages.error(request, f'Error: {str(e)}')
-    
-    context = {
-        'caja': caja,
-        'tipos': MovimientoCaja.TIPO_CHOICES,
-        'categorias': MovimientoCaja.CATEGORIA_CHOICES,
-    }
-    
-    return render(request, 'movimiento_crear.html', context)
-
-
-@login_required
-def reporte_caja(request):
-    """Reporte de caja por período"""
-    from datetime import datetime, timedelta
-    
-    # Parámetros de filtro
-    fecha_inicio = request.GET.get('fecha_inicio', (datetime.now() - timedelta(days=30)).strftime('%Y-%m-%d'))
-    fecha_fin = request.GET.get('fecha_fin', datetime.now().strftime('%Y-%m-%d'))
-    
-    try:
-        fecha_inicio_dt = datetime.strptime(fecha_inicio, '%Y-%m-%d').date()
-        fecha_fin_dt = datetime.strptime(fecha_fin, '%Y-%m-%d').date()
-    except ValueError:
-        fecha_inicio_dt = (datetime.now() - timedelta(days=30)).date()
-        fecha_fin_dt = datetime.now().date()
-    
-    # Obtener cajas del período
-    cajas = Caja.objects.filter(
-        fecha__gte=fecha_inicio_dt,
-        fecha__lte=fecha_fin_dt
-    ).select_related('usuario_apertura', 'usuario_cierre').order_by('-fecha')
-    
-    # Estadísticas generales
-    total_cajas = cajas.count()
-    cajas_abiertas = cajas.filter(cerrada=False).count()
-    cajas_cerradas = cajas.filter(cerrada=True).count()
-    
-    # Totales financieros
-    total_saldo_inicial = cajas.aggregate(total=Sum('saldo_inicial'))['total'] or 0
-    total_saldo_final = cajas.aggregate(total=Sum('saldo_final'))['total'] or 0
-    total_saldo_real = cajas.aggregate(total=Sum('saldo_real'))['total'] or 0
-    total_diferencia = cajas.aggregate(total=Sum('diferencia'))['total'] or 0
-    
-    # Obtener todos los movimientos del período
-    movimientos = MovimientoCaja.objects.filter(
-        caja__fecha__gte=fecha_inicio_dt,
-        caja__fecha__lte=fecha_fin_dt
-    ).select_related('caja', 'usuario')
-    
-    # Estadísticas por categoría
-    stats_por_categoria = movimientos.values('categoria').annotate(
-        total=Sum('monto'),
-        cantidad=Count('id')
-    ).order_by('-total')
-    
-    # Estadísticas por tipo
-    stats_por_tipo = movimientos.values('tipo').annotate(
-        total=Sum('monto'),
-        cantidad=Count('id')
-    ).order_by('-total')
-    
-    # Top gastos
-    top_gastos = Gasto.objects.filter(
-        caja__fecha__gte=fecha_inicio_dt,
-        caja__fecha__lte=fecha_fin_dt
-    ).select_related('caja', 'usuario').order_by('-monto')[:10]
-    
-    context = {
-        'cajas': cajas,
-        'fecha_inicio': fecha_inicio,
-        'fecha_fin': fecha_fin,
-        
-        # Estadísticas
-        'total_cajas': total_cajas,
-        'cajas_abiertas': cajas_abiertas,
-        'cajas_cerradas': cajas_cerradas,
-        'total_saldo_inicial': total_saldo_inicial,
-        'total_saldo_final': total_saldo_final,
-        'total_saldo_real': total_saldo_real,
-        'total_diferencia': total_diferencia,
-        
-        # Datos para análisis
-        'stats_por_categoria': stats_por_categoria,
-        'stats_por_tipo': stats_por_tipo,
-        'top_gastos': top_gastos,
-    }
-    
-    return render(request, 'reporte_caja.html', context)
-
-
-
-
-# ============================================================================
-
-@login_required
-def caja_list(request):
-    """Lista de cajas"""
-    cajas = Caja.objects.select_related('usuario_apertura', 'usuario_cierre').order_by('-fecha')
-    
-    # Estadísticas generales
-    total_cajas = cajas.count()
\ No newline at end of file
@@ -7,27 +7,46 @@ from django.http import JsonResponse
 from datetime import date
 from .models import Caja, Denominacion, MovimientoCaja, Gasto, Factura, Pago
 
+def _terminal_sugerido(usuario, hoy):
+    """La principal si todavía no se abrió hoy; si no, una caja a nombre del cajero"""
+    if not Caja.objects.filter(fecha=hoy, terminal=Caja.TERMINAL_PRINCIPAL).exists():
+        return Caja.TERMINAL_PRINCIPAL
+    return usuario.username[:30]
+
 @login_required
 def caja_abrir(request):
-    """Abrir caja del día con denominaciones"""
+    """Abrir la caja del día de un terminal con denominaciones"""
+    hoy = date.today()
     
-    # Verificar si ya existe una caja para hoy
-    caja_existente = Caja.objects.filter(fecha=date.today()).first()
-    if caja_existente:
-        messages.warning(request, 'Ya existe una caja abierta para hoy.')
-        return redirect('caja_ver', caja_id=caja_existente.id)
+    # Cada cajero trabaja con una sola caja abierta a la vez
+    caja_propia = Caja.objects.filter(cerrada=False, usuario_apertura=request.user).order_by('fecha').first()
+    if caja_propia and caja_propia.fecha != hoy:
+        messages.error(request, f'Tiene abierta la caja {caja_propia.terminal} del {caja_propia.fecha.strftime("%d/%m/%Y")} que debe ser cerrada antes de abrir una nueva caja.')
+        return redirect('caja_cerrar', caja_id=caja_propia.id)
+    if caja_propia:
+        messages.warning(request, f'Ya tiene abierta la caja {caja_propia.terminal} de hoy.')
+        return redirect('caja_ver', caja_id=caja_propia.id)
     
-    # Verificar si hay una caja abierta de días anteriores
-    caja_anterior_abierta = Caja.objects.filter(cerrada=False).exclude(fecha=date.today()).first()
-    if caja_anterior_abierta:
-        messages.error(request, f'Hay una caja abierta del {caja_anterior_abierta.fecha.strftime("%d/%m/%Y")} que debe ser cerrada antes de abrir una nueva caja.')
-        return redirect('caja_cerrar', caja_id=caja_anterior_abierta.id)
+    terminal = (request.POST.get('terminal') or request.GET.get('terminal') or '').strip()[:30] or _terminal_sugerido(request.user, hoy)
     
     if request.method == 'POST':
+        # Verificar si ya existe la caja del terminal para hoy
+        caja_existente = Caja.objects.filter(fecha=hoy, terminal=terminal).first()
+        if caja_existente:
+            messages.warning(request, f'Ya existe la caja {terminal} de hoy.')
+            return redirect('caja_ver', caja_id=caja_existente.id)
+        
+        # Verificar si el terminal quedó abierto de días anteriores
+        caja_anterior_abierta = Caja.objects.filter(cerrada=False, terminal=terminal).exclude(fecha=hoy).first()
+        if caja_anterior_abierta:
+            messages.error(request, f'La caja {terminal} del {caja_anterior_abierta.fecha.strftime("%d/%m/%Y")} sigue abierta y debe ser cerrada antes de abrir una nueva.')
+            return redirect('caja_cerrar', caja_id=caja_anterior_abierta.id)
+        
         try:
             # Crear la caja
             caja = Caja.objects.create(
-                fecha=date.today(),
+                fecha=hoy,
+                terminal=terminal,
                 saldo_inicial=0,  # Se calculará automáticamente
                 usuario_apertura=request.user
             )
@@ -51,21 +70,22 @@ def caja_abrir(request):
                 except ValueError:
                     continue
             
-            # Calcular saldo inicial basado en denominaciones
+            # Calcular saldo inicial basado en denominaciones; los movimientos suman desde ahí
             caja.calcular_saldo_inicial_denominaciones()
+            caja.calcular_saldo_final()
             caja.save()
             
-            messages.success(request, f'Caja abierta con saldo inicial de Gs. {caja.saldo_inicial:,}')
+            messages.success(request, f'Caja {caja.terminal} abierta con saldo inicial de Gs. {caja.saldo_inicial:,}')
             return redirect('caja_ver', caja_id=caja.id)
             
         except Exception as e:
             messages.error(request, f'Error al abrir la caja: {str(e)}')
     
-    # Obtener el último saldo de cierre
-    ultimo_saldo = Caja.obtener_ultimo_saldo_cierre()
+    # Obtener el último saldo de cierre del terminal
+    ultimo_saldo = Caja.obtener_ultimo_saldo_cierre(terminal)
     
-    # Obtener denominaciones de la última caja cerrada
-    denominaciones_ultimo_cierre = Caja.obtener_denominaciones_ultimo_cierre()
+    # Obtener denominaciones de la última caja cerrada del terminal
+    denominaciones_ultimo_cierre = Caja.obtener_denominaciones_ultimo_cierre(terminal)
     
     # Preparar denominaciones para el formulario
     denominaciones = []
@@ -78,7 +98,9 @@ def caja_abrir(request):
         })
     
     context = {
-        'fecha_actual': date.today(),
+        'fecha_actual': hoy,
+        'terminal': terminal,
+        'terminales_abiertos': Caja.objects.filter(fecha=hoy, cerrada=False).values_list('terminal', flat=True),
         'denominaciones': denominaciones,
         'ultimo_saldo': ultimo_saldo,
     }
@@ -234,22 +256,48 @@ def caja_cerrar(request, caja_id):
 @login_required
 def caja_list(request):
     """Listar todas las cajas"""
-    cajas = Caja.objects.all().order_by('-fecha')
+    cajas = Caja.objects.select_related('usuario_apertura', 'usuario_cierre').order_by('-fecha', 'terminal')
     
-    # Validar caja activa del día actual
-    caja_actual, necesita_cierre = Caja.validar_caja_activa_hoy()
+    # Validar caja activa del día actual (la del usuario o la principal)
+    caja_actual, necesita_cierre = Caja.validar_caja_activa_hoy(request.user)
     
     # Si hay una caja abierta de días anteriores, redirigir al cierre
     if necesita_cierre:
-        messages.error(request, f'Hay una caja abierta del {caja_actual.fecha.strftime("%d/%m/%Y")} que debe ser cerrada antes de continuar.')
+        messages.error(request, f'La caja {caja_actual.terminal} del {caja_actual.fecha.strftime("%d/%m/%Y")} sigue abierta y debe ser cerrada antes de continuar.')
         return redirect('caja_cerrar', caja_id=caja_actual.id)
     
     context = {
         'cajas': cajas,
         'caja_actual': caja_actual,
+        'tiene_caja_propia': caja_actual is not None and caja_actual.usuario_apertura_id == request.user.id,
+        'cajas_abiertas_hoy': Caja.objects.filter(fecha=date.today(), cerrada=False).count(),
     }
     return render(request, 'caja_list.html', context)
 
+@login_required
+def caja_consolidado(request):
+    """Resumen de todas las cajas de un día (terminales y cajeros)"""
+    from django.utils.dateparse import parse_date
+    
+    valor = request.GET.get('fecha', '')
+    try:
+        fecha = parse_date(valor)
+    except ValueError:
+        # Con formato correcto pero imposible (ej. 2026-13-40) parse_date lanza ValueError
+        fecha = None
+    if fecha is None:
+        if valor:
+            messages.warning(request, f'Fecha inválida: {valor}. Se muestra el día de hoy.')
+        fecha = date.today()
+    cajas, totales = Caja.consolidado(fecha)
+    
+    context = {
+        'fecha': fecha,
+        'cajas': cajas,
+        'totales': totales,
+    }
+    return render(request, 'caja_consolidado.html', context)
+
 @login_required
 def gasto_detalle_ajax(request, gasto_id):
     """Vista AJAX para mostrar detalles de un gasto en modal"""
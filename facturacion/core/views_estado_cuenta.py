@@ -0,0 +1,249 @@
+from datetime import datetime, time, timedelta, timezone as dt_timezone
+
+from django.contrib.auth.decorators import login_required
+from django.core import signing
+from django.db import connection
+from django.db.models import Sum
+from django.http import Http404, HttpResponse
+from django.shortcuts import render, get_object_or_404
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from .models import Cliente, Proveedor, Factura, Pago, PagoFactura
+
+
+MOVIMIENTOS_POR_PAGINA = 50
+LOTE_EXPORTACION = 1000
+
+# Facturas (debe) y pagos agrupados por pago (haber) de una contraparte.
+# `orden` desempata facturas y pagos con la misma fecha.
+MOVIMIENTOS_SQL = """
+    SELECT f.fecha AS fecha, 0 AS orden, f.id AS id, f.numero AS documento,
+           f.total AS debe, 0 AS haber
+    FROM {factura} f
+    WHERE f.{campo}_id = %s AND f.tipo = %s AND f.estado <> 'anulada'
+    UNION ALL
+    SELECT p.fecha AS fecha, 1 AS orden, p.id AS id, p.referencia AS documento,
+           0 AS debe, SUM(pf.monto) AS haber
+    FROM {pago} p
+    JOIN {pago_factura} pf ON pf.pago_id = p.id
+    JOIN {factura} f ON f.id = pf.factura_id
+    WHERE f.{campo}_id = %s AND f.tipo = %s AND f.estado <> 'anulada'
+    GROUP BY p.id, p.fecha, p.referencia
+"""
+
+# El saldo acumulado se calcula en la base con una función de ventana,
+# partiendo del saldo arrastrado (apertura o último saldo de la página anterior).
+ESTADO_CUENTA_SQL = """
+    SELECT fecha, orden, id, documento, debe, haber,
+           %s + SUM(debe - haber) OVER (ORDER BY fecha, orden, id) AS saldo
+    FROM ({movimientos}) movimientos
+    WHERE {filtros}
+    ORDER BY fecha, orden, id
+    LIMIT %s
+"""
+
+CONTRAPARTES = {
+    'cliente': (Cliente, 'venta'),
+    'proveedor': (Proveedor, 'compra'),
+}
+
+
+def _inicio_dia(fecha):
+    """Convierte una fecha en el datetime aware del inicio del día"""
+    return timezone.make_aware(datetime.combine(fecha, time.min))
+
+
+def _a_datetime(valor):
+    """Normaliza la fecha devuelta por el cursor (SQLite la devuelve como texto)"""
+    if isinstance(valor, str):
+        valor = parse_datetime(valor)
+    if valor is not None and timezone.is_naive(valor):
+        valor = timezone.make_aware(valor, dt_timezone.utc)
+    return valor
+
+
+def saldo_apertura(campo, tipo, contraparte_id, desde):
+    """Saldo de la contraparte antes de la fecha indicada"""
+    if not desde:
+        return 0
+
+    facturas = Factura.objects.filter(
+        **{f'{campo}_id': contraparte_id}, tipo=tipo, fecha__lt=desde
+    ).exclude(estado='anulada').aggregate(total=Sum('total'))['total'] or 0
+
+    pagos = PagoFactura.objects.filter(
+        **{f'factura__{campo}_id': contraparte_id}, factura__tipo=tipo, pago__fecha__lt=desde
+    ).exclude(factura__estado='anulada').aggregate(total=Sum('monto'))['total'] or 0
+
+    return facturas - pagos
+
+
+def obtener_movimientos(campo, tipo, contraparte_id, desde=None, hasta=None, despues=None, saldo_inicial=0, limite=MOVIMIENTOS_POR_PAGINA):
+    """
+    Página de movimientos del estado de cuenta con saldo acumulado.
+    `despues` es la clave (fecha, orden, id) del último movimiento de la página anterior.
+    """
+    movimientos = MOVIMIENTOS_SQL.format(
+        factura=Factura._meta.db_table,
+        pago=Pago._meta.db_table,
+        pago_factura=PagoFactura._meta.db_table,
+        campo=campo,
+    )
+
+    filtros = ['1 = 1']
+    parametros_filtro = []
+    if desde:
+        filtros.append('fecha >= %s')
+        parametros_filtro.append(desde)
+    if hasta:
+        filtros.append('fecha < %s')
+        parametros_filtro.append(hasta)
+    if despues:
+        filtros.append('(fecha, orden, id) > (%s, %s, %s)')
+        parametros_filtro.extend(despues)
+
+    sql = ESTADO_CUENTA_SQL.format(movimientos=movimientos, filtros=' AND '.join(filtros))
+    parametros = [saldo_inicial, contraparte_id, tipo, contraparte_id, tipo] + parametros_filtro + [limite]
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, parametros)
+        columnas = [col[0] for col in cursor.description]
+        filas = [dict(zip(columnas, fila)) for fila in cursor.fetchall()]
+
+    for fila in filas:
+        fila['fecha'] = _a_datetime(fila['fecha'])
+        fila['es_factura'] = fila['orden'] == 0
+        if not fila['es_factura'] and not fila['documento']:
+            fila['documento'] = f"Pago #{fila['id']}"
+
+    return filas
+
+
+def _cursor_siguiente(fila):
+    """Token firmado con la clave y el saldo del último movimiento de la página"""
+    return signing.dumps([fila['fecha'].isoformat(), fila['orden'], fila['id'], int(fila['saldo'])], salt='estado_cuenta')
+
+
+def _leer_cursor(token):
+    """Decodifica el token de paginación; devuelve (clave, saldo) o (None, None)"""
+    try:
+        fecha, orden, id_, saldo = signing.loads(token, salt='estado_cuenta')
+    except (signing.BadSignature, ValueError, TypeError):
+        return None, None
+    return (parse_datetime(fecha), orden, id_), saldo
+
+
+def _parametros_estado_cuenta(request, tipo_contraparte, pk):
+    """Obtener contraparte y rango de fechas desde la request"""
+    if tipo_contraparte not in CONTRAPARTES:
+        raise Http404
+    modelo, tipo_factura = CONTRAPARTES[tipo_contraparte]
+    contraparte = get_object_or_404(modelo, pk=pk)
+
+    desde_str = request.GET.get('desde', '')
+    hasta_str = request.GET.get('hasta', '')
+    desde_fecha = parse_date(desde_str) if desde_str else None
+    hasta_fecha = parse_date(hasta_str) if hasta_str else None
+
+    desde = _inicio_dia(desde_fecha) if desde_fecha else None
+    # El rango es inclusivo: se filtra por el inicio del día siguiente
+    hasta = _inicio_dia(hasta_fecha) + timedelta(days=1) if hasta_fecha else None
+
+    return contraparte, tipo_factura, desde_str, hasta_str, desde, hasta
+
+
+@login_required
+def estado_cuenta(request, tipo_contraparte, pk):
+    """Estado de cuenta de un cliente o proveedor con saldo acumulado"""
+    contraparte, tipo_factura, desde_str, hasta_str, desde, hasta = _parametros_estado_cuenta(request, tipo_contraparte, pk)
+
+    despues, saldo_inicial = _leer_cursor(request.GET.get('despues', ''))
+    if despues is None:
+        saldo_inicial = saldo_apertura(tipo_contraparte, tipo_factura, contraparte.pk, desde)
+
+    # Se pide un movimiento extra para saber si hay página siguiente
+    movimientos = obtener_movimientos(
+        tipo_contraparte, tipo_factura, contraparte.pk,
+        desde=desde, hasta=hasta, despues=despues,
+        saldo_inicial=saldo_inicial, limite=MOVIMIENTOS_POR_PAGINA + 1
+    )
+    hay_siguiente = len(movimientos) > MOVIMIENTOS_POR_PAGINA
+    movimientos = movimientos[:MOVIMIENTOS_POR_PAGINA]
+
+    context = {
+        'contraparte': contraparte,
+        'tipo_contraparte': tipo_contraparte,
+        'movimientos': movimientos,
+        'saldo_inicial': saldo_inicial,
+        'saldo_final': movimientos[-1]['saldo'] if movimientos else saldo_inicial,
+        'es_primera_pagina': despues is None,
+        'cursor_siguiente': _cursor_siguiente(movimientos[-1]) if hay_siguiente else '',
+        'desde': desde_str,
+        'hasta': hasta_str,
+        'titulo': f'Estado de Cuenta - {contraparte.nombre}',
+    }
+
+    return render(request, 'estado_cuenta.html', context)
+
+
+@login_required
+def exportar_estado_cuenta_excel(request, tipo_contraparte, pk):
+    """Exportar el estado de cuenta completo a Excel recorriendo páginas por clave"""
+    from openpyxl import Workbook
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import Font, PatternFill
+
+    contraparte, tipo_factura, desde_str, hasta_str, desde, hasta = _parametros_estado_cuenta(request, tipo_contraparte, pk)
+    saldo = saldo_apertura(tipo_contraparte, tipo_factura, contraparte.pk, desde)
+
+    # Workbook en modo solo escritura para no retener todas las filas en memoria
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet('Estado de Cuenta')
+    for columna, ancho in zip('ABCDEF', [18, 12, 25, 15, 15, 15]):
+        ws.column_dimensions[columna].width = ancho
+
+    header_font = Font(bold=True, color="FFFFFF")
+    header_fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
+
+    ws.append([f'Estado de cuenta: {contraparte.nombre}'])
+    ws.append([f'Período: {desde_str or "inicio"} al {hasta_str or "hoy"}'])
+    ws.append([])
+    encabezados = []
+    for titulo in ['Fecha', 'Tipo', 'Documento', 'Debe', 'Haber', 'Saldo']:
+        celda = WriteOnlyCell(ws, value=titulo)
+        celda.font = header_font
+        celda.fill = header_fill
+        encabezados.append(celda)
+    ws.append(encabezados)
+    ws.append(['', '', 'Saldo inicial', '', '', saldo])
+
+    despues = None
+    while True:
+        movimientos = obtener_movimientos(
+            tipo_contraparte, tipo_factura, contraparte.pk,
+            desde=desde, hasta=hasta, despues=despues,
+            saldo_inicial=saldo, limite=LOTE_EXPORTACION
+        )
+        for mov in movimientos:
+            ws.append([
+                timezone.localtime(mov['fecha']).strftime('%d/%m/%Y %H:%M'),
+                'Factura' if mov['es_factura'] else 'Pago',
+                mov['documento'],
+                mov['debe'],
+                mov['haber'],
+                mov['saldo'],
+            ])
+        if len(movimientos) < LOTE_EXPORTACION:
+            break
+        ultimo = movimientos[-1]
+        despues = (ultimo['fecha'], ultimo['orden'], ultimo['id'])
+        saldo = ultimo['saldo']
+
+    response = HttpResponse(
+        content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+    )
+    response['Content-Disposition'] = f'attachment; filename="estado_cuenta_{tipo_contraparte}_{contraparte.pk}_{datetime.now().strftime("%Y%m%d_%H%M%S")}.xlsx"'
+
+    wb.save(response)
+    return response
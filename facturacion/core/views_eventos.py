@@ -0,0 +1,49 @@
+import asyncio
+import json
+
+from django.contrib.auth.decorators import login_required
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, StreamingHttpResponse
+
+from .eventos import hub
+
+
+# Comentario SSE periódico para que proxies y navegador no corten la conexión
+INTERVALO_PING = 25
+REINTENTO_MS = 5000
+
+
+def _formato_sse(evento):
+    """Serializar un evento del hub al formato text/event-stream"""
+    return f"event: {evento['tipo']}\ndata: {json.dumps(evento['datos'], default=str)}\n\n"
+
+
+async def _flujo_eventos(usuario_id):
+    """Generador asíncrono que espera eventos del hub sin consultar la base"""
+    suscripcion, cola = hub.suscribir(usuario_id)
+    try:
+        yield f'retry: {REINTENTO_MS}\n\n'
+        while True:
+            try:
+                evento = await asyncio.wait_for(cola.get(), timeout=INTERVALO_PING)
+            except asyncio.TimeoutError:
+                yield ': ping\n\n'
+                continue
+            yield _formato_sse(evento)
+    finally:
+        hub.desuscribir(suscripcion)
+
+
+@login_required
+async def eventos_stream(request):
+    """Canal SSE con notificaciones y contadores de alertas del usuario"""
+    if not isinstance(request, ASGIRequest):
+        # Bajo WSGI una conexión abierta bloquearía un worker: 204 indica al
+        # navegador que no reintente
+        return HttpResponse(status=204)
+
+    usuario = await request.auser()
+    response = StreamingHttpResponse(_flujo_eventos(usuario.id), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
@@ -0,0 +1,350 @@
+"""
+Exportaciones a Excel de facturas, productos, proveedores y detalles.
+
+Separadas de views.py para que openpyxl y este módulo se carguen solo cuando
+se pide una exportación.
+"""
+from django.db.models import Q
+
+from .consultas import presupuesto_consultas
+from .models import Factura, DetalleFactura, Producto, Proveedor
+
+
+def exportar_facturas_excel(request):
+    """Exportar facturas a Excel"""
+    from openpyxl import Workbook
+    from openpyxl.styles import Font, PatternFill, Alignment
+    from openpyxl.utils import get_column_letter
+    from django.http import HttpResponse
+    from datetime import datetime
+    
+    # Obtener parámetros de filtro
+    tipo = request.GET.get('tipo', '')
+    q = request.GET.get('q', '')
+    desde = request.GET.get('desde', '')
+    hasta = request.GET.get('hasta', '')
+    
+    # Filtrar facturas
+    facturas = Factura.objects.all()
+    if tipo:
+        facturas = facturas.filter(tipo=tipo)
+    if q:
+        facturas = facturas.filter(
+            Q(numero__icontains=q) |
+            Q(proveedor__nombre__icontains=q) |
+            Q(cliente__nombre__icontains=q)
+        )
+    if desde:
+        facturas = facturas.filter(fecha__gte=desde)
+    if hasta:
+        facturas = facturas.filter(fecha__lte=hasta)
+    
+    facturas = facturas.order_by('-fecha')
+    
+    # Crear workbook
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "Facturas"
+    
+    # Estilos
+    header_font = Font(bold=True, color="FFFFFF")
+    header_fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
+    header_alignment = Alignment(horizontal="center", vertical="center")
+    
+    # Encabezados
+    headers = [
+        'ID', 'Fecha', 'Tipo', 'Número', 'Proveedor/Cliente', 
+        'Estado', 'Subtotal 5%', 'Subtotal 10%', 'IVA', 'Total'
+    ]
+    
+    for col, header in enumerate(headers, 1):
+        cell = ws.cell(row=1, column=col, value=header)
+        cell.font = header_font
+        cell.fill = header_fill
+        cell.alignment = header_alignment
+    
+    # Datos
+    for row, factura in enumerate(facturas, 2):
+        ws.cell(row=row, column=1, value=factura.id)
+        ws.cell(row=row, column=2, value=factura.fecha.strftime('%d/%m/%Y'))
+        ws.cell(row=row, column=3, value=factura.get_tipo_display())
+        ws.cell(row=row, column=4, value=factura.numero or f"#{factura.id}")
+        
+        if factura.tipo == 'compra':
+            ws.cell(row=row, column=5, value=str(factura.proveedor))
+        else:
+            ws.cell(row=row, column=5, value=str(factura.cliente))
+        
+        ws.cell(row=row, column=6, value=factura.get_estado_display())
+        ws.cell(row=row, column=7, value=factura.subtotal_5 or 0)
+        ws.cell(row=row, column=8, value=factura.subtotal_10 or 0)
+        ws.cell(row=row, column=9, value=factura.iva or 0)
+        ws.cell(row=row, column=10, value=factura.total or 0)
+    
+    # Ajustar ancho de columnas
+    for column in ws.columns:
+        max_length = 0
+        column_letter = get_column_letter(column[0].column)
+        for cell in column:
+            try:
+                if len(str(cell.value)) > max_length:
+                    max_length = len(str(cell.value))
+            except:
+                pass
+        adjusted_width = min(max_length + 2, 50)
+        ws.column_dimensions[column_letter].width = adjusted_width
+    
+    # Crear respuesta
+    response = HttpResponse(
+        content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+    )
+    response['Content-Disposition'] = f'attachment; filename="facturas_{datetime.now().strftime("%Y%m%d_%H%M%S")}.xlsx"'
+    
+    wb.save(response)
+    return response
+
+def exportar_productos_excel(request):
+    """Exportar productos a Excel"""
+    from openpyxl import Workbook
+    from openpyxl.styles import Font, PatternFill, Alignment
+    from openpyxl.utils import get_column_letter
+    from django.http import HttpResponse
+    from datetime import datetime
+    
+    # Obtener parámetros de filtro
+    q = request.GET.get('q', '')
+    estado = request.GET.get('estado', '')
+    
+    # Filtrar productos
+    productos = Producto.objects.all()
+    if q:
+        productos = productos.filter(
+            Q(nombre__icontains=q) | Q(codigo__icontains=q)
+        )
+    if estado in dict(Producto.ESTADO_STOCK_CHOICES):
+        productos = productos.en_estado(estado)
+    
+    productos = productos.order_by('nombre')
+    
+    # Crear workbook
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "Productos"
+    
+    # Estilos
+    header_font = Font(bold=True, color="FFFFFF")
+    header_fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
+    header_alignment = Alignment(horizontal="center", vertical="center")
+    
+    # Encabezados
+    headers = [
+        'Código', 'Nombre', 'Stock', 'Stock Mínimo', 'Costo', 
+        'Precio', 'IVA (%)', 'Estado'
+    ]
+    
+    for col, header in enumerate(headers, 1):
+        cell = ws.cell(row=1, column=col, value=header)
+        cell.font = header_font
+        cell.fill = header_fill
+        cell.alignment = header_alignment
+    
+    # Datos
+    for row, producto in enumerate(productos, 2):
+        ws.cell(row=row, column=1, value=producto.codigo)
+        ws.cell(row=row, column=2, value=producto.nombre)
+        ws.cell(row=row, column=3, value=producto.stock)
+        ws.cell(row=row, column=4, value=producto.stock_minimo)
+        ws.cell(row=row, column=5, value=producto.costo or 0)
+        ws.cell(row=row, column=6, value=producto.precio or 0)
+        ws.cell(row=row, column=7, value=producto.iva)
+        
+        ws.cell(row=row, column=8, value=producto.get_estado_stock_display())
+    
+    # Ajustar ancho de columnas
+    for column in ws.columns:
+        max_length = 0
+        column_letter = get_column_letter(column[0].column)
+        for cell in column:
+            try:
+                if len(str(cell.value)) > max_length:
+                    max_length = len(str(cell.value))
+            except:
+                pass
+        adjusted_width = min(max_length + 2, 50)
+        ws.column_dimensions[column_letter].width = adjusted_width
+    
+    # Crear respuesta
+    response = HttpResponse(
+        content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+    )
+    response['Content-Disposition'] = f'attachment; filename="productos_{datetime.now().strftime("%Y%m%d_%H%M%S")}.xlsx"'
+    
+    wb.save(response)
+    return response
+
+def exportar_proveedores_excel(request):
+    """Exportar proveedores a Excel"""
+    from openpyxl import Workbook
+    from openpyxl.styles import Font, PatternFill, Alignment
+    from openpyxl.utils import get_column_letter
+    from django.http import HttpResponse
+    from datetime import datetime
+    
+    # Obtener parámetros de filtro
+    q = request.GET.get('q', '')
+    estado = request.GET.get('estado', '')
+    
+    # Filtrar proveedores
+    proveedores = Proveedor.objects.all()
+    if q:
+        proveedores = proveedores.filter(
+            Q(nombre__icontains=q) | Q(ruc__icontains=q)
+        )
+    if estado:
+        if estado == 'activo':
+            proveedores = proveedores.filter(activo=True)
+        elif estado == 'inactivo':
+            proveedores = proveedores.filter(activo=False)
+    
+    proveedores = proveedores.order_by('nombre')
+    
+    # Crear workbook
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "Proveedores"
+    
+    # Estilos
+    header_font = Font(bold=True, color="FFFFFF")
+    header_fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
+    header_alignment = Alignment(horizontal="center", vertical="center")
+    
+    # Encabezados
+    headers = [
+        'Nombre', 'RIF/RUC', 'Dirección', 'Teléfono', 'Email', 
+        'Estado', 'Saldo'
+    ]
+    
+    for col, header in enumerate(headers, 1):
+        cell = ws.cell(row=1, column=col, value=header)
+        cell.font = header_font
+        cell.fill = header_fill
+        cell.alignment = header_alignment
+    
+    # Datos
+    for row, proveedor in enumerate(proveedores, 2):
+        ws.cell(row=row, column=1, value=proveedor.nombre)
+        ws.cell(row=row, column=2, value=proveedor.ruc)
+        ws.cell(row=row, column=3, value=proveedor.direccion or '')
+        ws.cell(row=row, column=4, value=proveedor.telefono or '')
+        ws.cell(row=row, column=5, value=proveedor.email or '')
+        ws.cell(row=row, column=6, value="Activo" if proveedor.activo else "Inactivo")
+        ws.cell(row=row, column=7, value=proveedor.saldo or 0)
+    
+    # Ajustar ancho de columnas
+    for column in ws.columns:
+        max_length = 0
+        column_letter = get_column_letter(column[0].column)
+        for cell in column:
+            try:
+                if len(str(cell.value)) > max_length:
+                    max_length = len(str(cell.value))
+            except:
+                pass
+        adjusted_width = min(max_length + 2, 50)
+        ws.column_dimensions[column_letter].width = adjusted_width
+    
+    # Crear respuesta
+    response = HttpResponse(
+        content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+    )
+    response['Content-Disposition'] = f'attachment; filename="proveedores_{datetime.now().strftime("%Y%m%d_%H%M%S")}.xlsx"'
+    
+    wb.save(response)
+    return response
+
+@presupuesto_consultas(5)
+def exportar_detalles_facturas_excel(request):
+    """Exportar detalles de facturas a Excel"""
+    from openpyxl import Workbook
+    from openpyxl.styles import Font, PatternFill, Alignment
+    from openpyxl.utils import get_column_letter
+    from django.http import HttpResponse
+    from datetime import datetime
+    
+    # Obtener parámetros de filtro
+    q = request.GET.get('q', '')
+    tipo = request.GET.get('tipo', '')
+    desde = request.GET.get('desde', '')
+    hasta = request.GET.get('hasta', '')
+    
+    # Filtrar detalles
+    detalles = DetalleFactura.objects.all()
+    if q:
+        detalles = detalles.filter(
+            Q(producto__nombre__icontains=q) | Q(producto__codigo__icontains=q)
+        )
+    if tipo:
+        detalles = detalles.filter(factura__tipo=tipo)
+    if desde:
+        detalles = detalles.filter(factura__fecha__gte=desde)
+    if hasta:
+        detalles = detalles.filter(factura__fecha__lte=hasta)
+    
+    detalles = detalles.select_related('factura', 'producto').order_by('-factura__fecha')
+    
+    # Crear workbook
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "Detalles Facturas"
+    
+    # Estilos
+    header_font = Font(bold=True, color="FFFFFF")
+    header_fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
+    header_alignment = Alignment(horizontal="center", vertical="center")
+    
+    # Encabezados
+    headers = [
+        'Fecha Factura', 'Número Factura', 'Tipo', 'Producto', 'Código', 
+        'Cantidad', 'Precio Unitario', 'Subtotal', 'IVA', 'Total'
+    ]
+    
+    for col, header in enumerate(headers, 1):
+        cell = ws.cell(row=1, column=col, value=header)
+        cell.font = header_font
+        cell.fill = header_fill
+        cell.alignment = header_alignment
+    
+    # Datos
+    for row, detalle in enumerate(detalles, 2):
+        ws.cell(row=row, column=1, value=detalle.factura.fecha.strftime('%d/%m/%Y'))
+        ws.cell(row=row, column=2, value=detalle.factura.numero or f"#{detalle.factura.id}")
+        ws.cell(row=row, column=3, value=detalle.factura.get_tipo_display())
+        ws.cell(row=row, column=4, value=detalle.producto.nombre)
+        ws.cell(row=row, column=5, value=detalle.producto.codigo)
+        ws.cell(row=row, column=6, value=detalle.cantidad)
+        ws.cell(row=row, column=7, value=detalle.precio_unitario)
+        ws.cell(row=row, column=8, value=detalle.subtotal)
+        ws.cell(row=row, column=9, value=detalle.iva)
+        ws.cell(row=row, column=10, value=detalle.total)
+    
+    # Ajustar ancho de columnas
+    for column in ws.columns:
+        max_length = 0
+        column_letter = get_column_letter(column[0].column)
+        for cell in column:
+            try:
+                if len(str(cell.value)) > max_length:
+                    max_length = len(str(cell.value))
+            except:
+                pass
+        adjusted_width = min(max_length + 2, 50)
+        ws.column_dimensions[column_letter].width = adjusted_width
+    
+    # Crear respuesta
+    response = HttpResponse(
+        content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+    )
+    response['Content-Disposition'] = f'attachment; filename="detalles_facturas_{datetime.now().strftime("%Y%m%d_%H%M%S")}.xlsx"'
+    
+    wb.save(response)
+    return response
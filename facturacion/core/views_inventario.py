@@ -0,0 +1,210 @@
+import csv
+import io
+
+from django.contrib import messages
+from django.contrib.auth.decorators import login_required
+from django.db.models import Count
+from django.http import HttpResponse
+from django.shortcuts import get_object_or_404, redirect, render
+
+from .decorators import puede_editar_modulo, puede_ver_modulo
+from .models import Producto, TomaInventario
+
+
+def _resumen_diferencias(filas):
+    """Totales de la toma: productos, unidades y valor de faltantes y sobrantes"""
+    resumen = {
+        'contados': 0, 'con_diferencia': 0,
+        'unidades_faltantes': 0, 'unidades_sobrantes': 0,
+        'valor_faltante': 0, 'valor_sobrante': 0,
+    }
+    for fila in filas:
+        resumen['contados'] += 1
+        if not fila.diferencia:
+            continue
+        resumen['con_diferencia'] += 1
+        if fila.diferencia < 0:
+            resumen['unidades_faltantes'] -= fila.diferencia
+            resumen['valor_faltante'] -= fila.valor_diferencia or 0
+        else:
+            resumen['unidades_sobrantes'] += fila.diferencia
+            resumen['valor_sobrante'] += fila.valor_diferencia or 0
+    resumen['valor_neto'] = resumen['valor_sobrante'] - resumen['valor_faltante']
+    return resumen
+
+
+def _leer_csv(archivo):
+    """
+    Filas codigo,cantidad (con o sin encabezado; separador coma o punto y coma).
+    Devuelve ({codigo: cantidad}, [errores]).
+    """
+    texto = archivo.read().decode('utf-8-sig', errors='replace')
+    primera = texto.split('\n', 1)[0]
+    separador = ';' if primera.count(';') > primera.count(',') else ','
+
+    cantidades, errores = {}, []
+    for numero, fila in enumerate(csv.reader(io.StringIO(texto), delimiter=separador), start=1):
+        if not fila or not fila[0].strip():
+            continue
+        codigo = fila[0].strip()
+        valor = fila[1].strip().replace('.', '') if len(fila) > 1 else ''
+        try:
+            cantidad = int(valor)
+        except ValueError:
+            if numero > 1:
+                errores.append(f'Línea {numero}: cantidad inválida para {codigo}')
+            continue  # la primera línea puede ser el encabezado
+        if cantidad < 0:
+            errores.append(f'Línea {numero}: cantidad negativa para {codigo}')
+            continue
+        cantidades[codigo] = cantidad
+    return cantidades, errores
+
+
+@login_required
+@puede_ver_modulo('stock')
+def tomas_inventario_list(request):
+    """Lista de tomas de inventario"""
+    tomas = TomaInventario.objects.select_related('usuario', 'usuario_aplicacion').annotate(
+        productos=Count('conteos')
+    )
+    return render(request, 'tomas_inventario_list.html', {
+        'tomas': tomas,
+        'hay_borrador': tomas.filter(estado='borrador').exists(),
+    })
+
+
+@login_required
+@puede_editar_modulo('stock')
+def toma_inventario_crear(request):
+    """Iniciar una toma de inventario"""
+    if request.method == 'POST':
+        toma = TomaInventario.objects.create(
+            descripcion=request.POST.get('descripcion', '').strip(),
+            usuario=request.user,
+        )
+        messages.success(request, f'Toma de inventario #{toma.pk} iniciada. Cargue las cantidades contadas.')
+        return redirect('toma_inventario_ver', pk=toma.pk)
+    return redirect('tomas_inventario_list')
+
+
+@login_required
+@puede_ver_modulo('stock')
+def toma_inventario_ver(request, pk):
+    """Grilla de conteo y vista previa de diferencias, o reporte de diferencias si ya se aplicó"""
+    toma = get_object_or_404(TomaInventario.objects.select_related('usuario', 'usuario_aplicacion'), pk=pk)
+    diferencias = list(toma.diferencias())
+    contexto = {
+        'toma': toma,
+        'resumen': _resumen_diferencias(diferencias),
+    }
+
+    if toma.estado == 'borrador':
+        # Grilla con todos los productos activos (y los inactivos ya contados)
+        por_producto = {fila.producto_id: fila for fila in diferencias}
+        productos = Producto.objects.filter(activo=True) | Producto.objects.filter(pk__in=por_producto)
+        contexto['filas'] = [
+            {'producto': producto, 'conteo': por_producto.get(producto.pk)}
+            for producto in productos.order_by('nombre')
+        ]
+    else:
+        contexto['diferencias'] = [fila for fila in diferencias if fila.diferencia]
+        contexto['sin_diferencia'] = len(diferencias) - len(contexto['diferencias'])
+
+    return render(request, 'toma_inventario_ver.html', contexto)
+
+
+@login_required
+@puede_editar_modulo('stock')
+def toma_inventario_guardar(request, pk):
+    """Guardar las cantidades de la grilla o de un archivo CSV (codigo,cantidad)"""
+    toma = get_object_or_404(TomaInventario, pk=pk)
+    if request.method != 'POST':
+        return redirect('toma_inventario_ver', pk=pk)
+    if toma.estado != 'borrador':
+        messages.error(request, 'Solo se pueden modificar tomas de inventario en borrador.')
+        return redirect('toma_inventario_ver', pk=pk)
+
+    cantidades, errores = {}, []
+    if request.FILES.get('archivo'):
+        por_codigo, errores = _leer_csv(request.FILES['archivo'])
+        ids = dict(Producto.objects.filter(codigo__in=por_codigo).values_list('codigo', 'id'))
+        for codigo, cantidad in por_codigo.items():
+            if codigo in ids:
+                cantidades[ids[codigo]] = cantidad
+            else:
+                errores.append(f'Código desconocido: {codigo}')
+    else:
+        for clave, valor in request.POST.items():
+            producto_id = clave[len('contado-'):]
+            if not clave.startswith('contado-') or not producto_id.isdigit():
+                continue
+            producto_id = int(producto_id)
+            valor = valor.strip()
+            if not valor:
+                cantidades[producto_id] = None
+                continue
+            try:
+                cantidades[producto_id] = int(valor)
+                if cantidades[producto_id] < 0:
+                    raise ValueError
+            except ValueError:
+                cantidades.pop(producto_id, None)
+                errores.append(f'Cantidad inválida: {valor}')
+
+    toma.guardar_conteos(cantidades)
+    contados = sum(1 for cantidad in cantidades.values() if cantidad is not None)
+    messages.success(request, f'{contados} cantidades guardadas.')
+    for error in errores[:20]:
+        messages.warning(request, error)
+    if len(errores) > 20:
+        messages.warning(request, f'... y {len(errores) - 20} errores más.')
+    return redirect('toma_inventario_ver', pk=pk)
+
+
+@login_required
+@puede_editar_modulo('stock')
+def toma_inventario_aplicar(request, pk):
+    """Registrar todos los ajustes de la toma en una transacción"""
+    toma = get_object_or_404(TomaInventario, pk=pk)
+    if request.method == 'POST':
+        try:
+            movimientos = toma.aplicar(request.user)
+            messages.success(request, f'Toma de inventario aplicada: {len(movimientos)} productos ajustados.')
+        except ValueError as e:
+            messages.error(request, str(e))
+    return redirect('toma_inventario_ver', pk=pk)
+
+
+@login_required
+@puede_editar_modulo('stock')
+def toma_inventario_cancelar(request, pk):
+    """Descartar una toma en borrador sin tocar el stock"""
+    toma = get_object_or_404(TomaInventario, pk=pk)
+    if request.method == 'POST':
+        if toma.estado == 'borrador':
+            toma.estado = 'cancelada'
+            toma.save(update_fields=['estado'])
+            messages.success(request, f'Toma de inventario #{toma.pk} cancelada.')
+        else:
+            messages.error(request, 'Solo se pueden cancelar tomas de inventario en borrador.')
+    return redirect('tomas_inventario_list')
+
+
+@login_required
+@puede_ver_modulo('stock')
+def toma_inventario_exportar(request, pk):
+    """Reporte de diferencias en CSV"""
+    toma = get_object_or_404(TomaInventario, pk=pk)
+    response = HttpResponse(content_type='text/csv; charset=utf-8')
+    response['Content-Disposition'] = f'attachment; filename="toma_inventario_{toma.pk}.csv"'
+    response.write('\ufeff')  # BOM para que Excel detecte UTF-8
+
+    escritor = csv.writer(response, delimiter=';')
+    escritor.writerow(['Código', 'Producto', 'Stock sistema', 'Contado', 'Diferencia', 'Costo', 'Valor diferencia'])
+    for fila in toma.diferencias():
+        escritor.writerow([
+            fila.producto.codigo, fila.producto.nombre, fila.sistema, fila.cantidad_contada,
+            fila.diferencia, fila.costo_unitario, fila.valor_diferencia,
+        ])
+    return response
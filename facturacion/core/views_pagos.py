@@ -5,9 +5,11 @@ from django.db.models import Q
 from django.core.paginator import Paginator
 from django.utils import timezone
 from .models import Pago, Factura, Caja
+from .consultas import presupuesto_consultas
 
 
 @login_required
+@presupuesto_consultas(25)
 def pagos_dashboard(request):
     """Dashboard principal del módulo de pagos"""
     # Facturas pendientes
@@ -22,7 +24,7 @@ def pagos_dashboard(request):
     ).select_related('proveedor').order_by('-fecha')[:5]
     
     # Caja activa
-    caja_activa = Caja.obtener_caja_activa()
+    caja_activa = Caja.obtener_caja_activa(usuario=request.user)
     
     context = {
         'facturas_pendientes_clientes': facturas_pendientes_clientes,
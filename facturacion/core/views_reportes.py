@@ -1,14 +1,18 @@
 from django.shortcuts import render
 from django.contrib.auth.decorators import login_required
-from django.db.models import Sum, Count, Avg, Q, F
-from .models import Pago, Gasto, Factura, Producto, Cliente, Proveedor
+from .decorators import usar_replica
+from .consultas import presupuesto_consultas
+from django.db.models import Sum, Count, Avg, Q, F, OuterRef
+from django.db.models.functions import Coalesce
+from .models import Pago, Gasto, Factura, DetalleFactura, Producto, Cliente, Proveedor, InventarioSnapshot, HistorialCosto
 from datetime import datetime, timedelta
 from django.http import HttpResponse
-import xlsxwriter
+from django.utils import timezone
 import io
 
 
 @login_required
+@usar_replica
 def reporte_flujo_caja(request):
     """Reporte de flujo de caja"""
     
@@ -143,8 +147,10 @@ def reporte_flujo_caja(request):
 
 
 @login_required
+@usar_replica
 def exportar_flujo_caja_excel(request):
     """Exportar reporte de flujo de caja a Excel"""
+    import xlsxwriter
     
     # Parámetros de filtro
     fecha_inicio = request.GET.get('fecha_inicio')
@@ -269,6 +275,7 @@ def exportar_flujo_caja_excel(request):
 
 
 @login_required
+@usar_replica
 def reporte_rentabilidad_productos(request):
     """Reporte de rentabilidad por productos"""
     
@@ -290,33 +297,43 @@ def reporte_rentabilidad_productos(request):
         fecha_inicio_dt = (hoy - timedelta(days=30)).date()
         fecha_fin_dt = hoy
     
-    # Obtener productos con sus ventas y rentabilidad
+    # Ventas del período por producto; cada línea al costo promedio vigente en la
+    # fecha de su factura (HistorialCosto), sin recorrer el historial de compras
+    costo_linea = Coalesce(
+        HistorialCosto.subconsulta(OuterRef('producto'), OuterRef('factura__fecha')),
+        F('producto__costo_promedio'),
+    )
+    ventas = {
+        fila['producto']: fila
+        for fila in DetalleFactura.objects.filter(
+            factura__tipo='venta',
+            factura__estado='pagada',
+            factura__fecha__date__gte=fecha_inicio_dt,
+            factura__fecha__date__lte=fecha_fin_dt,
+        ).annotate(costo_linea=costo_linea).values('producto').annotate(
+            total_ventas=Sum('subtotal'),
+            cantidad_vendida=Sum('cantidad'),
+            cantidad_facturas=Count('factura', distinct=True),
+            costo_ventas=Sum(F('cantidad') * F('costo_linea')),
+        ).order_by()
+    }
+    
     productos_rentabilidad = []
     
     for producto in Producto.objects.all():
-        # Ventas del producto en el período
-        ventas_producto = Factura.objects.filter(
-            tipo='venta',
-            estado='pagada',
-            fecha__date__gte=fecha_inicio_dt,
-            fecha__date__lte=fecha_fin_dt,
-            detalles__producto=producto
-        ).aggregate(
-            total_ventas=Sum('detalles__subtotal'),
-            cantidad_vendida=Sum('detalles__cantidad'),
-            cantidad_facturas=Count('id', distinct=True)
-        )
-        
-        total_ventas = ventas_producto['total_ventas'] or 0
-        cantidad_vendida = ventas_producto['cantidad_vendida'] or 0
-        cantidad_facturas = ventas_producto['cantidad_facturas'] or 0
+        fila = ventas.get(producto.pk, {})
+        total_ventas = fila.get('total_ventas') or 0
+        cantidad_vendida = fila.get('cantidad_vendida') or 0
+        cantidad_facturas = fila.get('cantidad_facturas') or 0
         
-        # Calcular rentabilidad (precio_venta - costo)
+        # Calcular rentabilidad (precio_venta - costo promedio de lo vendido)
         if cantidad_vendida > 0:
             precio_promedio_venta = total_ventas / cantidad_vendida
-            margen_bruto = precio_promedio_venta - producto.costo
+            costo_unitario = fila['costo_ventas'] / cantidad_vendida
+            margen_bruto = precio_promedio_venta - costo_unitario
             porcentaje_rentabilidad = (margen_bruto / precio_promedio_venta) * 100 if precio_promedio_venta > 0 else 0
         else:
+            costo_unitario = producto.costo_promedio
             margen_bruto = 0
             porcentaje_rentabilidad = 0
         
@@ -326,6 +343,8 @@ def reporte_rentabilidad_productos(request):
             'cantidad_vendida': cantidad_vendida,
             'cantidad_facturas': cantidad_facturas,
             'precio_promedio_venta': total_ventas / cantidad_vendida if cantidad_vendida > 0 else 0,
+            'costo_unitario': costo_unitario,
+            'costo_ventas': fila.get('costo_ventas') or 0,
             'margen_bruto': margen_bruto,
             'porcentaje_rentabilidad': porcentaje_rentabilidad
         })
@@ -352,6 +371,7 @@ def reporte_rentabilidad_productos(request):
 
 
 @login_required
+@usar_replica
 def reporte_tendencias_ventas(request):
     """Reporte de tendencias de ventas"""
     
@@ -438,6 +458,7 @@ def reporte_tendencias_ventas(request):
 
 
 @login_required
+@usar_replica
 def reporte_analisis_clientes(request):
     """Reporte de análisis de clientes"""
     
@@ -557,6 +578,7 @@ def reporte_analisis_clientes(request):
 
 
 @login_required
+@usar_replica
 def reporte_eficiencia_operativa(request):
     """Reporte de eficiencia operativa"""
     
@@ -581,6 +603,9 @@ def reporte_eficiencia_operativa(request):
     # Métricas de eficiencia
     
     # 1. Rotación de inventario
+    # Stock al inicio (cierre del día anterior) y al cierre del período, desde los snapshots de inventario
+    stock_inicial = InventarioSnapshot.stock_a_fecha(fecha_inicio_dt - timedelta(days=1))
+    stock_final = InventarioSnapshot.stock_a_fecha(fecha_fin_dt)
     productos_rotacion = []
     for producto in Producto.objects.all():
         # Ventas del período
@@ -594,8 +619,8 @@ def reporte_eficiencia_operativa(request):
             cantidad_vendida=Sum('detalles__cantidad')
         )['cantidad_vendida'] or 0
         
-        # Stock promedio (simplificado como stock actual)
-        stock_promedio = producto.stock
+        # Stock promedio del período
+        stock_promedio = (stock_inicial.get(producto.pk, 0) + stock_final.get(producto.pk, 0)) / 2
         
         # Rotación = ventas / stock promedio
         rotacion = ventas_periodo / stock_promedio if stock_promedio > 0 else 0
@@ -633,12 +658,10 @@ def reporte_eficiencia_operativa(request):
     ).order_by('-total')
     
     # 4. Productos con stock bajo
-    productos_stock_bajo = Producto.objects.filter(
-        stock__lt=F('stock_minimo')
-    ).exclude(stock=0)
+    productos_stock_bajo = Producto.objects.stock_bajo()
     
     # 5. Productos agotados
-    productos_agotados = Producto.objects.filter(stock=0)
+    productos_agotados = Producto.objects.agotados()
     
     # 6. Tendencias de ventas por día de la semana
     ventas_por_dia = []
@@ -675,3 +698,149 @@ def reporte_eficiencia_operativa(request):
     }
     
     return render(request, 'reporte_eficiencia_operativa.html', context)
+
+
+def _parametros_antiguedad(request):
+    """Tipo (venta/compra) y fecha de corte del reporte de antigüedad"""
+    tipo = request.GET.get('tipo', 'venta')
+    if tipo not in ('venta', 'compra'):
+        tipo = 'venta'
+    
+    hoy = datetime.now().date()
+    fecha_corte_str = request.GET.get('fecha_corte') or hoy.strftime('%Y-%m-%d')
+    try:
+        fecha_corte = datetime.strptime(fecha_corte_str, '%Y-%m-%d').date()
+    except ValueError:
+        fecha_corte = hoy
+        fecha_corte_str = hoy.strftime('%Y-%m-%d')
+    
+    return tipo, fecha_corte, fecha_corte_str
+
+
+# Valor de `contraparte` para las facturas sin cliente o proveedor asignado
+SIN_CONTRAPARTE = 'ninguno'
+
+
+@login_required
+@usar_replica
+@presupuesto_consultas(15)
+def reporte_antiguedad_saldos(request):
+    """Antigüedad de cuentas por cobrar (ventas) o por pagar (compras)"""
+    tipo, fecha_corte, fecha_corte_str = _parametros_antiguedad(request)
+    campo = 'proveedor' if tipo == 'compra' else 'cliente'
+    
+    # Una sola consulta agrupada por contraparte con los tramos como columnas
+    saldos = list(Factura.antiguedad_saldos(tipo, fecha_corte))
+    
+    tramos = [{'clave': clave, 'nombre': nombre} for clave, nombre, _, _ in Factura.TRAMOS_ANTIGUEDAD]
+    for fila in saldos:
+        # Las facturas sin contraparte tienen su propio valor en el enlace al detalle
+        fila['contraparte_id'] = fila[f'{campo}_id'] if fila[f'{campo}_id'] is not None else SIN_CONTRAPARTE
+        fila['contraparte_nombre'] = fila[f'{campo}__nombre'] or 'Sin asignar'
+        fila['tramos'] = [{'clave': tramo['clave'], 'monto': fila[tramo['clave']] or 0} for tramo in tramos]
+    
+    totales = [sum(fila[tramo['clave']] or 0 for fila in saldos) for tramo in tramos]
+    
+    # Detalle de facturas de una contraparte y tramo
+    detalle = None
+    contraparte_id = request.GET.get('contraparte', '')
+    tramo = request.GET.get('tramo')
+    if contraparte_id == SIN_CONTRAPARTE:
+        filtro = {f'{campo}__isnull': True}
+    else:
+        try:
+            contraparte_id = int(contraparte_id)
+            filtro = {f'{campo}_id': contraparte_id}
+        except ValueError:
+            # Vacío o no numérico: solo el resumen
+            contraparte_id, filtro = None, None
+    if filtro is not None:
+        detalle = Factura.objects.filter(
+            tipo=tipo, estado='pendiente', monto_pendiente__gt=0, **filtro
+        ).select_related(campo).order_by('fecha_vencimiento')
+        if tramo in dict((t['clave'], t) for t in tramos):
+            detalle = detalle.filter(Factura.condicion_tramo(tramo, fecha_corte))
+    
+    context = {
+        'tipo': tipo,
+        'fecha_corte': fecha_corte_str,
+        'tramos': tramos,
+        'saldos': saldos,
+        'totales': totales,
+        'total_general': sum(totales),
+        'detalle': detalle,
+        'contraparte_id': contraparte_id,
+        'tramo': tramo,
+        'titulo': 'Antigüedad de Cuentas por Pagar' if tipo == 'compra' else 'Antigüedad de Cuentas por Cobrar',
+    }
+    
+    return render(request, 'reporte_antiguedad_saldos.html', context)
+
+
+@login_required
+@usar_replica
+def exportar_antiguedad_saldos_excel(request):
+    """Exportar antigüedad de saldos a Excel escribiendo fila por fila"""
+    import xlsxwriter
+
+    tipo, fecha_corte, fecha_corte_str = _parametros_antiguedad(request)
+    campo = 'proveedor' if tipo == 'compra' else 'cliente'
+    tramos = Factura.TRAMOS_ANTIGUEDAD
+    
+    output = io.BytesIO()
+    # constant_memory vuelca cada fila a disco apenas se completa
+    workbook = xlsxwriter.Workbook(output, {'constant_memory': True})
+    
+    formato_moneda = workbook.add_format({'num_format': '#,##0'})
+    formato_fecha = workbook.add_format({'num_format': 'dd/mm/yyyy'})
+    formato_titulo = workbook.add_format({'bold': True, 'font_size': 14})
+    formato_subtitulo = workbook.add_format({'bold': True, 'font_size': 12})
+    
+    # Hoja 1: Resumen por contraparte
+    worksheet1 = workbook.add_worksheet('Resumen')
+    worksheet1.write(0, 0, 'ANTIGÜEDAD DE CUENTAS POR PAGAR' if tipo == 'compra' else 'ANTIGÜEDAD DE CUENTAS POR COBRAR', formato_titulo)
+    worksheet1.write(1, 0, f'Fecha de corte: {fecha_corte.strftime("%d/%m/%Y")}', formato_subtitulo)
+    
+    encabezados = ['Proveedor' if tipo == 'compra' else 'Cliente', 'Facturas'] + [nombre for _, nombre, _, _ in tramos] + ['Total']
+    for col, encabezado in enumerate(encabezados):
+        worksheet1.write(3, col, encabezado, formato_subtitulo)
+    
+    fila = 4
+    for saldo in Factura.antiguedad_saldos(tipo, fecha_corte).iterator():
+        worksheet1.write(fila, 0, saldo[f'{campo}__nombre'] or 'Sin asignar')
+        worksheet1.write(fila, 1, saldo['cantidad'])
+        for col, (clave, _, _, _) in enumerate(tramos, 2):
+            worksheet1.write(fila, col, saldo[clave] or 0, formato_moneda)
+        worksheet1.write(fila, len(tramos) + 2, saldo['total'], formato_moneda)
+        fila += 1
+    
+    # Hoja 2: Facturas pendientes
+    worksheet2 = workbook.add_worksheet('Facturas')
+    for col, encabezado in enumerate(['Factura', 'Fecha', 'Vencimiento', 'Proveedor' if tipo == 'compra' else 'Cliente', 'Total', 'Pendiente', 'Días Vencida']):
+        worksheet2.write(0, col, encabezado, formato_subtitulo)
+    
+    facturas = Factura.objects.filter(
+        tipo=tipo, estado='pendiente', monto_pendiente__gt=0
+    ).order_by(f'{campo}__nombre', 'fecha_vencimiento').values_list(
+        'numero', 'fecha', 'fecha_vencimiento', f'{campo}__nombre', 'total', 'monto_pendiente'
+    )
+    
+    for fila, (numero, fecha, vencimiento, nombre, total, pendiente) in enumerate(facturas.iterator(chunk_size=2000), 1):
+        worksheet2.write(fila, 0, numero)
+        worksheet2.write_datetime(fila, 1, timezone.localtime(fecha).replace(tzinfo=None), formato_fecha)
+        worksheet2.write_datetime(fila, 2, vencimiento, formato_fecha)
+        worksheet2.write(fila, 3, nombre or 'Sin asignar')
+        worksheet2.write(fila, 4, total, formato_moneda)
+        worksheet2.write(fila, 5, pendiente, formato_moneda)
+        worksheet2.write(fila, 6, max(0, (fecha_corte - vencimiento).days))
+    
+    workbook.close()
+    output.seek(0)
+    
+    response = HttpResponse(
+        output.read(),
+        content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+    )
+    response['Content-Disposition'] = f'attachment; filename="antiguedad_{tipo}_{fecha_corte_str}.xlsx"'
+    
+    return response